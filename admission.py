@@ -0,0 +1,202 @@
+import math
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, namedtuple
+
+# Admission control in front of the routes.
+# - Token buckets per JWT identity, per role and per client IP, configured per route
+#   (parse_limits). Over the limit: 429 with Retry-After set to when a token is next free.
+# - A cap on requests in flight per worker with a short bounded queue. When the queue is
+#   full or the wait times out the request is shed with 503 instead of piling up on the
+#   DB pool and the bcrypt queue.
+# Buckets live in this process ('local') or in a SQLite file shared by every worker on the
+# host ('sqlite:///path'), like the order cache.
+
+RateLimit = namedtuple('RateLimit', 'scope rate burst')
+
+LIMIT_RE = re.compile(r"^(identity|role|ip):(\d+(?:\.\d+)?)/(\d+(?:\.\d+)?)s(?::(\d+))?$")
+
+
+def parse_limits(spec):
+    # "route=scope:count/seconds[:burst],...;route=..." -> {route: (RateLimit, ...)}
+    # e.g. "/login=ip:10/60s;default=identity:50/1s:100". The burst defaults to count.
+    # Routes are Flask rules ('/customer/track-order/<int:order_id>'); 'default' covers the rest.
+    limits = {}
+    for entry in filter(None, (part.strip() for part in (spec or '').split(';'))):
+        route, _, rules = entry.rpartition('=')
+        if not route:
+            raise ValueError(f"Rate limit entry without a route: {entry}")
+        parsed = []
+        for rule in filter(None, (part.strip() for part in rules.split(','))):
+            match = LIMIT_RE.match(rule)
+            if match is None:
+                raise ValueError(f"Invalid rate limit '{rule}'; expected scope:count/seconds[:burst]")
+            scope, count, seconds, burst = match.groups()
+            parsed.append(RateLimit(scope, float(count) / float(seconds), int(burst or math.ceil(float(count)))))
+        limits[route.strip()] = tuple(parsed)
+    return limits
+
+
+def refill(tokens, updated, now, rate, burst):
+    return min(burst, tokens + max(now - updated, 0) * rate)
+
+
+class LocalBuckets:
+    # Per-process: with several workers each one allows the full rate
+    def __init__(self, max_keys=100000):
+        self.max_keys = max_keys
+        self.buckets = OrderedDict()
+        self.lock = threading.Lock()
+
+    def take(self, key, rate, burst):
+        # -> 0 when a token was taken, else seconds until one is available
+        now = time.monotonic()
+        with self.lock:
+            tokens, updated = self.buckets.get(key, (burst, now))
+            tokens = refill(tokens, updated, now, rate, burst)
+            wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+            self.buckets[key] = (tokens - 1 if not wait else tokens, now)
+            self.buckets.move_to_end(key)
+            # The least recently used bucket is the one most likely to be full again anyway
+            while len(self.buckets) > self.max_keys:
+                self.buckets.popitem(last=False)
+        return wait
+
+    def size(self):
+        with self.lock:
+            return len(self.buckets)
+
+
+class SQLiteBuckets:
+    # Shared by every worker process on one host through a SQLite file
+    def __init__(self, path, purge_every=1000, idle_seconds=3600):
+        self.purge_every = purge_every
+        self.idle_seconds = idle_seconds
+        self.takes_since_purge = 0
+        self.lock = threading.Lock()
+        self.path = path
+        self.conn = self.connect()
+        # A forked worker (see serve.py) must not share the connection opened in its parent
+        os.register_at_fork(after_in_child=self.reopen)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS buckets (key TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS buckets_updated ON buckets (updated)")
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def reopen(self):
+        self.lock = threading.Lock()
+        self.conn = self.connect()
+
+    def take(self, key, rate, burst):
+        now = time.time()
+        with self.lock:
+            # The write lock up front makes the read-modify-write atomic across processes
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self.conn.execute("SELECT tokens, updated FROM buckets WHERE key = ?", (key,)).fetchone()
+                tokens = refill(*(row or (burst, now)), now, rate, burst)
+                wait = 0.0 if tokens >= 1 else (1 - tokens) / rate
+                self.conn.execute("INSERT OR REPLACE INTO buckets (key, tokens, updated) VALUES (?, ?, ?)",
+                                  (key, tokens - 1 if not wait else tokens, now))
+                self.takes_since_purge += 1
+                if self.takes_since_purge >= self.purge_every:
+                    self.takes_since_purge = 0
+                    self.conn.execute("DELETE FROM buckets WHERE updated < ?", (now - self.idle_seconds,))
+                self.conn.execute("COMMIT")
+            except Exception:
+                self.conn.execute("ROLLBACK")
+                raise
+        return wait
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM buckets").fetchone()[0]
+
+
+def create_bucket_store(url):
+    # 'local' or 'sqlite:///path/to/ratelimits.db'
+    if not url or url == 'local':
+        return LocalBuckets()
+    if url.startswith('sqlite:///'):
+        return SQLiteBuckets(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported rate limit backend: {url}")
+
+
+def retry_after(seconds):
+    # Retry-After takes whole seconds
+    return str(max(1, math.ceil(seconds)))
+
+
+class AdmissionControl:
+    # max_concurrent 0: no cap on requests in flight
+    def __init__(self, store, limits, max_concurrent=0, max_queue=0, queue_timeout=1.0):
+        self.store = store
+        self.limits = limits
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.cond = threading.Condition()
+        self.in_flight = 0
+        self.waiting = 0
+        self.counters = {"admitted": 0, "queued": 0, "throttled": 0, "shed_queue_full": 0, "shed_queue_timeout": 0}
+
+    def incr(self, name):
+        with self.cond:
+            self.counters[name] += 1
+
+    def check(self, route, identity=None, role=None, ip=None):
+        # -> (scope, seconds to wait) for the first limit the request exceeds, or None.
+        # Limits whose subject is unknown (no token, no role) are skipped.
+        rule = route if route in self.limits else 'default'
+        subjects = {'identity': f"{role}:{identity}" if identity is not None else None, 'role': role, 'ip': ip}
+        for limit in self.limits.get(rule, ()):
+            subject = subjects[limit.scope]
+            if subject is None:
+                continue
+            wait = self.store.take(f"{limit.scope}:{rule}:{subject}", limit.rate, limit.burst)
+            if wait:
+                self.incr("throttled")
+                return limit.scope, wait
+        return None
+
+    def admit(self):
+        # Takes a slot (release() it when the request is done) -> None, or the reason the request is shed
+        if not self.max_concurrent:
+            return None
+        with self.cond:
+            if self.in_flight >= self.max_concurrent:
+                if self.waiting >= self.max_queue:
+                    self.counters["shed_queue_full"] += 1
+                    return "queue_full"
+                self.waiting += 1
+                self.counters["queued"] += 1
+                try:
+                    free = self.cond.wait_for(lambda: self.in_flight < self.max_concurrent, self.queue_timeout)
+                finally:
+                    self.waiting -= 1
+                if not free:
+                    self.counters["shed_queue_timeout"] += 1
+                    return "queue_timeout"
+            self.in_flight += 1
+            self.counters["admitted"] += 1
+        return None
+
+    def release(self):
+        with self.cond:
+            self.in_flight -= 1
+            self.cond.notify()
+
+    def stats(self):
+        buckets = self.store.size()
+        with self.cond:
+            return {**self.counters, "in_flight": self.in_flight, "waiting": self.waiting,
+                    "max_concurrent": self.max_concurrent, "buckets": buckets}
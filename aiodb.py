@@ -0,0 +1,135 @@
+import asyncio
+import time
+from contextlib import asynccontextmanager
+
+import aiomysql
+
+from db import SESSION_INIT, PoolExhausted
+
+# Async counterpart of db.Database for asgi.py, on an aiomysql pool.
+# Same shape: `async with adb.cursor()` for reads, `async with adb.transaction()` for writes,
+# and the same DB_POOL_* / MYSQL_* settings (the pool size is per worker process).
+
+
+class InstrumentedAsyncCursor:
+    # Reports every execute to `observer(sql, seconds, rows)`, like metrics.InstrumentedCursor
+    def __init__(self, cursor, observer):
+        self._cursor = cursor
+        self._observer = observer
+
+    async def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return await self._cursor.execute(sql, params)
+        finally:
+            self._observer(sql, time.perf_counter() - started, self._cursor.rowcount)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class AsyncDatabase:
+    def __init__(self, config):
+        self.config = config
+        self.pool = None
+        self.observer = None
+        self.on_wait = None
+
+    async def start(self):
+        config = self.config
+        self.pool = await aiomysql.create_pool(
+            host=config['MYSQL_HOST'],
+            port=int(config.get('MYSQL_PORT', 3306)),
+            user=config['MYSQL_USER'],
+            password=config['MYSQL_PASSWORD'],
+            db=config['MYSQL_DB'],
+            minsize=0,
+            maxsize=int(config['DB_POOL_SIZE']),
+            pool_recycle=int(config['DB_POOL_RECYCLE']),
+            init_command=SESSION_INIT,
+            autocommit=True
+        )
+
+    async def prefill(self, count):
+        # Opens connections up to `count` ahead of the first requests, like db.Database.prefill
+        conns = []
+        try:
+            while len(conns) < min(count, self.pool.maxsize):
+                conns.append(await self.pool.acquire())
+        finally:
+            for conn in conns:
+                self.pool.release(conn)
+        return len(conns)
+
+    async def close(self):
+        if self.pool is not None:
+            self.pool.close()
+            await self.pool.wait_closed()
+            self.pool = None
+
+    @asynccontextmanager
+    async def connection(self):
+        timeout = float(self.config['DB_POOL_TIMEOUT'])
+        started = time.perf_counter()
+        try:
+            conn = await asyncio.wait_for(self.pool.acquire(), timeout)
+        except asyncio.TimeoutError:
+            raise PoolExhausted(
+                f"Timed out after {timeout}s waiting for a database connection "
+                f"(pool size {self.pool.maxsize}, all in use)"
+            )
+        if self.on_wait is not None:
+            self.on_wait(time.perf_counter() - started)
+        try:
+            yield conn
+        except aiomysql.Error:
+            # The driver failed: the session may be lost or out of sync
+            conn.close()
+            raise
+        except Exception:
+            # Application errors leave the session usable once transaction() has rolled back
+            raise
+        except BaseException:
+            # Cancelled, possibly mid-query: the connection state is unknown, do not reuse it
+            conn.close()
+            raise
+        finally:
+            self.pool.release(conn)
+
+    def wrap(self, cursor):
+        return InstrumentedAsyncCursor(cursor, self.observer) if self.observer is not None else cursor
+
+    @asynccontextmanager
+    async def cursor(self, cursorclass=None):
+        async with self.connection() as conn:
+            cursor = await conn.cursor(cursorclass) if cursorclass else await conn.cursor()
+            try:
+                yield self.wrap(cursor)
+            except Exception:
+                if cursorclass is not None and issubclass(cursorclass, aiomysql.SSCursor):
+                    # Closing the cursor would read the rest of a streamed result: drop the connection
+                    conn.close()
+                raise
+            finally:
+                if not conn.closed:
+                    await cursor.close()
+
+    @asynccontextmanager
+    async def transaction(self):
+        # Commits when the block exits normally, rolls back on any exception
+        async with self.connection() as conn:
+            cursor = await conn.cursor()
+            await conn.begin()
+            try:
+                yield self.wrap(cursor)
+                await conn.commit()
+            except BaseException:
+                await conn.rollback()
+                raise
+            finally:
+                await cursor.close()
+
+    def stats(self):
+        if self.pool is None:
+            return {"size": 0, "in_use": 0, "idle": 0}
+        return {"size": self.pool.maxsize, "in_use": self.pool.size - self.pool.freesize, "idle": self.pool.freesize}
@@ -1,10 +1,35 @@
-from flask import Flask, request, jsonify
-from flask_mysqldb import MySQL
+import time
+# Cold-start timing begins before the dependencies are imported (see startup.py)
+IMPORT_STARTED = time.perf_counter()
+from flask import Flask, g, request, jsonify, Response
+import MySQLdb.cursors
 from datetime import datetime, timedelta
-from flask_bcrypt import Bcrypt
-from flask_jwt_extended import JWTManager, create_access_token, jwt_required, get_jwt_identity, get_jwt
+from flask_jwt_extended import (JWTManager, create_access_token, create_refresh_token, decode_token, get_jwt_identity, get_jwt,
+                                verify_jwt_in_request)
 from flask_cors import CORS
+import json
 import os
+import queue
+from admission import AdmissionControl, create_bucket_store, parse_limits, retry_after
+from archive import ORDER_TABLES, OrderArchiver, history_page, order_row
+from auth import TokenRevocations, role_required, current_role
+from bulk import EXPORTS, IMPORTERS, detect_format, export_rows, import_records, read_records, text_field
+from cache import create_cache, order_key, assigned_key
+from db import Database, PoolExhausted
+from dispatch import balance_assignments, apply_assignments
+from events import EventHub, create_broker, sse_format
+from hashing import PasswordHasher, HashingBusy
+from idempotency import MAX_KEY_LENGTH, IdempotencyConflict, IdempotencyKeys, request_hash
+from locations import LocationBuffer, parse_fix, latest_per_order, downsample_interval
+from metrics import Metrics
+from nearby import CourierPositions, utc_datetime
+from order_status import (ASSIGNED, CLOSED_STATUSES, COURIER_STATUSES, DELIVERED, FAILED, PENDING, InvalidTransition,
+                          assigned_status, check_transition, closed_at, record_changes, summarize)
+from responses import Compression, body_etag, etag, rows_payload, wants_columns
+from rollups import ROLLUP_TABLES, OrderRollups, day_of, hour_of, to_datetime
+from search import MIN_WORD_LENGTH, SEARCH_TARGETS, SearchQuery, build_search_query
+from startup import Startup
+from triage import RESOLVED, IssueQueue, NotClaimed, parse_head_starts
 
 app1 = Flask(__name__)
 
@@ -13,15 +38,383 @@ app1.config['MYSQL_USER'] = os.getenv('MYSQL_USER', 'root')
 app1.config['MYSQL_PASSWORD'] = os.getenv('MYSQL_PASSWORD', 'root')
 app1.config['MYSQL_DB'] = os.getenv('MYSQL_DB', 'courier1')
 app1.config['MYSQL_HOST'] = os.getenv('MYSQL_HOST', 'localhost')
-
-mysql = MySQL(app1)
-
-# Initialize Bcrypt, JWT, and CORS
-bcrypt = Bcrypt(app1)
+app1.config['MYSQL_PORT'] = int(os.getenv('MYSQL_PORT', '3306'))
+
+# Connection pool (see db.py)
+app1.config['DB_POOL_SIZE'] = int(os.getenv('DB_POOL_SIZE', '10'))
+app1.config['DB_POOL_TIMEOUT'] = float(os.getenv('DB_POOL_TIMEOUT', '5'))  # seconds to wait for a free connection
+app1.config['DB_POOL_RECYCLE'] = float(os.getenv('DB_POOL_RECYCLE', '3600'))  # reopen connections older than this
+app1.config['DB_POOL_PING_AFTER'] = float(os.getenv('DB_POOL_PING_AFTER', '30'))  # ping connections idle longer than this
+
+db = Database(app1)
+
+# Instrumentation: latency histograms served on /metrics (see metrics.py)
+app1.config['METRICS_TOKEN'] = os.getenv('METRICS_TOKEN', '')  # when set, /metrics requires 'Authorization: Bearer <token>'
+app1.config['SLOW_QUERY_MS'] = float(os.getenv('SLOW_QUERY_MS', '0'))  # log statements slower than this; 0 disables
+app1.config['PROFILE_HEADER_ENABLED'] = os.getenv('PROFILE_HEADER_ENABLED', '0') == '1'  # sample requests sent with X-Profile
+app1.config['PROFILE_SECRET'] = os.getenv('PROFILE_SECRET', '')  # when set, X-Profile must carry this value
+app1.config['PROFILE_DIR'] = os.getenv('PROFILE_DIR', 'profiles')
+metrics = Metrics(app1)
+db.observer = metrics.observe_query
+db.on_wait = metrics.observe_pool_wait
+
+# Response compression and conditional GETs on listings (see responses.py)
+app1.config['COMPRESS_MIN_SIZE'] = int(os.getenv('COMPRESS_MIN_SIZE', '1024'))  # bytes; smaller responses are sent as is
+app1.config['COMPRESS_LEVEL'] = int(os.getenv('COMPRESS_LEVEL', '6'))
+app1.config['ETAG_SETTLE_SECONDS'] = float(os.getenv('ETAG_SETTLE_SECONDS', '2'))  # pages changed more recently are hashed instead
+Compression(app1)
+
+# Password hashing runs in a process pool off the request thread (see hashing.py)
+app1.config['BCRYPT_LOG_ROUNDS'] = int(os.getenv('BCRYPT_LOG_ROUNDS', '12'))  # stored hashes with another cost are upgraded on login
+app1.config['HASH_EXECUTOR'] = os.getenv('HASH_EXECUTOR', 'process')  # 'process', 'thread' or 'inline'
+app1.config['HASH_WORKERS'] = int(os.getenv('HASH_WORKERS', '0')) or None  # default: one per CPU
+app1.config['HASH_MAX_PENDING'] = int(os.getenv('HASH_MAX_PENDING', '0')) or None  # default: 4 per worker
+app1.config['HASH_QUEUE_TIMEOUT'] = float(os.getenv('HASH_QUEUE_TIMEOUT', '2'))
+app1.config['VERIFIED_LOGIN_TTL'] = float(os.getenv('VERIFIED_LOGIN_TTL', '60'))  # 0 disables the verified-credential cache
+hasher = PasswordHasher(
+    rounds=app1.config['BCRYPT_LOG_ROUNDS'],
+    workers=app1.config['HASH_WORKERS'],
+    max_pending=app1.config['HASH_MAX_PENDING'],
+    queue_timeout=app1.config['HASH_QUEUE_TIMEOUT'],
+    executor=app1.config['HASH_EXECUTOR'],
+    verified_ttl=app1.config['VERIFIED_LOGIN_TTL']
+)
+
+# Initialize JWT and CORS
 app1.config['JWT_SECRET_KEY'] = os.getenv('JWT_SECRET_KEY', 'myapp123')  # Use a secure key in production
+app1.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=int(os.getenv('JWT_ACCESS_TOKEN_MINUTES', '15')))
+app1.config['JWT_REFRESH_TOKEN_EXPIRES'] = timedelta(hours=int(os.getenv('JWT_REFRESH_TOKEN_HOURS', '12')))
 jwt = JWTManager(app1)
 CORS(app1)  # Restrict origins in production
 
+# Revoked tokens and deleted users are checked in memory; workers sync from token_revocations (see auth.py)
+app1.config['REVOCATION_SYNC_INTERVAL'] = float(os.getenv('REVOCATION_SYNC_INTERVAL', '1'))  # seconds for a revocation to reach other workers
+revocations = TokenRevocations(
+    db,
+    sync_interval=app1.config['REVOCATION_SYNC_INTERVAL'],
+    retention=app1.config['JWT_REFRESH_TOKEN_EXPIRES'].total_seconds()
+)
+
+# Delivery analytics rollups, folded from order_events (see rollups.py)
+app1.config['ROLLUP_INTERVAL'] = float(os.getenv('ROLLUP_INTERVAL', '60'))  # seconds between folds; 0 leaves it to `python rollups.py fold`
+app1.config['ROLLUP_BATCH_SIZE'] = int(os.getenv('ROLLUP_BATCH_SIZE', '5000'))
+app1.config['ROLLUP_SETTLE_SECONDS'] = float(os.getenv('ROLLUP_SETTLE_SECONDS', '5'))
+app1.config['ROLLUP_GAP_SECONDS'] = float(os.getenv('ROLLUP_GAP_SECONDS', '300'))  # how long a missing event_id holds the fold back before it counts as a rollback
+app1.config['ANALYTICS_MAX_HOURLY_DAYS'] = int(os.getenv('ANALYTICS_MAX_HOURLY_DAYS', '31'))  # longest range served hour by hour
+rollups = OrderRollups(
+    db,
+    interval=app1.config['ROLLUP_INTERVAL'],
+    batch_size=app1.config['ROLLUP_BATCH_SIZE'],
+    settle=app1.config['ROLLUP_SETTLE_SECONDS'],
+    gap_seconds=app1.config['ROLLUP_GAP_SECONDS']
+)
+
+
+@jwt.token_in_blocklist_loader
+def check_if_token_revoked(jwt_header, jwt_payload):
+    return revocations.is_revoked(jwt_payload)
+
+
+@app1.errorhandler(PoolExhausted)
+def handle_pool_exhausted(e):
+    return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
+
+
+@app1.errorhandler(HashingBusy)
+def handle_hashing_busy(e):
+    return jsonify({"error": str(e)}), 503, {'Retry-After': '1'}
+
+# Admission control: per-route token buckets and a cap on requests in flight (see admission.py)
+# RATE_LIMITS: "route=scope:count/seconds[:burst],...;..." with scope identity (JWT user), role or ip;
+# a route listed here is not also counted against 'default'. Set it to '' to turn rate limiting off.
+DEFAULT_RATE_LIMITS = ';'.join([
+    "/login=ip:20/60s:10",
+    "/signup=ip:10/60s",
+    "/customer/track-order/<int:order_id>=identity:5/1s:20",
+    "/delivery/update-location=identity:5/1s:20",
+    "/delivery/update-location/bulk=identity:2/1s:10",
+    "/admin/import/<string:entity>=identity:1/10s:2",
+    "default=identity:50/1s:100,ip:200/1s:400",
+])
+app1.config['RATE_LIMITS'] = os.getenv('RATE_LIMITS', DEFAULT_RATE_LIMITS)
+app1.config['RATE_LIMIT_URL'] = os.getenv('RATE_LIMIT_URL', 'local')  # 'sqlite:///path' shares the buckets across workers
+app1.config['ADMISSION_MAX_CONCURRENT'] = int(os.getenv('ADMISSION_MAX_CONCURRENT', '0'))  # requests in flight per worker; 0: no cap
+app1.config['ADMISSION_MAX_QUEUE'] = int(os.getenv('ADMISSION_MAX_QUEUE', '32'))  # requests waiting for a slot before shedding
+app1.config['ADMISSION_QUEUE_TIMEOUT'] = float(os.getenv('ADMISSION_QUEUE_TIMEOUT', '0.5'))
+admission = AdmissionControl(
+    create_bucket_store(app1.config['RATE_LIMIT_URL']),
+    parse_limits(app1.config['RATE_LIMITS']),
+    max_concurrent=app1.config['ADMISSION_MAX_CONCURRENT'],
+    max_queue=app1.config['ADMISSION_MAX_QUEUE'],
+    queue_timeout=app1.config['ADMISSION_QUEUE_TIMEOUT']
+)
+throttled_requests = metrics.counter('courier_requests_throttled_total', 'Requests rejected with 429 by a rate limit',
+                                     ('route', 'scope'))
+shed_requests = metrics.counter('courier_requests_shed_total', 'Requests shed with 503 by the concurrency cap',
+                                ('route', 'reason'))
+# Scrapes and health probes must get through when the service is overloaded
+ADMISSION_EXEMPT = {'/metrics', '/health', '/ready'}
+
+
+def check_rate_limits(route, identity, role, ip):
+    # -> Retry-After value when a limit is exceeded, else None (asgi.py shares this)
+    throttled = admission.check(route, identity, role, ip)
+    if throttled is None:
+        return None
+    scope, wait = throttled
+    throttled_requests.inc((route, scope))
+    return retry_after(wait)
+
+
+@app1.before_request
+def admit_request():
+    route = request.url_rule.rule if request.url_rule else None
+    if route is None or route in ADMISSION_EXEMPT or request.method == 'OPTIONS':
+        return None
+    claims = {}
+    try:
+        verify_jwt_in_request(optional=True)
+        claims = get_jwt()
+    except Exception:
+        pass  # the route's own check rejects the token; until then only the ip limits apply
+    wait = check_rate_limits(route, claims.get('sub'), claims.get('role'), request.remote_addr)
+    if wait is not None:
+        return jsonify({"error": "Too many requests"}), 429, {'Retry-After': wait}
+    reason = admission.admit()
+    if reason is not None:
+        shed_requests.inc((route, reason))
+        return jsonify({"error": "Server busy, please retry"}), 503, {'Retry-After': '1'}
+    g.admitted = True
+    return None
+
+
+@app1.teardown_request
+def release_admission(exc=None):
+    # Runs when the view returns, so streamed responses (SSE, NDJSON) do not hold a slot while they stream
+    if g.pop('admitted', False):
+        admission.release()
+
+# Order tracking push channel ('local' or 'sqlite:///path' to share events across workers)
+app1.config['EVENT_BROKER_URL'] = os.getenv('EVENT_BROKER_URL', 'local')
+app1.config['SSE_KEEPALIVE_SECONDS'] = int(os.getenv('SSE_KEEPALIVE_SECONDS', '15'))
+order_events = EventHub(create_broker(app1.config['EVENT_BROKER_URL']))
+
+# Read-through cache for track-order / assigned-orders ('local' or 'sqlite:///path' to share across workers)
+app1.config['CACHE_URL'] = os.getenv('CACHE_URL', 'local')
+app1.config['CACHE_TTL'] = float(os.getenv('CACHE_TTL', '30'))
+app1.config['CACHE_MAX_ENTRIES'] = int(os.getenv('CACHE_MAX_ENTRIES', '10000'))
+order_cache = create_cache(app1.config['CACHE_URL'], app1.config['CACHE_TTL'], app1.config['CACHE_MAX_ENTRIES'])
+
+
+def invalidate_orders(order_ids=(), delivery_person_ids=()):
+    # Call after the write has committed
+    keys = [order_key(o) for o in order_ids] + [assigned_key(d) for d in delivery_person_ids if d is not None]
+    if keys:
+        order_cache.delete(*keys)
+
+# Closed orders older than ARCHIVE_AFTER_DAYS move from orders to orders_archive (see archive.py)
+app1.config['ARCHIVE_AFTER_DAYS'] = int(os.getenv('ARCHIVE_AFTER_DAYS', '90'))
+app1.config['ARCHIVE_INTERVAL'] = float(os.getenv('ARCHIVE_INTERVAL', '300'))  # seconds between runs; 0 leaves it to `python archive.py run`
+app1.config['ARCHIVE_BATCH_SIZE'] = int(os.getenv('ARCHIVE_BATCH_SIZE', '500'))  # orders moved per transaction
+app1.config['ARCHIVE_PAUSE_SECONDS'] = float(os.getenv('ARCHIVE_PAUSE_SECONDS', '0.5'))  # between batches
+
+
+def archived_orders(moved):
+    # Archived orders drop out of their courier's assigned-orders list
+    invalidate_orders([order_id for order_id, _ in moved], {courier for _, courier in moved})
+
+
+archiver = OrderArchiver(
+    db,
+    after_days=app1.config['ARCHIVE_AFTER_DAYS'],
+    interval=app1.config['ARCHIVE_INTERVAL'],
+    batch_size=app1.config['ARCHIVE_BATCH_SIZE'],
+    pause=app1.config['ARCHIVE_PAUSE_SECONDS'],
+    on_batch=archived_orders
+)
+
+# Courier location ingestion: fixes are buffered and written to order_locations in batches
+app1.config['LOCATION_FLUSH_SIZE'] = int(os.getenv('LOCATION_FLUSH_SIZE', '500'))
+app1.config['LOCATION_FLUSH_INTERVAL'] = float(os.getenv('LOCATION_FLUSH_INTERVAL', '1.0'))
+app1.config['LOCATION_FLUSH_ATTEMPTS'] = int(os.getenv('LOCATION_FLUSH_ATTEMPTS', '5'))  # flushes before a fix is dropped
+app1.config['LOCATION_MAX_CLOCK_SKEW'] = int(os.getenv('LOCATION_MAX_CLOCK_SKEW', '60'))  # seconds; fixes stamped later are rejected
+app1.config['LOCATION_MAX_FIXES_PER_REQUEST'] = int(os.getenv('LOCATION_MAX_FIXES_PER_REQUEST', '1000'))
+app1.config['LOCATION_MAX_TRAIL_POINTS'] = int(os.getenv('LOCATION_MAX_TRAIL_POINTS', '5000'))
+
+# Latest courier positions for nearest-courier queries, indexed in memory (see nearby.py)
+app1.config['COURIER_ACTIVE_SECONDS'] = float(os.getenv('COURIER_ACTIVE_SECONDS', '600'))  # couriers silent for longer are left out
+app1.config['COURIER_SYNC_INTERVAL'] = float(os.getenv('COURIER_SYNC_INTERVAL', '1'))  # seconds for a position to reach other workers
+app1.config['COURIER_CELL_DEGREES'] = float(os.getenv('COURIER_CELL_DEGREES', '0.01'))  # grid cell size, about 1 km
+app1.config['NEARBY_MAX_RESULTS'] = int(os.getenv('NEARBY_MAX_RESULTS', '100'))
+courier_positions = CourierPositions(
+    db,
+    active_seconds=app1.config['COURIER_ACTIVE_SECONDS'],
+    sync_interval=app1.config['COURIER_SYNC_INTERVAL'],
+    cell_degrees=app1.config['COURIER_CELL_DEGREES']
+)
+
+
+def write_location_batch(batch):
+    # Runs on the buffer's flush thread: one multi-row INSERT plus one UPDATE of the latest positions
+    # per order, and one upsert of the latest position per courier
+    latest = latest_per_order(batch)
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO order_locations (order_id, delivery_person_id, latitude, longitude, location, recorded_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            [(f['order_id'], f['delivery_person_id'], f['lat'], f['lon'], f['location'], f['recorded_at'])
+             for f in batch]
+        )
+        # A fix flushed late must not replace a newer location, e.g. one update_order_location wrote directly
+        cursor.execute(
+            f"SELECT order_id, location_recorded_at FROM orders WHERE order_id IN ({', '.join(['%s'] * len(latest))}) "
+            "FOR UPDATE",
+            list(latest)
+        )
+        stored = dict(cursor.fetchall())
+        latest = {order_id: fix for order_id, fix in latest.items() if order_id in stored
+                  and (stored[order_id] is None or to_datetime(stored[order_id]) <= fix['recorded_at'])}
+        if latest:
+            order_ids = list(latest)
+            cases = " ".join(["WHEN %s THEN %s"] * len(order_ids))
+            locations = [value for order_id in order_ids for value in (order_id, latest[order_id]['location'])]
+            stamps = [value for order_id in order_ids for value in (order_id, latest[order_id]['recorded_at'])]
+            cursor.execute(
+                f"UPDATE orders SET location = CASE order_id {cases} END, location_recorded_at = CASE order_id {cases} END "
+                f"WHERE order_id IN ({', '.join(['%s'] * len(order_ids))})",
+                locations + stamps + order_ids
+            )
+        courier_positions.record(cursor, batch)
+    invalidate_orders(latest)
+    for order_id, fix in latest.items():
+        if fix.get('published'):
+            continue
+        order_events.publish(order_id, {"type": "location", "order_id": order_id, "location": fix['location'],
+                                        "lat": fix['lat'], "lon": fix['lon']})
+
+
+location_buffer = LocationBuffer(
+    write_location_batch,
+    max_size=app1.config['LOCATION_FLUSH_SIZE'],
+    max_delay=app1.config['LOCATION_FLUSH_INTERVAL'],
+    max_attempts=app1.config['LOCATION_FLUSH_ATTEMPTS'],
+    # Fixes that can never be written, e.g. for a courier deleted since; dropped one by one
+    reject_errors=(MySQLdb.IntegrityError, MySQLdb.DataError)
+)
+
+# Admin listing pagination
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+STREAM_BATCH_SIZE = 1000
+
+
+def parse_datetime(value):
+    return datetime.fromisoformat(value)
+
+
+def wants_stream():
+    return (request.args.get('format') == 'ndjson'
+            or 'application/x-ndjson' in request.headers.get('Accept', ''))
+
+
+def build_listing_query(columns, table, key, filters, cursor_arg='after', args=None):
+    # filters: list of (query arg, column, operator, converter); raises ValueError on bad input
+    # args defaults to request.args (asgi.py passes its own)
+    args = request.args if args is None else args
+    clauses, params = [], []
+    after = args.get(cursor_arg)
+    if after:
+        clauses.append(f"{key} > %s")
+        params.append(int(after))
+    for arg, column, op, convert in filters:
+        value = args.get(arg)
+        if value is None or value == '':
+            continue
+        clauses.append(f"{column} {op} %s")
+        params.append(convert(value))
+    sql = f"SELECT {', '.join(columns)} FROM {table}"
+    if clauses:
+        sql += " WHERE " + " AND ".join(clauses)
+    sql += f" ORDER BY {key}"
+    return sql, params
+
+
+def page_limit(args):
+    limit = args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    return max(1, min(limit, MAX_PAGE_SIZE))
+
+
+def fetch_page(sql, params, fields, key):
+    # Keyset page: returns (rows as objects or columns, cursor for the next page or None)
+    limit = page_limit(request.args)
+    with db.cursor() as cursor:
+        cursor.execute(sql + " LIMIT %s", params + [limit])
+        rows = cursor.fetchall()
+    next_cursor = rows[-1][fields.index(key)] if len(rows) == limit else None
+    return rows_payload(fields, rows, wants_columns(request.args)), next_cursor
+
+
+def rows_etag(sql, params, key):
+    # Validator for the rows `sql` selects (columns: key, updated_at) without reading them:
+    # their count, key sum and last update. None when a row changed too recently, since
+    # updated_at has one-second resolution and a second change in that second would go unseen.
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT COUNT(*), SUM({key}), MAX(updated_at), CURRENT_TIMESTAMP FROM ({sql}) AS page", params)
+        count, key_sum, updated, now = cursor.fetchone()
+    if updated is not None and (to_datetime(now) - to_datetime(updated)).total_seconds() < app1.config['ETAG_SETTLE_SECONDS']:
+        return None
+    return etag(request.full_path, get_jwt_identity(), count, key_sum, updated)
+
+
+def page_etag(table, key, filters):
+    # rows_etag for the keyset page the request asks for; only worth a query when the client has a tag
+    if not request.if_none_match:
+        return None
+    sql, params = build_listing_query([key, "updated_at"], table, key, filters)
+    return rows_etag(sql + " LIMIT %s", params + [page_limit(request.args)], key)
+
+
+def not_modified(tag):
+    return tag is not None and request.if_none_match.contains_weak(tag)
+
+
+def listing_response(payload, tag=None):
+    # 200 with a strong ETag (the validator, or a hash of the body), or 304 if the client has it
+    response = app1.json.response(payload)
+    response.set_etag(tag or body_etag(response.get_data()))
+    response.headers['Cache-Control'] = 'private, no-cache'
+    return response.make_conditional(request)
+
+
+def cached_listing(orders):
+    # Cached order lists are stored as objects
+    if wants_columns(request.args):
+        return rows_payload(ORDER_FIELDS, [[order[field] for field in ORDER_FIELDS] for order in orders], True)
+    return orders
+
+
+def stream_rows(queries):
+    # queries: list of (sql, params, fields, extra fields merged into every row)
+    # Rows are read through a server-side cursor and written out as NDJSON
+    limit = request.args.get('limit', type=int)
+
+    def generate():
+        for sql, params, fields, extra in queries:
+            if limit:
+                sql, params = sql + " LIMIT %s", params + [limit]
+            # The pooled connection is held only while this generator is being consumed
+            with db.cursor(MySQLdb.cursors.SSCursor) as cursor:
+                cursor.execute(sql, params)
+                while True:
+                    rows = cursor.fetchmany(STREAM_BATCH_SIZE)
+                    if not rows:
+                        break
+                    yield ''.join(
+                        json.dumps({**extra, **dict(zip(fields, row))}, default=str) + '\n' for row in rows
+                    )
+
+    return Response(generate(), mimetype='application/x-ndjson')
+
 # Temporary endpoint to create a default admin (remove after use)
 @app1.route('/setup-admin', methods=['POST'])
 def setup_admin():
@@ -38,35 +431,36 @@ def setup_admin():
         if not username or not password:
             return jsonify({"error": "Username and password are required"}), 400
 
-        cursor = mysql.connection.cursor()
-
         # Check if admin already exists
-        cursor.execute("SELECT username FROM admins WHERE username = %s", (username,))
-        if cursor.fetchone():
-            cursor.close()
-            return jsonify({"error": "Admin already exists"}), 409
+        with db.cursor() as cursor:
+            cursor.execute("SELECT username FROM admins WHERE username = %s", (username,))
+            if cursor.fetchone():
+                return jsonify({"error": "Admin already exists"}), 409
 
-        # Hash the password using Flask-Bcrypt
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        # Hash the password in the hashing pool (outside the connection checkout)
+        hashed_password = hasher.hash(password)
 
         # Insert admin
-        cursor.execute(
-            "INSERT INTO admins (username, password, created_at) VALUES (%s, %s, NOW())",
-            (username, hashed_password)
-        )
-        mysql.connection.commit()
-        cursor.close()
+        with db.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO admins (username, password, created_at) VALUES (%s, %s, NOW())",
+                (username, hashed_password)
+            )
 
         return jsonify({"message": f"Admin '{username}' created successfully"}), 201
 
+    except (HashingBusy, PoolExhausted):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 # Unified login route for all users
-from flask import request, jsonify
-from flask_jwt_extended import create_access_token
-from datetime import timedelta
+PASSWORD_TABLES = {
+    'customer': ('customers', 'customer_id'),
+    'delivery_person': ('delivery_persons', 'delivery_person_id'),
+    'admin': ('admins', 'id'),
+}
 
 @app1.route('/login', methods=['POST'])
 def login():
@@ -82,56 +476,96 @@ def login():
         if role not in ['customer', 'delivery_person', 'admin']:
             return jsonify({"error": "Invalid role specified"}), 400
 
-        cursor = mysql.connection.cursor()
-
         user = None
         user_id = None
         stored_password = None
 
-        if role == 'customer':
-            cursor.execute("SELECT customer_id, email, password FROM customers WHERE email = %s", (email,))
-            user = cursor.fetchone()
-            if user:
-                user_id, user_email, stored_password = user
-
-        elif role == 'delivery_person':
-            cursor.execute("SELECT delivery_person_id, email, password FROM delivery_persons WHERE email = %s", (email,))
-            user = cursor.fetchone()
-            if user:
-                user_id, user_email, stored_password = user
-
-        elif role == 'admin':
-            cursor.execute("SELECT id, username, password FROM admins WHERE username = %s", (email,))
-            user = cursor.fetchone()
-            if user:
-                user_id, username, stored_password = user
-
-        cursor.close()
+        with db.cursor() as cursor:
+            if role == 'customer':
+                cursor.execute("SELECT customer_id, email, password FROM customers WHERE email = %s", (email,))
+                user = cursor.fetchone()
+                if user:
+                    user_id, user_email, stored_password = user
+
+            elif role == 'delivery_person':
+                cursor.execute("SELECT delivery_person_id, email, password FROM delivery_persons WHERE email = %s", (email,))
+                user = cursor.fetchone()
+                if user:
+                    user_id, user_email, stored_password = user
+
+            elif role == 'admin':
+                cursor.execute("SELECT id, username, password FROM admins WHERE username = %s", (email,))
+                user = cursor.fetchone()
+                if user:
+                    user_id, username, stored_password = user
 
         if not user:
             return jsonify({"error": "Invalid credentials"}), 401
 
-        if not bcrypt.check_password_hash(stored_password, password):
+        if not hasher.verify(stored_password, password):
             return jsonify({"error": "Invalid credentials"}), 401
 
-        # Create JWT token with user_id and role
-        token = create_access_token(
-            identity=str(user_id),
-            additional_claims={'role': role},
-            expires_delta=timedelta(hours=1)
-        )
+        # Transparently upgrade hashes made with an outdated work factor
+        if hasher.needs_rehash(stored_password):
+            table, key = PASSWORD_TABLES[role]
+            new_hash = hasher.hash(password)
+            with db.transaction() as cursor:
+                cursor.execute(
+                    f"UPDATE {table} SET password = %s WHERE {key} = %s AND password = %s",
+                    (new_hash, user_id, stored_password)
+                )
+            hasher.incr("rehashed")
+
+        # Create a short-lived access token and a refresh token with user_id and role
+        token = create_access_token(identity=str(user_id), additional_claims={'role': role})
+        refresh_token = create_refresh_token(identity=str(user_id), additional_claims={'role': role})
 
         return jsonify({
             "message": "Login successful",
             "token": token,
+            "refresh_token": refresh_token,
+            "expires_in": int(app1.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()),
             "role": role,
             "id": user_id
         }), 200
 
+    except (HashingBusy, PoolExhausted):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
+# Exchange a refresh token for a new access token
+@app1.route('/refresh', methods=['POST'])
+@role_required(refresh=True)
+def refresh():
+    token = create_access_token(identity=get_jwt_identity(), additional_claims={'role': current_role()})
+    return jsonify({
+        "token": token,
+        "expires_in": int(app1.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds())
+    }), 200
+
+# Revoke the current access token, and the refresh token if one is sent as {"refresh_token": ...}
+@app1.route('/logout', methods=['POST'])
+@role_required()
+def logout():
+    claims = get_jwt()
+    refresh_token = (request.get_json(silent=True) or {}).get('refresh_token')
+    refresh_claims = None
+    if refresh_token:
+        try:
+            refresh_claims = decode_token(refresh_token)
+        except Exception:
+            return jsonify({"error": "Invalid refresh token"}), 400
+        if refresh_claims.get('sub') != claims.get('sub') or refresh_claims.get('type') != 'refresh':
+            return jsonify({"error": "Invalid refresh token"}), 400
+    with db.transaction() as cursor:
+        revocations.revoke_token(claims, cursor)
+        if refresh_claims:
+            revocations.revoke_token(refresh_claims, cursor)
+    return jsonify({"message": "Logged out"}), 200
+
+
 # Customer signup (public, for signup button)
 @app1.route('/signup', methods=['POST'])
 def signup():
@@ -146,43 +580,35 @@ def signup():
         if not all([name, phone, email, address, password]):
             return jsonify({"error": "Missing required fields"}), 400
 
-        cursor = mysql.connection.cursor()
-
         # Check if email already exists
-        cursor.execute("SELECT email FROM customers WHERE email = %s", (email,))
-        if cursor.fetchone():
-            cursor.close()
-            return jsonify({"error": "Email already registered"}), 409
+        with db.cursor() as cursor:
+            cursor.execute("SELECT email FROM customers WHERE email = %s", (email,))
+            if cursor.fetchone():
+                return jsonify({"error": "Email already registered"}), 409
 
-        # Hash the password using Flask-Bcrypt
-        hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+        # Hash the password in the hashing pool
+        hashed_password = hasher.hash(password)
 
         # Insert new customer
-        cursor.execute(
-            "INSERT INTO customers (name, phone, email, address, password) VALUES (%s, %s, %s, %s, %s)",
-            (name, phone, email, address, hashed_password)
-        )
-        mysql.connection.commit()
-        cursor.close()
+        with db.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO customers (name, phone, email, address, password) VALUES (%s, %s, %s, %s, %s)",
+                (name, phone, email, address, hashed_password)
+            )
 
         return jsonify({"message": "Customer registered successfully"}), 201
 
+    except (HashingBusy, PoolExhausted):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 
 # Admin and Delivery Person registration (restricted)
 @app1.route('/register', methods=['POST'])
-@jwt_required()
+@role_required('admin')
 def register():
     try:
-        current_user_id = get_jwt_identity()
-        claims = get_jwt()
-        role = claims.get('role')
-
-        if role != 'admin':
-            return jsonify({"error": "Admin access required"}), 403
-
         data = request.json
         name = data.get('name')
         email = data.get('email')
@@ -195,103 +621,348 @@ def register():
         if new_role not in ['admin', 'delivery_person']:
             return jsonify({"error": "Invalid role specified"}), 400
 
-        cursor = mysql.connection.cursor()
-
         if new_role == 'admin':
-            cursor.execute("SELECT username FROM admins WHERE username = %s", (email,))
-            if cursor.fetchone():
-                cursor.close()
-                return jsonify({"error": "Email already registered"}), 409
+            with db.cursor() as cursor:
+                cursor.execute("SELECT username FROM admins WHERE username = %s", (email,))
+                if cursor.fetchone():
+                    return jsonify({"error": "Email already registered"}), 409
 
-            hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+            hashed_password = hasher.hash(password)
 
-            cursor.execute(
-                "INSERT INTO admins (username, password) VALUES (%s, %s)",
-                (email, hashed_password)
-            )
+            with db.transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO admins (username, password) VALUES (%s, %s)",
+                    (email, hashed_password)
+                )
 
         else:  # delivery_person
-            cursor.execute("SELECT email FROM delivery_persons WHERE email = %s", (email,))
-            if cursor.fetchone():
-                cursor.close()
-                return jsonify({"error": "Email already registered"}), 409
-
-            hashed_password = bcrypt.generate_password_hash(password).decode('utf-8')
+            with db.cursor() as cursor:
+                cursor.execute("SELECT email FROM delivery_persons WHERE email = %s", (email,))
+                if cursor.fetchone():
+                    return jsonify({"error": "Email already registered"}), 409
 
-            cursor.execute(
-                "INSERT INTO delivery_persons (name, email, password) VALUES (%s, %s, %s)",
-                (name, email, hashed_password)
-            )
+            hashed_password = hasher.hash(password)
 
-        mysql.connection.commit()
-        cursor.close()
+            with db.transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO delivery_persons (name, email, password) VALUES (%s, %s, %s)",
+                    (name, email, hashed_password)
+                )
 
         return jsonify({"message": f"{new_role.capitalize()} registered successfully"}), 201
 
+    except (HashingBusy, PoolExhausted):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
 # Admin: View all users
+# Query params: limit, customers_after, delivery_persons_after, type (customer|delivery_person), format=ndjson
+CUSTOMER_FIELDS = ["customer_id", "name", "phone", "email", "address"]
+DELIVERY_PERSON_FIELDS = ["delivery_person_id", "name", "email"]
+
 @app1.route('/admin/users', methods=['GET'])
-@jwt_required()
+@role_required('admin')
 def view_users():
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT customer_id, name, phone, email, address FROM customers")
-    customers = cursor.fetchall()
-    cursor.execute("SELECT delivery_person_id, name, email FROM delivery_persons")
-    delivery_persons = cursor.fetchall()
-    cursor.close()
-    return jsonify({
-        "customers": [{"customer_id": c[0], "name": c[1], "phone": c[2], "email": c[3], "address": c[4]} for c in customers],
-        "delivery_persons": [{"delivery_person_id": d[0], "name": d[1], "email": d[2]} for d in delivery_persons]
-    }), 200
+    user_type = request.args.get('type')
+    if user_type not in (None, 'customer', 'delivery_person'):
+        return jsonify({"error": "Invalid user type"}), 400
+    try:
+        customers_query = build_listing_query(CUSTOMER_FIELDS, "customers", "customer_id", [], 'customers_after')
+        delivery_query = build_listing_query(DELIVERY_PERSON_FIELDS, "delivery_persons", "delivery_person_id", [],
+                                             'delivery_persons_after')
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}), 400
+
+    if wants_stream():
+        queries = []
+        if user_type in (None, 'customer'):
+            queries.append((*customers_query, CUSTOMER_FIELDS, {"user_type": "customer"}))
+        if user_type in (None, 'delivery_person'):
+            queries.append((*delivery_query, DELIVERY_PERSON_FIELDS, {"user_type": "delivery_person"}))
+        return stream_rows(queries)
+
+    result = {}
+    if user_type in (None, 'customer'):
+        result["customers"], result["customers_next_cursor"] = fetch_page(
+            *customers_query, CUSTOMER_FIELDS, "customer_id")
+    if user_type in (None, 'delivery_person'):
+        result["delivery_persons"], result["delivery_persons_next_cursor"] = fetch_page(
+            *delivery_query, DELIVERY_PERSON_FIELDS, "delivery_person_id")
+    return listing_response(result)
 
 # Admin: View all orders
+# Query params: limit, after, status, assigned_to, customer_id, created_from, created_to, format=ndjson,
+# shape=columns ({"fields": [...], "rows": [[...]]} instead of one object per row)
+ORDER_FIELDS = ["order_id", "customer_id", "assigned_to", "status"]
+ORDER_FILTERS = [
+    ('status', 'status', '=', str),
+    ('assigned_to', 'assigned_to', '=', int),
+    ('customer_id', 'customer_id', '=', int),
+    ('created_from', 'created_at', '>=', parse_datetime),
+    ('created_to', 'created_at', '<', parse_datetime),
+]
+
 @app1.route('/admin/orders', methods=['GET'])
-@jwt_required()
+@role_required('admin')
 def view_all_orders():
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT order_id, customer_id, assigned_to, status FROM orders")
-    orders = cursor.fetchall()
-    cursor.close()
+    try:
+        sql, params = build_listing_query(ORDER_FIELDS, "orders", "order_id", ORDER_FILTERS)
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    if wants_stream():
+        return stream_rows([(sql, params, ORDER_FIELDS, {})])
+    tag = page_etag("orders", "order_id", ORDER_FILTERS)
+    if not_modified(tag):
+        return listing_response(None, tag)
+    orders, next_cursor = fetch_page(sql, params, ORDER_FIELDS, "order_id")
+    return listing_response({
+        "orders": orders,
+        "next_cursor": next_cursor
+    }, tag)
+
+
+def analytics_range(default_days):
+    # from/to: ISO datetimes (UTC); raises ValueError
+    end = parse_datetime(request.args['to']) if request.args.get('to') else datetime.utcnow()
+    start = parse_datetime(request.args['from']) if request.args.get('from') else end - timedelta(days=default_days)
+    if start >= end:
+        raise ValueError("from must be before to")
+    return start, end
+
+
+def isoformat(value):
+    return value.isoformat() if hasattr(value, 'isoformat') else str(value)
+
+
+def average_seconds(total, count):
+    return round(total / count, 1) if count else None
+
+# Admin: Delivery analytics, read from the rollup tables only (never from orders)
+# Orders entering each status per bucket and courier, with the average assignment-to-delivery time
+# Query params: granularity=hour|day, from, to, delivery_person_id, status
+@app1.route('/admin/analytics/orders', methods=['GET'])
+@role_required('admin')
+def analytics_orders():
+    granularity = request.args.get('granularity', 'day')
+    if granularity not in ROLLUP_TABLES:
+        return jsonify({"error": "granularity must be hour or day"}), 400
+    try:
+        start, end = analytics_range(1 if granularity == 'hour' else 30)
+        delivery_person_id = request.args.get('delivery_person_id', type=int)
+    except ValueError:
+        return jsonify({"error": "Invalid from/to value"}), 400
+    if granularity == 'hour' and end - start > timedelta(days=app1.config['ANALYTICS_MAX_HOURLY_DAYS']):
+        return jsonify({"error": f"Hourly ranges are limited to {app1.config['ANALYTICS_MAX_HOURLY_DAYS']} days"}), 400
+
+    sql = (f"SELECT bucket_start, delivery_person_id, status, transitions, timed_deliveries, delivery_seconds "
+           f"FROM {ROLLUP_TABLES[granularity]} WHERE bucket_start >= %s AND bucket_start < %s")
+    params = [hour_of(start) if granularity == 'hour' else day_of(start), end]
+    if delivery_person_id is not None:
+        sql += " AND delivery_person_id = %s"
+        params.append(delivery_person_id)
+    if request.args.get('status'):
+        sql += " AND status = %s"
+        params.append(request.args['status'])
+    with db.cursor() as cursor:
+        cursor.execute(sql + " ORDER BY bucket_start, delivery_person_id, status", params)
+        rows = cursor.fetchall()
     return jsonify({
-        "orders": [{"order_id": o[0], "customer_id": o[1], "assigned_to": o[2], "status": o[3]} for o in orders]
+        "granularity": granularity,
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "buckets": [{"bucket_start": isoformat(bucket), "delivery_person_id": courier, "status": status,
+                     "transitions": transitions, "avg_delivery_seconds": average_seconds(seconds, timed)}
+                    for bucket, courier, status, transitions, timed, seconds in rows]
     }), 200
 
+# Per-courier throughput and average assignment-to-delivery time over a range of days
+# Query params: from, to
+@app1.route('/admin/analytics/couriers', methods=['GET'])
+@role_required('admin')
+def analytics_couriers():
+    try:
+        start, end = analytics_range(30)
+    except ValueError:
+        return jsonify({"error": "Invalid from/to value"}), 400
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT delivery_person_id, status, SUM(transitions), SUM(timed_deliveries), SUM(delivery_seconds) "
+            "FROM order_rollups_daily WHERE bucket_start >= %s AND bucket_start < %s AND delivery_person_id <> 0 "
+            "GROUP BY delivery_person_id, status",
+            (day_of(start), end)
+        )
+        rows = cursor.fetchall()
+    couriers = {}
+    for courier, status, transitions, timed, seconds in rows:
+        entry = couriers.setdefault(courier, {"delivery_person_id": courier, "transitions": {}, "timed": 0, "seconds": 0})
+        entry["transitions"][status] = int(transitions)
+        entry["timed"] += int(timed)
+        entry["seconds"] += int(seconds)
+    result = []
+    for entry in couriers.values():
+        result.append({
+            "delivery_person_id": entry["delivery_person_id"],
+            "delivered": entry["transitions"].get(DELIVERED, 0),
+            "failed": entry["transitions"].get(FAILED, 0),
+            "transitions": entry["transitions"],
+            "avg_delivery_seconds": average_seconds(entry["seconds"], entry["timed"])
+        })
+    result.sort(key=lambda c: (-c["delivered"], c["delivery_person_id"]))
+    return jsonify({"from": start.isoformat(), "to": end.isoformat(), "delivery_persons": result}), 200
+
+# Open orders per status, hour by hour
+# Query params: from, to, status
+@app1.route('/admin/analytics/backlog', methods=['GET'])
+@role_required('admin')
+def analytics_backlog():
+    try:
+        start, end = analytics_range(1)
+    except ValueError:
+        return jsonify({"error": "Invalid from/to value"}), 400
+    if end - start > timedelta(days=app1.config['ANALYTICS_MAX_HOURLY_DAYS']):
+        return jsonify({"error": f"Hourly ranges are limited to {app1.config['ANALYTICS_MAX_HOURLY_DAYS']} days"}), 400
+    sql = "SELECT bucket_start, status, open_orders FROM order_backlog_hourly WHERE bucket_start >= %s AND bucket_start < %s"
+    params = [hour_of(start), end]
+    if request.args.get('status'):
+        sql += " AND status = %s"
+        params.append(request.args['status'])
+    with db.cursor() as cursor:
+        cursor.execute(sql + " ORDER BY bucket_start, status", params)
+        rows = cursor.fetchall()
+    buckets = {}
+    for bucket, status, open_orders in rows:
+        buckets.setdefault(isoformat(bucket), {})[status] = open_orders
+    return jsonify({
+        "from": start.isoformat(),
+        "to": end.isoformat(),
+        "buckets": [{"bucket_start": bucket, "open_orders": counts, "total": sum(counts.values())}
+                    for bucket, counts in buckets.items()]
+    }), 200
+
+# Admin: Order counts by status and delivery person, read from the counters kept by order_status.py
+# Query params: delivery_person_id (only that courier's counts)
+@app1.route('/admin/order-summary', methods=['GET'])
+@role_required('admin')
+def order_summary():
+    delivery_person_id = request.args.get('delivery_person_id', type=int)
+    with db.cursor() as cursor:
+        if delivery_person_id is not None:
+            cursor.execute(
+                "SELECT status, delivery_person_id, order_count FROM order_status_counts WHERE delivery_person_id = %s",
+                (delivery_person_id,)
+            )
+        else:
+            cursor.execute("SELECT status, delivery_person_id, order_count FROM order_status_counts")  # advisor: full-scan-ok
+        rows = cursor.fetchall()
+    return jsonify(summarize(rows)), 200
+
+# Admin: Status and courier history of an order
+@app1.route('/admin/orders/<int:order_id>/events', methods=['GET'])
+@role_required('admin')
+def order_event_log(order_id):
+    with db.cursor() as cursor:
+        cursor.execute(
+            "SELECT event_id, from_status, to_status, delivery_person_id, actor_type, actor_id, created_at "
+            "FROM order_events WHERE order_id = %s ORDER BY event_id",
+            (order_id,)
+        )
+        rows = cursor.fetchall()
+    fields = ["event_id", "from_status", "to_status", "delivery_person_id", "actor_type", "actor_id", "created_at"]
+    return jsonify({"order_id": order_id, "events": [dict(zip(fields, row)) for row in rows]}), 200
+
+# Admin: Couriers nearest to a point, e.g. the pickup of an order about to be assigned
+# Query params: lat, lon, k (default 10), max_km, or radius_km for every courier within that distance
+# Only couriers that reported a position in the last COURIER_ACTIVE_SECONDS are considered
+@app1.route('/admin/couriers/nearby', methods=['GET'])
+@role_required('admin')
+def nearby_couriers():
+    started = time.perf_counter()
+    try:
+        lat, lon = float(request.args['lat']), float(request.args['lon'])
+        k = int(request.args.get('k', 10))
+        max_km = float(request.args['max_km']) if request.args.get('max_km') else None
+        radius_km = float(request.args['radius_km']) if request.args.get('radius_km') else None
+    except (KeyError, ValueError):
+        return jsonify({"error": "lat and lon are required; k, max_km and radius_km must be numbers"}), 400
+    if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+        return jsonify({"error": "Coordinates out of range"}), 400
+    k = max(1, min(k, app1.config['NEARBY_MAX_RESULTS']))
+    with db.cursor() as cursor:
+        # Couriers deleted through another worker stay in this one's index until they go stale;
+        # they are dropped here and the query runs once more to fill their places
+        for _ in range(2):
+            if radius_km is not None:
+                found = courier_positions.within(lat, lon, radius_km, limit=app1.config['NEARBY_MAX_RESULTS'])
+            else:
+                found = courier_positions.nearest(lat, lon, k, max_km)
+            if not found:
+                break
+            ids = [key for _, key, _, _, _ in found]
+            placeholders = ', '.join(['%s'] * len(ids))
+            cursor.execute(f"SELECT delivery_person_id, name FROM delivery_persons WHERE delivery_person_id IN ({placeholders})", ids)
+            names = dict(cursor.fetchall())
+            if len(names) == len(ids):
+                break
+            for courier in set(ids) - set(names):
+                courier_positions.remove(courier)
+        couriers = []
+        if found:
+            cursor.execute(
+                "SELECT delivery_person_id, SUM(order_count) FROM order_status_counts "
+                f"WHERE delivery_person_id IN ({placeholders}) "
+                f"AND status NOT IN ({', '.join(['%s'] * len(CLOSED_STATUSES))}) GROUP BY delivery_person_id",
+                ids + list(CLOSED_STATUSES)
+            )
+            loads = {courier: int(count) for courier, count in cursor.fetchall()}
+            couriers = [{"delivery_person_id": courier, "name": names[courier], "distance_km": round(km, 3),
+                         "lat": plat, "lon": plon, "recorded_at": utc_datetime(stamp).isoformat(),
+                         "open_orders": loads.get(courier, 0)}
+                        for km, courier, plat, plon, stamp in found if courier in names]
+    return jsonify({
+        "couriers": couriers,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }), 200
+
+# Admin: Courier position index size and sync counters
+@app1.route('/admin/couriers/index-stats', methods=['GET'])
+@role_required('admin')
+def courier_index_stats():
+    return jsonify({"courier_index": courier_positions.stats()}), 200
+
 # Admin: Assign delivery
 @app1.route('/admin/assign-delivery', methods=['POST'])
-@jwt_required()
+@role_required('admin')
 def assign_order():
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
-    data = request.json
-    order_id = data.get('order_id')
-    delivery_person_id = data.get('delivery_person_id')
-    if not all([order_id, delivery_person_id]):
+    data = request.get_json(silent=True)
+    if not isinstance(data, dict):
+        return jsonify({"error": "JSON object body required"}), 400
+    if not all([data.get('order_id'), data.get('delivery_person_id')]):
         return jsonify({"error": "Missing required fields"}), 400
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT delivery_person_id FROM delivery_persons WHERE delivery_person_id = %s", (delivery_person_id,))
-    if not cursor.fetchone():
-        cursor.close()
-        return jsonify({"error": "Delivery person not found"}), 404
-    cursor.execute("UPDATE orders SET assigned_to = %s WHERE order_id = %s", (delivery_person_id, order_id))
-    mysql.connection.commit()
-    cursor.execute("SELECT order_id, customer_id, assigned_to, status FROM orders WHERE order_id = %s", (order_id,))
-    order = cursor.fetchone()
-    cursor.close()
+    try:
+        order_id, delivery_person_id = int(data['order_id']), int(data['delivery_person_id'])
+    except (ValueError, TypeError):
+        return jsonify({"error": "order_id and delivery_person_id must be integers"}), 400
+    with db.transaction() as cursor:
+        cursor.execute("SELECT delivery_person_id FROM delivery_persons WHERE delivery_person_id = %s", (delivery_person_id,))
+        if not cursor.fetchone():
+            return jsonify({"error": "Delivery person not found"}), 404
+        # Previous courier, so their cached assigned-orders list can be dropped too
+        cursor.execute("SELECT assigned_to, status FROM orders WHERE order_id = %s FOR UPDATE", (order_id,))
+        previous = cursor.fetchone()
+        if previous:
+            try:
+                status = assigned_status(previous[1])
+            except InvalidTransition as e:
+                return jsonify({"error": str(e)}), 409
+            cursor.execute("UPDATE orders SET assigned_to = %s, status = %s WHERE order_id = %s",
+                           (delivery_person_id, status, order_id))
+            record_changes(cursor, [(order_id, previous[1], status, previous[0], delivery_person_id)],
+                           'admin', get_jwt_identity())
+        cursor.execute("SELECT order_id, customer_id, assigned_to, status FROM orders WHERE order_id = %s", (order_id,))
+        order = cursor.fetchone()
+    if previous:
+        invalidate_orders([order_id], [previous[0], delivery_person_id])
     if order:
         return jsonify({
             "message": "Order assigned successfully",
@@ -299,64 +970,374 @@ def assign_order():
         }), 200
     return jsonify({"message": "Order not found"}), 404
 
+# Admin: Assign many orders in one transaction
+# Body: {"assignments": [{"order_id": 1, "delivery_person_id": 2}, ...]}
+app1.config['MAX_BULK_ASSIGNMENTS'] = int(os.getenv('MAX_BULK_ASSIGNMENTS', '10000'))
+
+@app1.route('/admin/assign-delivery/bulk', methods=['POST'])
+@role_required('admin')
+def bulk_assign_orders():
+    data = request.json or {}
+    items = data.get('assignments')
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "assignments must be a non-empty list"}), 400
+    if len(items) > app1.config['MAX_BULK_ASSIGNMENTS']:
+        return jsonify({"error": f"At most {app1.config['MAX_BULK_ASSIGNMENTS']} assignments per request"}), 413
+
+    assignments, rejected = {}, []
+    for index, item in enumerate(items):
+        try:
+            assignments[int(item['order_id'])] = int(item['delivery_person_id'])
+        except (KeyError, ValueError, TypeError):
+            rejected.append({"index": index, "error": "order_id and delivery_person_id are required"})
+    if not assignments:
+        return jsonify({"assigned": 0, "rejected": rejected}), 400
+
+    started = time.perf_counter()
+    with db.transaction() as cursor:
+        # Every delivery person in one query
+        courier_ids = sorted(set(assignments.values()))
+        cursor.execute(
+            f"SELECT delivery_person_id FROM delivery_persons "
+            f"WHERE delivery_person_id IN ({', '.join(['%s'] * len(courier_ids))})",
+            courier_ids
+        )
+        known_couriers = {row[0] for row in cursor.fetchall()}
+        # Current assignees and statuses, locked, for the event log, cache invalidation and not-found reporting
+        order_ids = sorted(assignments)
+        cursor.execute(
+            f"SELECT order_id, assigned_to, status FROM orders WHERE order_id IN ({', '.join(['%s'] * len(order_ids))}) FOR UPDATE",
+            order_ids
+        )
+        previous = {row[0]: (row[1], row[2]) for row in cursor.fetchall()}
+        changes = []
+        for order_id, courier_id in list(assignments.items()):
+            if courier_id not in known_couriers:
+                rejected.append({"order_id": order_id, "error": "Delivery person not found"})
+            elif order_id not in previous:
+                rejected.append({"order_id": order_id, "error": "Order not found"})
+            else:
+                old_courier, old_status = previous[order_id]
+                try:
+                    changes.append((order_id, old_status, assigned_status(old_status), old_courier, courier_id))
+                    continue
+                except InvalidTransition as e:
+                    rejected.append({"order_id": order_id, "error": str(e)})
+            del assignments[order_id]
+        apply_assignments(cursor, assignments)
+        record_changes(cursor, changes, 'admin', get_jwt_identity())
+
+    invalidate_orders(assignments, set(assignments.values()) | {previous[o][0] for o in assignments})
+    return jsonify({
+        "message": "Orders assigned",
+        "assigned": len(assignments),
+        "rejected": rejected,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }), 200
+
+# Admin: Spread all unassigned Pending orders across delivery persons by current open load
+# Body (optional): {"limit": 5000, "max_per_courier": 50}
+@app1.route('/admin/auto-dispatch', methods=['POST'])
+@role_required('admin')
+def auto_dispatch():
+    data = request.get_json(silent=True) or {}
+    try:
+        limit = int(data.get('limit', app1.config['MAX_BULK_ASSIGNMENTS']))
+        max_per_courier = int(data['max_per_courier']) if data.get('max_per_courier') is not None else None
+    except (ValueError, TypeError):
+        return jsonify({"error": "limit and max_per_courier must be integers"}), 400
+
+    started = time.perf_counter()
+    with db.transaction() as cursor:
+        # Open load of every courier from the status counters, without touching orders
+        cursor.execute(
+            "SELECT d.delivery_person_id, COALESCE(SUM(c.order_count), 0) FROM delivery_persons d "
+            "LEFT JOIN order_status_counts c ON c.delivery_person_id = d.delivery_person_id "
+            f"AND c.status NOT IN ({', '.join(['%s'] * len(CLOSED_STATUSES))}) "
+            "GROUP BY d.delivery_person_id",
+            CLOSED_STATUSES
+        )
+        loads = {courier_id: int(load) for courier_id, load in cursor.fetchall()}
+        # SKIP LOCKED lets two dispatch runs work side by side without taking the same orders
+        cursor.execute(
+            "SELECT order_id FROM orders WHERE assigned_to IS NULL AND status = 'Pending' "
+            "ORDER BY order_id LIMIT %s FOR UPDATE SKIP LOCKED",
+            (limit,)
+        )
+        pending = [row[0] for row in cursor.fetchall()]
+        assignments = balance_assignments(pending, loads, max_per_courier)
+        assigned = apply_assignments(cursor, assignments, only_unassigned=True)
+        record_changes(cursor, [(order_id, PENDING, ASSIGNED, None, courier_id)
+                                for order_id, courier_id in assignments.items()], 'admin', get_jwt_identity())
+
+    invalidate_orders(assignments, set(assignments.values()))
+    return jsonify({
+        "message": "Auto-dispatch complete",
+        "pending": len(pending),
+        "assigned": assigned,
+        "couriers": len(set(assignments.values())),
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
+    }), 200
+
+# Admin: Bulk import of orders, customers or delivery persons from a CSV or NDJSON body (see bulk.py)
+# Query params: format=csv|ndjson (default: from Content-Type). Responds with a per-row error report.
+app1.config['IMPORT_CHUNK_SIZE'] = int(os.getenv('IMPORT_CHUNK_SIZE', '1000'))  # rows per INSERT and transaction
+
+
+def import_invalidator(entity):
+    # Imported orders with a courier change that courier's cached assigned-orders list
+    if entity != 'orders':
+        return None
+    return lambda inserted: invalidate_orders((), {row['assigned_to'] for _, row in inserted if row['assigned_to']})
+
+
+@app1.route('/admin/import/<string:entity>', methods=['POST'])
+@role_required('admin')
+def bulk_import(entity):
+    if entity not in IMPORTERS:
+        return jsonify({"error": f"Unknown entity; expected one of: {', '.join(sorted(IMPORTERS))}"}), 404
+    try:
+        fmt = detect_format(request.args.get('format'), request.content_type or '')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    report = import_records(db, hasher, entity, read_records(request.stream, fmt),
+                            chunk_size=app1.config['IMPORT_CHUNK_SIZE'], actor=('admin', get_jwt_identity()),
+                            on_chunk=import_invalidator(entity))
+    return jsonify(report.as_dict()), 200
+
+# Admin: Streaming export as CSV or NDJSON (passwords are never exported)
+# Query params: format=csv|ndjson (default csv), after=<id> to resume
+@app1.route('/admin/export/<string:entity>', methods=['GET'])
+@role_required('admin')
+def bulk_export(entity):
+    if entity not in EXPORTS:
+        return jsonify({"error": f"Unknown entity; expected one of: {', '.join(sorted(EXPORTS))}"}), 404
+    try:
+        fmt = detect_format(request.args.get('format') or 'csv')
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return Response(
+        export_rows(db, entity, fmt, after=request.args.get('after', type=int), batch_size=STREAM_BATCH_SIZE),
+        mimetype='text/csv' if fmt == 'csv' else 'application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="{entity}.{fmt}"'}
+    )
+
 # Admin: Delete user
 @app1.route('/admin/delete-user/<string:user_type>/<int:user_id>', methods=['DELETE'])
-@jwt_required()
+@role_required('admin')
 def delete_user(user_type, user_id):
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
-    cursor = mysql.connection.cursor()
-    if user_type == "customer":
-        cursor.execute("DELETE FROM customers WHERE customer_id = %s", (user_id,))
-    elif user_type == "delivery_person":
-        cursor.execute("DELETE FROM delivery_persons WHERE delivery_person_id = %s", (user_id,))
-    else:
-        cursor.close()
+    if user_type not in ("customer", "delivery_person"):
         return jsonify({"message": "Invalid user type"}), 400
-    mysql.connection.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        # Orders touched by the cascade (deleted or unassigned), for cache invalidation
+        if user_type == "customer":
+            affected = []
+            for table in ORDER_TABLES:
+                cursor.execute(f"SELECT order_id, assigned_to, status FROM {table} WHERE customer_id = %s FOR UPDATE",
+                               (user_id,))
+                affected.extend(cursor.fetchall())
+                # order_locations has no foreign key to orders, so the trails are not deleted by the cascade
+                cursor.execute(f"DELETE FROM order_locations WHERE order_id IN (SELECT order_id FROM {table} WHERE customer_id = %s)",
+                               (user_id,))
+            cursor.execute("DELETE FROM customers WHERE customer_id = %s", (user_id,))
+            # Deleted with the customer: the counters drop them, the event log keeps their history
+            changes = [(order_id, status, None, courier_id, None) for order_id, courier_id, status in affected]
+        else:
+            affected = []
+            for table in ORDER_TABLES:
+                cursor.execute(f"SELECT order_id, assigned_to, status FROM {table} WHERE assigned_to = %s FOR UPDATE",
+                               (user_id,))
+                affected.extend(cursor.fetchall())
+            cursor.execute("DELETE FROM courier_positions WHERE delivery_person_id = %s", (user_id,))
+            cursor.execute("DELETE FROM delivery_persons WHERE delivery_person_id = %s", (user_id,))
+            changes = [(order_id, status, status, courier_id, None) for order_id, courier_id, status in affected]
+        record_changes(cursor, changes, 'admin', get_jwt_identity())
+        # Tokens already issued to the deleted user stop working on every worker
+        revocations.revoke_user(user_type, user_id, cursor)
+    invalidate_orders([a[0] for a in affected], {a[1] for a in affected})
+    if user_type == "delivery_person":
+        courier_positions.remove(user_id)
     return jsonify({"message": f"{user_type.capitalize()} deleted successfully"}), 200
 
 # Admin: View all issues
+# Query params: limit, after, status, user_type, user_id, created_from, created_to, format=ndjson, shape=columns
+ISSUE_FIELDS = ["issue_id", "user_type", "user_id", "message", "status", "response"]
+ISSUE_FILTERS = [
+    ('status', 'status', '=', str),
+    ('user_type', 'user_type', '=', str),
+    ('user_id', 'user_id', '=', int),
+    ('created_from', 'created_at', '>=', parse_datetime),
+    ('created_to', 'created_at', '<', parse_datetime),
+]
+
 @app1.route('/admin/issues', methods=['GET'])
-@jwt_required()
+@role_required('admin')
 def view_issues():
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT issue_id, user_type, user_id, message, status, response FROM issues")
-    issues = cursor.fetchall()
-    cursor.close()
+    try:
+        sql, params = build_listing_query(ISSUE_FIELDS, "issues", "issue_id", ISSUE_FILTERS)
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    if wants_stream():
+        return stream_rows([(sql, params, ISSUE_FIELDS, {})])
+    tag = page_etag("issues", "issue_id", ISSUE_FILTERS)
+    if not_modified(tag):
+        return listing_response(None, tag)
+    issues, next_cursor = fetch_page(sql, params, ISSUE_FIELDS, "issue_id")
+    return listing_response({
+        "issues": issues,
+        "next_cursor": next_cursor
+    }, tag)
+
+# Admin: Ranked full-text search over issues and feedback (see search.py)
+# Query params: q (words, "phrases", -excluded, prefix*), in=issues|feedback|all (default all),
+# status, user_type, user_id (issues only), order_id, customer_id (feedback only), created_from, created_to,
+# limit, after (the previous page's next_cursor)
+app1.config['SEARCH_MAX_RESULTS'] = int(os.getenv('SEARCH_MAX_RESULTS', '1000'))  # deepest rank a page can reach
+SEARCH_FILTER_ARGS = {arg for spec in SEARCH_TARGETS.values() for arg, _, _, _ in spec['filters']}
+
+@app1.route('/admin/search', methods=['GET'])
+@role_required('admin')
+def admin_search():
+    started = time.perf_counter()
+    query = SearchQuery.parse(request.args.get('q'))
+    if not query:
+        return jsonify({"error": f"q needs at least one word of {MIN_WORD_LENGTH} or more characters"}), 400
+    scope = request.args.get('in', 'all')
+    if scope != 'all' and scope not in SEARCH_TARGETS:
+        return jsonify({"error": f"in must be all or one of: {', '.join(SEARCH_TARGETS)}"}), 400
+    # A filter only one target has narrows the search to that target
+    filters = {arg for arg in SEARCH_FILTER_ARGS if request.args.get(arg)}
+    targets = [target for target in (SEARCH_TARGETS if scope == 'all' else [scope])
+               if not filters - {arg for arg, _, _, _ in SEARCH_TARGETS[target]['filters']}]
+    if not targets:
+        return jsonify({"error": "These filters do not apply to the same target"}), 400
+    try:
+        offset = int(request.args.get('after') or 0)
+        created_from = parse_datetime(request.args['created_from']) if request.args.get('created_from') else None
+        created_to = parse_datetime(request.args['created_to']) if request.args.get('created_to') else None
+        queries = [(target, *build_search_query(target, query, request.args, created_from, created_to))
+                   for target in targets]
+    except ValueError:
+        return jsonify({"error": "Invalid filter value"}), 400
+    limit = min(page_limit(request.args), max(app1.config['SEARCH_MAX_RESULTS'] - offset, 0))
+    if offset < 0 or not limit:
+        return jsonify({"error": f"Results are limited to the best {app1.config['SEARCH_MAX_RESULTS']} matches"}), 400
+
+    results = []
+    with db.cursor() as cursor:
+        for target, sql, params in queries:
+            # Each target's best offset + limit (+1 to tell if there is more) rows are enough to merge this page
+            cursor.execute(sql + " LIMIT %s", params + [offset + limit + 1])
+            fields = SEARCH_TARGETS[target]['fields']
+            results.extend({"type": target, **dict(zip(fields, row)), "score": round(float(row[-1]), 4)}
+                           for row in cursor.fetchall())
+    results.sort(key=lambda result: -result["score"])
+    more = len(results) > offset + limit and offset + limit < app1.config['SEARCH_MAX_RESULTS']
     return jsonify({
-        "issues": [{"issue_id": i[0], "user_type": i[1], "user_id": i[2], "message": i[3], "status": i[4], "response": i[5]} for i in issues]
+        "query": query.boolean(),
+        "results": results[offset:offset + limit],
+        "next_cursor": offset + limit if more else None,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 2)
     }), 200
 
+# Admin: Database connection pool metrics
+@app1.route('/admin/db-pool', methods=['GET'])
+@role_required('admin')
+def db_pool_stats():
+    return jsonify({"pool": db.stats()}), 200
+
+# Admin: Order cache hit/miss counters
+@app1.route('/admin/cache-stats', methods=['GET'])
+@role_required('admin')
+def cache_stats():
+    return jsonify({"cache": {**order_cache.stats.snapshot(), "entries": order_cache.size()}}), 200
+
+# Admin: Rate limiting and load shedding counters
+@app1.route('/admin/admission-stats', methods=['GET'])
+@role_required('admin')
+def admission_stats():
+    return jsonify({"admission": admission.stats()}), 200
+
+# Admin: Order archival progress (see archive.py)
+@app1.route('/admin/archive-stats', methods=['GET'])
+@role_required('admin')
+def archive_stats():
+    return jsonify({"archive": {**archiver.stats(), **archiver.status()}}), 200
+
+# Admin: Password hashing latency and queue metrics
+@app1.route('/admin/hashing-stats', methods=['GET'])
+@role_required('admin')
+def hashing_stats():
+    return jsonify({"hashing": hasher.stats()}), 200
+
+
+def service_gauges():
+    pool = db.stats()
+    cache = order_cache.stats.snapshot()
+    hashing = hasher.stats()
+    revocation = revocations.stats()
+    rollup = rollups.stats()
+    admitted = admission.stats()
+    archived = archiver.stats()
+    positions = courier_positions.stats()
+    triage = issue_queue.stats()
+    started = startup.status()
+    return [
+        ("courier_db_pool_in_use", "Pooled connections currently checked out", pool["in_use"]),
+        ("courier_db_pool_idle", "Idle pooled connections", pool["idle"]),
+        ("courier_db_pool_timeouts", "Checkouts that timed out waiting for a connection", pool["timeouts"]),
+        ("courier_cache_hits", "Order cache hits", cache["hits"]),
+        ("courier_cache_misses", "Order cache misses", cache["misses"]),
+        ("courier_hashing_pending", "Password hashing calls queued or running", hashing["pending"]),
+        ("courier_hashing_rejected_busy", "Password hashing calls rejected with 503", hashing["rejected_busy"]),
+        ("courier_location_buffer_pending", "Location fixes waiting to be flushed", location_buffer.stats()["pending"]),
+        ("courier_revoked_tokens", "Revoked token ids held in memory", revocation["tokens"]),
+        ("courier_revoked_users", "Revoked users held in memory", revocation["users"]),
+        ("courier_revocation_sync_errors", "Failed token_revocations syncs", revocation["sync_errors"]),
+        ("courier_rollup_events_folded", "order_events folded into the analytics rollups by this worker", rollup["events"]),
+        ("courier_rollup_errors", "Failed analytics rollup folds", rollup["errors"]),
+        ("courier_orders_archived", "Orders moved to orders_archive by this worker", archived["archived"]),
+        ("courier_archive_errors", "Failed order archival runs", archived["errors"]),
+        ("courier_positions_indexed", "Couriers in the nearest-courier index", positions["couriers"]),
+        ("courier_position_sync_errors", "Failed courier_positions syncs", positions["sync_errors"]),
+        ("courier_issues_claimed", "Issues claimed from the triage queue through this worker", triage["claimed"]),
+        ("courier_issue_claim_conflicts", "Batch responses refused for issues not held by the admin", triage["conflicts"]),
+        ("courier_startup_import_seconds", "Seconds importing the app, in this worker or the master it was forked from",
+         started["import_seconds"] or 0),
+        ("courier_startup_warm_up_seconds", "Seconds this worker spent starting its threads and warming up",
+         started["warm_up_seconds"] or 0),
+        ("courier_worker_ready", "1 once this worker has warmed up", int(started["ready"])),
+        ("courier_admission_in_flight", "Requests holding an admission slot", admitted["in_flight"]),
+        ("courier_admission_waiting", "Requests queued for an admission slot", admitted["waiting"]),
+    ]
+
+
+metrics.add_gauges(service_gauges)
+
+
+# Prometheus scrape endpoint
+@app1.route('/metrics', methods=['GET'])
+def prometheus_metrics():
+    token = app1.config['METRICS_TOKEN']
+    if token and request.headers.get('Authorization') != f"Bearer {token}":
+        return jsonify({"error": "Unauthorized"}), 401
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
+
 # Admin: Respond to or resolve an issue
 @app1.route('/admin/issues/respond/<int:issue_id>', methods=['PATCH'])
-@jwt_required()
+@role_required('admin')
 def respond_to_issue(issue_id):
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'admin':
-        return jsonify({"error": "Admin access required"}), 403
     data = request.json
     response = data.get('response')
     status = data.get('status', 'resolved')
     if not response:
         return jsonify({"error": "Response is required"}), 400
-    cursor = mysql.connection.cursor()
-    cursor.execute("UPDATE issues SET response = %s, status = %s WHERE issue_id = %s", (response, status, issue_id))
-    mysql.connection.commit()
-    cursor.execute("SELECT issue_id, user_type, user_id, message, status, response FROM issues WHERE issue_id = %s", (issue_id,))
-    issue = cursor.fetchone()
-    cursor.close()
+    with db.transaction() as cursor:
+        # Answering an issue directly ends any claim on it in the triage queue
+        cursor.execute("UPDATE issues SET response = %s, status = %s, claimed_by = NULL, claim_expires_at = NULL WHERE issue_id = %s",
+                       (response, status, issue_id))
+        cursor.execute("SELECT issue_id, user_type, user_id, message, status, response FROM issues WHERE issue_id = %s", (issue_id,))
+        issue = cursor.fetchone()
     if issue:
         return jsonify({
             "message": "Issue updated",
@@ -364,17 +1345,89 @@ def respond_to_issue(issue_id):
         }), 200
     return jsonify({"message": "Issue not found"}), 404
 
+# Issue triage queue: admins claim open issues under a lease and answer them in batches (see triage.py)
+app1.config['ISSUE_CLAIM_SECONDS'] = float(os.getenv('ISSUE_CLAIM_SECONDS', '900'))  # lease; unanswered issues go back to the queue after it
+app1.config['ISSUE_MAX_CLAIM'] = int(os.getenv('ISSUE_MAX_CLAIM', '50'))  # issues per claim and per batch response
+app1.config['ISSUE_PRIORITY'] = os.getenv('ISSUE_PRIORITY', 'delivery_person=3600,customer=900')  # head start in seconds per user_type
+issue_queue = IssueQueue(
+    db,
+    lease_seconds=app1.config['ISSUE_CLAIM_SECONDS'],
+    head_starts=parse_head_starts(app1.config['ISSUE_PRIORITY']),
+    max_claim=app1.config['ISSUE_MAX_CLAIM']
+)
+ISSUE_CLAIM_FIELDS = ISSUE_FIELDS + ["created_at", "claim_expires_at"]
+
+
+def issue_ids_of(values):
+    # -> distinct issue ids, or None unless `values` is a non-empty list of integers
+    if not isinstance(values, list) or not values or not all(isinstance(v, int) and not isinstance(v, bool) for v in values):
+        return None
+    return list(dict.fromkeys(values))
+
+# Admin: Claim the next open issues, oldest first with a head start per user_type
+# Body (optional): {"count": 10}. The issues are leased to the caller for ISSUE_CLAIM_SECONDS.
+@app1.route('/admin/issues/claim', methods=['POST'])
+@role_required('admin')
+def claim_issues():
+    data = request.get_json(silent=True) or {}
+    count = data.get('count', 10) if isinstance(data, dict) else None
+    if not isinstance(count, int) or isinstance(count, bool) or count < 1:
+        return jsonify({"error": "count must be a positive integer"}), 400
+    if count > app1.config['ISSUE_MAX_CLAIM']:
+        return jsonify({"error": f"At most {app1.config['ISSUE_MAX_CLAIM']} issues per claim"}), 400
+    rows = issue_queue.claim(int(get_jwt_identity()), count)
+    return jsonify({"issues": rows_payload(ISSUE_CLAIM_FIELDS, rows)}), 200
+
+# Admin: Respond to or resolve several claimed issues in one transaction
+# Body: {"responses": [{"issue_id": 1, "response": "...", "status": "resolved"}, ...]}
+# Nothing is written unless the caller holds every one of the issues
+@app1.route('/admin/issues/respond/batch', methods=['POST'])
+@role_required('admin')
+def respond_to_issues():
+    data = request.get_json(silent=True)
+    items = data.get('responses') if isinstance(data, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "responses must be a non-empty list"}), 400
+    if len(items) > app1.config['ISSUE_MAX_CLAIM']:
+        return jsonify({"error": f"At most {app1.config['ISSUE_MAX_CLAIM']} responses per batch"}), 400
+    responses = []
+    for index, item in enumerate(items):
+        if not isinstance(item, dict) or not item.get('response') or not isinstance(item.get('status', RESOLVED), str):
+            return jsonify({"error": f"responses[{index}] needs an issue_id and a response"}), 400
+        responses.append((item.get('issue_id'), item['response'], item.get('status', RESOLVED)))
+    ids = issue_ids_of([issue_id for issue_id, _, _ in responses])
+    if ids is None or len(ids) != len(responses):
+        return jsonify({"error": "Each response needs a distinct integer issue_id"}), 400
+    try:
+        rows = issue_queue.respond(int(get_jwt_identity()), responses)
+    except NotClaimed as e:
+        return jsonify({"error": "Claim these issues before responding", "not_claimed": e.issue_ids}), 409
+    return jsonify({"message": "Issues updated", "issues": rows_payload(ISSUE_FIELDS, rows)}), 200
+
+# Admin: Hand claimed issues back to the queue
+# Body: {"issue_ids": [1, 2]}
+@app1.route('/admin/issues/release', methods=['POST'])
+@role_required('admin')
+def release_issues():
+    data = request.get_json(silent=True)
+    ids = issue_ids_of(data.get('issue_ids') if isinstance(data, dict) else None)
+    if ids is None:
+        return jsonify({"error": "issue_ids must be a non-empty list of integers"}), 400
+    return jsonify({"released": issue_queue.release(int(get_jwt_identity()), ids)}), 200
+
+# Admin: Open issues per user_type, how many are claimed, and this worker's queue counters
+@app1.route('/admin/issues/queue', methods=['GET'])
+@role_required('admin')
+def issue_queue_status():
+    return jsonify({"queue": issue_queue.status(), "counters": issue_queue.stats()}), 200
+
 # Customer/Delivery Person: Raise an issue
 @app1.route('/raise-issue', methods=['POST'])
-@jwt_required()
+@role_required('customer', 'delivery_person', message="Only customers and delivery persons can raise issues")
 def raise_issue():
     try:
         current_user_id = get_jwt_identity()
-        claims = get_jwt()
-        role = claims.get('role')
-
-        if role not in ['customer', 'delivery_person']:
-            return jsonify({"error": "Only customers and delivery persons can raise issues"}), 403
+        role = current_role()
 
         data = request.json
         message = data.get('message')
@@ -382,24 +1435,20 @@ def raise_issue():
         if not message:
             return jsonify({"error": "Message is required"}), 400
 
-        cursor = mysql.connection.cursor()
-
         try:
-            cursor.execute(
-                "INSERT INTO issues (user_type, user_id, message, status) VALUES (%s, %s, %s, %s)",
-                (role, current_user_id, message, "open")
-            )
-            mysql.connection.commit()
-            issue_id = cursor.lastrowid
-
-        except Exception as db_err:
-            mysql.connection.rollback()
-            cursor.close()
+            with db.transaction() as cursor:
+                cursor.execute(
+                    "INSERT INTO issues (user_type, user_id, message, status) VALUES (%s, %s, %s, %s)",
+                    (role, current_user_id, message, "open")
+                )
+                issue_id = cursor.lastrowid
+
+        except MySQLdb.Error as db_err:
             return jsonify({"error": f"DB insert failed: {str(db_err)}"}), 500
 
-        cursor.execute("SELECT issue_id, user_type, user_id, message, status, response FROM issues WHERE issue_id = %s", (issue_id,))
-        issue = cursor.fetchone()
-        cursor.close()
+        with db.cursor() as cursor:
+            cursor.execute("SELECT issue_id, user_type, user_id, message, status, response FROM issues WHERE issue_id = %s", (issue_id,))
+            issue = cursor.fetchone()
 
         if not issue:
             return jsonify({"error": "Issue retrieval failed after insertion"}), 500
@@ -416,172 +1465,524 @@ def raise_issue():
             }
         }), 201
 
+    except (HashingBusy, PoolExhausted):
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+# Order placement: an Idempotency-Key header makes a retry replay the first response (see idempotency.py)
+app1.config['IDEMPOTENCY_TTL'] = int(os.getenv('IDEMPOTENCY_TTL', '86400'))  # seconds a key keeps replaying its response
+app1.config['MAX_BATCH_ORDERS'] = int(os.getenv('MAX_BATCH_ORDERS', '100'))  # orders per /customer/place-order/batch
+idempotency_keys = IdempotencyKeys(db, ttl=app1.config['IDEMPOTENCY_TTL'])
+ORDER_DETAIL_FIELDS = ('pickup_address', 'drop_address')
+
+
+@app1.errorhandler(IdempotencyConflict)
+def handle_idempotency_conflict(e):
+    return jsonify({"error": str(e)}), 422
+
+
+def order_details(item):
+    # Optional fields of a new order; raises ValueError
+    if not isinstance(item, dict):
+        raise ValueError("Each order must be an object")
+    return {field: text_field(item, field, 255, required=False) for field in ORDER_DETAIL_FIELDS}
+
+
+def insert_orders(cursor, customer_id, details):
+    # One multi-row INSERT. A simple INSERT gets consecutive AUTO_INCREMENT ids and lastrowid
+    # is the first of them, so the ids are known without reading the rows back.
+    cursor.execute(
+        f"INSERT INTO orders (customer_id, status, {', '.join(ORDER_DETAIL_FIELDS)}) "
+        f"VALUES {', '.join(['(%s, %s, %s, %s)'] * len(details))}",
+        [value for item in details for value in (customer_id, PENDING, *(item[f] for f in ORDER_DETAIL_FIELDS))]
+    )
+    first_id = cursor.lastrowid
+    orders = [{"order_id": first_id + i, "customer_id": customer_id, "assigned_to": None, "status": PENDING, **item}
+              for i, item in enumerate(details)]
+    record_changes(cursor, [(order["order_id"], None, PENDING, None, None) for order in orders],
+                   'customer', customer_id)
+    return orders
+
+
+def json_body(status, body, replayed=False):
+    response = app1.response_class(body + "\n", status=status, mimetype=app1.json.mimetype)
+    if replayed:
+        response.headers['Idempotent-Replayed'] = 'true'
+    return response
+
+
+def place_orders(details, respond):
+    # respond(orders) -> response payload; the stored body is replayed as-is for a retried key
+    customer_id = int(get_jwt_identity())
+    key = request.headers.get('Idempotency-Key')
+    if key is not None and not 0 < len(key) <= MAX_KEY_LENGTH:
+        return jsonify({"error": f"Idempotency-Key must be 1 to {MAX_KEY_LENGTH} characters"}), 400
+    if key is not None:
+        fingerprint = request_hash(request.method, request.path, request.get_data())
+        with db.cursor() as cursor:
+            stored = idempotency_keys.lookup(cursor, customer_id, key, fingerprint)
+        if stored is not None:
+            return json_body(*stored, replayed=True)
+    try:
+        with db.transaction() as cursor:
+            orders = insert_orders(cursor, customer_id, details)
+            body = app1.json.dumps(respond(orders))
+            if key is not None:
+                idempotency_keys.store(cursor, customer_id, key, fingerprint, 201, body)
+    except MySQLdb.IntegrityError:
+        # A concurrent request with the same key committed first and this one rolled back
+        if key is None:
+            raise
+        with db.cursor() as cursor:
+            stored = idempotency_keys.lookup(cursor, customer_id, key, fingerprint)
+        if stored is None:
+            raise
+        return json_body(*stored, replayed=True)
+    invalidate_orders([order["order_id"] for order in orders])
+    if key is not None:
+        idempotency_keys.stored_one()
+    return json_body(201, body)
+
 # Customer: Place order
 @app1.route('/customer/place-order', methods=['POST'])
-@jwt_required()
+@role_required('customer')
 def place_order():
-    current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'customer':
-        return jsonify({"error": "Customer access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute(
-        "INSERT INTO orders (customer_id, status) VALUES (%s, %s)",
-        (current_user_id, "Pending")
-    )
-    mysql.connection.commit()
-    order_id = cursor.lastrowid
-    cursor.execute("SELECT order_id, customer_id, assigned_to, status FROM orders WHERE order_id = %s", (order_id,))
-    order = cursor.fetchone()
-    cursor.close()
-    return jsonify({
-        "message": "Order placed successfully",
-        "order": {
-            "order_id": order[0],
-            "customer_id": order[1],
-            "assigned_to": order[2],
-            "status": order[3]
-        }
-    }), 201
+    try:
+        details = order_details(request.get_json(silent=True) or {})
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return place_orders([details], lambda orders: {"message": "Order placed successfully", "order": orders[0]})
+
+# Customer: Place several orders at once, e.g. {"orders": [{"pickup_address": ..., "drop_address": ...}, ...]}
+@app1.route('/customer/place-order/batch', methods=['POST'])
+@role_required('customer')
+def place_order_batch():
+    body = request.get_json(silent=True)
+    items = body.get('orders') if isinstance(body, dict) else None
+    if not isinstance(items, list) or not items:
+        return jsonify({"error": "orders must be a non-empty list"}), 400
+    if len(items) > app1.config['MAX_BATCH_ORDERS']:
+        return jsonify({"error": f"At most {app1.config['MAX_BATCH_ORDERS']} orders per batch"}), 400
+    try:
+        details = [order_details(item) for item in items]
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    return place_orders(details, lambda orders: {
+        "message": f"{len(orders)} orders placed successfully",
+        "order_ids": [order["order_id"] for order in orders],
+        "orders": orders
+    })
 
 # Customer: Track order
 @app1.route('/customer/track-order/<int:order_id>', methods=['GET'])
-@jwt_required()
+@role_required('customer')
 def track_order(order_id):
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'customer':
-        return jsonify({"error": "Customer access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute(
-        "SELECT order_id, customer_id, assigned_to, status FROM orders WHERE order_id = %s AND customer_id = %s",
-        (order_id, current_user_id)
-    )
-    order = cursor.fetchone()
-    cursor.close()
-    if order:
+    order = order_cache.get(order_key(order_id))
+    if order is None:
+        # Taken before the read: the row is not cached if the order is written meanwhile
+        generation = order_cache.generation(order_key(order_id))
+        with db.cursor() as cursor:
+            row = order_row(cursor, ORDER_FIELDS, "order_id = %s", (order_id,))
+        if row:
+            order = {"order_id": row[0], "customer_id": row[1], "assigned_to": row[2], "status": row[3]}
+            order_cache.set(order_key(order_id), order, generation)
+    # Ownership is checked against the cached row as well
+    if order and str(order["customer_id"]) == str(current_user_id):
         return jsonify({
-            "order": {"order_id": order[0], "customer_id": order[1], "assigned_to": order[2], "status": order[3]}
+            "order": order
         }), 200
     return jsonify({"message": "Order not found or access denied"}), 404
 
+# Customer: Subscribe to live order updates (Server-Sent Events)
+# EventSource cannot set headers, so the token may also be passed as ?jwt=<token>
+@app1.route('/customer/track-order/<int:order_id>/events', methods=['GET'])
+@role_required('customer', locations=['headers', 'query_string'])
+def track_order_events(order_id):
+    current_user_id = get_jwt_identity()
+    with db.cursor() as cursor:
+        order = order_row(cursor, ORDER_FIELDS + ["location"], "order_id = %s AND customer_id = %s",
+                          (order_id, current_user_id))
+    if not order:
+        return jsonify({"message": "Order not found or access denied"}), 404
+
+    snapshot = {"order_id": order[0], "customer_id": order[1], "assigned_to": order[2], "status": order[3],
+                "location": order[4]}
+    subscription = order_events.subscribe(order_id)
+    keepalive = app1.config['SSE_KEEPALIVE_SECONDS']
+
+    # The subscriber holds no DB connection while it waits for events
+    def generate():
+        try:
+            yield sse_format(snapshot, event="snapshot")
+            while True:
+                try:
+                    payload = subscription.get(timeout=keepalive)
+                except queue.Empty:
+                    yield ": keepalive\n\n"
+                    continue
+                yield sse_format(payload, event=payload.get("type"))
+        finally:
+            order_events.unsubscribe(order_id, subscription)
+
+    return Response(generate(), mimetype='text/event-stream',
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
 # Customer: Provide feedback
 @app1.route('/customer/feedback', methods=['POST'])
-@jwt_required()
+@role_required('customer')
 def submit_feedback():
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'customer':
-        return jsonify({"error": "Customer access required"}), 403
     data = request.json
     order_id = data.get('order_id')
     feedback = data.get('feedback')
     if not all([order_id, feedback]):
         return jsonify({"error": "Order ID and feedback are required"}), 400
-    cursor = mysql.connection.cursor()
-    cursor.execute("SELECT order_id FROM orders WHERE order_id = %s AND customer_id = %s", (order_id, current_user_id))
-    if not cursor.fetchone():
-        cursor.close()
-        return jsonify({"error": "Order not found or access denied"}), 404
-    cursor.execute(
-        "INSERT INTO feedback (order_id, customer_id, feedback) VALUES (%s, %s, %s)",
-        (order_id, current_user_id, feedback)
-    )
-    mysql.connection.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        if not order_row(cursor, ["order_id"], "order_id = %s AND customer_id = %s", (order_id, current_user_id)):
+            return jsonify({"error": "Order not found or access denied"}), 404
+        cursor.execute(
+            "INSERT INTO feedback (order_id, customer_id, feedback) VALUES (%s, %s, %s)",
+            (order_id, current_user_id, feedback)
+        )
     return jsonify({"message": "Feedback submitted successfully"}), 201
 
 # Delivery Person: View assigned orders
 @app1.route('/delivery/assigned-orders', methods=['GET'])
-@jwt_required()
+@role_required('delivery_person')
 def assigned_orders():
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'delivery_person':
-        return jsonify({"error": "Delivery person access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute(
-        "SELECT order_id, customer_id, assigned_to, status FROM orders WHERE assigned_to = %s",
-        (current_user_id,)
-    )
-    orders = cursor.fetchall()
-    cursor.close()
-    return jsonify({
-        "assigned_orders": [{"order_id": o[0], "customer_id": o[1], "assigned_to": o[2], "status": o[3]} for o in orders]
-    }), 200
+    orders = order_cache.get(assigned_key(current_user_id))
+    if orders is None:
+        generation = order_cache.generation(assigned_key(current_user_id))
+        with db.cursor() as cursor:
+            cursor.execute(
+                "SELECT order_id, customer_id, assigned_to, status FROM orders WHERE assigned_to = %s",
+                (current_user_id,)
+            )
+            rows = cursor.fetchall()
+        orders = [{"order_id": o[0], "customer_id": o[1], "assigned_to": o[2], "status": o[3]} for o in rows]
+        order_cache.set(assigned_key(current_user_id), orders, generation)
+    return listing_response({
+        "assigned_orders": cached_listing(orders)
+    })
 
 # Delivery Person: Update order status
+# Assigned -> Picked Up -> In Transit -> Delivered, or Failed from any of the first three
 @app1.route('/delivery/update-status', methods=['PATCH'])
-@jwt_required()
+@role_required('delivery_person')
 def update_order_status():
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'delivery_person':
-        return jsonify({"error": "Delivery person access required"}), 403
     data = request.json
     order_id = data.get('order_id')
     status = data.get('status')
     if not all([order_id, status]):
         return jsonify({"error": "Order ID and status are required"}), 400
-    cursor = mysql.connection.cursor()
-    cursor.execute(
-        "UPDATE orders SET status = %s WHERE order_id = %s AND assigned_to = %s",
-        (status, order_id, current_user_id)
-    )
-    mysql.connection.commit()
-    cursor.close()
+    with db.transaction() as cursor:
+        cursor.execute(
+            "SELECT status FROM orders WHERE order_id = %s AND assigned_to = %s FOR UPDATE",
+            (order_id, current_user_id)
+        )
+        row = cursor.fetchone()
+        if row:
+            try:
+                check_transition(row[0], status, COURIER_STATUSES)
+            except InvalidTransition as e:
+                return jsonify({"error": str(e)}), 409
+            cursor.execute("UPDATE orders SET status = %s, closed_at = %s WHERE order_id = %s",
+                           (status, closed_at(status), order_id))
+            record_changes(cursor, [(order_id, row[0], status, int(current_user_id), int(current_user_id))],
+                           'delivery_person', current_user_id)
+        updated = row is not None
+    if updated:
+        invalidate_orders([order_id], [current_user_id])
+        order_events.publish(order_id, {"type": "status", "order_id": order_id, "status": status})
     return jsonify({"message": "Order status updated successfully"}), 200
 
 # Delivery Person: Update order location
 @app1.route('/delivery/update-location', methods=['PATCH'])
-@jwt_required()
+@role_required('delivery_person')
 def update_order_location():
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'delivery_person':
-        return jsonify({"error": "Delivery person access required"}), 403
     data = request.json
     order_id = data.get('order_id')
     location = data.get('location')
     if not all([order_id, location]):
         return jsonify({"error": "Order ID and location are required"}), 400
-    cursor = mysql.connection.cursor()
-    cursor.execute(
-        "UPDATE orders SET location = %s WHERE order_id = %s AND assigned_to = %s",
-        (location, order_id, current_user_id)
-    )
-    mysql.connection.commit()
-    cursor.close()
+    recorded_at = datetime.utcnow()
+    with db.transaction() as cursor:
+        cursor.execute(
+            "UPDATE orders SET location = %s, location_recorded_at = %s WHERE order_id = %s AND assigned_to = %s",
+            (location, recorded_at, order_id, current_user_id)
+        )
+        updated = cursor.rowcount
+    if updated:
+        invalidate_orders([order_id])
+        order_events.publish(order_id, {"type": "location", "order_id": order_id, "location": location})
+        # Keep the single-ping path in the location trail as well
+        try:
+            fix = parse_fix({"order_id": order_id, "location": location})
+            fix['recorded_at'] = recorded_at
+            fix['delivery_person_id'] = int(current_user_id)
+            fix['published'] = True
+            location_buffer.add([fix])
+        except (ValueError, TypeError):
+            pass
     return jsonify({"message": "Order location updated successfully"}), 200
 
-# Delivery Person: View delivery history
-@app1.route('/delivery/history', methods=['GET'])
-@jwt_required()
-def delivery_history():
+# Delivery Person: Report many timestamped location fixes at once
+# Body: {"fixes": [{"order_id": 1, "lat": 12.97, "lon": 77.59, "recorded_at": "2025-05-27T09:18:35Z"}, ...]}
+@app1.route('/delivery/update-location/bulk', methods=['POST'])
+@role_required('delivery_person')
+def bulk_update_location():
     current_user_id = get_jwt_identity()
-    claims = get_jwt()
-    role = claims.get('role')
-    if role != 'delivery_person':
-        return jsonify({"error": "Delivery person access required"}), 403
-    cursor = mysql.connection.cursor()
-    cursor.execute(
-        "SELECT order_id, customer_id, assigned_to, status FROM orders WHERE assigned_to = %s AND status = 'Delivered'",
-        (current_user_id,)
-    )
-    history = cursor.fetchall()
-    cursor.close()
+    data = request.json or {}
+    fixes = data.get('fixes')
+    if not isinstance(fixes, list) or not fixes:
+        return jsonify({"error": "fixes must be a non-empty list"}), 400
+    if len(fixes) > app1.config['LOCATION_MAX_FIXES_PER_REQUEST']:
+        return jsonify({"error": f"At most {app1.config['LOCATION_MAX_FIXES_PER_REQUEST']} fixes per request"}), 413
+
+    accepted, rejected = [], []
+    for index, raw in enumerate(fixes):
+        try:
+            fix = parse_fix(raw, app1.config['LOCATION_MAX_CLOCK_SKEW'])
+        except KeyError as e:
+            rejected.append({"index": index, "error": f"{e.args[0]} is required"})
+            continue
+        except (ValueError, TypeError, AttributeError) as e:
+            rejected.append({"index": index, "error": str(e) or "Invalid fix"})
+            continue
+        fix['delivery_person_id'] = int(current_user_id)
+        accepted.append((index, fix))
+
+    if accepted:
+        # One ownership check for every order referenced by the batch
+        order_ids = sorted({fix['order_id'] for _, fix in accepted})
+        with db.cursor() as cursor:
+            cursor.execute(
+                f"SELECT order_id FROM orders WHERE assigned_to = %s AND order_id IN ({', '.join(['%s'] * len(order_ids))})",
+                [current_user_id] + order_ids
+            )
+            owned = {row[0] for row in cursor.fetchall()}
+        for index, fix in accepted:
+            if fix['order_id'] not in owned:
+                rejected.append({"index": index, "error": "Order not assigned to you"})
+        accepted = [fix for _, fix in accepted if fix['order_id'] in owned]
+        location_buffer.add(accepted)
+
+    return jsonify({
+        "message": "Location fixes accepted",
+        "accepted": len(accepted),
+        "rejected": sorted(rejected, key=lambda r: r["index"])
+    }), 202
+
+# Customer/Delivery Person/Admin: Location trail of an order
+# Query params: from, to (ISO timestamps), interval (seconds per bucket, omit for raw fixes)
+@app1.route('/orders/<int:order_id>/locations', methods=['GET'])
+@role_required('customer', 'delivery_person', 'admin')
+def order_location_trail(order_id):
+    current_user_id = get_jwt_identity()
+    role = current_role()
+    try:
+        start = parse_datetime(request.args['from']) if request.args.get('from') else None
+        end = parse_datetime(request.args['to']) if request.args.get('to') else None
+        interval = downsample_interval(request.args['interval']) if request.args.get('interval') else None
+    except ValueError:
+        return jsonify({"error": "Invalid from/to/interval"}), 400
+
+    clauses, params = ["order_id = %s"], [order_id]
+    if start:
+        clauses.append("recorded_at >= %s")
+        params.append(start)
+    if end:
+        clauses.append("recorded_at < %s")
+        params.append(end)
+    where = " AND ".join(clauses)
+    limit = app1.config['LOCATION_MAX_TRAIL_POINTS']
+
+    with db.cursor() as cursor:
+        if role == 'customer':
+            found = order_row(cursor, ["order_id"], "order_id = %s AND customer_id = %s", (order_id, current_user_id))
+        elif role == 'delivery_person':
+            found = order_row(cursor, ["order_id"], "order_id = %s AND assigned_to = %s", (order_id, current_user_id))
+        else:
+            found = order_row(cursor, ["order_id"], "order_id = %s", (order_id,))
+        if not found:
+            return jsonify({"message": "Order not found or access denied"}), 404
+
+        if interval:
+            # Keep the last fix received in each time bucket
+            cursor.execute(
+                "SELECT l.latitude, l.longitude, l.location, l.recorded_at FROM order_locations l "
+                f"JOIN (SELECT MAX(id) AS id FROM order_locations WHERE {where} "
+                "GROUP BY FLOOR(UNIX_TIMESTAMP(recorded_at) / %s)) b ON l.id = b.id "
+                "ORDER BY l.recorded_at LIMIT %s",
+                params + [interval, limit]
+            )
+        else:
+            cursor.execute(
+                "SELECT latitude, longitude, location, recorded_at FROM order_locations "
+                f"WHERE {where} ORDER BY recorded_at LIMIT %s",
+                params + [limit]
+            )
+        points = cursor.fetchall()
     return jsonify({
-        "delivery_history": [{"order_id": h[0], "customer_id": h[1], "assigned_to": h[2], "status": h[3]} for h in history]
+        "order_id": order_id,
+        "interval": interval,
+        "locations": [{"lat": float(p[0]) if p[0] is not None else None,
+                       "lon": float(p[1]) if p[1] is not None else None,
+                       "location": p[2],
+                       "recorded_at": p[3].isoformat() if hasattr(p[3], 'isoformat') else p[3]} for p in points]
     }), 200
 
+# Delivery Person: View delivery history, newest first, from live and archived orders
+# Query params: from, to (delivery time), limit, before=next_cursor, shape=columns
+HISTORY_FIELDS = ["order_id", "delivered_at", "customer_id", "assigned_to", "status"]
+
+
+def parse_history_cursor(value):
+    # next_cursor is "<delivered_at>,<order_id>" of the last order on the page
+    delivered_at, _, order_id = value.rpartition(',')
+    return parse_datetime(delivered_at), int(order_id)
+
+
+@app1.route('/delivery/history', methods=['GET'])
+@role_required('delivery_person')
+def delivery_history():
+    current_user_id = get_jwt_identity()
+    try:
+        start = parse_datetime(request.args['from']) if request.args.get('from') else None
+        end = parse_datetime(request.args['to']) if request.args.get('to') else None
+        before = parse_history_cursor(request.args['before']) if request.args.get('before') else None
+    except ValueError:
+        return jsonify({"error": "from and to must be ISO 8601 timestamps and before a next_cursor"}), 400
+    limit = page_limit(request.args)
+    with db.cursor() as cursor:
+        rows = history_page(cursor, ["order_id", "closed_at", "customer_id", "assigned_to", "status"],
+                            current_user_id, DELIVERED, start, end, before, limit)
+    rows = [(row[0], isoformat(row[1]), *row[2:]) for row in rows]
+    next_cursor = f"{rows[limit - 1][1]},{rows[limit - 1][0]}" if len(rows) > limit else None
+    # Archived rows never change and live ones are few, so the body hash is the validator
+    return listing_response({
+        "delivery_history": rows_payload(HISTORY_FIELDS, rows[:limit], wants_columns(request.args)),
+        "next_cursor": next_cursor
+    })
+
+# Start-up: each serving process starts the background threads and warms up before it reports
+# ready (see startup.py); serve.py imports the app once and forks its workers from there
+app1.config['WARM_UP'] = os.getenv('WARM_UP', '1') == '1'  # 0 starts workers without warming up
+app1.config['WARM_DB_CONNECTIONS'] = int(os.getenv('WARM_DB_CONNECTIONS', '0')) or app1.config['DB_POOL_SIZE']  # default: the whole pool
+app1.config['WARM_CACHE_ORDERS'] = int(os.getenv('WARM_CACHE_ORDERS', '1000'))  # newest orders loaded into the order cache
+startup = Startup()
+for component in (revocations, rollups, order_events, archiver, courier_positions, location_buffer):
+    startup.service(component)
+
+# The reads behind login, track-order and assigned-orders, run once with keys that match nothing.
+# mysqlclient binds parameters on the client, so there are no server-side statements to prepare;
+# running them opens the tables and reads their index roots before the first real request does.
+WARM_STATEMENTS = [
+    ("SELECT customer_id, email, password FROM customers WHERE email = %s", ('',)),
+    ("SELECT delivery_person_id, email, password FROM delivery_persons WHERE email = %s", ('',)),
+    ("SELECT id, username, password FROM admins WHERE username = %s", ('',)),
+    *[(f"SELECT {', '.join(ORDER_FIELDS)} FROM {table} WHERE order_id = %s", (0,)) for table in ORDER_TABLES],
+    ("SELECT order_id, customer_id, assigned_to, status FROM orders WHERE assigned_to = %s", (0,)),
+    ("SELECT status, delivery_person_id, order_count FROM order_status_counts WHERE delivery_person_id = %s", (0,)),
+]
+
+
+@startup.step('db_connections')
+def warm_connections():
+    db.prefill(app1.config['WARM_DB_CONNECTIONS'])
+
+
+@startup.step('statements')
+def warm_statements():
+    with db.cursor() as cursor:
+        for sql, params in WARM_STATEMENTS:
+            cursor.execute(sql, params)
+            cursor.fetchall()
+
+
+@startup.step('revocations')
+def warm_revocations():
+    # Every token is checked against the denylist, so load it before the first one arrives
+    revocations.sync()
+
+
+@startup.step('courier_positions')
+def warm_courier_positions():
+    courier_positions.sync()
+
+
+@startup.step('order_cache')
+def warm_order_cache():
+    # The newest orders are the ones customers are tracking
+    if not app1.config['WARM_CACHE_ORDERS']:
+        return
+    with db.cursor() as cursor:
+        cursor.execute("SELECT MAX(order_id) FROM orders")
+        newest = cursor.fetchone()[0] or 0
+        oldest = max(newest - app1.config['WARM_CACHE_ORDERS'], 0)
+        # Generations before the read, as on a miss: other workers may be writing already (shared CACHE_URL)
+        generations = {order_id: order_cache.generation(order_key(order_id)) for order_id in range(oldest + 1, newest + 1)}
+        cursor.execute(f"SELECT {', '.join(ORDER_FIELDS)} FROM orders WHERE order_id > %s AND order_id <= %s",
+                       (oldest, newest))
+        rows = cursor.fetchall()
+    for row in rows:
+        order_cache.set(order_key(row[0]), dict(zip(ORDER_FIELDS, row)), generations[row[0]])
+
+
+@startup.step('password_hashing')
+def warm_password_hashing():
+    hasher.warm()
+
+
+@startup.step('routes')
+def warm_routes():
+    # Werkzeug compiles the URL map on the first match otherwise
+    app1.url_map.update()
+
+
+def create_app(warm=None, skip=()):
+    # Entry point for servers and scripts: starts this process's background threads and warms it up
+    # (WARM_UP) before returning, so its first request is served warm. Call it in each worker
+    # process, after forking. app1 stays one module-level app that the routes, asgi.py and the
+    # CLIs share; a process that never calls this starts on its first request instead. skip names
+    # warm-up steps to leave out.
+    startup.start(app1.config['WARM_UP'] if warm is None else warm, skip)
+    return app1
+
+
+@app1.before_request
+def start_on_first_request():
+    # Liveness probes must answer while a worker is still warming up
+    if not startup.started() and request.path != '/health':
+        startup.start(app1.config['WARM_UP'])
+
+
+# Liveness: the process is up and answering
+@app1.route('/health', methods=['GET'])
+def health():
+    return jsonify({"status": "ok"}), 200
+
+# Readiness: this worker has warmed up and reaches the database; with import and warm-up timings
+@app1.route('/ready', methods=['GET'])
+def readiness():
+    status = startup.status()
+    if not status["ready"]:
+        return jsonify(status), 503
+    try:
+        with db.cursor() as cursor:
+            cursor.execute("SELECT 1")
+            cursor.fetchall()
+    except Exception as e:
+        return jsonify({**status, "ready": False, "error": f"Database unavailable: {e}"}), 503
+    return jsonify(status), 200
+
+
+startup.imported(time.perf_counter() - IMPORT_STARTED)
+
 if __name__ == '__main__':
-    app1.run(debug=True)
\ No newline at end of file
+    create_app().run(debug=True)
@@ -0,0 +1,188 @@
+import argparse
+import logging
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from order_status import CLOSED_STATUSES
+
+logger = logging.getLogger(__name__)
+
+# Archival of closed orders.
+# Delivered and failed orders closed (closed_at) more than `after_days` ago are moved from orders
+# to orders_archive in batches: the rows are copied and deleted in one transaction, so an order
+# is always in exactly one of the two tables. Batches are taken with SKIP LOCKED, so any number
+# of workers can run the thread, and a pause between batches keeps the moves from competing
+# with live traffic. Order ids are never reused, so reads fall back to the archive by id
+# (order_row) and courier history reads both tables (history_page). The status counters,
+# order_events and the rollups keep counting archived orders.
+#
+#   python archive.py run      # archive everything that is due now
+#   python archive.py status
+
+ORDER_TABLES = ('orders', 'orders_archive')
+ARCHIVE_COLUMNS = ['order_id', 'customer_id', 'assigned_to', 'status', 'location', 'pickup_address', 'drop_address',
+                   'created_at', 'updated_at', 'closed_at']
+
+
+def order_row(cursor, columns, where, params):
+    # First row matching `where` in orders, then in the archive. Live first: an order moved
+    # between the two reads is found in the archive, never missed.
+    for table in ORDER_TABLES:
+        cursor.execute(f"SELECT {', '.join(columns)} FROM {table} WHERE {where}", params)
+        row = cursor.fetchone()
+        if row is not None:
+            return row
+    return None
+
+
+def history_page(cursor, columns, courier_id, status, start=None, end=None, before=None, limit=50):
+    # Closed orders of one courier, newest first by closed_at then order_id, from both tables.
+    # columns must start with order_id, closed_at. before: (closed_at, order_id) of the last
+    # row of the previous page. Returns up to limit + 1 rows, so the caller can tell if more follow.
+    clauses, params = ["assigned_to = %s", "status = %s"], [courier_id, status]
+    if start is not None:
+        clauses.append("closed_at >= %s")
+        params.append(start)
+    if end is not None:
+        clauses.append("closed_at < %s")
+        params.append(end)
+    if before is not None:
+        clauses.append("(closed_at < %s OR (closed_at = %s AND order_id < %s))")
+        params.extend([before[0], before[0], before[1]])
+    rows = {}
+    # Live first, as in order_row: an order moved in between is read twice rather than not at all
+    for table in ORDER_TABLES:
+        cursor.execute(
+            f"SELECT {', '.join(columns)} FROM {table} WHERE {' AND '.join(clauses)} "
+            "ORDER BY closed_at DESC, order_id DESC LIMIT %s",
+            params + [limit + 1]
+        )
+        for row in cursor.fetchall():
+            rows.setdefault(row[0], row)
+    return sorted(rows.values(), key=lambda row: (str(row[1] or ''), row[0]), reverse=True)[:limit + 1]
+
+
+class OrderArchiver:
+    # interval 0: start() runs no background thread (run `python archive.py run` from a scheduler instead)
+    def __init__(self, db, after_days=90, interval=300.0, batch_size=500, pause=0.5, on_batch=None):
+        self.db = db
+        self.after_days = after_days
+        self.interval = interval
+        self.batch_size = batch_size
+        self.pause = pause
+        # on_batch(moved rows as (order_id, assigned_to)), called after each batch commits
+        self.on_batch = on_batch
+        self.lock = threading.Lock()
+        self.counters = {"runs": 0, "batches": 0, "archived": 0, "errors": 0}
+
+    def start(self):
+        if self.interval:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.archive_all()
+            except Exception:
+                logger.exception("Order archival failed")
+                self.incr("errors")
+
+    def cutoff(self):
+        return datetime.utcnow() - timedelta(days=self.after_days)
+
+    def archive_all(self, log=None):
+        total = 0
+        while True:
+            moved = self.archive_batch()
+            total += moved
+            if log:
+                log(f"Archived {total} orders")
+            if moved < self.batch_size:
+                break
+            time.sleep(self.pause)
+        self.incr("runs")
+        return total
+
+    def archive_batch(self):
+        # One batch in one transaction; returns the number of orders moved
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                "SELECT order_id, assigned_to FROM orders "
+                f"WHERE status IN ({', '.join(['%s'] * len(CLOSED_STATUSES))}) AND closed_at < %s "
+                "ORDER BY order_id LIMIT %s FOR UPDATE SKIP LOCKED",
+                list(CLOSED_STATUSES) + [self.cutoff(), self.batch_size]
+            )
+            moved = cursor.fetchall()
+            if moved:
+                ids = [row[0] for row in moved]
+                placeholders = ', '.join(['%s'] * len(ids))
+                cursor.execute(
+                    f"INSERT INTO orders_archive ({', '.join(ARCHIVE_COLUMNS)}) "
+                    f"SELECT {', '.join(ARCHIVE_COLUMNS)} FROM orders WHERE order_id IN ({placeholders})",
+                    ids
+                )
+                cursor.execute(f"DELETE FROM orders WHERE order_id IN ({placeholders})", ids)
+        if moved:
+            self.incr("batches")
+            self.incr("archived", len(moved))
+            if self.on_batch:
+                self.on_batch(moved)
+        return len(moved)
+
+    def status(self):
+        with self.db.cursor() as cursor:
+            cursor.execute(
+                f"SELECT COUNT(*) FROM orders WHERE status IN ({', '.join(['%s'] * len(CLOSED_STATUSES))}) "
+                "AND closed_at < %s",
+                list(CLOSED_STATUSES) + [self.cutoff()]
+            )
+            due = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*) FROM orders")  # advisor: full-scan-ok (status report)
+            live = cursor.fetchone()[0]
+            cursor.execute("SELECT COUNT(*), MAX(archived_at) FROM orders_archive")  # advisor: full-scan-ok (status report)
+            archived, last = cursor.fetchone()
+        return {"live_orders": live, "archived_orders": archived, "due": due, "last_archived_at": last,
+                "after_days": self.after_days}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Archival of closed orders for the courier service")
+    commands = parser.add_subparsers(dest='command', required=True)
+    run = commands.add_parser('run', help="archive every closed order that is due")
+    run.add_argument('--after-days', type=int, help="override ARCHIVE_AFTER_DAYS")
+    commands.add_parser('status', help="show live and archived order counts and how many are due")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Reuse the service's configuration and connection pool
+    import app as service
+
+    config = service.app1.config
+    after_days = config['ARCHIVE_AFTER_DAYS']
+    if getattr(args, 'after_days', None) is not None:
+        after_days = args.after_days
+    archiver = OrderArchiver(service.db, after_days=after_days, interval=0, batch_size=config['ARCHIVE_BATCH_SIZE'],
+                             pause=config['ARCHIVE_PAUSE_SECONDS'], on_batch=service.archived_orders)
+    if args.command == 'run':
+        archiver.archive_all(log=print)
+    else:
+        for key, value in archiver.status().items():
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
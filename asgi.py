@@ -0,0 +1,710 @@
+import asyncio
+import contextvars
+import functools
+import io
+import json
+import logging
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from urllib.parse import parse_qsl
+
+import aiomysql
+from flask_jwt_extended import create_access_token, create_refresh_token, decode_token
+from jwt import ExpiredSignatureError, InvalidTokenError
+from werkzeug.datastructures import Headers, MultiDict
+from werkzeug.http import parse_etags
+
+import app as service
+from aiodb import AsyncDatabase
+from archive import ORDER_TABLES
+from auth import ROLE_ERRORS
+from cache import order_key, assigned_key
+from db import PoolExhausted
+from events import sse_format
+from hashing import HashingBusy
+from locations import parse_fix
+from order_status import COURIER_STATUSES, InvalidTransition, change_statements, check_transition, closed_at
+from responses import body_etag, choose_encoding, compress, rows_payload, wants_columns
+
+# ASGI serving mode: `python serve.py` (or `uvicorn asgi:application`).
+# The hot routes below run as coroutines over an aiomysql pool, so a client waiting on MySQL
+# costs a coroutine rather than a thread. bcrypt still runs in the hashing process pool and is
+# awaited through a small thread pool. Every other route is passed to the Flask app (app1) on a
+# thread pool, so the two modes serve the same API with the same responses. The tracking stream
+# (SSE) is served here as well, so the open streams never occupy that pool.
+
+log = logging.getLogger('asgi')
+
+app1 = service.app1
+app1.config['ASGI_WSGI_THREADS'] = int(service.os.getenv('ASGI_WSGI_THREADS', '32'))  # threads for routes served by Flask
+adb = AsyncDatabase(app1.config)
+adb.observer = service.metrics.observe_query
+adb.on_wait = service.metrics.observe_pool_wait
+wsgi_threads = ThreadPoolExecutor(max_workers=app1.config['ASGI_WSGI_THREADS'], thread_name_prefix='wsgi')
+# One thread per queued bcrypt call; the hasher's own max_pending/queue_timeout still apply
+hash_threads = ThreadPoolExecutor(max_workers=service.hasher.max_pending + 1, thread_name_prefix='hash-wait')
+app1.config['ASGI_IO_THREADS'] = int(service.os.getenv('ASGI_IO_THREADS', '8'))  # threads for blocking cache/broker calls
+io_threads = ThreadPoolExecutor(max_workers=app1.config['ASGI_IO_THREADS'], thread_name_prefix='io')
+
+
+class HTTPError(Exception):
+    def __init__(self, status, payload, headers=None):
+        super().__init__(payload)
+        self.status = status
+        self.payload = payload
+        self.headers = headers or {}
+
+
+class Request:
+    def __init__(self, scope, body):
+        self.method = scope['method']
+        self.path = scope['path']
+        self.args = MultiDict(parse_qsl(scope.get('query_string', b'').decode('latin-1'), keep_blank_values=True))
+        self.headers = Headers([(k.decode('latin-1'), v.decode('latin-1')) for k, v in scope.get('headers', [])])
+        self.body = body
+        self.claims = {}
+
+    @property
+    def json(self):
+        try:
+            data = json.loads(self.body or b'null')
+        except ValueError:
+            raise HTTPError(400, {"error": "Invalid JSON body"})
+        if not isinstance(data, dict):
+            raise HTTPError(400, {"error": "JSON object body required"})
+        return data
+
+    @property
+    def identity(self):
+        return self.claims.get('sub')
+
+
+class Response:
+    def __init__(self, body=b'', status=200, content_type='application/json', headers=None, stream=None):
+        self.body = body
+        self.status = status
+        self.content_type = content_type
+        self.headers = headers or {}
+        self.stream = stream
+
+
+def jsonify(payload, status=200, headers=None):
+    # Same bytes as flask.jsonify in production mode
+    body = app1.json.dumps(payload, separators=(",", ":")) + "\n"
+    return Response(body.encode('utf-8'), status, headers=headers)
+
+
+async def blocking(fn, *args):
+    return await asyncio.get_running_loop().run_in_executor(hash_threads, fn, *args)
+
+
+async def offload(fn, *args):
+    # Calls that may wait on a file or socket (the SQLite cache and broker, rate-limit buckets,
+    # the revocation sync) run beside the event loop, never on it
+    return await asyncio.get_running_loop().run_in_executor(io_threads, fn, *args)
+
+
+# ---- authentication (same rules and messages as flask_jwt_extended + auth.role_required)
+
+def bearer_token(request, query_string=False):
+    # Header first, then ?jwt= where the route allows it (locations=['headers', 'query_string'])
+    header = request.headers.get('Authorization', '')
+    if header:
+        parts = header.split()
+        if len(parts) != 2 or parts[0] != 'Bearer':
+            raise HTTPError(422, {"msg": "Bad Authorization header. Expected 'Authorization: Bearer <JWT>'"})
+        return parts[1]
+    if not query_string:
+        raise HTTPError(401, {"msg": "Missing Authorization Header"})
+    token = request.args.get('jwt')
+    if not token:
+        raise HTTPError(401, {"msg": "Missing JWT in headers or query_string "
+                                     "(Missing Authorization Header; Missing 'jwt' query paramater)"})
+    return token
+
+
+async def authenticate(request, roles, message=None, refresh=False, query_string=False):
+    token = bearer_token(request, query_string)
+    try:
+        with app1.app_context():
+            claims = decode_token(token)
+    except ExpiredSignatureError:
+        raise HTTPError(401, {"msg": "Token has expired"})
+    except InvalidTokenError as e:
+        raise HTTPError(422, {"msg": str(e)})
+    if claims.get('type') != ('refresh' if refresh else 'access'):
+        raise HTTPError(422, {"msg": "Only refresh tokens are allowed" if refresh else "Only non-refresh tokens are allowed"})
+    # In memory after the first sync at startup, but that sync (or a late one) reads MySQL
+    if await offload(service.revocations.is_revoked, claims):
+        raise HTTPError(401, {"msg": "Token has been revoked"})
+    if roles and claims.get('role') not in roles:
+        raise HTTPError(403, {"error": message or ROLE_ERRORS.get(tuple(roles), "Access denied")})
+    request.claims = claims
+
+
+# ---- routes
+
+LOGIN_QUERIES = {
+    'customer': "SELECT customer_id, password FROM customers WHERE email = %s",
+    'delivery_person': "SELECT delivery_person_id, password FROM delivery_persons WHERE email = %s",
+    'admin': "SELECT id, password FROM admins WHERE username = %s",
+}
+
+
+async def login(request):
+    data = request.json
+    email = data.get('email')
+    password = data.get('password')
+    role = data.get('role')
+    if not all([email, password, role]):
+        return jsonify({"error": "Email/UserID, password, and role are required"}, 400)
+    if role not in LOGIN_QUERIES:
+        return jsonify({"error": "Invalid role specified"}, 400)
+
+    async with adb.cursor() as cursor:
+        await cursor.execute(LOGIN_QUERIES[role], (email,))
+        user = await cursor.fetchone()
+    if not user:
+        return jsonify({"error": "Invalid credentials"}, 401)
+    user_id, stored_password = user
+
+    hasher = service.hasher
+    if not await blocking(hasher.verify, stored_password, password):
+        return jsonify({"error": "Invalid credentials"}, 401)
+
+    # Transparently upgrade hashes made with an outdated work factor
+    if hasher.needs_rehash(stored_password):
+        table, key = service.PASSWORD_TABLES[role]
+        new_hash = await blocking(hasher.hash, password)
+        async with adb.transaction() as cursor:
+            await cursor.execute(
+                f"UPDATE {table} SET password = %s WHERE {key} = %s AND password = %s",
+                (new_hash, user_id, stored_password)
+            )
+        hasher.incr("rehashed")
+
+    with app1.app_context():
+        token = create_access_token(identity=str(user_id), additional_claims={'role': role})
+        refresh_token = create_refresh_token(identity=str(user_id), additional_claims={'role': role})
+    return jsonify({
+        "message": "Login successful",
+        "token": token,
+        "refresh_token": refresh_token,
+        "expires_in": int(app1.config['JWT_ACCESS_TOKEN_EXPIRES'].total_seconds()),
+        "role": role,
+        "id": user_id
+    })
+
+
+async def track_order(request, order_id):
+    order = await offload(service.order_cache.get, order_key(order_id))
+    if order is None:
+        generation = await offload(service.order_cache.generation, order_key(order_id))
+        async with adb.cursor() as cursor:
+            # Live orders first, then the archive (as archive.order_row)
+            for table in ORDER_TABLES:
+                await cursor.execute(
+                    f"SELECT order_id, customer_id, assigned_to, status FROM {table} WHERE order_id = %s",
+                    (order_id,)
+                )
+                row = await cursor.fetchone()
+                if row:
+                    break
+        if row:
+            order = {"order_id": row[0], "customer_id": row[1], "assigned_to": row[2], "status": row[3]}
+            await offload(service.order_cache.set, order_key(order_id), order, generation)
+    if order and str(order["customer_id"]) == str(request.identity):
+        return jsonify({"order": order})
+    return jsonify({"message": "Order not found or access denied"}, 404)
+
+
+async def assigned_orders(request):
+    courier_id = request.identity
+    orders = await offload(service.order_cache.get, assigned_key(courier_id))
+    if orders is None:
+        generation = await offload(service.order_cache.generation, assigned_key(courier_id))
+        async with adb.cursor() as cursor:
+            await cursor.execute(
+                "SELECT order_id, customer_id, assigned_to, status FROM orders WHERE assigned_to = %s",
+                (courier_id,)
+            )
+            rows = await cursor.fetchall()
+        orders = [{"order_id": o[0], "customer_id": o[1], "assigned_to": o[2], "status": o[3]} for o in rows]
+        await offload(service.order_cache.set, assigned_key(courier_id), orders, generation)
+    if wants_columns(request.args):
+        orders = rows_payload(service.ORDER_FIELDS, [[o[f] for f in service.ORDER_FIELDS] for o in orders], True)
+    return jsonify({"assigned_orders": orders})
+
+
+async def update_order_status(request):
+    courier_id = request.identity
+    data = request.json
+    order_id = data.get('order_id')
+    status = data.get('status')
+    if not all([order_id, status]):
+        return jsonify({"error": "Order ID and status are required"}, 400)
+    async with adb.transaction() as cursor:
+        await cursor.execute(
+            "SELECT status FROM orders WHERE order_id = %s AND assigned_to = %s FOR UPDATE",
+            (order_id, courier_id)
+        )
+        row = await cursor.fetchone()
+        if row:
+            try:
+                check_transition(row[0], status, COURIER_STATUSES)
+            except InvalidTransition as e:
+                return jsonify({"error": str(e)}, 409)
+            await cursor.execute("UPDATE orders SET status = %s, closed_at = %s WHERE order_id = %s",
+                                 (status, closed_at(status), order_id))
+            for sql, params in change_statements([(order_id, row[0], status, int(courier_id), int(courier_id))],
+                                                 'delivery_person', courier_id):
+                await cursor.execute(sql, params)
+        updated = row is not None
+    if updated:
+        await offload(service.invalidate_orders, [order_id], [courier_id])
+        await offload(service.order_events.publish, order_id,
+                      {"type": "status", "order_id": order_id, "status": status})
+    return jsonify({"message": "Order status updated successfully"})
+
+
+async def update_order_location(request):
+    courier_id = request.identity
+    data = request.json
+    order_id = data.get('order_id')
+    location = data.get('location')
+    if not all([order_id, location]):
+        return jsonify({"error": "Order ID and location are required"}, 400)
+    recorded_at = datetime.utcnow()
+    async with adb.transaction() as cursor:
+        await cursor.execute(
+            "UPDATE orders SET location = %s, location_recorded_at = %s WHERE order_id = %s AND assigned_to = %s",
+            (location, recorded_at, order_id, courier_id)
+        )
+        updated = cursor.rowcount
+    if updated:
+        await offload(service.invalidate_orders, [order_id])
+        await offload(service.order_events.publish, order_id,
+                      {"type": "location", "order_id": order_id, "location": location})
+        try:
+            fix = parse_fix({"order_id": order_id, "location": location})
+            fix['recorded_at'] = recorded_at
+            fix['delivery_person_id'] = int(courier_id)
+            fix['published'] = True
+            service.location_buffer.add([fix])
+        except (ValueError, TypeError):
+            pass
+    return jsonify({"message": "Order location updated successfully"})
+
+
+class Subscription:
+    # EventHub subscriber for a coroutine: dispatch() runs on the broker's or a publisher's thread
+    # and hands each event to the loop, which drops the oldest when the consumer falls behind
+    def __init__(self, loop, maxsize):
+        self.loop = loop
+        self.queue = asyncio.Queue(maxsize)
+
+    def put_nowait(self, payload):
+        try:
+            self.loop.call_soon_threadsafe(self.deliver, payload)
+        except RuntimeError:  # the loop has shut down
+            pass
+
+    def deliver(self, payload):
+        if self.queue.full():
+            self.queue.get_nowait()
+        self.queue.put_nowait(payload)
+
+
+async def track_order_events(request, order_id):
+    # Same stream as the Flask route, served on the loop: an open stream costs a coroutine, not
+    # one of the wsgi_threads
+    async with adb.cursor() as cursor:
+        for table in ORDER_TABLES:
+            await cursor.execute(
+                f"SELECT order_id, customer_id, assigned_to, status, location FROM {table} "
+                "WHERE order_id = %s AND customer_id = %s",
+                (order_id, request.identity)
+            )
+            row = await cursor.fetchone()
+            if row:
+                break
+    if not row:
+        return jsonify({"message": "Order not found or access denied"}, 404)
+
+    snapshot = dict(zip(("order_id", "customer_id", "assigned_to", "status", "location"), row))
+    hub = service.order_events
+    subscription = Subscription(asyncio.get_running_loop(), hub.queue_size)
+    hub.subscribe(order_id, subscription)
+    keepalive = app1.config['SSE_KEEPALIVE_SECONDS']
+
+    async def generate():
+        try:
+            yield sse_format(snapshot, event="snapshot").encode('utf-8')
+            while True:
+                try:
+                    payload = await asyncio.wait_for(subscription.queue.get(), keepalive)
+                except asyncio.TimeoutError:
+                    yield b": keepalive\n\n"
+                    continue
+                yield sse_format(payload, event=payload.get("type")).encode('utf-8')
+        finally:
+            hub.unsubscribe(order_id, subscription)
+
+    return Response(content_type='text/event-stream; charset=utf-8', stream=generate(),
+                    headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+
+
+def wants_stream(request):
+    return (request.args.get('format') == 'ndjson'
+            or 'application/x-ndjson' in request.headers.get('Accept', ''))
+
+
+async def fetch_page(request, sql, params, fields, key):
+    limit = service.page_limit(request.args)
+    async with adb.cursor() as cursor:
+        await cursor.execute(sql + " LIMIT %s", params + [limit])
+        rows = await cursor.fetchall()
+    next_cursor = rows[-1][fields.index(key)] if len(rows) == limit else None
+    return rows_payload(fields, rows, wants_columns(request.args)), next_cursor
+
+
+def stream_rows(request, queries):
+    limit = request.args.get('limit', type=int)
+
+    async def generate():
+        for sql, params, fields, extra in queries:
+            if limit:
+                sql, params = sql + " LIMIT %s", params + [limit]
+            async with adb.cursor(aiomysql.SSCursor) as cursor:
+                await cursor.execute(sql, params)
+                while True:
+                    rows = await cursor.fetchmany(service.STREAM_BATCH_SIZE)
+                    if not rows:
+                        break
+                    yield ''.join(
+                        json.dumps({**extra, **dict(zip(fields, row))}, default=str) + '\n' for row in rows
+                    ).encode('utf-8')
+
+    return Response(content_type='application/x-ndjson', stream=generate())
+
+
+def listing_query(request, *args):
+    try:
+        return service.build_listing_query(*args, args=request.args)
+    except ValueError:
+        raise HTTPError(400, {"error": "Invalid filter value"})
+
+
+async def view_all_orders(request):
+    sql, params = listing_query(request, service.ORDER_FIELDS, "orders", "order_id", service.ORDER_FILTERS)
+    if wants_stream(request):
+        return stream_rows(request, [(sql, params, service.ORDER_FIELDS, {})])
+    orders, next_cursor = await fetch_page(request, sql, params, service.ORDER_FIELDS, "order_id")
+    return jsonify({"orders": orders, "next_cursor": next_cursor})
+
+
+async def view_issues(request):
+    sql, params = listing_query(request, service.ISSUE_FIELDS, "issues", "issue_id", service.ISSUE_FILTERS)
+    if wants_stream(request):
+        return stream_rows(request, [(sql, params, service.ISSUE_FIELDS, {})])
+    issues, next_cursor = await fetch_page(request, sql, params, service.ISSUE_FIELDS, "issue_id")
+    return jsonify({"issues": issues, "next_cursor": next_cursor})
+
+
+async def view_users(request):
+    user_type = request.args.get('type')
+    if user_type not in (None, 'customer', 'delivery_person'):
+        return jsonify({"error": "Invalid user type"}, 400)
+    try:
+        customers_query = service.build_listing_query(
+            service.CUSTOMER_FIELDS, "customers", "customer_id", [], 'customers_after', args=request.args)
+        delivery_query = service.build_listing_query(
+            service.DELIVERY_PERSON_FIELDS, "delivery_persons", "delivery_person_id", [], 'delivery_persons_after',
+            args=request.args)
+    except ValueError:
+        return jsonify({"error": "Invalid cursor"}, 400)
+
+    if wants_stream(request):
+        queries = []
+        if user_type in (None, 'customer'):
+            queries.append((*customers_query, service.CUSTOMER_FIELDS, {"user_type": "customer"}))
+        if user_type in (None, 'delivery_person'):
+            queries.append((*delivery_query, service.DELIVERY_PERSON_FIELDS, {"user_type": "delivery_person"}))
+        return stream_rows(request, queries)
+
+    result = {}
+    if user_type in (None, 'customer'):
+        result["customers"], result["customers_next_cursor"] = await fetch_page(
+            request, *customers_query, service.CUSTOMER_FIELDS, "customer_id")
+    if user_type in (None, 'delivery_person'):
+        result["delivery_persons"], result["delivery_persons_next_cursor"] = await fetch_page(
+            request, *delivery_query, service.DELIVERY_PERSON_FIELDS, "delivery_person_id")
+    return jsonify(result)
+
+
+# (method, Flask-style rule, handler, roles or None for public)
+ROUTES = [
+    ('POST', '/login', login, None),
+    ('GET', '/customer/track-order/<int:order_id>', track_order, ('customer',)),
+    ('GET', '/customer/track-order/<int:order_id>/events', track_order_events, ('customer',)),
+    ('GET', '/delivery/assigned-orders', assigned_orders, ('delivery_person',)),
+    ('PATCH', '/delivery/update-status', update_order_status, ('delivery_person',)),
+    ('PATCH', '/delivery/update-location', update_order_location, ('delivery_person',)),
+    ('GET', '/admin/orders', view_all_orders, ('admin',)),
+    ('GET', '/admin/issues', view_issues, ('admin',)),
+    ('GET', '/admin/users', view_users, ('admin',)),
+]
+
+
+# Listings get the same ETag/304 handling as in app.py (validated by a hash of the body here)
+CONDITIONAL_ROUTES = {'/delivery/assigned-orders', '/admin/orders', '/admin/issues', '/admin/users'}
+
+# EventSource cannot set headers, so these also take the token as ?jwt=<token>
+QUERY_TOKEN_ROUTES = {'/customer/track-order/<int:order_id>/events'}
+
+
+def compile_rule(rule):
+    pattern = re.sub(r"<int:(\w+)>", r"(?P<\1>\\d+)", rule)
+    return re.compile(f"^{pattern}$")
+
+
+ROUTE_TABLE = [(method, compile_rule(rule), rule, handler, roles) for method, rule, handler, roles in ROUTES]
+
+
+def match_route(method, path):
+    for route_method, pattern, rule, handler, roles in ROUTE_TABLE:
+        if route_method == method:
+            match = pattern.match(path)
+            if match:
+                return rule, handler, roles, {k: int(v) for k, v in match.groupdict().items()}
+    return None
+
+
+# ---- ASGI plumbing
+
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        if message['type'] == 'http.disconnect':
+            raise ConnectionError("client disconnected")
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body'):
+            return b''.join(chunks)
+
+
+class RequestBody(io.RawIOBase):
+    # wsgi.input for the Flask fallback: the body is received as the view reads it, so an upload
+    # such as the streaming bulk import is never held in memory whole
+    def __init__(self, receive, loop):
+        self.receive = receive
+        self.loop = loop
+        self.pending = b''
+        self.more = True
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        # Runs on a wsgi thread; waits for the next ASGI message on the loop
+        while not self.pending and self.more:
+            message = asyncio.run_coroutine_threadsafe(self.receive(), self.loop).result()
+            if message['type'] == 'http.disconnect':
+                raise ConnectionError("client disconnected")
+            self.pending = message.get('body', b'')
+            self.more = message.get('more_body', False)
+        count = min(len(buffer), len(self.pending))
+        buffer[:count] = self.pending[:count]
+        self.pending = self.pending[count:]
+        return count
+
+
+def watch_disconnect(receive):
+    # Resolves when the client goes away, so streaming responses can stop early
+    async def wait():
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+    return asyncio.ensure_future(wait())
+
+
+def finish_response(request, rule, response):
+    # ETag/304 for listings and compression, as responses.Compression does for the Flask routes
+    if response.status != 200 or response.stream is not None:
+        return response
+    tag = None
+    if rule in CONDITIONAL_ROUTES:
+        tag = body_etag(response.body)
+        response.headers.update({'ETag': f'"{tag}"', 'Cache-Control': 'private, no-cache'})
+        if parse_etags(request.headers.get('If-None-Match')).contains_weak(tag):
+            return Response(b'', 304, headers=response.headers)
+    response.headers['Vary'] = 'Accept-Encoding'
+    encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+    if encoding and len(response.body) >= app1.config['COMPRESS_MIN_SIZE']:
+        response.body = compress(response.body, encoding, app1.config['COMPRESS_LEVEL'])
+        response.headers['Content-Encoding'] = encoding
+        if tag:
+            response.headers['ETag'] = f'W/"{tag}"'
+    return response
+
+
+async def send_response(send, receive, response):
+    # CORS(app1) answers preflights through the Flask fallback; match its header on the native routes
+    headers = [(b'content-type', response.content_type.encode('latin-1')), (b'access-control-allow-origin', b'*')]
+    headers += [(k.lower().encode('latin-1'), str(v).encode('latin-1')) for k, v in response.headers.items()]
+    if response.stream is None:
+        if response.status != 304:
+            headers.append((b'content-length', str(len(response.body)).encode('latin-1')))
+        await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+        await send({'type': 'http.response.body', 'body': response.body})
+        return
+    await send({'type': 'http.response.start', 'status': response.status, 'headers': headers})
+    disconnected = watch_disconnect(receive)
+    try:
+        async for chunk in response.stream:
+            if disconnected.done():
+                break
+            await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        await response.stream.aclose()
+
+
+def wsgi_environ(scope, stream):
+    server = scope.get('server') or ('localhost', 80)
+    environ = {
+        'REQUEST_METHOD': scope['method'],
+        'SCRIPT_NAME': scope.get('root_path', ''),
+        'PATH_INFO': scope['path'].encode('utf-8').decode('latin-1'),
+        'QUERY_STRING': scope.get('query_string', b'').decode('latin-1'),
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': f"HTTP/{scope.get('http_version', '1.1')}",
+        'REMOTE_ADDR': (scope.get('client') or ('', 0))[0],
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': scope.get('scheme', 'http'),
+        'wsgi.input': stream,
+        'wsgi.input_terminated': True,  # read to the end when there is no Content-Length (chunked)
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': True,
+        'wsgi.run_once': False,
+    }
+    for name, value in scope.get('headers', []):
+        name, value = name.decode('latin-1'), value.decode('latin-1')
+        if name == 'content-type':
+            environ['CONTENT_TYPE'] = value
+        elif name == 'content-length':
+            environ['CONTENT_LENGTH'] = value
+        else:
+            key = 'HTTP_' + name.upper().replace('-', '_')
+            environ[key] = f"{environ[key]},{value}" if key in environ else value
+    return environ
+
+
+async def call_flask(scope, receive, send):
+    # Runs app1 on the thread pool; the request body is streamed in and the response (including
+    # NDJSON streams) relayed chunk by chunk. Each step may run on another pool thread, so all of
+    # them run in this request's own context: a stream holds its pooled connection in a ContextVar
+    # (db.checkout), which must neither leak to other requests on the thread nor be reset elsewhere.
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    stream = io.BufferedReader(RequestBody(receive, loop))
+    started = {}
+
+    def start_response(status, headers, exc_info=None):
+        started['status'] = int(status.split(' ', 1)[0])
+        started['headers'] = headers
+
+    def begin():
+        iterable = app1(wsgi_environ(scope, stream), start_response)
+        return iterable, iter(iterable)
+
+    iterable, iterator = await loop.run_in_executor(wsgi_threads, context.run, begin)
+    disconnected = watch_disconnect(receive)
+    try:
+        await send({
+            'type': 'http.response.start',
+            'status': started['status'],
+            'headers': [(k.lower().encode('latin-1'), v.encode('latin-1')) for k, v in started['headers']],
+        })
+        while not disconnected.done():
+            chunk = await loop.run_in_executor(wsgi_threads, context.run, next, iterator, None)
+            if chunk is None:
+                break
+            if chunk:
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body', 'body': b''})
+    finally:
+        disconnected.cancel()
+        if hasattr(iterable, 'close'):
+            await loop.run_in_executor(wsgi_threads, context.run, iterable.close)
+
+
+async def handle(scope, receive, send):
+    route = match_route(scope['method'], scope['path'])
+    if route is None:
+        return await call_flask(scope, receive, send)
+
+    rule, handler, roles, params = route
+    started = time.perf_counter()
+    # The native routes take small JSON bodies
+    request = Request(scope, await read_body(receive))
+    try:
+        if roles is not None:
+            await authenticate(request, roles, query_string=rule in QUERY_TOKEN_ROUTES)
+        # Same rate limits as the Flask routes; the aiomysql pool bounds the work in flight here
+        wait = await offload(service.check_rate_limits, rule, request.claims.get('sub'),
+                             request.claims.get('role'), (scope.get('client') or ('', 0))[0])
+        if wait is not None:
+            raise HTTPError(429, {"error": "Too many requests"}, {'Retry-After': wait})
+        response = await handler(request, **params)
+    except HTTPError as e:
+        response = jsonify(e.payload, e.status, e.headers)
+    except (PoolExhausted, HashingBusy) as e:
+        response = jsonify({"error": str(e)}, 503, {'Retry-After': '1'})
+    except Exception:
+        log.exception("Unhandled error in %s %s", scope['method'], scope['path'])
+        response = jsonify({"error": "Internal server error"}, 500)
+    await send_response(send, receive, finish_response(request, rule, response))
+    service.metrics.requests.observe((scope['method'], rule, str(response.status)), time.perf_counter() - started)
+
+
+async def lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await adb.start()
+                if app1.config['WARM_UP']:
+                    await adb.prefill(app1.config['WARM_DB_CONNECTIONS'])
+                # Threads and warm-up of this worker (see startup.py); the revocation denylist is
+                # loaded before the first request is checked against it. The hot routes use the
+                # aiomysql pool warmed above, so the MySQLdb pool is left to fill on demand.
+                await asyncio.get_running_loop().run_in_executor(
+                    wsgi_threads, functools.partial(service.create_app, skip=('db_connections',)))
+            except Exception as e:
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+                return
+            await send({'type': 'lifespan.startup.complete'})
+        elif message['type'] == 'lifespan.shutdown':
+            await adb.close()
+            wsgi_threads.shutdown(wait=False)
+            hash_threads.shutdown(wait=False)
+            io_threads.shutdown(wait=False)
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+async def application(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        return await lifespan(receive, send)
+    if scope['type'] != 'http':
+        return
+    try:
+        await handle(scope, receive, send)
+    except ConnectionError:
+        pass
@@ -0,0 +1,184 @@
+import threading
+import time
+from datetime import datetime, timezone
+from functools import wraps
+
+from flask import current_app, jsonify
+from flask_jwt_extended import get_jwt, verify_jwt_in_request
+
+# Authentication for the JWT-protected routes.
+# `role_required(...)` verifies the token and the role claim in one place. Revocation is
+# answered from memory: revoked token ids (jti) and revoked users (every token issued to the
+# user before a given moment) live in two dicts, so a check is two lookups and never a query.
+# The token_revocations table is the shared record; each worker polls it for new rows.
+
+ROLE_ERRORS = {
+    ('admin',): "Admin access required",
+    ('customer',): "Customer access required",
+    ('delivery_person',): "Delivery person access required",
+}
+
+
+def current_role():
+    return get_jwt().get('role')
+
+
+def role_required(*roles, message=None, locations=None, refresh=False):
+    # No roles: any valid token. The JWT check is timed as the 'jwt' request phase when metrics are on.
+    def wrapper(fn):
+        @wraps(fn)
+        def decorator(*args, **kwargs):
+            metrics = current_app.extensions.get('metrics')
+            if metrics is not None:
+                with metrics.phase('jwt'):
+                    verify_jwt_in_request(locations=locations, refresh=refresh)
+            else:
+                verify_jwt_in_request(locations=locations, refresh=refresh)
+            if roles and current_role() not in roles:
+                return jsonify({"error": message or ROLE_ERRORS.get(roles, "Access denied")}), 403
+            return fn(*args, **kwargs)
+        return decorator
+    return wrapper
+
+
+def to_datetime(timestamp):
+    # Stored as naive UTC, like the other DATETIME columns
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def to_timestamp(value):
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+class RevocationList:
+    def __init__(self):
+        self.jtis = {}   # jti -> expires (epoch seconds)
+        self.users = {}  # (role, user id) -> (revoked at, expires)
+        self.lock = threading.Lock()
+
+    def add(self, jti, role, user_id, revoked_at, expires_at):
+        with self.lock:
+            if jti:
+                self.jtis[jti] = max(expires_at, self.jtis.get(jti, 0))
+            if user_id is not None:
+                key = (role, str(user_id))
+                previous = self.users.get(key, (0, 0))
+                self.users[key] = (max(revoked_at, previous[0]), max(expires_at, previous[1]))
+
+    def is_revoked(self, payload):
+        # Plain dict reads; writers replace values atomically
+        if payload.get('jti') in self.jtis:
+            return True
+        entry = self.users.get((payload.get('role'), str(payload.get('sub'))))
+        return entry is not None and payload.get('iat', 0) <= entry[0]
+
+    def prune(self, now):
+        with self.lock:
+            self.jtis = {jti: expires for jti, expires in self.jtis.items() if expires > now}
+            self.users = {key: entry for key, entry in self.users.items() if entry[1] > now}
+
+    def sizes(self):
+        return len(self.jtis), len(self.users)
+
+
+class TokenRevocations:
+    # `retention` must cover the longest token lifetime: a revoked user stays revoked that long.
+    # Rows are read again for `overlap` seconds so ones committed late are not missed.
+    def __init__(self, db, sync_interval=1.0, retention=86400, overlap=5.0):
+        self.db = db
+        self.sync_interval = sync_interval
+        self.retention = retention
+        self.overlap = overlap
+        self.revoked = RevocationList()
+        self.since = None
+        self.loaded = False
+        self.sync_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.counters = {"syncs": 0, "sync_errors": 0, "revoked_tokens": 0, "revoked_users": 0, "rejected": 0}
+
+    def start(self):
+        # In each process that serves requests (see startup.py)
+        threading.Thread(target=self.run, daemon=True).start()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def run(self):
+        syncs = 0
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+                syncs += 1
+                if syncs % 60 == 0:
+                    self.purge()
+            except Exception:
+                self.incr("sync_errors")
+
+    def sync(self):
+        # Incremental: only rows revoked since the last sync (minus the overlap window)
+        with self.sync_lock:
+            now = time.time()
+            since = now - self.retention if self.since is None else self.since - self.overlap
+            with self.db.cursor() as cursor:
+                cursor.execute(
+                    "SELECT jti, user_type, user_id, revoked_at, expires_at FROM token_revocations "
+                    "WHERE revoked_at >= %s ORDER BY revoked_at",
+                    (to_datetime(since),)
+                )
+                rows = cursor.fetchall()
+            latest = self.since or since
+            for jti, role, user_id, revoked_at, expires_at in rows:
+                revoked_at = to_timestamp(revoked_at)
+                self.revoked.add(jti, role, user_id, revoked_at, to_timestamp(expires_at))
+                latest = max(latest, revoked_at)
+            self.since = latest
+            self.loaded = True
+            self.incr("syncs")
+
+    def purge(self):
+        now = time.time()
+        self.revoked.prune(now)
+        with self.db.transaction() as cursor:
+            cursor.execute("DELETE FROM token_revocations WHERE expires_at < %s", (to_datetime(now),))
+
+    def is_revoked(self, payload):
+        if not self.loaded:
+            # Only until the first sync has completed
+            self.sync()
+        revoked = self.revoked.is_revoked(payload)
+        if revoked:
+            self.incr("rejected")
+        return revoked
+
+    def revoke_token(self, payload, cursor=None):
+        now = time.time()
+        self.record(cursor, payload['jti'], payload.get('role'), None, now, payload.get('exp', now + self.retention))
+        self.incr("revoked_tokens")
+
+    def revoke_user(self, role, user_id, cursor=None):
+        # Every token issued to the user until now; pass the cursor to record it in the caller's transaction
+        now = time.time()
+        self.record(cursor, None, role, user_id, now, now + self.retention)
+        self.incr("revoked_users")
+
+    def record(self, cursor, jti, role, user_id, revoked_at, expires_at):
+        self.revoked.add(jti, role, user_id, revoked_at, expires_at)
+        sql = ("INSERT INTO token_revocations (jti, user_type, user_id, revoked_at, expires_at) "
+               "VALUES (%s, %s, %s, %s, %s)")
+        params = (jti, role, user_id, to_datetime(revoked_at), to_datetime(expires_at))
+        if cursor is not None:
+            cursor.execute(sql, params)
+        else:
+            with self.db.transaction() as cursor:
+                cursor.execute(sql, params)
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats["tokens"], stats["users"] = self.revoked.sizes()
+        stats["loaded"] = self.loaded
+        return stats
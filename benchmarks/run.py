@@ -0,0 +1,335 @@
+import argparse
+import http.client
+import json
+import os
+import platform
+import random
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from benchmarks import sqlite_backend
+from benchmarks.seed import BENCH_PASSWORD, seed
+from migrate import migrate
+
+# Load-test harness for app.py.
+#
+#   python -m benchmarks.run --orders 100000 --scenario mixed --duration 30 --concurrency 16
+#
+# Boots app1 on a local port against a SQLite stand-in (or the MySQL database from
+# the MYSQL_* environment with --db mysql), seeds synthetic data, drives a weighted
+# workload from client threads, and reports throughput and p50/p95/p99 latency per route.
+# Results are written as JSON; --baseline compares them against an earlier run.
+
+# Scenario -> {operation: weight}
+SCENARIOS = {
+    "mixed": {"track_order": 40, "assigned_orders": 15, "update_location": 15, "bulk_location": 5,
+              "login": 5, "place_order": 4, "update_status": 4, "admin_orders": 5, "admin_users": 3,
+              "admin_issues": 3, "delivery_history": 1},
+    "login-storm": {"login": 100},
+    "tracking": {"track_order": 100},
+    "locations": {"update_location": 70, "bulk_location": 30},
+    "admin": {"admin_orders": 40, "admin_users": 20, "admin_issues": 20, "admin_orders_stream": 20},
+}
+
+# Courier transitions; ones that do not follow from the order's current status get a 409
+STATUS_FLOW = ['Picked Up', 'In Transit', 'Delivered']
+
+
+class QuietHandler(WSGIRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Context:
+    # Tokens and ids the workload draws from
+    def __init__(self, app, sample_size=2000):
+        from flask_jwt_extended import create_access_token
+        from app import db
+
+        with db.cursor() as cursor:
+            cursor.execute(
+                "SELECT order_id, customer_id, assigned_to FROM orders WHERE assigned_to IS NOT NULL "
+                "AND status <> 'Delivered' ORDER BY order_id DESC LIMIT %s", (sample_size,)
+            )
+            self.active_orders = list(cursor.fetchall())
+            cursor.execute("SELECT email FROM customers ORDER BY customer_id DESC LIMIT %s", (sample_size,))
+            self.customer_emails = [row[0] for row in cursor.fetchall()]
+            cursor.execute("SELECT email FROM delivery_persons ORDER BY delivery_person_id DESC LIMIT %s", (sample_size,))
+            self.courier_emails = [row[0] for row in cursor.fetchall()]
+        if not self.active_orders:
+            raise SystemExit("No assigned orders to drive the workload; seed more data")
+
+        with app.app_context():
+            def token(identity, role):
+                return create_access_token(identity=str(identity), additional_claims={'role': role},
+                                           expires_delta=False)
+            self.customer_tokens = {c: token(c, 'customer') for _, c, _ in self.active_orders}
+            self.courier_tokens = {d: token(d, 'delivery_person') for _, _, d in self.active_orders}
+            self.admin_token = token(1, 'admin')
+
+
+def build_request(op, rng, ctx):
+    # -> (route label, method, path, json body or None, token or None)
+    order_id, customer_id, courier_id = rng.choice(ctx.active_orders)
+    if op == "track_order":
+        return ("GET /customer/track-order/<order_id>", "GET", f"/customer/track-order/{order_id}", None,
+                ctx.customer_tokens[customer_id])
+    if op == "assigned_orders":
+        return ("GET /delivery/assigned-orders", "GET", "/delivery/assigned-orders", None,
+                ctx.courier_tokens[courier_id])
+    if op == "delivery_history":
+        return ("GET /delivery/history", "GET", "/delivery/history", None, ctx.courier_tokens[courier_id])
+    if op == "update_location":
+        body = {"order_id": order_id, "location": f"{12.9 + rng.random() / 10:.6f},{77.5 + rng.random() / 10:.6f}"}
+        return ("PATCH /delivery/update-location", "PATCH", "/delivery/update-location", body,
+                ctx.courier_tokens[courier_id])
+    if op == "bulk_location":
+        now = time.time()
+        fixes = [{"order_id": order_id, "lat": 12.9 + rng.random() / 10, "lon": 77.5 + rng.random() / 10,
+                  "recorded_at": now - i * 5} for i in range(20)]
+        return ("POST /delivery/update-location/bulk", "POST", "/delivery/update-location/bulk", {"fixes": fixes},
+                ctx.courier_tokens[courier_id])
+    if op == "update_status":
+        body = {"order_id": order_id, "status": rng.choice(STATUS_FLOW[:2])}
+        return ("PATCH /delivery/update-status", "PATCH", "/delivery/update-status", body,
+                ctx.courier_tokens[courier_id])
+    if op == "place_order":
+        return ("POST /customer/place-order", "POST", "/customer/place-order", {}, ctx.customer_tokens[customer_id])
+    if op == "login":
+        if rng.random() < 0.8:
+            body = {"email": rng.choice(ctx.customer_emails), "password": BENCH_PASSWORD, "role": "customer"}
+        else:
+            body = {"email": rng.choice(ctx.courier_emails), "password": BENCH_PASSWORD, "role": "delivery_person"}
+        return ("POST /login", "POST", "/login", body, None)
+    if op == "admin_orders":
+        return ("GET /admin/orders", "GET", f"/admin/orders?limit=100&after={max(order_id - 100, 0)}", None,
+                ctx.admin_token)
+    if op == "admin_orders_stream":
+        return ("GET /admin/orders?format=ndjson", "GET", "/admin/orders?format=ndjson&status=Pending&limit=5000",
+                None, ctx.admin_token)
+    if op == "admin_users":
+        return ("GET /admin/users", "GET", "/admin/users?limit=100", None, ctx.admin_token)
+    if op == "admin_issues":
+        return ("GET /admin/issues", "GET", "/admin/issues?limit=100&status=open", None, ctx.admin_token)
+    raise ValueError(f"Unknown operation {op}")
+
+
+def worker(port, ops, weights, ctx, deadline, seed_value, results):
+    rng = random.Random(seed_value)
+    conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+    samples = []
+    while time.perf_counter() < deadline:
+        op = rng.choices(ops, weights)[0]
+        route, method, path, body, token = build_request(op, rng, ctx)
+        headers = {"Content-Type": "application/json"}
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+        payload = json.dumps(body) if body is not None else None
+        started = time.perf_counter()
+        try:
+            conn.request(method, path, body=payload, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+        except (OSError, http.client.HTTPException):
+            status = 0
+            conn.close()
+            conn = http.client.HTTPConnection("127.0.0.1", port, timeout=60)
+        samples.append((route, time.perf_counter() - started, status))
+    conn.close()
+    results.extend(samples)
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(round(q * (len(sorted_values) - 1))))]
+
+
+def summarize(samples, elapsed):
+    by_route = {}
+    for route, latency, status in samples:
+        by_route.setdefault(route, []).append((latency, status))
+    routes = {}
+    for route, entries in sorted(by_route.items()):
+        latencies = sorted(latency for latency, _ in entries)
+        routes[route] = {
+            "requests": len(entries),
+            "errors": sum(1 for _, status in entries if status == 0 or status >= 500),
+            "throughput_rps": round(len(entries) / elapsed, 2),
+            "p50_ms": round(percentile(latencies, 0.50) * 1000, 3),
+            "p95_ms": round(percentile(latencies, 0.95) * 1000, 3),
+            "p99_ms": round(percentile(latencies, 0.99) * 1000, 3),
+            "max_ms": round(latencies[-1] * 1000, 3),
+        }
+    all_latencies = sorted(latency for _, latency, _ in samples)
+    total = {
+        "requests": len(samples),
+        "errors": sum(1 for _, _, status in samples if status == 0 or status >= 500),
+        "throughput_rps": round(len(samples) / elapsed, 2),
+        "p50_ms": round(percentile(all_latencies, 0.50) * 1000, 3),
+        "p95_ms": round(percentile(all_latencies, 0.95) * 1000, 3),
+        "p99_ms": round(percentile(all_latencies, 0.99) * 1000, 3),
+    }
+    return routes, total
+
+
+def compare(results, baseline, tolerance):
+    # A route regresses when p95 grows or throughput drops by more than `tolerance`
+    regressions = []
+    for route, base in baseline.get("routes", {}).items():
+        current = results["routes"].get(route)
+        if current is None:
+            continue
+        if base["p95_ms"] and current["p95_ms"] > base["p95_ms"] * (1 + tolerance):
+            regressions.append(f"{route}: p95 {base['p95_ms']}ms -> {current['p95_ms']}ms")
+        if base["throughput_rps"] and current["throughput_rps"] < base["throughput_rps"] * (1 - tolerance):
+            regressions.append(f"{route}: throughput {base['throughput_rps']} -> {current['throughput_rps']} req/s")
+    # Cold start: differences under 50ms are noise
+    for name in ("import_seconds", "warm_up_seconds"):
+        base, current = baseline.get("startup", {}).get(name), results["startup"][name]
+        if base is not None and current > base * (1 + tolerance) and current - base > 0.05:
+            regressions.append(f"startup: {name} {base:.3f}s -> {current:.3f}s")
+    return regressions
+
+
+def print_report(results):
+    print(f"\n{'route':<45} {'req':>8} {'err':>5} {'req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for route, stats in results["routes"].items():
+        print(f"{route:<45} {stats['requests']:>8} {stats['errors']:>5} {stats['throughput_rps']:>9} "
+              f"{stats['p50_ms']:>9} {stats['p95_ms']:>9} {stats['p99_ms']:>9}")
+    total = results["total"]
+    print(f"{'TOTAL':<45} {total['requests']:>8} {total['errors']:>5} {total['throughput_rps']:>9} "
+          f"{total['p50_ms']:>9} {total['p95_ms']:>9} {total['p99_ms']:>9}\n")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the courier tracking API")
+    parser.add_argument("--scenario", choices=sorted(SCENARIOS), default="mixed")
+    parser.add_argument("--orders", type=int, default=10000, help="orders to seed (10k .. 10M)")
+    parser.add_argument("--customers", type=int, help="default: orders / 10")
+    parser.add_argument("--delivery-persons", type=int, help="default: orders / 200")
+    parser.add_argument("--duration", type=float, default=30, help="seconds of load after warm-up")
+    parser.add_argument("--warmup", type=float, default=3)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--db", choices=["sqlite", "mysql"], default="sqlite")
+    parser.add_argument("--db-path", default="bench.sqlite3", help="SQLite file for --db sqlite")
+    parser.add_argument("--reuse", action="store_true", help="keep an existing seeded database")
+    parser.add_argument("--bcrypt-rounds", type=int, default=10)
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--output", default="bench_results.json")
+    parser.add_argument("--baseline", help="results file to compare against")
+    parser.add_argument("--save-baseline", action="store_true", help="also write the results to --baseline")
+    parser.add_argument("--tolerance", type=float, default=0.2, help="allowed relative regression (0.2 = 20%%)")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    os.environ.setdefault('BCRYPT_LOG_ROUNDS', str(args.bcrypt_rounds))
+    os.environ.setdefault('DB_POOL_SIZE', str(max(args.concurrency, 4)))
+    # Every simulated client shares one IP and a handful of users; set RATE_LIMITS to measure throttling
+    os.environ.setdefault('RATE_LIMITS', '')
+
+    fresh = args.db == "sqlite" and not (args.reuse and os.path.exists(args.db_path))
+    if fresh:
+        for suffix in ("", "-wal", "-shm"):
+            if os.path.exists(args.db_path + suffix):
+                os.remove(args.db_path + suffix)
+        sqlite_backend.create_schema(args.db_path)
+
+    import app as service
+    if args.db == "sqlite":
+        service.db.pool.connect = sqlite_backend.connect_factory(args.db_path)
+
+    with service.db.connection() as conn:
+        migrate(conn, log=lambda message: None)
+
+    if fresh or (args.db == "mysql" and not args.reuse):
+        started = time.perf_counter()
+        with service.db.connection() as conn:
+            seed(conn, orders=args.orders, customers=args.customers, delivery_persons=args.delivery_persons,
+                 rounds=args.bcrypt_rounds, random_seed=args.seed)
+        print(f"Seeded in {time.perf_counter() - started:.1f}s")
+
+    app = service.create_app()
+    boot = service.startup.status()
+    print(f"Started in {boot['import_seconds']:.2f}s import + {boot['warm_up_seconds']:.2f}s warm-up {boot['steps']}")
+
+    ctx = Context(app)
+    server = make_server("127.0.0.1", 0, app, threaded=True, request_handler=QuietHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    port = server.server_port
+
+    ops = list(SCENARIOS[args.scenario])
+    weights = [SCENARIOS[args.scenario][op] for op in ops]
+
+    def run_phase(seconds, seed_offset):
+        results = []
+        deadline = time.perf_counter() + seconds
+        threads = [threading.Thread(target=worker, args=(port, ops, weights, ctx, deadline,
+                                                         args.seed + seed_offset + i, results))
+                   for i in range(args.concurrency)]
+        started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return results, time.perf_counter() - started
+
+    if args.warmup > 0:
+        print(f"Warming up for {args.warmup}s")
+        run_phase(args.warmup, 10000)
+    print(f"Running '{args.scenario}' for {args.duration}s with {args.concurrency} clients")
+    samples, elapsed = run_phase(args.duration, 0)
+    server.shutdown()
+
+    routes, total = summarize(samples, elapsed)
+    results = {
+        "meta": {
+            "scenario": args.scenario,
+            "orders": args.orders,
+            "duration_s": round(elapsed, 2),
+            "concurrency": args.concurrency,
+            "db": args.db,
+            "bcrypt_rounds": int(os.environ['BCRYPT_LOG_ROUNDS']),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "finished_at": datetime.now(timezone.utc).isoformat(),
+        },
+        "routes": routes,
+        "total": total,
+        "startup": boot,
+    }
+    print_report(results)
+    with open(args.output, "w") as f:
+        json.dump(results, f, indent=2)
+    print(f"Results written to {args.output}")
+
+    if args.baseline and args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"Baseline saved to {args.baseline}")
+    elif args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["meta"].get("scenario") != args.scenario:
+            print(f"Warning: baseline scenario is {baseline['meta'].get('scenario')!r}")
+        regressions = compare(results, baseline, args.tolerance)
+        if regressions:
+            print("Regressions against baseline:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print("No regressions against baseline")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,134 @@
+import random
+from datetime import datetime, timedelta
+
+import bcrypt
+
+from order_status import rebuild_counts
+
+# Synthetic data for the benchmark. Works on any connection with the MySQLdb
+# cursor surface (a real MySQLdb connection or benchmarks.sqlite_backend.Connection).
+
+BENCH_PASSWORD = 'bench-password'
+ADMIN_USERNAME = 'bench-admin'
+STATUS_WEIGHTS = [('Pending', 10), ('Assigned', 10), ('In Transit', 10), ('Delivered', 70)]
+
+
+def default_scale(orders):
+    return {
+        "orders": orders,
+        "customers": max(orders // 10, 10),
+        "delivery_persons": max(orders // 200, 5),
+        "issues": max(orders // 20, 10),
+    }
+
+
+def insert_batches(conn, sql, rows, batch_size):
+    cursor = conn.cursor()
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            cursor.execute("START TRANSACTION")
+            cursor.executemany(sql, batch)
+            conn.commit()
+            batch = []
+    if batch:
+        cursor.execute("START TRANSACTION")
+        cursor.executemany(sql, batch)
+        conn.commit()
+    cursor.close()
+
+
+def seed(conn, orders=10000, customers=None, delivery_persons=None, issues=None, rounds=4, batch_size=10000,
+         random_seed=42, log=print):
+    scale = default_scale(orders)
+    customers = customers or scale["customers"]
+    delivery_persons = delivery_persons or scale["delivery_persons"]
+    issues = issues or scale["issues"]
+    rng = random.Random(random_seed)
+    # One hash shared by every synthetic account keeps seeding fast; the cost is still configurable
+    password_hash = bcrypt.hashpw(BENCH_PASSWORD.encode('utf-8'), bcrypt.gensalt(rounds)).decode('utf-8')
+    now = datetime.utcnow().replace(microsecond=0)
+
+    cursor = conn.cursor()
+    cursor.execute("SELECT COALESCE(MAX(customer_id), 0) FROM customers")
+    customer_base = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(delivery_person_id), 0) FROM delivery_persons")
+    courier_base = cursor.fetchone()[0]
+    cursor.execute("SELECT COALESCE(MAX(order_id), 0) FROM orders")
+    order_base = cursor.fetchone()[0]
+    cursor.execute("SELECT id FROM admins WHERE username = %s", (ADMIN_USERNAME,))
+    has_admin = cursor.fetchone() is not None
+    cursor.close()
+
+    if not has_admin:
+        insert_batches(conn, "INSERT INTO admins (username, password) VALUES (%s, %s)",
+                       [(ADMIN_USERNAME, password_hash)], batch_size)
+
+    log(f"Seeding {customers} customers")
+    insert_batches(
+        conn,
+        "INSERT INTO customers (name, phone, email, address, password) VALUES (%s, %s, %s, %s, %s)",
+        ((f"Customer {i}", f"9{i:09d}"[-10:], f"customer{i}@bench.local", f"{i} Bench Street", password_hash)
+         for i in range(customer_base + 1, customer_base + customers + 1)),
+        batch_size
+    )
+
+    log(f"Seeding {delivery_persons} delivery persons")
+    insert_batches(
+        conn,
+        "INSERT INTO delivery_persons (name, email, password) VALUES (%s, %s, %s)",
+        ((f"Courier {i}", f"courier{i}@bench.local", password_hash)
+         for i in range(courier_base + 1, courier_base + delivery_persons + 1)),
+        batch_size
+    )
+
+    statuses = [status for status, _ in STATUS_WEIGHTS]
+    weights = [weight for _, weight in STATUS_WEIGHTS]
+
+    def order_rows():
+        for _ in range(orders):
+            status = rng.choices(statuses, weights)[0]
+            assigned = None if status == 'Pending' else rng.randint(courier_base + 1, courier_base + delivery_persons)
+            created = now - timedelta(seconds=rng.randint(0, 365 * 86400))
+            yield (rng.randint(customer_base + 1, customer_base + customers), assigned, status, created, created)
+
+    log(f"Seeding {orders} orders")
+    insert_batches(
+        conn,
+        "INSERT INTO orders (customer_id, assigned_to, status, created_at, updated_at) VALUES (%s, %s, %s, %s, %s)",
+        order_rows(),
+        batch_size
+    )
+
+    def issue_rows():
+        for i in range(issues):
+            if rng.random() < 0.7:
+                user_type, user_id = 'customer', rng.randint(customer_base + 1, customer_base + customers)
+            else:
+                user_type, user_id = 'delivery_person', rng.randint(courier_base + 1, courier_base + delivery_persons)
+            status = 'open' if rng.random() < 0.4 else 'resolved'
+            yield (user_type, user_id, f"Synthetic issue {i}: parcel delayed at hub", status,
+                   None if status == 'open' else "Resolved by bench")
+
+    log(f"Seeding {issues} issues")
+    insert_batches(
+        conn,
+        "INSERT INTO issues (user_type, user_id, message, status, response) VALUES (%s, %s, %s, %s, %s)",
+        issue_rows(),
+        batch_size
+    )
+
+    # Orders were inserted directly, so derive the status counters from them in one pass
+    cursor = conn.cursor()
+    cursor.execute("START TRANSACTION")
+    rebuild_counts(cursor)
+    conn.commit()
+    cursor.close()
+
+    return {
+        "customers": (customer_base + 1, customer_base + customers),
+        "delivery_persons": (courier_base + 1, courier_base + delivery_persons),
+        "orders": (order_base + 1, order_base + orders),
+        "issues": issues,
+    }
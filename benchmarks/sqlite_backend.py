@@ -0,0 +1,200 @@
+import math
+import os
+import re
+import sqlite3
+from datetime import datetime, timezone
+from functools import lru_cache
+
+from search import SearchQuery
+
+# SQLite stand-in for MySQL so the benchmark can run without a database server.
+# It translates the schema from the MySQL dump and the handful of MySQL-only
+# constructs used by app.py, and exposes the small MySQLdb connection/cursor
+# surface that db.Database relies on.
+
+SCHEMA_DUMP = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'Dump20250527 (1).sql')
+
+
+def translate_schema(dump_sql):
+    # CREATE TABLE statements from the mysqldump -> SQLite DDL (tables + indexes)
+    statements = []
+    for match in re.finditer(r"CREATE TABLE (?:IF NOT EXISTS )?`(\w+)` \((.*?)\n\)[^;]*;", dump_sql, re.S):
+        table, body = match.group(1), match.group(2)
+        columns, indexes = [], []
+        primary = None
+        for line in body.strip().splitlines():
+            line = line.strip().rstrip(',')
+            if line.startswith('PRIMARY KEY'):
+                primary = re.search(r"\((.*)\)", line).group(1).replace('`', '')
+            elif line.startswith('UNIQUE KEY'):
+                name, cols = re.match(r"UNIQUE KEY `(\w+)` \((.*)\)", line).groups()
+                indexes.append(f"CREATE UNIQUE INDEX `{table}_{name}` ON `{table}` ({cols})")
+            elif line.startswith('KEY'):
+                name, cols = re.match(r"KEY `(\w+)` \((.*)\)", line).groups()
+                cols = re.sub(r"\(\d+\)", "", cols)
+                indexes.append(f"CREATE INDEX `{table}_{name}` ON `{table}` ({cols})")
+            elif line.startswith('CONSTRAINT'):
+                # Named as in MySQL, so migrations can drop them (drop_foreign_key)
+                columns.append(line)
+            elif line.startswith('`'):
+                line = re.sub(r"\benum\([^)]*\)", "TEXT", line)
+                line = line.replace(" ON UPDATE CURRENT_TIMESTAMP", "")
+                line = re.sub(r" COMMENT '[^']*'", "", line)
+                columns.append(line)
+        columns = [
+            re.sub(r"^`(\w+)` \w+(\(\d+\))? NOT NULL AUTO_INCREMENT", r"`\1` INTEGER PRIMARY KEY AUTOINCREMENT", col)
+            if primary and col.startswith(f"`{primary}`") else col
+            for col in columns
+        ]
+        if primary and not any('AUTOINCREMENT' in col for col in columns):
+            columns.append(f"PRIMARY KEY ({primary})")
+        statements.append(f"CREATE TABLE IF NOT EXISTS `{table}` (\n  " + ",\n  ".join(columns) + "\n)")
+        statements.extend(index.replace(" INDEX ", " INDEX IF NOT EXISTS ", 1) for index in indexes)
+    return statements
+
+
+def translate_sql(sql):
+    sql = sql.replace('%s', '?')
+    sql = sql.replace('NOW()', 'CURRENT_TIMESTAMP')
+    sql = re.sub(r"\bFOR UPDATE( SKIP LOCKED)?", "", sql)
+    # Counter upserts: the conflict target may be left out of SQLite's last ON CONFLICT clause
+    sql = sql.replace("ON DUPLICATE KEY UPDATE", "ON CONFLICT DO UPDATE SET")
+    sql = re.sub(r"\bVALUES\((\w+)\)", r"excluded.\1", sql)
+    # Take the write lock up front so concurrent writers queue on the busy timeout instead of failing
+    sql = re.sub(r"^\s*START TRANSACTION", "BEGIN IMMEDIATE", sql)
+    # Index DDL from migrations/: SQLite index names are global, so prefix them like translate_schema does
+    sql = re.sub(r"^\s*CREATE (UNIQUE )?INDEX `?(\w+)`? ON `?(\w+)`?", r"CREATE \1INDEX IF NOT EXISTS `\3_\2` ON `\3`", sql)
+    sql = re.sub(r"^\s*DROP INDEX `?(\w+)`? ON `?(\w+)`?", r"DROP INDEX IF EXISTS `\2_\1`", sql)
+    # No FULLTEXT indexes: MATCH ... AGAINST becomes a scan scored by FULLTEXT_SCORE()
+    sql = re.sub(r"^\s*CREATE FULLTEXT INDEX .*", "SELECT 1", sql, flags=re.S)
+    sql = re.sub(r"MATCH \(([^)]*)\) AGAINST \(\? IN BOOLEAN MODE\)", r"FULLTEXT_SCORE(?, \1)", sql)
+    return sql
+
+
+def _unix_timestamp(value):
+    if value is None:
+        return None
+    parsed = datetime.fromisoformat(str(value))
+    if parsed.tzinfo is None:
+        parsed = parsed.replace(tzinfo=timezone.utc)
+    return parsed.timestamp()
+
+
+@lru_cache(maxsize=256)
+def _parse_search(query):
+    return SearchQuery.parse(query)
+
+
+def _fulltext_score(query, *texts):
+    return _parse_search(query).score(*texts)
+
+
+def drop_foreign_key(raw, table, name):
+    # SQLite has no ALTER TABLE ... DROP CONSTRAINT; removing a foreign key from the stored
+    # CREATE TABLE does not change the table's format, so it can be edited in place
+    sql = raw.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = ?", (table,)).fetchone()[0]
+    stripped = re.sub(rf",\s*CONSTRAINT `{name}` FOREIGN KEY [^\n]*?(?=,\n|\n\))", "", sql)
+    version = raw.execute("PRAGMA schema_version").fetchone()[0]
+    raw.execute("PRAGMA writable_schema=ON")
+    try:
+        raw.execute("UPDATE sqlite_master SET sql = ? WHERE type = 'table' AND name = ?", (stripped, table))
+        raw.execute(f"PRAGMA schema_version={version + 1}")
+    finally:
+        raw.execute("PRAGMA writable_schema=OFF")
+
+
+class Cursor:
+    def __init__(self, raw):
+        self.raw = raw
+
+    def execute(self, sql, params=()):
+        if re.match(r"\s*CREATE TABLE (IF NOT EXISTS )?`", sql):
+            # Table DDL from migrations/ is written in the dump's format
+            for statement in translate_schema(sql.rstrip().rstrip(';') + ";"):
+                self.raw.execute(statement)
+            return 0
+        match = re.match(r"\s*ALTER TABLE `?(\w+)`? DROP FOREIGN KEY `?(\w+)`?", sql)
+        if match:
+            drop_foreign_key(self.raw.connection, *match.groups())
+            return 0
+        self.raw.execute(translate_sql(sql), tuple(params or ()))
+        return max(self.raw.rowcount, 0)
+
+    def executemany(self, sql, seq):
+        self.raw.executemany(translate_sql(sql), [tuple(row) for row in seq])
+        return max(self.raw.rowcount, 0)
+
+    def fetchone(self):
+        return self.raw.fetchone()
+
+    def fetchall(self):
+        return tuple(self.raw.fetchall())
+
+    def fetchmany(self, size=1):
+        return tuple(self.raw.fetchmany(size))
+
+    def __iter__(self):
+        return iter(self.raw)
+
+    @property
+    def lastrowid(self):
+        # MySQL reports the first id of a multi-row INSERT, SQLite the last
+        if self.raw.lastrowid and self.raw.rowcount > 1:
+            return self.raw.lastrowid - self.raw.rowcount + 1
+        return self.raw.lastrowid
+
+    @property
+    def rowcount(self):
+        return self.raw.rowcount
+
+    @property
+    def description(self):
+        return self.raw.description
+
+    def close(self):
+        self.raw.close()
+
+
+class Connection:
+    def __init__(self, path):
+        self.raw = sqlite3.connect(path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.raw.execute("PRAGMA journal_mode=WAL")
+        self.raw.execute("PRAGMA synchronous=NORMAL")
+        self.raw.execute("PRAGMA foreign_keys=ON")
+        self.raw.create_function('UNIX_TIMESTAMP', 1, _unix_timestamp)
+        self.raw.create_function('FLOOR', 1, lambda v: None if v is None else math.floor(v))
+        self.raw.create_function('FULLTEXT_SCORE', -1, _fulltext_score)
+
+    def cursor(self, cursorclass=None):
+        return Cursor(self.raw.cursor())
+
+    def commit(self):
+        if self.raw.in_transaction:
+            self.raw.commit()
+
+    def rollback(self):
+        if self.raw.in_transaction:
+            self.raw.rollback()
+
+    def autocommit(self, on):
+        pass
+
+    def ping(self, reconnect=False):
+        self.raw.execute("SELECT 1")
+
+    def close(self):
+        self.raw.close()
+
+
+def connect_factory(path):
+    return lambda: Connection(path)
+
+
+def create_schema(path, dump_path=SCHEMA_DUMP):
+    with open(dump_path, encoding='utf-8') as f:
+        statements = translate_schema(f.read())
+    conn = sqlite3.connect(path)
+    for statement in statements:
+        conn.execute(statement)
+    conn.commit()
+    conn.close()
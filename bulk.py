@@ -0,0 +1,390 @@
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+
+import MySQLdb
+import MySQLdb.cursors
+
+from order_status import PENDING, STATUSES, closed_at, record_changes
+
+# Bulk import and export of orders, customers and delivery persons (CSV or NDJSON).
+# Imports read the upload as a stream and work in chunks: each chunk is validated row by row,
+# checked against the database with one query per lookup, its passwords hashed in parallel,
+# and written with one multi-row INSERT in its own transaction. A bad row is reported with its
+# line number and skipped; it never aborts the rest of the file. Only input that cannot be read
+# any further (bytes that are not UTF-8, a CSV field over the csv module limit) stops the import,
+# after the rows before it are written.
+# Exports read through a server-side cursor and are written out as they are fetched.
+#
+#   python bulk.py import orders orders.csv
+#   python bulk.py export customers customers.ndjson --format ndjson
+
+FORMATS = ('csv', 'ndjson')
+MAX_REPORTED_ERRORS = 1000
+
+
+def detect_format(fmt, content_type='', filename=''):
+    if fmt:
+        if fmt not in FORMATS:
+            raise ValueError(f"format must be one of: {', '.join(FORMATS)}")
+        return fmt
+    if 'ndjson' in content_type or 'json' in content_type or filename.endswith(('.ndjson', '.jsonl')):
+        return 'ndjson'
+    return 'csv'
+
+
+class UnreadableInput(ValueError):
+    pass
+
+
+def read_records(stream, fmt):
+    # Binary stream -> (line number, dict or ValueError), one record at a time; the last record is
+    # an UnreadableInput if the stream cannot be decoded or parsed past that point
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    line = 0
+    try:
+        for line, record in (csv_records(text) if fmt == 'csv' else ndjson_records(text)):
+            yield line, record
+    except (UnicodeDecodeError, csv.Error) as e:
+        yield line + 1, UnreadableInput(f"Unreadable input, import stopped: {e}")
+
+
+def csv_records(text):
+    reader = csv.DictReader(text)
+    for record in reader:
+        yield reader.line_num, {k.strip(): (v or '').strip() for k, v in record.items() if k is not None}
+
+
+def ndjson_records(text):
+    for line_no, line in enumerate(text, 1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError:
+            yield line_no, ValueError("Invalid JSON")
+            continue
+        yield line_no, record if isinstance(record, dict) else ValueError("Expected a JSON object")
+
+
+def text_field(record, name, max_length, required=True):
+    value = record.get(name)
+    value = '' if value is None else str(value).strip()
+    if not value:
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    if len(value) > max_length:
+        raise ValueError(f"{name} is longer than {max_length} characters")
+    return value
+
+
+def int_field(record, name, required=True):
+    value = record.get(name)
+    if value in (None, ''):
+        if required:
+            raise ValueError(f"{name} is required")
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{name} must be an integer")
+
+
+def email_field(record):
+    email = text_field(record, 'email', 255)
+    if '@' not in email:
+        raise ValueError("email is not a valid address")
+    return email
+
+
+def password_fields(record):
+    # -> (plain password to hash, or None; stored hash). A bcrypt password_hash is taken as is.
+    password_hash = text_field(record, 'password_hash', 255, required=False)
+    if password_hash:
+        if not password_hash.startswith('$2'):
+            raise ValueError("password_hash must be a bcrypt hash")
+        return None, password_hash
+    return text_field(record, 'password', 1024), None
+
+
+def validate_customer(record):
+    password, password_hash = password_fields(record)
+    return {"name": text_field(record, 'name', 100), "phone": text_field(record, 'phone', 20),
+            "email": email_field(record), "address": text_field(record, 'address', 65535),
+            "password": password, "password_hash": password_hash}
+
+
+def validate_delivery_person(record):
+    password, password_hash = password_fields(record)
+    return {"name": text_field(record, 'name', 100), "email": email_field(record),
+            "password": password, "password_hash": password_hash}
+
+
+def validate_order(record):
+    assigned_to = int_field(record, 'assigned_to', required=False)
+    status = text_field(record, 'status', 50, required=False) or PENDING
+    if status not in STATUSES:
+        raise ValueError(f"status must be one of: {', '.join(STATUSES)}")
+    if status != PENDING and assigned_to is None:
+        raise ValueError(f"status {status} requires assigned_to")
+    return {"customer_id": int_field(record, 'customer_id'), "assigned_to": assigned_to, "status": status,
+            "location": text_field(record, 'location', 255, required=False),
+            "pickup_address": text_field(record, 'pickup_address', 255, required=False),
+            "drop_address": text_field(record, 'drop_address', 255, required=False)}
+
+
+def existing_values(cursor, table, column, values):
+    values = sorted(set(values))
+    if not values:
+        return set()
+    cursor.execute(f"SELECT {column} FROM {table} WHERE {column} IN ({', '.join(['%s'] * len(values))})", values)
+    return {row[0] for row in cursor.fetchall()}
+
+
+class UserImport:
+    # customers and delivery_persons: unique email, password hashed unless given as password_hash
+    def __init__(self, table, columns, validate):
+        self.table = table
+        self.columns = columns
+        self.validate = validate
+        self.seen = set()
+
+    def check(self, db, rows):
+        # -> {line: error} for emails already registered or repeated in the file
+        errors = {}
+        with db.cursor() as cursor:
+            taken = {email.lower() for email in
+                     existing_values(cursor, self.table, 'email', [row['email'] for _, row in rows])}
+        for line, row in rows:
+            email = row['email'].lower()
+            if email in taken or email in self.seen:
+                errors[line] = "email already registered"
+            self.seen.add(email)
+        return errors
+
+    def prepare(self, hasher, rows):
+        plain = [row for _, row in rows if row['password_hash'] is None]
+        for row, hashed in zip(plain, hasher.hash_many([row['password'] for row in plain]) if plain else []):
+            row['password_hash'] = hashed
+        return [tuple(row['password_hash'] if column == 'password' else row[column] for column in self.columns)
+                for _, row in rows]
+
+    def after_insert(self, cursor, first_id, rows, actor):
+        pass
+
+
+class OrderImport:
+    table = 'orders'
+    columns = ('customer_id', 'assigned_to', 'status', 'location', 'pickup_address', 'drop_address', 'closed_at')
+
+    def validate(self, record):
+        # Orders imported as Delivered or Failed count as closed from the import on
+        row = validate_order(record)
+        row['closed_at'] = closed_at(row['status'])
+        return row
+
+    def check(self, db, rows):
+        errors = {}
+        with db.cursor() as cursor:
+            customers = existing_values(cursor, 'customers', 'customer_id', [row['customer_id'] for _, row in rows])
+            couriers = existing_values(cursor, 'delivery_persons', 'delivery_person_id',
+                                       [row['assigned_to'] for _, row in rows if row['assigned_to'] is not None])
+        for line, row in rows:
+            if row['customer_id'] not in customers:
+                errors[line] = "customer not found"
+            elif row['assigned_to'] is not None and row['assigned_to'] not in couriers:
+                errors[line] = "delivery person not found"
+        return errors
+
+    def prepare(self, hasher, rows):
+        return [tuple(row[column] for column in self.columns) for _, row in rows]
+
+    def after_insert(self, cursor, first_id, rows, actor):
+        # Same event log and status counters as orders placed one by one
+        record_changes(cursor, [(first_id + i, None, row['status'], None, row['assigned_to'])
+                                for i, (_, row) in enumerate(rows)], *actor)
+
+
+IMPORTERS = {
+    'customers': lambda: UserImport('customers', ('name', 'phone', 'email', 'address', 'password'), validate_customer),
+    'delivery_persons': lambda: UserImport('delivery_persons', ('name', 'email', 'password'), validate_delivery_person),
+    'orders': OrderImport,
+}
+
+
+class ImportReport:
+    def __init__(self, entity):
+        self.entity = entity
+        self.rows = 0
+        self.inserted = 0
+        self.errors = []
+        self.failed = 0
+        self.stopped = False
+        self.started = time.perf_counter()
+
+    def error(self, line, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({"line": line, "error": message})
+
+    def as_dict(self):
+        return {
+            "entity": self.entity,
+            "rows": self.rows,
+            "inserted": self.inserted,
+            "failed": self.failed,
+            "errors": sorted(self.errors, key=lambda e: e["line"]),
+            "errors_truncated": self.failed > len(self.errors),
+            "stopped": self.stopped,
+            "elapsed_ms": round((time.perf_counter() - self.started) * 1000, 2)
+        }
+
+
+def import_records(db, hasher, entity, records, chunk_size=1000, actor=(None, None), on_chunk=None):
+    # records: (line, dict or ValueError) as produced by read_records(); returns an ImportReport
+    importer = IMPORTERS[entity]()
+    report = ImportReport(entity)
+    chunk = []
+    for line, record in records:
+        if isinstance(record, UnreadableInput):
+            # Nothing past this point can be read; write what came before it and stop
+            report.error(line, str(record))
+            report.stopped = True
+            break
+        report.rows += 1
+        try:
+            if isinstance(record, ValueError):
+                raise record
+            chunk.append((line, importer.validate(record)))
+        except ValueError as e:
+            report.error(line, str(e))
+        if len(chunk) >= chunk_size:
+            import_chunk(db, hasher, importer, chunk, report, actor, on_chunk)
+            chunk = []
+    if chunk:
+        import_chunk(db, hasher, importer, chunk, report, actor, on_chunk)
+    return report
+
+
+def import_chunk(db, hasher, importer, chunk, report, actor, on_chunk):
+    errors = importer.check(db, chunk)
+    for line, message in sorted(errors.items()):
+        report.error(line, message)
+    rows = [(line, row) for line, row in chunk if line not in errors]
+    if not rows:
+        return
+    # Hashing happens before the transaction so no connection is held while it runs
+    values = importer.prepare(hasher, rows)
+    try:
+        inserted = insert_rows(db, importer, rows, values, actor)
+    except MySQLdb.IntegrityError:
+        # Lost a race with another writer (e.g. the same email signed up meanwhile): row by row
+        inserted = []
+        for row, value in zip(rows, values):
+            try:
+                inserted.extend(insert_rows(db, importer, [row], [value], actor))
+            except MySQLdb.IntegrityError as e:
+                report.error(row[0], f"rejected by the database: {e}")
+    report.inserted += len(inserted)
+    if on_chunk is not None and inserted:
+        on_chunk(inserted)
+
+
+def insert_rows(db, importer, rows, values, actor):
+    # One multi-row INSERT in one transaction; returns [(id, row)]
+    with db.transaction() as cursor:
+        cursor.execute(
+            f"INSERT INTO {importer.table} ({', '.join(importer.columns)}) "
+            f"VALUES {', '.join(['(' + ', '.join(['%s'] * len(importer.columns)) + ')'] * len(values))}",
+            [value for row in values for value in row]
+        )
+        # A multi-row INSERT reports the first id; InnoDB gives a simple INSERT consecutive ids
+        first_id = cursor.lastrowid
+        importer.after_insert(cursor, first_id, rows, actor)
+    return [(first_id + i, row) for i, (_, row) in enumerate(rows)]
+
+
+EXPORTS = {
+    'orders': ('orders', 'order_id',
+               ["order_id", "customer_id", "assigned_to", "status", "location", "pickup_address", "drop_address",
+                "created_at", "updated_at"]),
+    'customers': ('customers', 'customer_id', ["customer_id", "name", "phone", "email", "address", "created_at"]),
+    'delivery_persons': ('delivery_persons', 'delivery_person_id',
+                         ["delivery_person_id", "name", "email", "created_at"]),
+}
+
+
+def export_rows(db, entity, fmt, after=None, batch_size=1000):
+    # Generator of str chunks; the pooled connection is held only while it is being consumed
+    table, key, fields = EXPORTS[entity]
+    sql = f"SELECT {', '.join(fields)} FROM {table}"
+    params = []
+    if after is not None:
+        sql += f" WHERE {key} > %s"
+        params.append(after)
+    sql += f" ORDER BY {key}"
+
+    buffer = io.StringIO()
+    writer = csv.writer(buffer, lineterminator='\n')
+    if fmt == 'csv':
+        writer.writerow(fields)
+        yield buffer.getvalue()
+    with db.cursor(MySQLdb.cursors.SSCursor) as cursor:
+        cursor.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            if fmt == 'csv':
+                buffer.seek(0)
+                buffer.truncate()
+                writer.writerows(rows)
+                yield buffer.getvalue()
+            else:
+                yield ''.join(json.dumps(dict(zip(fields, row)), default=str) + '\n' for row in rows)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Bulk import and export for the courier service")
+    commands = parser.add_subparsers(dest='command', required=True)
+    import_cmd = commands.add_parser('import', help="import a CSV or NDJSON file")
+    import_cmd.add_argument('entity', choices=sorted(IMPORTERS))
+    import_cmd.add_argument('path', help="file to read, - for stdin")
+    import_cmd.add_argument('--format', choices=FORMATS)
+    import_cmd.add_argument('--chunk-size', type=int)
+    export_cmd = commands.add_parser('export', help="export a table as CSV or NDJSON")
+    export_cmd.add_argument('entity', choices=sorted(EXPORTS))
+    export_cmd.add_argument('path', help="file to write, - for stdout")
+    export_cmd.add_argument('--format', choices=FORMATS)
+    export_cmd.add_argument('--after', type=int, help="only rows with a larger id")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Reuse the service's configuration, connection pool and hashing pool
+    import app as service
+
+    fmt = detect_format(args.format, filename=args.path)
+    if args.command == 'import':
+        stream = sys.stdin.buffer if args.path == '-' else open(args.path, 'rb')
+        with stream:
+            report = import_records(service.db, service.hasher, args.entity, read_records(stream, fmt),
+                                    chunk_size=args.chunk_size or service.app1.config['IMPORT_CHUNK_SIZE'],
+                                    actor=('admin', None), on_chunk=service.import_invalidator(args.entity))
+        json.dump(report.as_dict(), sys.stdout, indent=2, default=str)
+        print()
+        return 1 if report.failed else 0
+    out = sys.stdout if args.path == '-' else open(args.path, 'w', encoding='utf-8', newline='')
+    with out:
+        for chunk in export_rows(service.db, args.entity, fmt, after=args.after):
+            out.write(chunk)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,249 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+# Read-through cache for hot lookups (track-order, assigned-orders).
+# Both backends expire entries after `ttl` seconds and evict least recently used
+# entries beyond `max_entries`. Values must be JSON-serialisable.
+#
+# Every delete() gives the key a new generation. A reader takes generation(key) before it loads
+# the value from the database and passes it to set(); the value is only stored if the key was not
+# invalidated in between, so a load that raced a write cannot put the old row back. Generations
+# are kept for the `max_entries` most recently invalidated keys; a key beyond those reports the
+# newest generation dropped (`floor`), so a load that overlaps the drop is not stored either.
+
+
+class CacheStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "sets": 0, "stale_sets": 0, "invalidations": 0, "evictions": 0}
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def snapshot(self):
+        with self.lock:
+            stats = dict(self.counters)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_ratio"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+
+class LocalCache:
+    # Per-process: fine for a single worker
+    def __init__(self, ttl=30, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.generations = OrderedDict()  # key -> generation of its last invalidation, oldest first
+        self.last_generation = 0
+        self.floor = 0
+        self.lock = threading.Lock()
+        self.stats = CacheStats()
+
+    def generation(self, key):
+        with self.lock:
+            return self.generations.get(key, self.floor)
+
+    def get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                value, expires = entry
+                if expires > time.monotonic():
+                    self.entries.move_to_end(key)
+                    self.stats.incr("hits")
+                    return value
+                del self.entries[key]
+        self.stats.incr("misses")
+        return None
+
+    def set(self, key, value, generation=None):
+        with self.lock:
+            if generation is not None and self.generations.get(key, self.floor) != generation:
+                self.stats.incr("stale_sets")
+                return
+            self.entries[key] = (value, time.monotonic() + self.ttl)
+            self.entries.move_to_end(key)
+            evicted = 0
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+                evicted += 1
+        self.stats.incr("sets")
+        if evicted:
+            self.stats.incr("evictions", evicted)
+
+    def delete(self, *keys):
+        with self.lock:
+            for key in keys:
+                self.entries.pop(key, None)
+                self.last_generation += 1
+                self.generations[key] = self.last_generation
+                self.generations.move_to_end(key)
+            while len(self.generations) > self.max_entries:
+                _, self.floor = self.generations.popitem(last=False)
+        self.stats.incr("invalidations", len(keys))
+
+    def clear(self):
+        with self.lock:
+            self.entries.clear()
+
+    def size(self):
+        with self.lock:
+            return len(self.entries)
+
+
+# The key's generation, or the floor for a key without one (one parameter: the key)
+CURRENT_GENERATION = (
+    "COALESCE((SELECT generation FROM cache_generations WHERE key = ?), "
+    "(SELECT value FROM cache_counters WHERE name = 'floor'))"
+)
+
+
+class SQLiteCache:
+    # Shared by every worker process on one host through a SQLite file
+    def __init__(self, path, ttl=30, max_entries=10000, evict_every=100):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.evict_every = evict_every
+        self.sets_since_evict = 0
+        self.lock = threading.Lock()
+        self.stats = CacheStats()
+        self.path = path
+        self.conn = self.connect()
+        # A forked worker (see serve.py) must not share the connection opened in its parent
+        os.register_at_fork(after_in_child=self.reopen)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            "key TEXT PRIMARY KEY, value TEXT NOT NULL, expires REAL NOT NULL, accessed REAL NOT NULL)"
+        )
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_accessed ON cache (accessed)")
+        # Shared by the processes like the entries: the last generation handed out and the floor
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache_generations (key TEXT PRIMARY KEY, generation INTEGER NOT NULL)")
+        self.conn.execute("CREATE INDEX IF NOT EXISTS cache_generations_order ON cache_generations (generation)")
+        self.conn.execute("CREATE TABLE IF NOT EXISTS cache_counters (name TEXT PRIMARY KEY, value INTEGER NOT NULL)")
+        self.conn.execute("INSERT OR IGNORE INTO cache_counters (name, value) VALUES ('generation', 0), ('floor', 0)")
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=OFF")
+        return conn
+
+    def reopen(self):
+        self.lock = threading.Lock()
+        self.conn = self.connect()
+
+    def generation(self, key):
+        with self.lock:
+            return self.conn.execute(f"SELECT {CURRENT_GENERATION}", (key,)).fetchone()[0]
+
+    def get(self, key):
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute("SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[1] > now:
+                self.conn.execute("UPDATE cache SET accessed = ? WHERE key = ?", (now, key))
+                self.stats.incr("hits")
+                return json.loads(row[0])
+            if row is not None:
+                self.conn.execute("DELETE FROM cache WHERE key = ?", (key,))
+        self.stats.incr("misses")
+        return None
+
+    def set(self, key, value, generation=None):
+        now = time.time()
+        with self.lock:
+            if generation is None:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires, accessed) VALUES (?, ?, ?, ?)",
+                    (key, json.dumps(value, default=str), now + self.ttl, now)
+                )
+            else:
+                # Checked and stored in one statement, so no other process can invalidate in between
+                stored = self.conn.execute(
+                    "INSERT OR REPLACE INTO cache (key, value, expires, accessed) "
+                    f"SELECT ?, ?, ?, ? WHERE {CURRENT_GENERATION} = ?",
+                    (key, json.dumps(value, default=str), now + self.ttl, now, key, generation)
+                ).rowcount
+                if not stored:
+                    self.stats.incr("stale_sets")
+                    return
+            self.sets_since_evict += 1
+            if self.sets_since_evict >= self.evict_every:
+                self.sets_since_evict = 0
+                self.evict(now)
+        self.stats.incr("sets")
+
+    def evict(self, now):
+        self.conn.execute("DELETE FROM cache WHERE expires <= ?", (now,))
+        count = self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            self.conn.execute(
+                "DELETE FROM cache WHERE key IN (SELECT key FROM cache ORDER BY accessed LIMIT ?)", (overflow,)
+            )
+            self.stats.incr("evictions", overflow)
+        count = self.conn.execute("SELECT COUNT(*) FROM cache_generations").fetchone()[0]
+        overflow = count - self.max_entries
+        if overflow > 0:
+            with self.write_transaction():
+                floor = self.conn.execute(
+                    "SELECT generation FROM cache_generations ORDER BY generation LIMIT 1 OFFSET ?", (overflow - 1,)
+                ).fetchone()[0]
+                self.conn.execute("UPDATE cache_counters SET value = ? WHERE name = 'floor'", (floor,))
+                self.conn.execute("DELETE FROM cache_generations WHERE generation <= ?", (floor,))
+
+    @contextmanager
+    def write_transaction(self):
+        # BEGIN IMMEDIATE takes the write lock up front, so no other process writes in between
+        self.conn.execute("BEGIN IMMEDIATE")
+        try:
+            yield
+        except BaseException:
+            self.conn.execute("ROLLBACK")
+            raise
+        self.conn.execute("COMMIT")
+
+    def delete(self, *keys):
+        if not keys:
+            return
+        with self.lock, self.write_transaction():
+            for key in keys:
+                self.conn.execute("UPDATE cache_counters SET value = value + 1 WHERE name = 'generation'")
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO cache_generations (key, generation) "
+                    "SELECT ?, value FROM cache_counters WHERE name = 'generation'", (key,)
+                )
+            self.conn.executemany("DELETE FROM cache WHERE key = ?", [(key,) for key in keys])
+        self.stats.incr("invalidations", len(keys))
+
+    def clear(self):
+        with self.lock:
+            self.conn.execute("DELETE FROM cache")
+
+    def size(self):
+        with self.lock:
+            return self.conn.execute("SELECT COUNT(*) FROM cache").fetchone()[0]
+
+
+def create_cache(url, ttl=30, max_entries=10000):
+    # 'local' or 'sqlite:///path/to/cache.db'
+    if not url or url == 'local':
+        return LocalCache(ttl, max_entries)
+    if url.startswith('sqlite:///'):
+        return SQLiteCache(url[len('sqlite:///'):], ttl, max_entries)
+    raise ValueError(f"Unsupported cache backend: {url}")
+
+
+def order_key(order_id):
+    return f"order:{int(order_id)}"
+
+
+def assigned_key(delivery_person_id):
+    return f"assigned:{int(delivery_person_id)}"
@@ -0,0 +1,258 @@
+import contextvars
+import threading
+import time
+from contextlib import contextmanager
+
+import MySQLdb
+import MySQLdb.cursors
+
+from metrics import InstrumentedCursor
+
+# Pooled MySQL access for the service.
+# Routes use `db.cursor()` for reads and `db.transaction()` for writes; both borrow a
+# connection from the pool for the duration of the `with` block and always give it back.
+# Blocks nested inside another block on the same thread reuse the outer connection.
+
+
+# Sessions run in UTC: the app computes times with datetime.utcnow() and compares them with
+# TIMESTAMP columns, which MySQL returns in the session time zone
+SESSION_INIT = "SET time_zone = '+00:00'"
+
+
+class PoolExhausted(Exception):
+    pass
+
+
+class PooledConnection:
+    def __init__(self, raw):
+        self.raw = raw
+        self.created = time.monotonic()
+        self.last_used = self.created
+        self.in_transaction = False
+        # Set when a block failed with a streamed result half read; the connection is dropped
+        self.unread = False
+
+
+class ConnectionPool:
+    def __init__(self, connect, size=10, timeout=5.0, recycle=3600, ping_after=30, on_wait=None):
+        self.connect = connect
+        self.on_wait = on_wait
+        self.size = size
+        self.timeout = timeout
+        self.recycle = recycle
+        self.ping_after = ping_after
+        self.idle = []
+        self.in_use = 0
+        self.cond = threading.Condition()
+        self.counters = {"acquired": 0, "created": 0, "recycled": 0, "failed_health_checks": 0,
+                         "timeouts": 0, "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+
+    def acquire(self):
+        started = time.monotonic()
+        deadline = started + self.timeout
+        with self.cond:
+            while not self.idle and self.in_use >= self.size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    self.counters["timeouts"] += 1
+                    raise PoolExhausted(
+                        f"Timed out after {self.timeout}s waiting for a database connection "
+                        f"(pool size {self.size}, all in use)"
+                    )
+                self.cond.wait(remaining)
+            conn = self.idle.pop() if self.idle else None
+            self.in_use += 1
+            waited = time.monotonic() - started
+            self.counters["acquired"] += 1
+            self.counters["wait_seconds_total"] += waited
+            self.counters["wait_seconds_max"] = max(self.counters["wait_seconds_max"], waited)
+        if self.on_wait is not None:
+            self.on_wait(waited)
+        try:
+            return self.check(conn)
+        except Exception:
+            with self.cond:
+                self.in_use -= 1
+                self.cond.notify()
+            raise
+
+    def check(self, conn):
+        # Recycle old connections and ping ones that sat idle; open a new one when needed
+        now = time.monotonic()
+        if conn is not None and now - conn.created > self.recycle:
+            self.close(conn)
+            self.counters["recycled"] += 1
+            conn = None
+        elif conn is not None and now - conn.last_used > self.ping_after:
+            try:
+                conn.raw.ping()
+            except Exception:
+                self.close(conn)
+                self.counters["failed_health_checks"] += 1
+                conn = None
+        if conn is None:
+            conn = PooledConnection(self.connect())
+            self.counters["created"] += 1
+        return conn
+
+    def release(self, conn, discard=False):
+        with self.cond:
+            self.in_use -= 1
+            if discard:
+                self.close(conn)
+            else:
+                conn.last_used = time.monotonic()
+                self.idle.append(conn)
+            self.cond.notify()
+
+    def close(self, conn):
+        try:
+            conn.raw.close()
+        except Exception:
+            pass
+
+    def prefill(self, count):
+        # Opens connections up to `count` ahead of the first requests -> how many are idle now
+        conns = []
+        try:
+            while len(conns) < min(count, self.size):
+                conns.append(self.acquire())
+        finally:
+            for conn in conns:
+                self.release(conn)
+        return len(conns)
+
+    def close_all(self):
+        with self.cond:
+            idle, self.idle = self.idle, []
+        for conn in idle:
+            self.close(conn)
+
+    def stats(self):
+        with self.cond:
+            stats = dict(self.counters)
+            stats.update({"size": self.size, "in_use": self.in_use, "idle": len(self.idle)})
+        stats["wait_seconds_avg"] = stats["wait_seconds_total"] / stats["acquired"] if stats["acquired"] else 0.0
+        return stats
+
+
+class Database:
+    def __init__(self, app=None):
+        self.pool = None
+        # Optional hooks: observer(sql, seconds, rows) for every statement, on_wait(seconds) per checkout
+        self.observer = None
+        self.on_wait = None
+        self.current = contextvars.ContextVar(f"db_connection_{id(self)}", default=None)
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        config = app.config
+        config.setdefault('MYSQL_PORT', 3306)
+        config.setdefault('MYSQL_CHARSET', 'utf8mb4')
+        config.setdefault('DB_POOL_SIZE', 10)
+        config.setdefault('DB_POOL_TIMEOUT', 5.0)
+        config.setdefault('DB_POOL_RECYCLE', 3600)
+        config.setdefault('DB_POOL_PING_AFTER', 30)
+
+        def connect():
+            conn = MySQLdb.connect(
+                host=config['MYSQL_HOST'], user=config['MYSQL_USER'], passwd=config['MYSQL_PASSWORD'],
+                db=config['MYSQL_DB'], port=int(config['MYSQL_PORT']), charset=config['MYSQL_CHARSET'],
+                init_command=SESSION_INIT
+            )
+            # Reads never hold a snapshot open; writes opt in through transaction()
+            conn.autocommit(True)
+            return conn
+
+        self.pool = ConnectionPool(
+            config.get('DB_CONNECT') or connect,
+            size=int(config['DB_POOL_SIZE']),
+            timeout=float(config['DB_POOL_TIMEOUT']),
+            recycle=float(config['DB_POOL_RECYCLE']),
+            ping_after=float(config['DB_POOL_PING_AFTER']),
+            on_wait=lambda waited: self.on_wait and self.on_wait(waited)
+        )
+        app.extensions['db'] = self
+
+    @contextmanager
+    def checkout(self):
+        active = self.current.get()
+        if active is not None:
+            yield active
+            return
+        conn = self.pool.acquire()
+        token = self.current.set(conn)
+        failed = False
+        try:
+            yield conn
+        except MySQLdb.Error:
+            # The driver failed: the session may be lost or out of sync
+            failed = True
+            raise
+        except Exception:
+            # Application errors (a rejected transition, an idempotency conflict) leave the session
+            # usable once transaction() has rolled back, unless rows of a streamed result are unread
+            failed = conn.unread
+            raise
+        except BaseException:
+            # Interrupted (a closed response stream, KeyboardInterrupt), possibly mid-query
+            failed = True
+            raise
+        finally:
+            self.current.reset(token)
+            self.pool.release(conn, discard=failed)
+
+    @contextmanager
+    def connection(self):
+        with self.checkout() as conn:
+            yield conn.raw
+
+    def new_cursor(self, conn, cursorclass=None):
+        cursor = conn.raw.cursor(cursorclass) if cursorclass else conn.raw.cursor()
+        if self.observer is not None:
+            cursor = InstrumentedCursor(cursor, self.observer)
+        return cursor
+
+    @contextmanager
+    def cursor(self, cursorclass=None):
+        with self.checkout() as conn:
+            cursor = self.new_cursor(conn, cursorclass)
+            try:
+                yield cursor
+            except Exception:
+                if cursorclass is not None and issubclass(cursorclass, MySQLdb.cursors.CursorUseResultMixIn):
+                    conn.unread = True
+                raise
+            finally:
+                cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        # Commits when the block exits normally, rolls back on any exception.
+        # Nested inside another transaction it simply joins the outer one.
+        with self.checkout() as conn:
+            cursor = self.new_cursor(conn)
+            if conn.in_transaction:
+                try:
+                    yield cursor
+                finally:
+                    cursor.close()
+                return
+            conn.in_transaction = True
+            try:
+                cursor.execute("START TRANSACTION")
+                yield cursor
+                conn.raw.commit()
+            except BaseException:
+                conn.raw.rollback()
+                raise
+            finally:
+                conn.in_transaction = False
+                cursor.close()
+
+    def prefill(self, count):
+        return self.pool.prefill(count)
+
+    def stats(self):
+        return self.pool.stats()
@@ -0,0 +1,44 @@
+import heapq
+
+from order_status import ASSIGNED, PENDING
+
+# Order assignment helpers shared by the bulk-assign and auto-dispatch endpoints
+
+UPDATE_CHUNK_SIZE = 1000
+
+
+def balance_assignments(order_ids, loads, max_per_courier=None):
+    # Greedy least-loaded assignment. `loads` maps courier id -> current open orders.
+    # Returns {order_id: courier_id}; orders left over once every courier is full stay unassigned.
+    heap = [(load, courier_id) for courier_id, load in loads.items()
+            if max_per_courier is None or load < max_per_courier]
+    heapq.heapify(heap)
+    assignments = {}
+    for order_id in order_ids:
+        if not heap:
+            break
+        load, courier_id = heapq.heappop(heap)
+        assignments[order_id] = courier_id
+        load += 1
+        if max_per_courier is None or load < max_per_courier:
+            heapq.heappush(heap, (load, courier_id))
+    return assignments
+
+
+def apply_assignments(cursor, assignments, only_unassigned=False):
+    # Batched UPDATE ... SET assigned_to = CASE order_id ... END, UPDATE_CHUNK_SIZE orders per statement.
+    # Pending orders become Assigned. Returns the number of rows changed.
+    items = list(assignments.items())
+    changed = 0
+    for start in range(0, len(items), UPDATE_CHUNK_SIZE):
+        chunk = items[start:start + UPDATE_CHUNK_SIZE]
+        cases = " ".join(["WHEN %s THEN %s"] * len(chunk))
+        params = [value for pair in chunk for value in pair]
+        order_ids = [order_id for order_id, _ in chunk]
+        sql = (f"UPDATE orders SET assigned_to = CASE order_id {cases} END, "
+               f"status = CASE WHEN status = %s THEN %s ELSE status END "
+               f"WHERE order_id IN ({', '.join(['%s'] * len(order_ids))})")
+        if only_unassigned:
+            sql += " AND assigned_to IS NULL"
+        changed += cursor.execute(sql, params + [PENDING, ASSIGNED] + order_ids)
+    return changed
@@ -0,0 +1,151 @@
+import json
+import logging
+import os
+import queue
+import sqlite3
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Per-order pub/sub used by the tracking push channel.
+# The hub fans events out to subscribers in this process; the broker decides how
+# events travel between worker processes.
+
+
+class LocalBroker:
+    # Single process: publishing is just a local dispatch
+    def start(self, dispatch):
+        self.dispatch = dispatch
+
+    def publish(self, channel, payload):
+        self.dispatch(channel, payload)
+
+
+class SQLiteBroker:
+    # Shares events between worker processes on one host through a SQLite file.
+    # Every process appends to the same table and tails it from its own high-water mark.
+    def __init__(self, path, poll_interval=0.2, retention=60):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.retention = retention
+        self.lock = threading.Lock()
+        self.conn = self.connect()
+        # A forked worker (see serve.py) must not share the connection opened in its parent
+        os.register_at_fork(after_in_child=self.reopen)
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS events ("
+            "id INTEGER PRIMARY KEY AUTOINCREMENT, channel TEXT NOT NULL, payload TEXT NOT NULL, created REAL NOT NULL)"
+        )
+        self.conn.commit()
+
+    def connect(self):
+        conn = sqlite3.connect(self.path, timeout=5, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        return conn
+
+    def reopen(self):
+        self.lock = threading.Lock()
+        self.conn = self.connect()
+
+    def start(self, dispatch):
+        self.dispatch = dispatch
+        row = self.conn.execute("SELECT COALESCE(MAX(id), 0) FROM events").fetchone()
+        self.last_id = row[0]
+        threading.Thread(target=self.poll, daemon=True).start()
+
+    def publish(self, channel, payload):
+        with self.lock:
+            self.conn.execute(
+                "INSERT INTO events (channel, payload, created) VALUES (?, ?, ?)",
+                (str(channel), json.dumps(payload), time.time())
+            )
+            self.conn.commit()
+
+    def poll(self):
+        conn = self.connect()
+        last_prune = time.time()
+        while True:
+            # A failed round (e.g. 'database is locked') is retried on the next tick; the thread must
+            # not die, or this worker stops receiving the other workers' events
+            try:
+                rows = conn.execute(
+                    "SELECT id, channel, payload FROM events WHERE id > ? ORDER BY id", (self.last_id,)
+                ).fetchall()
+                for event_id, channel, payload in rows:
+                    self.last_id = event_id
+                    self.dispatch(channel, json.loads(payload))
+                if time.time() - last_prune > self.retention:
+                    conn.execute("DELETE FROM events WHERE created < ?", (time.time() - self.retention,))
+                    conn.commit()
+                    last_prune = time.time()
+            except Exception:
+                logger.exception("Polling the event broker failed")
+                if conn.in_transaction:
+                    conn.rollback()
+            time.sleep(self.poll_interval)
+
+
+class EventHub:
+    def __init__(self, broker=None, queue_size=100):
+        self.broker = broker or LocalBroker()
+        self.queue_size = queue_size
+        self.subscribers = {}
+        self.lock = threading.Lock()
+
+    def start(self):
+        self.broker.start(self.dispatch)
+
+    def subscribe(self, channel, q=None):
+        # q: anything with put_nowait/get_nowait (asgi.py hands its events to the event loop)
+        q = q if q is not None else queue.Queue(maxsize=self.queue_size)
+        with self.lock:
+            self.subscribers.setdefault(str(channel), set()).add(q)
+        return q
+
+    def unsubscribe(self, channel, q):
+        with self.lock:
+            subscribers = self.subscribers.get(str(channel))
+            if subscribers:
+                subscribers.discard(q)
+                if not subscribers:
+                    del self.subscribers[str(channel)]
+
+    def publish(self, channel, payload):
+        self.broker.publish(str(channel), payload)
+
+    def dispatch(self, channel, payload):
+        with self.lock:
+            subscribers = list(self.subscribers.get(str(channel), ()))
+        for q in subscribers:
+            try:
+                q.put_nowait(payload)
+            except queue.Full:
+                # Slow consumer: drop its oldest event rather than block the publisher. Publishers
+                # racing on the same queue may empty or refill it between the two steps.
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        pass
+                    try:
+                        q.put_nowait(payload)
+                        break
+                    except queue.Full:
+                        continue
+
+
+def create_broker(url):
+    # 'local' or 'sqlite:///path/to/events.db'
+    if not url or url == 'local':
+        return LocalBroker()
+    if url.startswith('sqlite:///'):
+        return SQLiteBroker(url[len('sqlite:///'):])
+    raise ValueError(f"Unsupported event broker: {url}")
+
+
+def sse_format(payload, event=None):
+    message = f"data: {json.dumps(payload, default=str)}\n\n"
+    if event:
+        message = f"event: {event}\n" + message
+    return message
@@ -0,0 +1,209 @@
+import hashlib
+import hmac
+import os
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import bcrypt
+
+# Password hashing off the request thread.
+# bcrypt runs in a dedicated process pool (so it is not bound by the GIL); callers
+# block on the result. At most `max_pending` calls may be queued or running at once;
+# beyond that callers wait up to `queue_timeout` seconds and then get HashingBusy.
+
+
+class HashingBusy(Exception):
+    pass
+
+
+def _password_bytes(password):
+    # bcrypt only uses the first 72 bytes; newer bcrypt releases reject longer input
+    return password.encode('utf-8')[:72]
+
+
+def _hash(password, rounds):
+    return bcrypt.hashpw(_password_bytes(password), bcrypt.gensalt(rounds)).decode('utf-8')
+
+
+def _check(stored_hash, password):
+    try:
+        return bcrypt.checkpw(_password_bytes(password), stored_hash.encode('utf-8'))
+    except ValueError:
+        # Malformed stored hash
+        return False
+
+
+def hash_cost(stored_hash):
+    # '$2b$12$...' -> 12
+    try:
+        return int(stored_hash.split('$')[2])
+    except (AttributeError, IndexError, ValueError):
+        return None
+
+
+class LatencyStats:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.ops = {}
+
+    def record(self, op, seconds):
+        with self.lock:
+            stats = self.ops.setdefault(op, {"calls": 0, "total_seconds": 0.0, "max_seconds": 0.0})
+            stats["calls"] += 1
+            stats["total_seconds"] += seconds
+            stats["max_seconds"] = max(stats["max_seconds"], seconds)
+
+    def snapshot(self):
+        with self.lock:
+            ops = {op: dict(stats) for op, stats in self.ops.items()}
+        for stats in ops.values():
+            stats["avg_seconds"] = stats["total_seconds"] / stats["calls"]
+        return ops
+
+
+class VerifiedCache:
+    # Remembers successful verifications for a short window.
+    # Keyed by the stored hash, so a password change invalidates the entry by itself;
+    # the password is kept only as an HMAC under a per-process secret.
+    def __init__(self, ttl=60, max_entries=10000):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.secret = os.urandom(32)
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def digest(self, stored_hash, password):
+        return hmac.new(self.secret, (stored_hash + '\0' + password).encode('utf-8'), hashlib.sha256).digest()
+
+    def hit(self, stored_hash, password):
+        if self.ttl <= 0:
+            return False
+        with self.lock:
+            entry = self.entries.get(stored_hash)
+            if entry is None:
+                return False
+            digest, expires = entry
+            if expires <= time.monotonic():
+                del self.entries[stored_hash]
+                return False
+        return hmac.compare_digest(digest, self.digest(stored_hash, password))
+
+    def add(self, stored_hash, password):
+        if self.ttl <= 0:
+            return
+        digest = self.digest(stored_hash, password)
+        with self.lock:
+            self.entries[stored_hash] = (digest, time.monotonic() + self.ttl)
+            self.entries.move_to_end(stored_hash)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+
+
+class PasswordHasher:
+    def __init__(self, rounds=12, workers=None, max_pending=None, queue_timeout=2.0, executor='process',
+                 verified_ttl=60):
+        self.rounds = rounds
+        self.workers = workers or os.cpu_count() or 2
+        self.max_pending = max_pending or self.workers * 4
+        self.queue_timeout = queue_timeout
+        self.executor_kind = executor
+        self.executor = None
+        self.executor_lock = threading.Lock()
+        self.slots = threading.BoundedSemaphore(self.max_pending)
+        self.verified = VerifiedCache(verified_ttl)
+        self.latency = LatencyStats()
+        self.lock = threading.Lock()
+        self.counters = {"verify_cache_hits": 0, "rejected_busy": 0, "rehashed": 0, "pending": 0, "bulk_hashed": 0}
+
+    def get_executor(self):
+        # Started on first use so importing the app stays cheap
+        with self.executor_lock:
+            if self.executor is None:
+                if self.executor_kind == 'process':
+                    self.executor = ProcessPoolExecutor(max_workers=self.workers)
+                else:
+                    self.executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix='hashing')
+            return self.executor
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    @contextmanager
+    def slot(self):
+        if not self.slots.acquire(timeout=self.queue_timeout):
+            self.incr("rejected_busy")
+            raise HashingBusy("Password hashing queue is full, try again shortly")
+        self.incr("pending")
+        try:
+            yield
+        finally:
+            self.incr("pending", -1)
+            self.slots.release()
+
+    def run(self, op, fn, *args):
+        started = time.perf_counter()
+        with self.slot():
+            if self.executor_kind == 'inline':
+                result = fn(*args)
+            else:
+                result = self.get_executor().submit(fn, *args).result()
+        self.latency.record(op, time.perf_counter() - started)
+        return result
+
+    def hash(self, password, rounds=None):
+        return self.run('hash', _hash, password, rounds or self.rounds)
+
+    def hash_many(self, passwords, rounds=None):
+        # Bulk imports: submitted in waves of `workers`, each holding one queue slot, so
+        # interactive logins wait behind at most one wave rather than the whole import
+        rounds = rounds or self.rounds
+        hashes = []
+        for start in range(0, len(passwords), self.workers):
+            wave = passwords[start:start + self.workers]
+            with self.slot():
+                if self.executor_kind == 'inline':
+                    hashes.extend(_hash(password, rounds) for password in wave)
+                else:
+                    futures = [self.get_executor().submit(_hash, password, rounds) for password in wave]
+                    hashes.extend(future.result() for future in futures)
+        self.incr("bulk_hashed", len(passwords))
+        return hashes
+
+    def verify(self, stored_hash, password):
+        if self.verified.hit(stored_hash, password):
+            self.incr("verify_cache_hits")
+            return True
+        ok = self.run('verify', _check, stored_hash, password)
+        if ok:
+            self.verified.add(stored_hash, password)
+        return ok
+
+    def needs_rehash(self, stored_hash):
+        return hash_cost(stored_hash) != self.rounds
+
+    def stats(self):
+        with self.lock:
+            stats = dict(self.counters)
+        stats.update({"rounds": self.rounds, "workers": self.workers, "executor": self.executor_kind,
+                      "max_pending": self.max_pending, "latency": self.latency.snapshot()})
+        return stats
+
+    def warm(self):
+        # Starts every pool worker (each imports bcrypt) so the first logins do not wait for them
+        if self.executor_kind == 'inline':
+            return 0
+        executor = self.get_executor()
+        futures = [executor.submit(_hash, 'warm-up', 4) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+        return len(futures)
+
+    def shutdown(self):
+        with self.executor_lock:
+            if self.executor is not None:
+                self.executor.shutdown(wait=False)
+                self.executor = None
@@ -0,0 +1,77 @@
+import hashlib
+import logging
+import threading
+from datetime import datetime, timedelta
+
+logger = logging.getLogger(__name__)
+
+# Idempotency-Key support for order placement.
+# The response to the first request with a key is stored in the same transaction as the orders it
+# created, so a retry either finds it and gets the same response back without touching orders,
+# or finds nothing because nothing was committed. Two requests racing with one key collide on the
+# (customer_id, idempotency_key) primary key: the second one's transaction, orders included, rolls
+# back and it replays the first one's response. A key reused with a different request is refused.
+
+MAX_KEY_LENGTH = 255
+
+
+class IdempotencyConflict(Exception):
+    pass
+
+
+def request_hash(method, path, body):
+    return hashlib.sha256(b'\n'.join([method.encode(), path.encode(), body or b''])).hexdigest()
+
+
+class IdempotencyKeys:
+    def __init__(self, db, ttl=86400, purge_every=1000):
+        self.db = db
+        self.ttl = ttl
+        self.purge_every = purge_every
+        self.stored = 0
+        self.lock = threading.Lock()
+
+    def lookup(self, cursor, customer_id, key, fingerprint):
+        # -> (status code, response body) of the first request with this key, or None
+        cursor.execute(
+            "SELECT request_hash, status_code, response FROM idempotency_keys "
+            "WHERE customer_id = %s AND idempotency_key = %s AND expires_at > %s",
+            (customer_id, key, datetime.utcnow())
+        )
+        row = cursor.fetchone()
+        if row is None:
+            return None
+        if row[0] != fingerprint:
+            raise IdempotencyConflict("Idempotency-Key was already used for a different request")
+        return row[1], row[2]
+
+    def store(self, cursor, customer_id, key, fingerprint, status, body):
+        # Call in the transaction that did the work; raises IntegrityError if a concurrent
+        # request with the same key stored its response first
+        now = datetime.utcnow()
+        cursor.execute(
+            "DELETE FROM idempotency_keys WHERE customer_id = %s AND idempotency_key = %s AND expires_at <= %s",
+            (customer_id, key, now)
+        )
+        cursor.execute(
+            "INSERT INTO idempotency_keys (customer_id, idempotency_key, request_hash, status_code, response, expires_at) "
+            "VALUES (%s, %s, %s, %s, %s, %s)",
+            (customer_id, key, fingerprint, status, body, now + timedelta(seconds=self.ttl))
+        )
+
+    def stored_one(self):
+        # Every purge_every stored keys, drop the expired ones (in a transaction of their own,
+        # so the order insert never waits on it)
+        with self.lock:
+            self.stored += 1
+            if self.stored % self.purge_every:
+                return
+        try:
+            self.purge()
+        except Exception:
+            logger.exception("Purging expired idempotency keys failed")
+
+    def purge(self):
+        with self.db.transaction() as cursor:
+            cursor.execute("DELETE FROM idempotency_keys WHERE expires_at <= %s", (datetime.utcnow(),))
+            return cursor.rowcount
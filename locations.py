@@ -0,0 +1,175 @@
+import atexit
+import logging
+import re
+import threading
+from datetime import datetime, timedelta, timezone
+
+logger = logging.getLogger(__name__)
+
+# Write-behind buffer for courier GPS fixes.
+# Fixes are collected in memory and handed to `flush_fn` in batches when the
+# buffer reaches `max_size` or every `max_delay` seconds, whichever comes first.
+
+# A free-text location that is just "lat,lon" also gives the fix its coordinates
+COORDINATES_RE = re.compile(r"^\s*(-?\d{1,3}(?:\.\d+)?)\s*,\s*(-?\d{1,3}(?:\.\d+)?)\s*$")
+
+# Seconds a device clock may run ahead of ours. The newest fix wins in orders.location and the
+# courier positions, so a fix stamped further in the future would pin them until that time came.
+MAX_CLOCK_SKEW = 60
+
+
+def parse_fix(fix, max_skew=MAX_CLOCK_SKEW):
+    # Normalise one incoming fix; raises ValueError/TypeError on bad input
+    try:
+        order_id = int(fix['order_id'])
+    except OverflowError:
+        raise ValueError("order_id out of range")
+    lat, lon = fix.get('lat'), fix.get('lon')
+    location = fix.get('location')
+    if lat is not None or lon is not None:
+        lat, lon = float(lat), float(lon)
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise ValueError("Coordinates out of range")
+        location = location or f"{lat:.6f},{lon:.6f}"
+    elif not location:
+        raise ValueError("lat/lon or location is required")
+    else:
+        match = COORDINATES_RE.match(str(location))
+        if match:
+            lat, lon = float(match.group(1)), float(match.group(2))
+            if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+                lat = lon = None
+    now = datetime.now(timezone.utc)
+    recorded_at = fix.get('recorded_at')
+    if isinstance(recorded_at, bool):
+        raise ValueError("recorded_at must be a timestamp or an ISO 8601 string")
+    try:
+        if recorded_at is None:
+            recorded_at = now
+        elif isinstance(recorded_at, (int, float)):
+            recorded_at = datetime.fromtimestamp(recorded_at, timezone.utc)
+        else:
+            recorded_at = datetime.fromisoformat(recorded_at)
+            if recorded_at.tzinfo is None:
+                recorded_at = recorded_at.replace(tzinfo=timezone.utc)
+        # Stored as naive UTC
+        recorded_at = recorded_at.astimezone(timezone.utc)
+    except (OverflowError, OSError):
+        # Timestamps such as 1e20 or inf, and dates that leave the datetime range once moved to UTC
+        raise ValueError("recorded_at out of range")
+    if recorded_at > now + timedelta(seconds=max_skew):
+        raise ValueError("recorded_at is in the future")
+    recorded_at = recorded_at.replace(tzinfo=None)
+    return {"order_id": order_id, "lat": lat, "lon": lon, "location": str(location)[:255],
+            "recorded_at": recorded_at}
+
+
+class LocationBuffer:
+    # A flush that fails is retried on later ticks, up to max_attempts times per fix. A batch the
+    # database rejects for its data (reject_errors, e.g. an IntegrityError) is split until the bad
+    # fixes are found; those are logged and dropped, and the rest of the batch is written.
+    def __init__(self, flush_fn, max_size=500, max_delay=1.0, max_pending=50000, max_attempts=5,
+                 reject_errors=()):
+        self.flush_fn = flush_fn
+        self.max_size = max_size
+        self.max_delay = max_delay
+        self.max_pending = max_pending
+        self.max_attempts = max_attempts
+        self.reject_errors = tuple(reject_errors)
+        self.pending = []
+        self.lock = threading.Lock()
+        self.flush_lock = threading.Lock()
+        self.wakeup = threading.Event()
+        self.dropped = 0
+        self.rejected = 0
+        self.flushed = 0
+
+    def start(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        atexit.register(self.flush)
+
+    def add(self, fixes):
+        with self.lock:
+            self.pending.extend(fixes)
+            overflow = len(self.pending) - self.max_pending
+            if overflow > 0:
+                del self.pending[:overflow]
+                self.dropped += overflow
+            full = len(self.pending) >= self.max_size
+        if full:
+            self.wakeup.set()
+
+    def run(self):
+        while True:
+            self.wakeup.wait(self.max_delay)
+            self.wakeup.clear()
+            self.flush()
+
+    def flush(self):
+        with self.flush_lock:
+            with self.lock:
+                batch, self.pending = self.pending, []
+            if not batch:
+                return 0
+            written, failed = self.write(batch)
+            if failed:
+                self.requeue(failed)
+            self.flushed += written
+            return written
+
+    def write(self, batch):
+        # -> (fixes written, fixes to retry)
+        try:
+            self.flush_fn(batch)
+            return len(batch), []
+        except self.reject_errors:
+            if len(batch) == 1:
+                logger.warning("Dropping a location fix the database rejected: %r", batch[0], exc_info=True)
+                self.rejected += 1
+                return 0, []
+        except Exception:
+            logger.exception("Location flush failed for %d fixes", len(batch))
+            return 0, batch
+        middle = len(batch) // 2
+        first_written, first_failed = self.write(batch[:middle])
+        second_written, second_failed = self.write(batch[middle:])
+        return first_written + second_written, first_failed + second_failed
+
+    def requeue(self, fixes):
+        # Put the fixes back without waking the flusher; they are retried on the next tick
+        retry = []
+        for fix in fixes:
+            fix['attempts'] = fix.get('attempts', 0) + 1
+            if fix['attempts'] < self.max_attempts:
+                retry.append(fix)
+        given_up = len(fixes) - len(retry)
+        if given_up:
+            logger.warning("Dropping %d location fixes after %d failed flushes", given_up, self.max_attempts)
+        with self.lock:
+            self.pending[:0] = retry
+            overflow = len(self.pending) - self.max_pending
+            if overflow > 0:
+                del self.pending[:overflow]
+            self.dropped += given_up + max(overflow, 0)
+
+    def stats(self):
+        with self.lock:
+            pending = len(self.pending)
+        return {"pending": pending, "flushed": self.flushed, "dropped": self.dropped, "rejected": self.rejected}
+
+
+def latest_per_order(batch):
+    latest = {}
+    for fix in batch:
+        current = latest.get(fix['order_id'])
+        if current is None or fix['recorded_at'] >= current['recorded_at']:
+            latest[fix['order_id']] = fix
+    return latest
+
+
+def downsample_interval(value, default=60, minimum=1, maximum=86400):
+    try:
+        interval = int(value) if value is not None else default
+    except ValueError:
+        raise ValueError("Invalid interval")
+    return max(minimum, min(interval, maximum))
@@ -0,0 +1,283 @@
+import logging
+import os
+import re
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+
+from responses import FastJSONProvider
+
+# Request-level instrumentation: per-route and per-query-shape latency histograms,
+# rows returned, pool wait time, a slow-query log and an opt-in sampling profiler.
+# Everything is rendered in Prometheus text format by `Metrics.render()`.
+
+slow_query_log = logging.getLogger('slow_query')
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+
+class Histogram:
+    def __init__(self, name, help_text, label_names, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.buckets = buckets
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, labels, value):
+        with self.lock:
+            series = self.series.get(labels)
+            if series is None:
+                series = self.series[labels] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+            series[1] += value
+            series[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            items = [(labels, list(counts), total, count) for labels, (counts, total, count) in self.series.items()]
+        for labels, counts, total, count in sorted(items):
+            base = format_labels(self.label_names, labels)
+            for bound, bucket_count in zip(self.buckets, counts):
+                le = join_labels(base, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{le} {bucket_count}")
+            le = join_labels(base, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{le} {count}")
+            lines.append(f"{self.name}_sum{wrap_labels(base)} {total}")
+            lines.append(f"{self.name}_count{wrap_labels(base)} {count}")
+        return lines
+
+
+class LabeledCounter:
+    def __init__(self, name, help_text, label_names):
+        self.name = name
+        self.help_text = help_text
+        self.label_names = label_names
+        self.series = Counter()
+        self.lock = threading.Lock()
+
+    def inc(self, labels, amount=1):
+        with self.lock:
+            self.series[labels] += amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self.lock:
+            items = sorted(self.series.items())
+        for labels, value in items:
+            lines.append(f"{self.name}{wrap_labels(format_labels(self.label_names, labels))} {value}")
+        return lines
+
+
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def format_labels(names, values):
+    return ",".join(f'{name}="{escape_label(value)}"' for name, value in zip(names, values))
+
+
+def join_labels(base, extra):
+    return "{" + (base + "," if base else "") + extra + "}"
+
+
+def wrap_labels(base):
+    return "{" + base + "}" if base else ""
+
+
+_IN_LIST = re.compile(r"\(\s*%s(\s*,\s*%s)+\s*\)")
+_CASE_LIST = re.compile(r"(WHEN %s THEN %s\s*)+")
+_VALUES_LIST = re.compile(r"(\(\s*%s(\s*,\s*%s)*\s*\))(\s*,\s*\(\s*%s(\s*,\s*%s)*\s*\))+")
+_LITERALS = re.compile(r"'(?:[^'\\]|\\.)*'|\b\d+\b")
+_SPACES = re.compile(r"\s+")
+
+
+def query_shape(sql):
+    # Stable label for a statement: literals and variable-length placeholder lists collapsed
+    if isinstance(sql, bytes):
+        sql = sql.decode('utf-8', 'replace')
+    shape = _SPACES.sub(" ", sql).strip()
+    # Multi-row VALUES first: its rows would otherwise each collapse to "(...)" and keep the row count
+    shape = _VALUES_LIST.sub(r"\1, ...", shape)
+    shape = _IN_LIST.sub("(...)", shape)
+    shape = _CASE_LIST.sub("WHEN ... ", shape)
+    shape = _LITERALS.sub("?", shape)
+    return shape[:200]
+
+
+class InstrumentedCursor:
+    # Wraps a DB-API cursor and reports every execute to `observer(sql, seconds, rows)`
+    def __init__(self, cursor, observer):
+        self._cursor = cursor
+        self._observer = observer
+
+    def execute(self, sql, params=None):
+        started = time.perf_counter()
+        try:
+            return self._cursor.execute(sql, params)
+        finally:
+            self._observer(sql, time.perf_counter() - started, self._cursor.rowcount)
+
+    def executemany(self, sql, seq):
+        started = time.perf_counter()
+        try:
+            return self._cursor.executemany(sql, seq)
+        finally:
+            self._observer(sql, time.perf_counter() - started, self._cursor.rowcount)
+
+    def __iter__(self):
+        return iter(self._cursor)
+
+    def __getattr__(self, name):
+        return getattr(self._cursor, name)
+
+
+class SamplingProfiler:
+    # Samples one thread's stack every `interval` seconds; output is folded stacks (flamegraph input)
+    def __init__(self, thread_id, interval=0.005):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.running = True
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def run(self):
+        while self.running:
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is not None:
+                stack = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                    frame = frame.f_back
+                self.stacks[";".join(reversed(stack))] += 1
+            time.sleep(self.interval)
+
+    def stop(self):
+        self.running = False
+        self.thread.join()
+        return self.stacks
+
+
+class Metrics:
+    def __init__(self, app=None):
+        self.requests = Histogram('courier_http_request_duration_seconds', 'Request latency by route',
+                                  ('method', 'route', 'status'))
+        self.phases = Histogram('courier_http_request_phase_seconds',
+                                'Time spent per request in SQL, JWT checks and JSON serialization',
+                                ('route', 'phase'))
+        self.queries = Histogram('courier_sql_query_duration_seconds', 'SQL latency by query shape', ('query',))
+        self.rows = Histogram('courier_sql_rows', 'Rows returned or affected by query shape', ('query',),
+                              buckets=ROW_BUCKETS)
+        self.pool_wait = Histogram('courier_db_pool_wait_seconds', 'Time spent waiting for a pooled connection', ())
+        self.counters = []
+        self.gauges = []
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('SLOW_QUERY_MS', 0)
+        app.config.setdefault('PROFILE_HEADER_ENABLED', False)
+        app.config.setdefault('PROFILE_SECRET', '')
+        app.config.setdefault('PROFILE_DIR', 'profiles')
+        app.config.setdefault('PROFILE_INTERVAL', 0.005)
+        self.app = app
+        app.before_request(self.start_request)
+        app.after_request(self.finish_request)
+        app.json = TimedJSONProvider(app, self)
+        app.extensions['metrics'] = self
+
+    def counter(self, name, help_text, label_names):
+        counter = LabeledCounter(name, help_text, label_names)
+        self.counters.append(counter)
+        return counter
+
+    def add_gauges(self, collect):
+        # `collect()` -> iterable of (name, help, value); sampled at scrape time
+        self.gauges.append(collect)
+
+    @contextmanager
+    def phase(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_phase(name, time.perf_counter() - started)
+
+    def add_phase(self, name, seconds):
+        if has_request_context():
+            phases = g.setdefault('metrics_phases', {})
+            phases[name] = phases.get(name, 0.0) + seconds
+
+    def observe_query(self, sql, seconds, rows):
+        shape = query_shape(sql)
+        self.queries.observe((shape,), seconds)
+        if rows is not None and rows >= 0:
+            self.rows.observe((shape,), rows)
+        self.add_phase('sql', seconds)
+        threshold = self.app.config['SLOW_QUERY_MS']
+        if threshold and seconds * 1000 >= threshold:
+            route = request.url_rule.rule if has_request_context() and request.url_rule else '-'
+            slow_query_log.warning("slow query %.1fms rows=%s route=%s: %s", seconds * 1000, rows, route, shape)
+
+    def observe_pool_wait(self, seconds):
+        self.pool_wait.observe((), seconds)
+
+    def start_request(self):
+        g.metrics_started = time.perf_counter()
+        config = self.app.config
+        if (config['PROFILE_HEADER_ENABLED'] and request.headers.get('X-Profile')
+                and (not config['PROFILE_SECRET'] or request.headers.get('X-Profile') == config['PROFILE_SECRET'])):
+            g.metrics_profiler = SamplingProfiler(threading.get_ident(), config['PROFILE_INTERVAL'])
+
+    def finish_request(self, response):
+        started = g.pop('metrics_started', None)
+        if started is None:
+            return response
+        route = request.url_rule.rule if request.url_rule else 'unmatched'
+        self.requests.observe((request.method, route, str(response.status_code)), time.perf_counter() - started)
+        for name, seconds in g.pop('metrics_phases', {}).items():
+            self.phases.observe((route, name), seconds)
+        profiler = g.pop('metrics_profiler', None)
+        if profiler is not None:
+            response.headers['X-Profile-Id'] = self.write_profile(profiler.stop())
+        return response
+
+    def write_profile(self, stacks):
+        profile_id = uuid.uuid4().hex
+        directory = self.app.config['PROFILE_DIR']
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, f"{profile_id}.folded"), "w") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        return profile_id
+
+    def render(self):
+        lines = []
+        for histogram in (self.requests, self.phases, self.queries, self.rows, self.pool_wait, *self.counters):
+            lines.extend(histogram.render())
+        for collect in self.gauges:
+            for name, help_text, value in collect():
+                lines.extend([f"# HELP {name} {help_text}", f"# TYPE {name} gauge", f"{name} {value}"])
+        return "\n".join(lines) + "\n"
+
+
+class TimedJSONProvider(FastJSONProvider):
+    def __init__(self, app, metrics):
+        super().__init__(app)
+        self.metrics = metrics
+
+    def dumps(self, obj, **kwargs):
+        with self.metrics.phase('serialization'):
+            return super().dumps(obj, **kwargs)
@@ -0,0 +1,380 @@
+import argparse
+import ast
+import hashlib
+import os
+import re
+import sys
+
+from search import SEARCH_TARGETS, SearchQuery, build_search_query
+
+# Versioned schema migrations and an EXPLAIN-based index advisor.
+#
+#   python migrate.py up [--target N]   apply pending migrations (the default command)
+#   python migrate.py status            list applied and pending migrations
+#   python migrate.py advise [--strict] EXPLAIN every statement in the service and flag full scans
+#
+# `Dump20250527 (1).sql` is the baseline schema. Every change after it is a numbered file in
+# migrations/ (NNNN_description.sql) that is applied once, in order, and recorded in
+# schema_migrations. Never edit a migration that has been applied; add a new one instead.
+# MySQL commits DDL implicitly, so keep each migration small enough to re-run by hand if it fails.
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+MIGRATIONS_DIR = os.path.join(BASE_DIR, 'migrations')
+MIGRATION_FILE = re.compile(r"^(\d{4})_(\w+)\.sql$")
+
+
+class MigrationError(Exception):
+    pass
+
+
+def split_statements(sql):
+    lines = [line for line in sql.splitlines() if not line.strip().startswith('--')]
+    return [statement.strip() for statement in "\n".join(lines).split(';') if statement.strip()]
+
+
+def load_migrations(directory=MIGRATIONS_DIR):
+    # -> [(version, name, statements, checksum)] sorted by version
+    migrations = []
+    for filename in sorted(os.listdir(directory)):
+        match = MIGRATION_FILE.match(filename)
+        if not match:
+            continue
+        with open(os.path.join(directory, filename), encoding='utf-8') as f:
+            sql = f.read().replace('\r\n', '\n')
+        checksum = hashlib.sha256(sql.encode('utf-8')).hexdigest()
+        migrations.append((int(match.group(1)), match.group(2), split_statements(sql), checksum))
+    versions = [m[0] for m in migrations]
+    if len(versions) != len(set(versions)):
+        raise MigrationError("Two migration files share a version number")
+    return migrations
+
+
+def applied_migrations(conn):
+    # -> {version: checksum}
+    cursor = conn.cursor()
+    cursor.execute(
+        "CREATE TABLE IF NOT EXISTS schema_migrations ("
+        "version INT NOT NULL PRIMARY KEY, name VARCHAR(255) NOT NULL, "
+        "checksum CHAR(64) NOT NULL, applied_at DATETIME NOT NULL)"
+    )
+    cursor.execute("SELECT version, checksum FROM schema_migrations ORDER BY version")
+    applied = {version: checksum for version, checksum in cursor.fetchall()}
+    cursor.close()
+    return applied
+
+
+def pending_migrations(conn, migrations=None):
+    migrations = load_migrations() if migrations is None else migrations
+    applied = applied_migrations(conn)
+    for version, name, _, checksum in migrations:
+        if version in applied and applied[version] != checksum:
+            raise MigrationError(f"Migration {version:04d}_{name} was edited after it was applied")
+    return [m for m in migrations if m[0] not in applied]
+
+
+def migrate(conn, target=None, log=print):
+    # Applies pending migrations up to `target` (default: all); returns the versions applied
+    done = []
+    for version, name, statements, checksum in pending_migrations(conn):
+        if target is not None and version > target:
+            break
+        log(f"Applying {version:04d}_{name}")
+        cursor = conn.cursor()
+        try:
+            for statement in statements:
+                cursor.execute(statement)
+            cursor.execute(
+                "INSERT INTO schema_migrations (version, name, checksum, applied_at) VALUES (%s, %s, %s, NOW())",
+                (version, name, checksum)
+            )
+            conn.commit()
+        except Exception as e:
+            conn.rollback()
+            raise MigrationError(f"Migration {version:04d}_{name} failed: {e}") from e
+        finally:
+            cursor.close()
+        done.append(version)
+    return done
+
+
+# Index advisor: statements are read from the source with `ast`, so it needs no traffic and
+# covers every call site; placeholders are filled with sample values of the column's type.
+# Every module that calls execute() is scanned (see sql_sources) except these: the stores kept in
+# SQLite rather than MySQL, the connection wrappers that run what their callers pass in, and this file.
+NOT_SCANNED = ('admission.py', 'cache.py', 'events.py', 'db.py', 'aiodb.py', 'metrics.py', 'migrate.py')
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE')
+# Put this comment inside an execute(...) call to accept a full scan that is intended
+SCAN_OK_MARKER = 'advisor: full-scan-ok'
+SAMPLE_DATETIME = '2025-01-01 00:00:00'
+_PLACEHOLDER_COLUMN = re.compile(r"`?(\w+)`?\s*(?:=|<>|!=|>=|<=|<|>|\bIN\s*\(\s*(?:%s\s*,\s*)*)\s*$", re.I)
+
+
+class SourceRenderer:
+    # Turns the first argument of an execute() call back into SQL text.
+    # Follows local variables to their last assignment and collapses placeholder lists
+    # built with ', '.join(['%s'] * n) to a single '%s'. Returns None when it cannot.
+    def __init__(self, tree):
+        self.parents = {}
+        for node in ast.walk(tree):
+            for child in ast.iter_child_nodes(node):
+                self.parents[child] = node
+
+    def scope(self, node):
+        while node in self.parents:
+            node = self.parents[node]
+            if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef)):
+                return node
+        return node
+
+    def resolve(self, name, at):
+        found = None
+        for node in ast.walk(self.scope(at)):
+            if not isinstance(node, ast.Assign) or node.lineno >= at.lineno:
+                continue
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id == name.id:
+                    value = node.value
+                elif (isinstance(target, ast.Tuple) and isinstance(node.value, ast.Tuple)
+                      and len(target.elts) == len(node.value.elts)):
+                    value = next((v for t, v in zip(target.elts, node.value.elts)
+                                  if isinstance(t, ast.Name) and t.id == name.id), None)
+                else:
+                    value = None
+                if value is not None and (found is None or node.lineno > found[0].lineno):
+                    found = (node, value)
+        # Later lookups start from the assignment itself, so `sql = sql + ...` reads the earlier value
+        return found if found else (None, None)
+
+    def items(self, node, at):
+        # Elements of a list expression, for str.join()
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Mult):
+            return self.items(node.left, at)
+        if isinstance(node, ast.Name):
+            assign, value = self.resolve(node, at)
+            return self.items(value, assign) if value is not None else None
+        if isinstance(node, ast.List):
+            rendered = [self.render(element, at) for element in node.elts]
+            return None if None in rendered else rendered
+        return None
+
+    def render(self, node, at):
+        if isinstance(node, ast.Constant) and isinstance(node.value, str):
+            return node.value
+        if isinstance(node, ast.JoinedStr):
+            parts = [self.render(v.value if isinstance(v, ast.FormattedValue) else v, at) for v in node.values]
+            return None if None in parts else "".join(parts)
+        if isinstance(node, ast.BinOp) and isinstance(node.op, ast.Add):
+            left, right = self.render(node.left, at), self.render(node.right, at)
+            return None if left is None or right is None else left + right
+        if isinstance(node, ast.Name):
+            assign, value = self.resolve(node, at)
+            return self.render(value, assign) if value is not None else None
+        if (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute) and node.func.attr == 'join'
+                and len(node.args) == 1):
+            separator = self.render(node.func.value, at)
+            items = self.items(node.args[0], at)
+            return None if separator is None or items is None else separator.join(items)
+        return None
+
+
+def collect_statements(path):
+    # -> (statements, skipped): [(location, sql, scan_ok)], [location]
+    with open(path, encoding='utf-8') as f:
+        source = f.read()
+    tree = ast.parse(source)
+    lines = source.splitlines()
+    renderer = SourceRenderer(tree)
+    statements, skipped = [], []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Attribute)
+                and node.func.attr in ('execute', 'executemany') and node.args):
+            continue
+        location = f"{os.path.basename(path)}:{node.lineno}"
+        sql = renderer.render(node.args[0], node)
+        if sql is None:
+            skipped.append(location)
+            continue
+        if sql.lstrip().split(None, 1)[0].upper() in EXPLAINABLE:
+            scan_ok = any(SCAN_OK_MARKER in line for line in lines[node.lineno - 1:node.end_lineno])
+            statements.append((location, sql, scan_ok))
+    return sorted(statements, key=lambda s: (s[0].split(':')[0], int(s[0].split(':')[1]))), skipped
+
+
+def sql_sources():
+    # Top-level modules that run SQL, so a new one is checked without being listed here
+    sources = []
+    for name in sorted(os.listdir(BASE_DIR)):
+        if not name.endswith('.py') or name in NOT_SCANNED:
+            continue
+        with open(os.path.join(BASE_DIR, name), encoding='utf-8') as f:
+            if re.search(r"\.execute(?:many)?\(", f.read()):
+                sources.append(name)
+    return sources
+
+
+def collect_listing_statements(service, path):
+    # Listing queries are assembled at request time by build_listing_query(); build one
+    # statement per filter for every call site, exactly as fetch_page() would run it
+    with open(path, encoding='utf-8') as f:
+        tree = ast.parse(f.read())
+    statements = []
+    for node in ast.walk(tree):
+        if not (isinstance(node, ast.Call) and isinstance(node.func, ast.Name)
+                and node.func.id == 'build_listing_query'):
+            continue
+        args = [getattr(service, a.id) if isinstance(a, ast.Name) else ast.literal_eval(a) for a in node.args]
+        columns, table, key, filters = args[:4]
+        cursor_arg = args[4] if len(args) > 4 else 'after'
+        variants = [{}, {cursor_arg: '1'}]
+        for arg, _, _, convert in filters:
+            variants.append({arg: next(v for v in ('1', SAMPLE_DATETIME) if _converts(convert, v))})
+        for query in variants:
+            with service.app1.test_request_context(query_string=query):
+                sql, _ = service.build_listing_query(columns, table, key, filters, cursor_arg)
+            label = "&".join(query) or "no filters"
+            statements.append((f"{os.path.basename(path)}:{node.lineno} ({label})", sql + " LIMIT %s", False))
+    return statements
+
+
+def collect_search_statements():
+    # Search queries are assembled by search.build_search_query(); one statement per target and filter
+    query = SearchQuery.parse('sample')
+    statements = []
+    for target, spec in SEARCH_TARGETS.items():
+        variants = [({}, None), ({'created_from': SAMPLE_DATETIME}, SAMPLE_DATETIME)]
+        variants += [({arg: '1'}, None) for arg, _, _, _ in spec['filters']]
+        for args, created_from in variants:
+            sql, _ = build_search_query(target, query, args, created_from)
+            label = "&".join(args) or "no filters"
+            statements.append((f"search.py:{target} ({label})", sql + " LIMIT %s", False))
+    return statements
+
+
+def _converts(convert, value):
+    try:
+        convert(value)
+        return True
+    except ValueError:
+        return False
+
+
+def column_types(cursor):
+    # column name -> sample value of the right type, from the live schema
+    cursor.execute(
+        "SELECT COLUMN_NAME, DATA_TYPE, COLUMN_TYPE FROM information_schema.COLUMNS WHERE TABLE_SCHEMA = DATABASE()"
+    )
+    samples = {}
+    for name, data_type, column_type in cursor.fetchall():
+        if data_type in ('datetime', 'timestamp', 'date'):
+            samples.setdefault(name, SAMPLE_DATETIME)
+        elif data_type == 'enum':
+            samples.setdefault(name, re.match(r"enum\('((?:[^']|'')*)'", column_type).group(1))
+        elif data_type in ('varchar', 'char', 'text', 'mediumtext', 'longtext'):
+            samples.setdefault(name, 'sample')
+        else:
+            samples.setdefault(name, 1)
+    return samples
+
+
+def sample_params(sql, samples):
+    params = []
+    for match in re.finditer(r"%s", sql):
+        before = sql[:match.start()]
+        column = _PLACEHOLDER_COLUMN.search(before)
+        if re.search(r"\bLIMIT\s*$", before, re.I):
+            params.append(10)
+        elif column and column.group(1) in samples:
+            params.append(samples[column.group(1)])
+        else:
+            params.append(1)
+    return params
+
+
+def explain(cursor, sql, params):
+    cursor.execute("EXPLAIN " + sql, params)
+    names = [d[0] for d in cursor.description]
+    return [dict(zip(names, row)) for row in cursor.fetchall()]
+
+
+def plan_problems(sql, plan):
+    # -> [(severity, message)]; 'error' means a table is read in full with no usable index
+    problems = []
+    limited = re.search(r"\bLIMIT\b", sql, re.I) is not None
+    for row in plan:
+        table = row.get('table')
+        if not table or table.startswith('<'):
+            continue
+        if row.get('type') == 'ALL':
+            if row.get('possible_keys'):
+                problems.append(('warning', f"full scan of {table} although {row['possible_keys']} could be used "
+                                            f"(often just a small table)"))
+            else:
+                problems.append(('error', f"full scan of {table}, no usable index (~{row.get('rows')} rows)"))
+        elif row.get('type') == 'index' and not limited:
+            problems.append(('warning', f"full index scan of {table} on {row.get('key')}"))
+    return problems
+
+
+def advise(service, strict=False, log=print):
+    # Returns the number of statements that fail the check
+    statements, skipped = [], []
+    for name in sql_sources():
+        found, missed = collect_statements(os.path.join(BASE_DIR, name))
+        statements.extend(found)
+        skipped.extend(missed)
+    statements.extend(collect_listing_statements(service, os.path.join(BASE_DIR, 'app.py')))
+    statements.extend(collect_search_statements())
+
+    failures = 0
+    with service.db.cursor() as cursor:
+        samples = column_types(cursor)
+        for location, sql, scan_ok in statements:
+            try:
+                problems = plan_problems(sql, explain(cursor, sql, sample_params(sql, samples)))
+            except Exception as e:
+                problems = [('warning', f"could not EXPLAIN: {e}")]
+            failed = any(severity == 'error' or strict for severity, _ in problems) and not scan_ok
+            failures += failed
+            status = 'FAIL' if failed else ('warn' if problems else 'ok')
+            log(f"{status:4}  {location}  {' '.join(sql.split())[:120]}")
+            for severity, message in problems:
+                log(f"        {severity}: {message}")
+    for location in skipped:
+        log(f"skip  {location}  (SQL built dynamically)")
+    log(f"{len(statements)} statements checked, {failures} failing, {len(skipped)} skipped")
+    return failures
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Schema migrations and index advisor for the courier service")
+    commands = parser.add_subparsers(dest='command')
+    up = commands.add_parser('up', help="apply pending migrations")
+    up.add_argument('--target', type=int, help="stop after this version")
+    commands.add_parser('status', help="list applied and pending migrations")
+    advise_cmd = commands.add_parser('advise', help="EXPLAIN every statement in the service and flag full scans")
+    advise_cmd.add_argument('--strict', action='store_true', help="fail on warnings too")
+    args = parser.parse_args(argv)
+    args.command = args.command or 'up'
+    return args
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Reuse the service's configuration and connection pool
+    import app as service
+
+    if args.command == 'advise':
+        return 1 if advise(service, strict=args.strict) else 0
+    with service.db.connection() as conn:
+        if args.command == 'status':
+            applied = applied_migrations(conn)
+            for version, name, _, _ in load_migrations():
+                print(f"{version:04d}_{name}  {'applied' if version in applied else 'pending'}")
+            return 0
+        done = migrate(conn, target=args.target)
+        print(f"Applied {len(done)} migration(s)" if done else "Schema is up to date")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
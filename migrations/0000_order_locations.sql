@@ -0,0 +1,15 @@
+-- Location trail of each order (see locations.py), written by the buffered location ingestion.
+-- Numbered before the others because it predates them: 0007 drops its foreign key. IF NOT EXISTS,
+-- as databases set up from an earlier copy of the dump already have it.
+CREATE TABLE IF NOT EXISTS `order_locations` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `order_id` int NOT NULL,
+  `delivery_person_id` int DEFAULT NULL,
+  `latitude` decimal(9,6) DEFAULT NULL,
+  `longitude` decimal(9,6) DEFAULT NULL,
+  `location` varchar(255) NOT NULL,
+  `recorded_at` datetime(3) NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `order_recorded` (`order_id`,`recorded_at`),
+  CONSTRAINT `order_locations_ibfk_1` FOREIGN KEY (`order_id`) REFERENCES `orders` (`order_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
@@ -0,0 +1,17 @@
+-- Composite indexes matched to the query shapes in app.py (check with `python migrate.py advise`).
+-- Every secondary index ends with the implicit primary key, so equality filters keep keyset order.
+
+-- delivery/history, delivery/assigned-orders, auto-dispatch and the courier load count filter on
+-- (assigned_to, status); customer_id makes the history and assigned-orders lookups index-only.
+-- It also serves the assigned_to foreign key, which makes the single-column key redundant.
+CREATE INDEX assigned_status ON orders (assigned_to, status, customer_id);
+DROP INDEX assigned_to ON orders;
+
+-- /admin/orders filters
+CREATE INDEX status ON orders (status);
+CREATE INDEX created_at ON orders (created_at);
+
+-- /admin/issues filters
+CREATE INDEX status ON issues (status);
+CREATE INDEX user_type_user_id ON issues (user_type, user_id);
+CREATE INDEX created_at ON issues (created_at);
@@ -0,0 +1,14 @@
+-- Revoked JWTs (jti) and revoked users (user_type/user_id: every token issued before revoked_at).
+-- Each worker polls this table by revoked_at to keep its in-memory denylist current (see auth.py).
+-- Rows are purged once expires_at has passed and no token they cover can still be valid.
+CREATE TABLE `token_revocations` (
+  `id` bigint NOT NULL AUTO_INCREMENT,
+  `jti` varchar(64) DEFAULT NULL,
+  `user_type` varchar(32) DEFAULT NULL,
+  `user_id` int DEFAULT NULL,
+  `revoked_at` datetime(3) NOT NULL,
+  `expires_at` datetime(3) NOT NULL,
+  PRIMARY KEY (`id`),
+  KEY `revoked_at` (`revoked_at`),
+  KEY `expires_at` (`expires_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
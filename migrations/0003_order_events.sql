@@ -0,0 +1,33 @@
+-- Order status history and per-status, per-courier counters (see order_status.py).
+-- order_events is append-only: one row per status or courier change, written in the same
+-- transaction as the change. order_status_counts holds the number of orders in each
+-- (status, delivery_person_id) pair, 0 standing for unassigned orders.
+CREATE TABLE `order_events` (
+  `event_id` bigint NOT NULL AUTO_INCREMENT,
+  `order_id` int NOT NULL,
+  `from_status` varchar(50) DEFAULT NULL,
+  `to_status` varchar(50) NOT NULL,
+  `delivery_person_id` int DEFAULT NULL,
+  `actor_type` varchar(32) DEFAULT NULL,
+  `actor_id` int DEFAULT NULL,
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`event_id`),
+  KEY `order_id` (`order_id`),
+  KEY `created_at` (`created_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE `order_status_counts` (
+  `status` varchar(50) NOT NULL,
+  `delivery_person_id` int NOT NULL DEFAULT '0',
+  `order_count` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`status`,`delivery_person_id`),
+  KEY `delivery_person_id` (`delivery_person_id`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- Orders assigned before the state machine kept the Pending status
+UPDATE orders SET status = 'Assigned' WHERE status = 'Pending' AND assigned_to IS NOT NULL;
+
+-- Backfill from the existing orders (one scan, at migration time only)
+INSERT INTO order_status_counts (status, delivery_person_id, order_count)
+SELECT COALESCE(status, 'Pending'), COALESCE(assigned_to, 0), COUNT(*) FROM orders
+GROUP BY COALESCE(status, 'Pending'), COALESCE(assigned_to, 0);
@@ -0,0 +1,43 @@
+-- Delivery analytics rollups (see rollups.py), folded incrementally from order_events.
+-- transitions: orders that entered `status` in the bucket; timed_deliveries / delivery_seconds:
+-- deliveries with a known assignment time and the total seconds from assignment to delivery.
+-- delivery_person_id 0 stands for unassigned orders, as in order_status_counts.
+CREATE TABLE `order_rollups_hourly` (
+  `bucket_start` datetime NOT NULL,
+  `delivery_person_id` int NOT NULL DEFAULT '0',
+  `status` varchar(50) NOT NULL,
+  `transitions` int NOT NULL DEFAULT '0',
+  `timed_deliveries` int NOT NULL DEFAULT '0',
+  `delivery_seconds` bigint NOT NULL DEFAULT '0',
+  PRIMARY KEY (`bucket_start`,`delivery_person_id`,`status`),
+  KEY `delivery_person_id` (`delivery_person_id`,`bucket_start`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+CREATE TABLE `order_rollups_daily` (
+  `bucket_start` date NOT NULL,
+  `delivery_person_id` int NOT NULL DEFAULT '0',
+  `status` varchar(50) NOT NULL,
+  `transitions` int NOT NULL DEFAULT '0',
+  `timed_deliveries` int NOT NULL DEFAULT '0',
+  `delivery_seconds` bigint NOT NULL DEFAULT '0',
+  PRIMARY KEY (`bucket_start`,`delivery_person_id`,`status`),
+  KEY `delivery_person_id` (`delivery_person_id`,`bucket_start`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- Open (not Delivered/Failed) orders per status, snapshotted from order_status_counts on every fold
+CREATE TABLE `order_backlog_hourly` (
+  `bucket_start` datetime NOT NULL,
+  `status` varchar(50) NOT NULL,
+  `open_orders` int NOT NULL DEFAULT '0',
+  PRIMARY KEY (`bucket_start`,`status`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- High-water marks of incremental jobs (the last event_id folded)
+CREATE TABLE `rollup_state` (
+  `name` varchar(64) NOT NULL,
+  `high_water` bigint NOT NULL DEFAULT '0',
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`name`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+INSERT INTO rollup_state (name, high_water) VALUES ('order_events', 0);
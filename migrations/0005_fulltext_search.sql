@@ -0,0 +1,6 @@
+-- Full-text indexes for /admin/search (see search.py). InnoDB updates them as rows are written;
+-- the first FULLTEXT index on a table rebuilds it to add the hidden FTS_DOC_ID column, so apply
+-- this outside peak hours on a large issues table.
+-- After heavy churn, OPTIMIZE TABLE with innodb_optimize_fulltext_only=ON compacts the indexes.
+CREATE FULLTEXT INDEX message_response ON issues (message, response);
+CREATE FULLTEXT INDEX feedback_text ON feedback (feedback);
@@ -0,0 +1,19 @@
+-- Pickup and drop-off addresses given when an order is placed (optional; older orders have neither).
+ALTER TABLE orders ADD COLUMN pickup_address varchar(255) DEFAULT NULL;
+ALTER TABLE orders ADD COLUMN drop_address varchar(255) DEFAULT NULL;
+
+-- Responses of order placements sent with an Idempotency-Key (see idempotency.py).
+-- A row is written in the same transaction as the orders it describes; a retry with the same
+-- key replays it until expires_at. Expired rows are purged by the workers as they go.
+CREATE TABLE `idempotency_keys` (
+  `customer_id` int NOT NULL,
+  `idempotency_key` varchar(255) NOT NULL,
+  `request_hash` char(64) NOT NULL,
+  `status_code` smallint NOT NULL,
+  `response` mediumtext NOT NULL,
+  `created_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  `expires_at` datetime NOT NULL,
+  PRIMARY KEY (`customer_id`,`idempotency_key`),
+  KEY `expires_at` (`expires_at`),
+  CONSTRAINT `idempotency_keys_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`customer_id`) ON DELETE CASCADE
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
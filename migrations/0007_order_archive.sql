@@ -0,0 +1,26 @@
+-- Closed orders older than ARCHIVE_AFTER_DAYS are moved here in batches (see archive.py), so
+-- orders only holds the live working set. A plain table rather than monthly RANGE partitions:
+-- partitioned InnoDB tables cannot have foreign keys, and the archive keeps the customer and
+-- courier ones. courier_history serves delivery history by time range the way pruning would.
+CREATE TABLE `orders_archive` (
+  `order_id` int NOT NULL,
+  `customer_id` int NOT NULL,
+  `assigned_to` int DEFAULT NULL,
+  `status` varchar(50) NOT NULL,
+  `location` varchar(255) DEFAULT NULL,
+  `pickup_address` varchar(255) DEFAULT NULL,
+  `drop_address` varchar(255) DEFAULT NULL,
+  `created_at` timestamp NULL DEFAULT NULL,
+  `updated_at` timestamp NULL DEFAULT NULL,
+  `archived_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP,
+  PRIMARY KEY (`order_id`),
+  KEY `courier_history` (`assigned_to`,`status`,`updated_at`),
+  KEY `customer_id` (`customer_id`),
+  CONSTRAINT `orders_archive_ibfk_1` FOREIGN KEY (`customer_id`) REFERENCES `customers` (`customer_id`) ON DELETE CASCADE,
+  CONSTRAINT `orders_archive_ibfk_2` FOREIGN KEY (`assigned_to`) REFERENCES `delivery_persons` (`delivery_person_id`) ON DELETE SET NULL
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
+
+-- Feedback and location trails outlive the move to the archive: their cascades from orders would
+-- delete them. Deleting a customer still removes both (feedback by customer_id, trails in app.py).
+ALTER TABLE feedback DROP FOREIGN KEY feedback_ibfk_1;
+ALTER TABLE order_locations DROP FOREIGN KEY order_locations_ibfk_1;
@@ -0,0 +1,14 @@
+-- Latest position of each courier, upserted with the location fixes (see nearby.py).
+-- Every worker keeps these in an in-memory grid for nearest-courier queries and polls the
+-- table by updated_at for positions received by the other workers.
+-- No foreign key: a fix from a courier deleted a moment earlier must not fail the whole batch;
+-- deleting a courier removes the row instead.
+CREATE TABLE `courier_positions` (
+  `delivery_person_id` int NOT NULL,
+  `latitude` decimal(9,6) NOT NULL,
+  `longitude` decimal(9,6) NOT NULL,
+  `recorded_at` datetime(3) NOT NULL,
+  `updated_at` datetime(3) NOT NULL,
+  PRIMARY KEY (`delivery_person_id`),
+  KEY `updated_at` (`updated_at`)
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4 COLLATE=utf8mb4_0900_ai_ci;
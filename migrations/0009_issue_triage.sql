@@ -0,0 +1,8 @@
+-- Claim leases for the issue triage queue (see triage.py): the admin holding the issue and until when.
+ALTER TABLE issues ADD COLUMN claimed_by int DEFAULT NULL;
+ALTER TABLE issues ADD COLUMN claim_expires_at datetime DEFAULT NULL;
+
+-- Claims read the open issues of one user_type oldest first and skip live leases from the index.
+-- It also serves the /admin/issues status filter, which makes the single-column key redundant.
+CREATE INDEX triage ON issues (status, user_type, created_at, claim_expires_at);
+DROP INDEX status ON issues;
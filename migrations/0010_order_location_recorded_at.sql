@@ -0,0 +1,3 @@
+-- When orders.location was recorded (UTC). Buffered fixes are flushed some time after they arrive,
+-- and a flush only moves an order's location forward in time (see write_location_batch in app.py).
+ALTER TABLE orders ADD COLUMN location_recorded_at datetime(3) DEFAULT NULL;
@@ -0,0 +1,24 @@
+-- When an order was delivered or failed (UTC), set once by the status change that closes it.
+-- updated_at moves on every later write to the row (a buffered location flush, for one), so
+-- delivery history and the archiver key on closed_at instead (see archive.py).
+ALTER TABLE orders ADD COLUMN closed_at timestamp NULL DEFAULT NULL;
+ALTER TABLE orders_archive ADD COLUMN closed_at timestamp NULL DEFAULT NULL;
+
+-- Backfill from the event that closed each order, or updated_at for orders older than the event
+-- log. Setting updated_at to itself keeps ON UPDATE CURRENT_TIMESTAMP from moving it.
+UPDATE orders SET closed_at = COALESCE(
+    (SELECT MAX(e.created_at) FROM order_events e WHERE e.order_id = orders.order_id AND e.to_status = orders.status),
+    updated_at
+  ), updated_at = updated_at
+WHERE status IN ('Delivered', 'Failed');
+UPDATE orders_archive SET closed_at = COALESCE(
+    (SELECT MAX(e.created_at) FROM order_events e
+     WHERE e.order_id = orders_archive.order_id AND e.to_status = orders_archive.status),
+    updated_at
+  )
+WHERE status IN ('Delivered', 'Failed');
+
+-- The archiver's age check, and delivery history by time range in the archive
+CREATE INDEX closed_at ON orders (closed_at);
+DROP INDEX courier_history ON orders_archive;
+CREATE INDEX courier_history ON orders_archive (assigned_to, status, closed_at);
@@ -0,0 +1,267 @@
+import heapq
+import itertools
+import logging
+import math
+import threading
+import time
+from datetime import datetime, timezone
+
+logger = logging.getLogger(__name__)
+
+# Nearest-courier lookup.
+# The latest position of every courier is kept in courier_positions (written with the location
+# fixes) and, in each worker, in a grid of lat/lon cells held in memory. A position update moves
+# one courier between two cells; a query reads only the cells around the point. Workers pick up
+# positions received by the others by polling courier_positions by updated_at, as auth.py does
+# for revocations. Couriers whose last fix is older than `active_seconds` are left out.
+
+EARTH_RADIUS_KM = 6371.0088
+KM_PER_DEGREE = math.pi * EARTH_RADIUS_KM / 180
+
+
+def haversine_km(lat1, lon1, lat2, lon2):
+    phi1, phi2 = math.radians(lat1), math.radians(lat2)
+    a = (math.sin((phi2 - phi1) / 2) ** 2
+         + math.cos(phi1) * math.cos(phi2) * math.sin(math.radians(lon2 - lon1) / 2) ** 2)
+    return 2 * EARTH_RADIUS_KM * math.asin(min(1.0, math.sqrt(a)))
+
+
+def to_timestamp(value):
+    # DATETIME columns are naive UTC; the SQLite stand-in returns them as text
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value)
+    return value.replace(tzinfo=timezone.utc).timestamp()
+
+
+def utc_datetime(timestamp):
+    return datetime.fromtimestamp(timestamp, timezone.utc).replace(tzinfo=None)
+
+
+def box_distance_km(lat, lon, lat0, lat1, lon0, lon1):
+    # Great-circle distance from a point to the nearest point of a lat/lon box (0 inside it).
+    # Outside the box's longitudes the nearest point is on one of its edge meridians. Along a meridian
+    # the distance grows with the angle from latitude atan2(sin lat, cos lat cos dlon), so the nearest
+    # point is there when the box covers it and otherwise at one of the box's corners.
+    if (lon - lon0) % 360 <= lon1 - lon0:
+        return max(lat0 - lat, lat - lat1, 0.0) * KM_PER_DEGREE
+    phi = math.radians(lat)
+    nearest = math.inf
+    for edge in (lon0, lon1):
+        foot = math.degrees(math.atan2(math.sin(phi), math.cos(phi) * math.cos(math.radians(edge - lon))))
+        for edge_lat in (lat0, lat1, foot) if lat0 <= foot <= lat1 else (lat0, lat1):
+            nearest = min(nearest, haversine_km(lat, lon, edge_lat, edge))
+    return nearest
+
+
+class GridIndex:
+    # A pyramid of lat/lon grids: level 0 has cell_degrees cells and each level above has cells
+    # `scale` times wider, up to the whole globe in a few dozen cells. Every point is held in one
+    # cell per level. Queries are best-first: cells are read nearest first, and a cell holding
+    # more than `leaf_size` points is split into its occupied cells one level down, so a query
+    # reads only the cells around its answer whether the couriers are packed or far apart.
+    def __init__(self, cell_degrees=0.01, scale=4, leaf_size=32):
+        self.cell_sizes = [cell_degrees]
+        while self.cell_sizes[-1] * scale <= 90:
+            self.cell_sizes.append(self.cell_sizes[-1] * scale)
+        self.scale = scale
+        self.leaf_size = leaf_size
+        self.levels = [{} for _ in self.cell_sizes]  # per level: (row, column) -> {key: (lat, lon, stamp)}
+        self.points = {}  # key -> (lat, lon, stamp, cell per level)
+        self.lock = threading.Lock()
+
+    def cells_of(self, lat, lon):
+        # Longitude 180 is -180; cells are aligned across levels (row // scale is the parent row)
+        lon = -180.0 if lon >= 180 else lon
+        return [(math.floor(lat / size), math.floor((lon + 180) / size)) for size in self.cell_sizes]
+
+    def update(self, key, lat, lon, stamp):
+        # Older fixes than the one held are ignored (they may arrive out of order)
+        cells = self.cells_of(lat, lon)
+        with self.lock:
+            current = self.points.get(key)
+            if current is not None:
+                if stamp < current[2]:
+                    return False
+                self.unlink(key, current[3])
+            self.points[key] = (lat, lon, stamp, cells)
+            for level, cell in zip(self.levels, cells):
+                level.setdefault(cell, {})[key] = (lat, lon, stamp)
+        return True
+
+    def unlink(self, key, cells):
+        for level, cell in zip(self.levels, cells):
+            members = level[cell]
+            del members[key]
+            if not members:
+                del level[cell]
+
+    def remove(self, key):
+        with self.lock:
+            current = self.points.pop(key, None)
+            if current is not None:
+                self.unlink(key, current[3])
+
+    def prune(self, before):
+        stale = [key for key, point in list(self.points.items()) if point[2] < before]
+        for key in stale:
+            self.remove(key)
+        return len(stale)
+
+    def cell_distance(self, depth, cell, lat, lon):
+        size = self.cell_sizes[depth]
+        row, column = cell
+        return box_distance_km(lat, lon, row * size, min(90.0, (row + 1) * size),
+                               column * size - 180, min(180.0, (column + 1) * size - 180))
+
+    def search(self, lat, lon, k=None, max_km=None, since=0):
+        # -> (km, key, lat, lon, stamp) nearest first: the k nearest, or all within max_km, or both.
+        # Points and cells share one heap keyed by (lower bound on) distance, so a point comes off
+        # it only when nothing left can be closer.
+        found = []
+        order = itertools.count()
+        with self.lock:
+            top = len(self.levels) - 1
+            heap = [(self.cell_distance(top, cell, lat, lon), 1, next(order), (top, cell)) for cell in self.levels[top]]
+            heapq.heapify(heap)
+            while heap:
+                distance, is_cell, _, item = heapq.heappop(heap)
+                if max_km is not None and distance > max_km:
+                    break
+                if not is_cell:
+                    found.append((distance, *item))
+                    if k is not None and len(found) >= k:
+                        break
+                    continue
+                depth, (row, column) = item
+                members = self.levels[depth][(row, column)]
+                if depth == 0 or len(members) <= self.leaf_size:
+                    for key, (plat, plon, stamp) in members.items():
+                        if stamp >= since:
+                            heapq.heappush(heap, (haversine_km(lat, lon, plat, plon), 0, next(order),
+                                                  (key, plat, plon, stamp)))
+                    continue
+                below = self.levels[depth - 1]
+                for child_row in range(row * self.scale, (row + 1) * self.scale):
+                    for child_column in range(column * self.scale, (column + 1) * self.scale):
+                        child = (child_row, child_column)
+                        if child in below:
+                            heapq.heappush(heap, (self.cell_distance(depth - 1, child, lat, lon), 1, next(order),
+                                                  (depth - 1, child)))
+        return found
+
+    def nearest(self, lat, lon, k, since=0, max_km=None):
+        return self.search(lat, lon, k=k, max_km=max_km, since=since)
+
+    def within(self, lat, lon, km, since=0, limit=None):
+        return self.search(lat, lon, k=limit, max_km=km, since=since)
+
+    def sizes(self):
+        with self.lock:
+            return len(self.points), len(self.levels[0])
+
+
+def latest_positions(fixes):
+    # Newest fix with coordinates per courier -> {courier id: (lat, lon, recorded_at)}
+    latest = {}
+    for fix in fixes:
+        if fix.get('lat') is None or fix.get('delivery_person_id') is None:
+            continue
+        current = latest.get(fix['delivery_person_id'])
+        if current is None or fix['recorded_at'] >= current[2]:
+            latest[fix['delivery_person_id']] = (fix['lat'], fix['lon'], fix['recorded_at'])
+    return latest
+
+
+class CourierPositions:
+    # Positions are re-read for `overlap` seconds so rows committed late are not missed
+    def __init__(self, db, active_seconds=600, sync_interval=1.0, overlap=5.0, cell_degrees=0.01):
+        self.db = db
+        self.active_seconds = active_seconds
+        self.sync_interval = sync_interval
+        self.overlap = overlap
+        self.index = GridIndex(cell_degrees)
+        self.since = None
+        self.sync_lock = threading.Lock()
+        self.lock = threading.Lock()
+        self.counters = {"syncs": 0, "sync_errors": 0, "updates": 0, "queries": 0}
+
+    def start(self):
+        if self.sync_interval:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def run(self):
+        syncs = 0
+        while True:
+            time.sleep(self.sync_interval)
+            try:
+                self.sync()
+                syncs += 1
+                if syncs % 60 == 0:
+                    self.index.prune(time.time() - self.active_seconds)
+            except Exception:
+                logger.exception("Courier position sync failed")
+                self.incr("sync_errors")
+
+    def sync(self):
+        # Incremental: only positions written since the last sync (minus the overlap window)
+        with self.sync_lock:
+            now = time.time()
+            since = now - self.active_seconds if self.since is None else self.since - self.overlap
+            with self.db.cursor() as cursor:
+                cursor.execute(
+                    "SELECT delivery_person_id, latitude, longitude, recorded_at, updated_at FROM courier_positions "
+                    "WHERE updated_at >= %s ORDER BY updated_at",
+                    (utc_datetime(since),)
+                )
+                rows = cursor.fetchall()
+            latest = self.since or since
+            for courier_id, lat, lon, recorded_at, updated_at in rows:
+                self.index.update(courier_id, float(lat), float(lon), to_timestamp(recorded_at))
+                latest = max(latest, to_timestamp(updated_at))
+            self.since = latest
+            self.incr("syncs")
+
+    def record(self, cursor, fixes):
+        # In the transaction that stores the fixes: one upsert that keeps each courier's newest fix
+        latest = sorted(latest_positions(fixes).items())
+        if not latest:
+            return 0
+        updated_at = datetime.utcnow()
+        newer = "VALUES(recorded_at) >= recorded_at"
+        cursor.execute(
+            "INSERT INTO courier_positions (delivery_person_id, latitude, longitude, recorded_at, updated_at) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s)'] * len(latest))} "
+            f"ON DUPLICATE KEY UPDATE latitude = CASE WHEN {newer} THEN VALUES(latitude) ELSE latitude END, "
+            f"longitude = CASE WHEN {newer} THEN VALUES(longitude) ELSE longitude END, "
+            f"updated_at = CASE WHEN {newer} THEN VALUES(updated_at) ELSE updated_at END, "
+            f"recorded_at = CASE WHEN {newer} THEN VALUES(recorded_at) ELSE recorded_at END",
+            [value for courier_id, (lat, lon, recorded_at) in latest
+             for value in (courier_id, lat, lon, recorded_at, updated_at)]
+        )
+        for courier_id, (lat, lon, recorded_at) in latest:
+            self.index.update(courier_id, lat, lon, to_timestamp(recorded_at))
+        self.incr("updates", len(latest))
+        return len(latest)
+
+    def remove(self, courier_id):
+        self.index.remove(courier_id)
+
+    def active_since(self):
+        return time.time() - self.active_seconds
+
+    def nearest(self, lat, lon, k, max_km=None):
+        self.incr("queries")
+        return self.index.nearest(lat, lon, k, self.active_since(), max_km)
+
+    def within(self, lat, lon, km, limit=None):
+        self.incr("queries")
+        return self.index.within(lat, lon, km, self.active_since(), limit)
+
+    def stats(self):
+        couriers, cells = self.index.sizes()
+        with self.lock:
+            return {**self.counters, "couriers": couriers, "cells": cells}
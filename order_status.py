@@ -0,0 +1,127 @@
+from collections import Counter
+from datetime import datetime
+
+# Order status state machine.
+# Every change to an order's status or courier is appended to order_events and applied to
+# order_status_counts (orders per status and courier) in the same transaction, so dashboards
+# and load checks read a few counter rows instead of grouping the orders table.
+# Helpers return (sql, params) statements so the sync (db.py) and async (aiodb.py) paths share them.
+
+PENDING = 'Pending'
+ASSIGNED = 'Assigned'
+PICKED_UP = 'Picked Up'
+IN_TRANSIT = 'In Transit'
+DELIVERED = 'Delivered'
+FAILED = 'Failed'
+
+STATUSES = (PENDING, ASSIGNED, PICKED_UP, IN_TRANSIT, DELIVERED, FAILED)
+TRANSITIONS = {
+    PENDING: (ASSIGNED,),
+    ASSIGNED: (PICKED_UP, FAILED),
+    PICKED_UP: (IN_TRANSIT, FAILED),
+    IN_TRANSIT: (DELIVERED, FAILED),
+    DELIVERED: (),
+    FAILED: (),
+}
+# Orders in these statuses no longer count towards a courier's open load
+CLOSED_STATUSES = (DELIVERED, FAILED)
+# Statuses a delivery person may set through /delivery/update-status
+COURIER_STATUSES = (PICKED_UP, IN_TRANSIT, DELIVERED, FAILED)
+
+# order_status_counts key for orders with no courier
+UNASSIGNED = 0
+
+
+class InvalidTransition(ValueError):
+    pass
+
+
+def check_transition(current, new, allowed=STATUSES):
+    if new not in allowed:
+        raise InvalidTransition(f"Invalid status '{new}'; expected one of: {', '.join(allowed)}")
+    # Rows written before the state machine may hold free-text statuses; they may move to any status once
+    if current in TRANSITIONS and new not in TRANSITIONS[current]:
+        raise InvalidTransition(f"Cannot change status from '{current}' to '{new}'")
+
+
+def assigned_status(current):
+    # Status after an admin assigns (or reassigns) a courier
+    if current in CLOSED_STATUSES:
+        raise InvalidTransition(f"Cannot assign an order that is {current}")
+    return ASSIGNED if current == PENDING else current
+
+
+def closed_at(status):
+    # orders.closed_at for an order moving to `status`: when it was delivered or failed. Unlike
+    # updated_at no later write moves it, so delivery history and the archiver key on it.
+    return datetime.utcnow() if status in CLOSED_STATUSES else None
+
+
+def change_statements(changes, actor_type=None, actor_id=None):
+    # changes: [(order_id, old status, new status, old courier, new courier)]
+    # old status None: a new order. new status None: the order was deleted (counted, not logged).
+    events, deltas = [], Counter()
+    for order_id, old_status, new_status, old_courier, new_courier in changes:
+        if old_status == new_status and old_courier == new_courier:
+            continue
+        if old_status is not None:
+            deltas[(old_status, old_courier or UNASSIGNED)] -= 1
+        if new_status is not None:
+            deltas[(new_status, new_courier or UNASSIGNED)] += 1
+            events.append((order_id, old_status, new_status, new_courier, actor_type, actor_id))
+
+    statements = []
+    # Counter rows in a fixed order so concurrent transitions cannot deadlock on them
+    counts = sorted((key, delta) for key, delta in deltas.items() if delta)
+    if counts:
+        statements.append((
+            "INSERT INTO order_status_counts (status, delivery_person_id, order_count) "
+            f"VALUES {', '.join(['(%s, %s, %s)'] * len(counts))} "
+            "ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count)",
+            [value for (status, courier), delta in counts for value in (status, courier, delta)]
+        ))
+    # Events last: the counter upsert can wait on a hot row lock, and an event_id taken before
+    # that wait would commit well after later ids (see OrderRollups.fold)
+    if events:
+        statements.append((
+            "INSERT INTO order_events (order_id, from_status, to_status, delivery_person_id, actor_type, actor_id) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(events))}",
+            [value for event in events for value in event]
+        ))
+    return statements
+
+
+def record_changes(cursor, changes, actor_type=None, actor_id=None):
+    for sql, params in change_statements(changes, actor_type, actor_id):
+        cursor.execute(sql, params)
+
+
+def rebuild_counts(cursor):
+    # Recomputes order_status_counts from orders and the archive (one full scan of each);
+    # for backfills and bulk loads
+    cursor.execute("DELETE FROM order_status_counts")  # advisor: full-scan-ok (rebuild)
+    cursor.execute(
+        "INSERT INTO order_status_counts (status, delivery_person_id, order_count) "
+        f"SELECT COALESCE(status, '{PENDING}'), COALESCE(assigned_to, {UNASSIGNED}), COUNT(*) FROM "
+        "(SELECT status, assigned_to FROM orders UNION ALL SELECT status, assigned_to FROM orders_archive) AS o "
+        f"GROUP BY COALESCE(status, '{PENDING}'), COALESCE(assigned_to, {UNASSIGNED})"
+    )
+
+
+def summarize(rows):
+    # rows: (status, courier, count) -> totals by status and per courier
+    by_status, by_courier, unassigned = Counter(), {}, Counter()
+    for status, courier, count in rows:
+        if not count:
+            continue
+        by_status[status] += count
+        if courier == UNASSIGNED:
+            unassigned[status] += count
+        else:
+            by_courier.setdefault(courier, Counter())[status] += count
+    return {
+        "total": sum(by_status.values()),
+        "by_status": dict(by_status),
+        "unassigned": dict(unassigned),
+        "by_delivery_person": {str(courier): dict(counts) for courier, counts in sorted(by_courier.items())},
+    }
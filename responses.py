@@ -0,0 +1,112 @@
+import gzip
+import hashlib
+
+from flask import request
+from flask.json.provider import DefaultJSONProvider
+from werkzeug.http import parse_accept_header
+
+try:
+    import orjson
+except ImportError:  # optional: the stdlib encoder is used instead
+    orjson = None
+
+try:
+    import brotli
+except ImportError:  # optional: gzip only
+    brotli = None
+
+# Response encoding for the JSON API.
+# - FastJSONProvider: orjson when installed, with the same output as Flask's default provider
+#   for dates, Decimals and UUIDs (they still go through DefaultJSONProvider.default).
+# - rows_payload(): row tuples as objects, or columnar {"fields": [...], "rows": [[...]]}
+#   (?shape=columns) which is encoded straight from the tuples without a dict per row.
+# - etag()/body_etag(): strong validators for listing responses; the routes answer
+#   If-None-Match with 304 (see listing_response in app.py).
+# - Compression: gzip (or br when the brotli package is installed) for larger responses.
+#   A compressed response's ETag is marked weak, as its bytes differ from the identity
+#   encoding; If-None-Match uses the weak comparison, so revalidation still yields 304.
+
+COMPRESSIBLE_TYPES = ('application/json', 'text/', 'application/javascript', 'image/svg+xml')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs.get('cls') is not None:
+            return super().dumps(obj, **kwargs)
+        option = orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS | orjson.OPT_NON_STR_KEYS
+        if kwargs.get('sort_keys', self.sort_keys):
+            option |= orjson.OPT_SORT_KEYS
+        if kwargs.get('indent'):
+            option |= orjson.OPT_INDENT_2
+        try:
+            return orjson.dumps(obj, default=kwargs.get('default', self.default), option=option).decode('utf-8')
+        except TypeError:
+            # e.g. integers beyond 64 bits
+            return super().dumps(obj, **kwargs)
+
+
+def wants_columns(args):
+    return args.get('shape') == 'columns'
+
+
+def rows_payload(fields, rows, columnar=False):
+    if columnar:
+        return {"fields": fields, "rows": rows}
+    return [dict(zip(fields, row)) for row in rows]
+
+
+def etag(*parts):
+    # Strong validator from the values that identify a representation (URL, user, row versions)
+    return hashlib.sha1('\x1f'.join(str(part) for part in parts).encode('utf-8')).hexdigest()
+
+
+def body_etag(body):
+    return 'b' + hashlib.sha1(body).hexdigest()
+
+
+def choose_encoding(accept_encoding):
+    accepted = parse_accept_header(accept_encoding or '')
+    if brotli is not None and accepted['br']:
+        return 'br'
+    if accepted['gzip']:
+        return 'gzip'
+    return None
+
+
+def compress(body, encoding, level=6):
+    if encoding == 'br':
+        return brotli.compress(body, quality=min(level, 11))
+    return gzip.compress(body, compresslevel=level)
+
+
+def compressible(content_type):
+    return (content_type or '').startswith(COMPRESSIBLE_TYPES)
+
+
+class Compression:
+    def __init__(self, app=None):
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        app.config.setdefault('COMPRESS_MIN_SIZE', 1024)
+        app.config.setdefault('COMPRESS_LEVEL', 6)
+        self.app = app
+        app.after_request(self.compress_response)
+
+    def compress_response(self, response):
+        config = self.app.config
+        # Streams (NDJSON, SSE, exports) are sent as they are produced and left alone
+        if (response.direct_passthrough or response.is_streamed or response.status_code != 200
+                or 'Content-Encoding' in response.headers or not compressible(response.mimetype)):
+            return response
+        response.vary.add('Accept-Encoding')
+        encoding = choose_encoding(request.headers.get('Accept-Encoding'))
+        if encoding is None or response.content_length is None or response.content_length < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(response.get_data(), encoding, config['COMPRESS_LEVEL']))
+        response.headers['Content-Encoding'] = encoding
+        tag, weak = response.get_etag()
+        if tag and not weak:
+            response.set_etag(tag, weak=True)
+        return response
@@ -0,0 +1,263 @@
+import argparse
+import logging
+import sys
+import threading
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+
+from archive import ORDER_TABLES
+from order_status import ASSIGNED, CLOSED_STATUSES, DELIVERED, PENDING, UNASSIGNED
+
+logger = logging.getLogger(__name__)
+
+# Delivery analytics rollups.
+# order_events is folded into hourly and daily aggregates per (courier, status): how many orders
+# entered the status, and for deliveries the time since the order was assigned. The fold is
+# incremental: rollup_state keeps the last event_id folded, and the aggregates and the new
+# high-water mark are written in one transaction, so every event is counted exactly once.
+# A transaction can commit after one that took a later event_id, so the fold stops at a recent
+# gap in event_id and picks the late event up next time (gaps older than gap_seconds are rollbacks).
+# The state row is locked while folding, so any number of workers can run the thread.
+# Each fold also snapshots order_status_counts into order_backlog_hourly (open orders by hour).
+# Analytics endpoints read only these tables, never orders.
+#
+#   python rollups.py backfill   # rebuild from order_events plus orders older than the event log
+#   python rollups.py fold       # fold new events now
+#   python rollups.py status
+
+STATE_KEY = 'order_events'
+ROLLUP_TABLES = {'hour': 'order_rollups_hourly', 'day': 'order_rollups_daily'}
+
+
+def to_datetime(value):
+    # DATETIME columns come back as datetime from MySQL and as text from the SQLite stand-in
+    return value if isinstance(value, datetime) else datetime.fromisoformat(str(value))
+
+
+def hour_of(value):
+    return to_datetime(value).replace(minute=0, second=0, microsecond=0)
+
+
+def day_of(value):
+    return to_datetime(value).date()
+
+
+def fold_rows(rows):
+    # rows: (status, courier, when, delivery seconds or None) -> {granularity: {(bucket, courier, status): [3 sums]}}
+    buckets = {'hour': defaultdict(lambda: [0, 0, 0]), 'day': defaultdict(lambda: [0, 0, 0])}
+    for status, courier, when, seconds in rows:
+        for granularity, bucket in (('hour', hour_of(when)), ('day', day_of(when))):
+            sums = buckets[granularity][(bucket, courier or UNASSIGNED, status)]
+            sums[0] += 1
+            if seconds is not None:
+                sums[1] += 1
+                sums[2] += int(seconds)
+    return buckets
+
+
+def upsert_rollups(cursor, buckets):
+    for granularity, rows in buckets.items():
+        if not rows:
+            continue
+        items = sorted(rows.items())
+        cursor.execute(
+            f"INSERT INTO {ROLLUP_TABLES[granularity]} "
+            "(bucket_start, delivery_person_id, status, transitions, timed_deliveries, delivery_seconds) "
+            f"VALUES {', '.join(['(%s, %s, %s, %s, %s, %s)'] * len(items))} "
+            "ON DUPLICATE KEY UPDATE transitions = transitions + VALUES(transitions), "
+            "timed_deliveries = timed_deliveries + VALUES(timed_deliveries), "
+            "delivery_seconds = delivery_seconds + VALUES(delivery_seconds)",
+            [value for key, sums in items for value in (*key, *sums)]
+        )
+
+
+class OrderRollups:
+    # interval 0: start() runs no background thread (fold from the CLI or a scheduler instead).
+    # Events younger than `settle` seconds are left for the next fold, and so is everything from
+    # a missing event_id on while the event after it is younger than `gap_seconds`: the missing id
+    # belongs to a transaction still open, and folding past it would skip it for good.
+    def __init__(self, db, interval=60.0, batch_size=5000, settle=5.0, gap_seconds=300.0):
+        self.db = db
+        self.interval = interval
+        self.batch_size = batch_size
+        self.settle = settle
+        self.gap_seconds = gap_seconds
+        self.lock = threading.Lock()
+        self.counters = {"folds": 0, "events": 0, "errors": 0, "gap_waits": 0}
+
+    def start(self):
+        if self.interval:
+            threading.Thread(target=self.run, daemon=True).start()
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.fold_all()
+            except Exception:
+                logger.exception("Rollup fold failed")
+                self.incr("errors")
+
+    def fold_all(self):
+        total = 0
+        while True:
+            folded = self.fold()
+            total += folded
+            if folded < self.batch_size:
+                return total
+
+    def fold(self):
+        # One batch of events in one transaction; returns the number folded
+        with self.db.transaction() as cursor:
+            cursor.execute("SELECT high_water FROM rollup_state WHERE name = %s FOR UPDATE", (STATE_KEY,))
+            high_water = cursor.fetchone()[0]
+            cursor.execute(
+                "SELECT event_id, order_id, to_status, delivery_person_id, created_at FROM order_events "
+                "WHERE event_id > %s AND created_at < %s ORDER BY event_id LIMIT %s",
+                (high_water, datetime.utcnow() - timedelta(seconds=self.settle), self.batch_size)
+            )
+            events = self.contiguous(cursor.fetchall(), high_water)
+            if events:
+                assigned_at = self.assignment_times(cursor, [e[1] for e in events if e[2] == DELIVERED])
+                rows = []
+                for event_id, order_id, status, courier, created_at in events:
+                    seconds = None
+                    if status == DELIVERED and order_id in assigned_at:
+                        seconds = max((to_datetime(created_at) - assigned_at[order_id]).total_seconds(), 0)
+                    rows.append((status, courier, created_at, seconds))
+                upsert_rollups(cursor, fold_rows(rows))
+                cursor.execute("UPDATE rollup_state SET high_water = %s WHERE name = %s", (events[-1][0], STATE_KEY))
+            self.snapshot_backlog(cursor)
+        self.incr("folds")
+        self.incr("events", len(events))
+        return len(events)
+
+    def contiguous(self, events, high_water):
+        # Events up to the first gap in event_id whose next event is recent; an older gap is a
+        # transaction that rolled back (or events removed by hand), so it is folded past
+        cutoff = datetime.utcnow() - timedelta(seconds=self.gap_seconds)
+        previous = high_water
+        for i, event in enumerate(events):
+            if event[0] != previous + 1 and to_datetime(event[4]) > cutoff:
+                self.incr("gap_waits")
+                return events[:i]
+            previous = event[0]
+        return events
+
+    def assignment_times(self, cursor, order_ids):
+        # Last assignment of each delivered order
+        if not order_ids:
+            return {}
+        order_ids = sorted(set(order_ids))
+        cursor.execute(
+            f"SELECT order_id, MAX(created_at) FROM order_events WHERE order_id IN ({', '.join(['%s'] * len(order_ids))}) "
+            "AND to_status = %s GROUP BY order_id",
+            order_ids + [ASSIGNED]
+        )
+        return {order_id: to_datetime(at) for order_id, at in cursor.fetchall() if at is not None}
+
+    def snapshot_backlog(self, cursor):
+        # Open orders per status for the current hour; the last snapshot in an hour wins
+        cursor.execute(
+            "SELECT status, SUM(order_count) FROM order_status_counts "
+            f"WHERE status NOT IN ({', '.join(['%s'] * len(CLOSED_STATUSES))}) GROUP BY status",
+            CLOSED_STATUSES
+        )  # advisor: full-scan-ok (one row per status and courier)
+        counts = sorted((status, int(count)) for status, count in cursor.fetchall())
+        if counts:
+            bucket = hour_of(datetime.utcnow())
+            cursor.execute(
+                "INSERT INTO order_backlog_hourly (bucket_start, status, open_orders) "
+                f"VALUES {', '.join(['(%s, %s, %s)'] * len(counts))} "
+                "ON DUPLICATE KEY UPDATE open_orders = VALUES(open_orders)",
+                [value for status, count in counts for value in (bucket, status, count)]
+            )
+
+    def backfill(self, chunk_size=5000, log=print):
+        # Rebuilds the hourly/daily rollups from scratch. Orders older than the event log
+        # contribute their creation and, if they moved on, their current status at updated_at
+        # (the steps in between and the delivery time are not known for them).
+        with self.db.transaction() as cursor:
+            cursor.execute("SELECT high_water FROM rollup_state WHERE name = %s FOR UPDATE", (STATE_KEY,))
+            for table in ROLLUP_TABLES.values():
+                cursor.execute(f"DELETE FROM {table}")
+            cursor.execute("UPDATE rollup_state SET high_water = 0 WHERE name = %s", (STATE_KEY,))
+
+        legacy = 0
+        # Archived orders count too; an order the archiver moves during the backfill can be missed
+        # or counted twice, so run it with ARCHIVE_INTERVAL=0 or between archive runs
+        for table in ORDER_TABLES:
+            last_id = 0
+            while True:
+                # Keyset chunks on the primary key keep each read short
+                with self.db.transaction() as cursor:
+                    cursor.execute(
+                        f"SELECT o.order_id, o.assigned_to, o.status, o.created_at, o.updated_at FROM {table} o "
+                        "WHERE o.order_id > %s AND NOT EXISTS (SELECT 1 FROM order_events e WHERE e.order_id = o.order_id) "
+                        "ORDER BY o.order_id LIMIT %s",
+                        (last_id, chunk_size)
+                    )
+                    orders = cursor.fetchall()
+                    if not orders:
+                        break
+                    rows = []
+                    for order_id, courier, status, created_at, updated_at in orders:
+                        rows.append((PENDING, None, created_at, None))
+                        if status and status != PENDING:
+                            rows.append((status, courier, updated_at or created_at, None))
+                    upsert_rollups(cursor, fold_rows(rows))
+                last_id = orders[-1][0]
+                legacy += len(orders)
+                log(f"Folded {legacy} orders without events")
+        events = self.fold_all()
+        log(f"Folded {events} events")
+        return legacy, events
+
+    def status(self):
+        with self.db.cursor() as cursor:
+            cursor.execute("SELECT high_water, updated_at FROM rollup_state WHERE name = %s", (STATE_KEY,))
+            high_water, updated_at = cursor.fetchone()
+            cursor.execute("SELECT COUNT(*) FROM order_events WHERE event_id > %s", (high_water,))
+            behind = cursor.fetchone()[0]
+        return {"high_water": high_water, "updated_at": updated_at, "events_behind": behind}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Delivery analytics rollups for the courier service")
+    commands = parser.add_subparsers(dest='command', required=True)
+    backfill = commands.add_parser('backfill', help="rebuild the rollups from order_events and older orders")
+    backfill.add_argument('--chunk-size', type=int, default=5000)
+    commands.add_parser('fold', help="fold events recorded since the last run")
+    commands.add_parser('status', help="show the high-water mark and how far behind it is")
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    # Reuse the service's configuration and connection pool
+    import app as service
+
+    config = service.app1.config
+    rollups = OrderRollups(service.db, interval=0, batch_size=config['ROLLUP_BATCH_SIZE'],
+                           settle=config['ROLLUP_SETTLE_SECONDS'], gap_seconds=config['ROLLUP_GAP_SECONDS'])
+    if args.command == 'backfill':
+        rollups.backfill(chunk_size=args.chunk_size)
+    elif args.command == 'fold':
+        print(f"Folded {rollups.fold_all()} events")
+    else:
+        for key, value in rollups.status().items():
+            print(f"{key}: {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
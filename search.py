@@ -0,0 +1,119 @@
+import re
+
+# Full-text search over issues (message, response) and feedback (feedback).
+# The FULLTEXT indexes from migrations/0005_fulltext_search.sql are maintained by InnoDB as rows
+# are written, so a new issue, response or feedback is searchable as soon as it commits.
+# User queries are words (all required), "exact phrases", -excluded words and prefix* words;
+# they are rendered as a boolean-mode query and results are ranked by MATCH() relevance.
+
+# Words shorter than innodb_ft_min_token_size are not indexed, so they cannot be required
+MIN_WORD_LENGTH = 3
+
+TOKEN_RE = re.compile(r'([+-]?)"([^"]*)"?|([+-]?)([^\s"]+)')
+WORD_RE = re.compile(r"\w+")
+
+SEARCH_TARGETS = {
+    'issues': {
+        'table': 'issues',
+        'key': 'issue_id',
+        'columns': ('message', 'response'),
+        'fields': ["issue_id", "user_type", "user_id", "message", "status", "response", "created_at"],
+        # (query arg, column, operator, converter) as for build_listing_query in app.py
+        'filters': [
+            ('status', 'status', '=', str),
+            ('user_type', 'user_type', '=', str),
+            ('user_id', 'user_id', '=', int),
+        ],
+    },
+    'feedback': {
+        'table': 'feedback',
+        'key': 'feedback_id',
+        'columns': ('feedback',),
+        'fields': ["feedback_id", "order_id", "customer_id", "feedback", "created_at"],
+        'filters': [
+            ('order_id', 'order_id', '=', int),
+            ('customer_id', 'customer_id', '=', int),
+        ],
+    },
+}
+
+
+def words_of(text):
+    return WORD_RE.findall((text or '').lower())
+
+
+class SearchQuery:
+    # clauses: (excluded, words, phrase, prefix)
+    def __init__(self, clauses):
+        self.clauses = clauses
+
+    @classmethod
+    def parse(cls, text, min_length=MIN_WORD_LENGTH):
+        clauses = []
+        for quoted_sign, phrase, sign, token in TOKEN_RE.findall(text or ''):
+            if phrase or quoted_sign:
+                words = tuple(words_of(phrase))
+                if any(len(word) >= min_length for word in words):
+                    clauses.append((quoted_sign == '-', words, True, False))
+                continue
+            prefix = token.endswith('*')
+            words = words_of(token)
+            for i, word in enumerate(words):
+                if len(word) >= min_length:
+                    clauses.append((sign == '-', (word,), False, prefix and i == len(words) - 1))
+        return cls(clauses)
+
+    def __bool__(self):
+        # Only exclusions would match every row
+        return any(not excluded for excluded, _, _, _ in self.clauses)
+
+    def boolean(self):
+        # e.g. +late +"wrong address" -refund +deliv*
+        parts = []
+        for excluded, words, phrase, prefix in self.clauses:
+            term = f'"{" ".join(words)}"' if phrase else words[0] + ('*' if prefix else '')
+            parts.append(('-' if excluded else '+') + term)
+        return ' '.join(parts)
+
+    def score(self, *texts):
+        # Relevance without a FULLTEXT index (the SQLite stand-in): occurrences of the required
+        # clauses, 0 when one is missing or an excluded one is present
+        words = words_of(' '.join(text or '' for text in texts))
+        joined = f" {' '.join(words)} "
+        score = 0
+        for excluded, clause_words, phrase, prefix in self.clauses:
+            if phrase:
+                hits = joined.count(f" {' '.join(clause_words)} ")
+            elif prefix:
+                hits = sum(1 for word in words if word.startswith(clause_words[0]))
+            else:
+                hits = words.count(clause_words[0])
+            if excluded and hits:
+                return 0
+            if not excluded:
+                if not hits:
+                    return 0
+                score += hits
+        return float(score)
+
+
+def build_search_query(target, query, args, created_from=None, created_to=None):
+    # -> (sql, params) for the matches of `query` in one target, best first; raises ValueError on bad filters
+    spec = SEARCH_TARGETS[target]
+    match = f"MATCH ({', '.join(spec['columns'])}) AGAINST (%s IN BOOLEAN MODE)"
+    clauses, params = [match], [query.boolean()]
+    for arg, column, op, convert in spec['filters']:
+        value = args.get(arg)
+        if value is None or value == '':
+            continue
+        clauses.append(f"{column} {op} %s")
+        params.append(convert(value))
+    if created_from is not None:
+        clauses.append("created_at >= %s")
+        params.append(created_from)
+    if created_to is not None:
+        clauses.append("created_at < %s")
+        params.append(created_to)
+    sql = (f"SELECT {', '.join(spec['fields'])}, {match} AS score FROM {spec['table']} "
+           f"WHERE {' AND '.join(clauses)} ORDER BY score DESC, {spec['key']} DESC")
+    return sql, [query.boolean()] + params
@@ -0,0 +1,94 @@
+import logging
+import os
+import sys
+
+try:
+    from gunicorn.app.base import BaseApplication
+    from gunicorn.util import import_app
+except ImportError:  # optional: without it each uvicorn worker imports the app on its own
+    BaseApplication = None
+
+# Production launcher.
+#   WEB_CONCURRENCY=4 python serve.py         # ASGI serving mode (asgi.py)
+#   WEB_CONCURRENCY=4 python serve.py wsgi    # the Flask app on threaded workers
+# With gunicorn installed, a master process imports the app once (preload) and forks the workers
+# from it, so a new worker skips the import. Each worker then starts its threads and warms up
+# (startup.py) before it accepts connections: in the ASGI lifespan, or in post_worker_init.
+# Each worker is a separate process with its own database pool (DB_POOL_SIZE), bcrypt process
+# pool and in-memory caches.
+
+log = logging.getLogger('serve')
+
+TARGETS = {
+    'asgi': ('asgi:application', 'uvicorn.workers.UvicornWorker'),
+    'wsgi': ('app:app1', 'gthread'),
+}
+
+
+def warm_worker(worker):
+    # gunicorn hook: runs in the worker before it accepts connections
+    if worker.cfg.worker_class_str != TARGETS['asgi'][1]:
+        import app as service
+        service.create_app()
+
+
+if BaseApplication is not None:
+    class PreloadingServer(BaseApplication):
+        def __init__(self, target, options):
+            self.target = target
+            self.options = options
+            super().__init__()
+
+        def load_config(self):
+            for key, value in self.options.items():
+                self.cfg.set(key, value)
+
+        def load(self):
+            # With preload_app this runs once, in the master
+            return import_app(self.target)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    mode = argv[0] if argv else 'asgi'
+    if mode not in TARGETS:
+        raise SystemExit(f"usage: python serve.py [{'|'.join(TARGETS)}]")
+    host = os.getenv('HOST', '0.0.0.0')
+    port = int(os.getenv('PORT', '5000'))
+    workers = int(os.getenv('WEB_CONCURRENCY', '1'))
+
+    # Split the CPUs between the workers' bcrypt pools instead of starting one per CPU in every worker
+    if not os.getenv('HASH_WORKERS'):
+        os.environ['HASH_WORKERS'] = str(max(1, (os.cpu_count() or 2) // workers))
+
+    if workers > 1:
+        for name in ('CACHE_URL', 'EVENT_BROKER_URL'):
+            if os.getenv(name, 'local') == 'local':
+                log.warning("%s is 'local' with %d workers: each worker keeps its own copy", name, workers)
+
+    target, worker_class = TARGETS[mode]
+    if BaseApplication is None:
+        if mode != 'asgi':
+            raise SystemExit("python serve.py wsgi needs gunicorn (pip install gunicorn)")
+        log.warning("gunicorn is not installed: every worker imports the app itself")
+        import uvicorn
+        uvicorn.run(target, host=host, port=port, workers=workers, lifespan='on',
+                    log_level=os.getenv('LOG_LEVEL', 'info'))
+        return
+
+    PreloadingServer(target, {
+        'bind': f"{host}:{port}",
+        'workers': workers,
+        'worker_class': worker_class,
+        'threads': int(os.getenv('WSGI_THREADS', '32')),  # per worker, wsgi mode only
+        'preload_app': True,
+        # A worker that has not warmed up within this many seconds is restarted
+        'timeout': int(os.getenv('WORKER_TIMEOUT', '60')),
+        'post_worker_init': warm_worker,
+        'loglevel': os.getenv('LOG_LEVEL', 'info'),
+    }).run()
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    main()
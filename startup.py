@@ -0,0 +1,131 @@
+import argparse
+import json
+import logging
+import os
+import statistics
+import subprocess
+import sys
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+# Process start-up for the service.
+# Importing app.py builds the app and its components but starts nothing: no threads, database
+# connections or process pools. A server can import it once in a master process and fork the
+# workers from there (see serve.py), so each worker skips the import. Every process that serves
+# requests then runs Startup.start(): the components' background threads first, then the warm-up
+# steps (database connections, hot statements, caches, the bcrypt pool), and only then does it
+# report ready on /ready. How long the import and each step took is kept for /ready and /metrics.
+#
+#   python startup.py measure --runs 5   # cold import and warm-up times of fresh processes
+
+
+class Startup:
+    def __init__(self):
+        self.services = []
+        self.steps = []
+        self.lock = threading.Lock()
+        self.pid = None
+        self.ready = False
+        self.import_seconds = None
+        self.warm_up_seconds = None
+        self.timings = {}
+        self.errors = {}
+
+    def service(self, component):
+        # component.start() runs once in every serving process
+        self.services.append(component)
+        return component
+
+    def step(self, name):
+        # Decorator for a warm-up step; a step that fails is logged and the worker still starts
+        def register(fn):
+            self.steps.append((name, fn))
+            return fn
+        return register
+
+    def imported(self, seconds):
+        self.import_seconds = seconds
+
+    def started(self):
+        # False in a freshly forked child as well: threads do not survive the fork
+        return self.pid == os.getpid()
+
+    def start(self, warm=True, skip=()):
+        with self.lock:
+            if self.started():
+                return
+            self.pid = os.getpid()
+            self.ready = False
+            self.timings, self.errors = {}, {}
+            began = time.perf_counter()
+            for component in self.services:
+                component.start()
+            if warm:
+                for name, fn in self.steps:
+                    if name in skip:
+                        continue
+                    step_began = time.perf_counter()
+                    try:
+                        fn()
+                    except Exception as e:
+                        logger.exception("Warm-up step %s failed", name)
+                        self.errors[name] = str(e)
+                    self.timings[name] = round(time.perf_counter() - step_began, 4)
+            self.warm_up_seconds = time.perf_counter() - began
+            self.ready = True
+        logger.info("Worker %d ready: import %.3fs, warm-up %.3fs %s", self.pid, self.import_seconds or 0,
+                    self.warm_up_seconds, self.timings)
+
+    def status(self):
+        return {
+            "ready": self.ready,
+            "pid": self.pid,
+            "import_seconds": round(self.import_seconds, 4) if self.import_seconds is not None else None,
+            "warm_up_seconds": round(self.warm_up_seconds, 4) if self.warm_up_seconds is not None else None,
+            "steps": dict(self.timings),
+            "errors": dict(self.errors),
+        }
+
+
+# Runs in a fresh interpreter per measurement, so nothing is imported yet
+MEASURE_SCRIPT = (
+    "import json, time; began = time.perf_counter(); import app; app.create_app(); "
+    "print(json.dumps({**app.startup.status(), 'total_seconds': time.perf_counter() - began}))"
+)
+
+
+def measure(runs=5, log=print):
+    # Cold start of `runs` new processes -> {measure: [seconds per run]}
+    samples = {}
+    for run in range(runs):
+        result = subprocess.run([sys.executable, '-c', MEASURE_SCRIPT], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                capture_output=True, text=True, check=True)
+        status = json.loads(result.stdout.strip().splitlines()[-1])
+        log(f"Run {run + 1}: import {status['import_seconds']:.3f}s, warm-up {status['warm_up_seconds']:.3f}s, "
+            f"total {status['total_seconds']:.3f}s {status['steps']}")
+        for name, seconds in [('import', status['import_seconds']), ('warm_up', status['warm_up_seconds']),
+                              ('total', status['total_seconds'])] + list(status['steps'].items()):
+            samples.setdefault(name, []).append(seconds)
+    return samples
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Start-up timing for the courier service")
+    commands = parser.add_subparsers(dest='command', required=True)
+    measured = commands.add_parser('measure', help="time the import and warm-up of fresh processes")
+    measured.add_argument('--runs', type=int, default=5)
+    return parser.parse_args(argv)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    samples = measure(args.runs)
+    for name, values in samples.items():
+        print(f"{name}: median {statistics.median(values):.3f}s, max {max(values):.3f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
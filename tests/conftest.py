@@ -0,0 +1,48 @@
+import os
+import sys
+from contextlib import contextmanager
+
+import pytest
+
+# The service's modules sit at the top of the repository rather than in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+class SQLiteDB:
+    # db.Database's cursor()/transaction() over the benchmark's SQLite stand-in, without MySQLdb
+    def __init__(self, path):
+        from benchmarks import sqlite_backend
+        self.conn = sqlite_backend.Connection(path)
+
+    @contextmanager
+    def cursor(self, cursorclass=None):
+        cursor = self.conn.cursor()
+        try:
+            yield cursor
+        finally:
+            cursor.close()
+
+    @contextmanager
+    def transaction(self):
+        with self.cursor() as cursor:
+            cursor.execute("START TRANSACTION")
+            try:
+                yield cursor
+            except BaseException:
+                self.conn.rollback()
+                raise
+            self.conn.commit()
+
+
+@pytest.fixture
+def db(tmp_path):
+    # A fresh database: the schema from the dump plus every migration
+    from benchmarks import sqlite_backend
+    from migrate import migrate
+
+    path = str(tmp_path / 'courier.sqlite3')
+    sqlite_backend.create_schema(path)
+    database = SQLiteDB(path)
+    migrate(database.conn, log=lambda message: None)
+    yield database
+    database.conn.close()
@@ -0,0 +1,147 @@
+import threading
+
+import pytest
+
+import admission
+from admission import (AdmissionControl, LocalBuckets, RateLimit, SQLiteBuckets, create_bucket_store, parse_limits,
+                       refill, retry_after)
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def monotonic(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(admission, 'time', clock)
+    return clock
+
+
+@pytest.fixture(params=['local', 'sqlite'])
+def store(request, tmp_path, clock):
+    if request.param == 'local':
+        return LocalBuckets()
+    return SQLiteBuckets(str(tmp_path / 'ratelimits.db'))
+
+
+def test_parse_limits():
+    limits = parse_limits(" /login=ip:10/60s ; default=identity:50/1s:100, role:2.5/0.5s ;")
+    assert limits == {
+        '/login': (RateLimit('ip', 10 / 60, 10),),
+        'default': (RateLimit('identity', 50.0, 100), RateLimit('role', 5.0, 3)),
+    }
+    assert parse_limits('') == {} and parse_limits(None) == {}
+    # Rules of Flask routes contain no '=', but the last one separates the route
+    assert list(parse_limits('/customer/track-order/<int:order_id>=identity:5/1s')) == ['/customer/track-order/<int:order_id>']
+
+
+@pytest.mark.parametrize('spec, error', [('ip:10/60s', "without a route"), ('/login=ip:10/minute', "Invalid rate limit"),
+                                         ('/login=user:1/1s', "Invalid rate limit")])
+def test_invalid_limits(spec, error):
+    with pytest.raises(ValueError, match=error):
+        parse_limits(spec)
+
+
+def test_refill_is_capped_at_the_burst():
+    assert refill(0, 10, 12, 0.5, 5) == 1
+    assert refill(4, 10, 100, 0.5, 5) == 5
+    assert refill(2, 10, 9, 0.5, 5) == 2  # a clock that went back adds nothing
+
+
+def test_token_bucket(store, clock):
+    # 2 requests per second, bursts of 3
+    assert [store.take('k', 2.0, 3) for _ in range(3)] == [0, 0, 0]
+    assert store.take('k', 2.0, 3) == pytest.approx(0.5)
+    clock.now += 0.25
+    assert store.take('k', 2.0, 3) == pytest.approx(0.25)
+    clock.now += 0.25
+    assert store.take('k', 2.0, 3) == 0
+    assert store.take('other', 2.0, 3) == 0
+    assert store.size() == 2
+
+
+def test_local_buckets_keep_the_most_recent_keys(clock):
+    store = LocalBuckets(max_keys=2)
+    for key in ('a', 'b', 'a', 'c'):
+        store.take(key, 1.0, 1)
+    assert list(store.buckets) == ['a', 'c']
+
+
+def test_sqlite_buckets_purge_idle_keys(tmp_path, clock):
+    store = SQLiteBuckets(str(tmp_path / 'ratelimits.db'), purge_every=2, idle_seconds=60)
+    store.take('idle', 1.0, 1)
+    clock.now += 120
+    store.take('active', 1.0, 1)
+    assert store.size() == 1
+
+
+def test_buckets_are_shared_through_the_file(tmp_path, clock):
+    path = str(tmp_path / 'ratelimits.db')
+    first, second = SQLiteBuckets(path), SQLiteBuckets(path)
+    assert first.take('k', 1.0, 1) == 0
+    assert second.take('k', 1.0, 1) == pytest.approx(1.0)
+
+
+def test_create_bucket_store(tmp_path):
+    assert isinstance(create_bucket_store('local'), LocalBuckets)
+    assert isinstance(create_bucket_store(f"sqlite:///{tmp_path / 'r.db'}"), SQLiteBuckets)
+    with pytest.raises(ValueError, match="Unsupported rate limit backend"):
+        create_bucket_store('redis://localhost')
+
+
+@pytest.mark.parametrize('seconds, header', [(0.01, '1'), (1.0, '1'), (1.2, '2'), (59.5, '60')])
+def test_retry_after(seconds, header):
+    assert retry_after(seconds) == header
+
+
+def test_check_uses_the_route_or_default_limits(clock):
+    control = AdmissionControl(LocalBuckets(), parse_limits("/login=ip:1/60s;default=identity:1/1s"))
+    assert control.check('/login', ip='10.0.0.1') is None
+    scope, wait = control.check('/login', ip='10.0.0.1')
+    assert (scope, wait) == ('ip', pytest.approx(60))
+    assert control.check('/login', ip='10.0.0.2') is None
+    # Identities are per role; requests without a token skip identity limits
+    assert control.check('/admin/orders', identity=1, role='admin') is None
+    assert control.check('/admin/orders', identity=1, role='customer') is None
+    assert control.check('/admin/orders', identity=1, role='admin')[0] == 'identity'
+    assert control.check('/admin/orders') is None
+    assert control.stats()["throttled"] == 2
+
+
+def test_no_cap_admits_everything():
+    control = AdmissionControl(LocalBuckets(), {})
+    assert all(control.admit() is None for _ in range(100))
+
+
+def test_requests_beyond_the_queue_are_shed():
+    control = AdmissionControl(LocalBuckets(), {}, max_concurrent=1, max_queue=0, queue_timeout=0.01)
+    assert control.admit() is None
+    assert control.admit() == "queue_full"
+    control.release()
+    assert control.admit() is None
+
+
+def test_queued_requests_time_out_or_take_a_freed_slot():
+    control = AdmissionControl(LocalBuckets(), {}, max_concurrent=1, max_queue=1, queue_timeout=0.01)
+    control.admit()
+    assert control.admit() == "queue_timeout"
+
+    control.queue_timeout = 5
+    result = []
+    waiter = threading.Thread(target=lambda: result.append(control.admit()))
+    waiter.start()
+    while not control.waiting:
+        pass
+    control.release()
+    waiter.join(5)
+    assert result == [None]
+    stats = control.stats()
+    assert (stats["in_flight"], stats["waiting"], stats["queued"], stats["shed_queue_timeout"]) == (1, 0, 2, 1)
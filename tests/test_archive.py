@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from archive import OrderArchiver, history_page, order_row
+from order_status import ASSIGNED, CLOSED_STATUSES, DELIVERED, FAILED
+
+OLD = datetime(2025, 1, 1, 12, 0)
+RECENT = datetime.utcnow() - timedelta(days=1)
+
+
+@pytest.fixture
+def orders(db):
+    # -> add(status, changed_at, assigned_to=None, updated_at=changed_at) -> order_id; closed orders closed at changed_at
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO customers (name, phone, email, address, password) VALUES (%s, %s, %s, %s, %s)",
+                       ('c', '1', 'c@example.com', 'a', 'x'))
+        customer_id = cursor.lastrowid
+        cursor.execute("INSERT INTO delivery_persons (name, email, password) VALUES (%s, %s, %s)",
+                       ('d', 'd@example.com', 'x'))
+
+    def add(status, changed_at, assigned_to=None, updated_at=None):
+        with db.transaction() as cursor:
+            cursor.execute(
+                "INSERT INTO orders (customer_id, assigned_to, status, updated_at, closed_at) VALUES (%s, %s, %s, %s, %s)",
+                (customer_id, assigned_to, status, updated_at or changed_at,
+                 changed_at if status in CLOSED_STATUSES else None)
+            )
+            return cursor.lastrowid
+    return add
+
+
+def table_ids(db, table):
+    with db.cursor() as cursor:
+        cursor.execute(f"SELECT order_id FROM {table} ORDER BY order_id")
+        return [row[0] for row in cursor.fetchall()]
+
+
+def test_only_old_closed_orders_are_moved(db, orders):
+    delivered, failed = orders(DELIVERED, OLD, 1), orders(FAILED, OLD)
+    open_order, recent = orders(ASSIGNED, OLD, 1), orders(DELIVERED, RECENT, 1)
+    batches = []
+    archiver = OrderArchiver(db, after_days=30, interval=0, batch_size=1, pause=0, on_batch=batches.append)
+    assert archiver.status()["due"] == 2
+    assert archiver.archive_all() == 2
+    assert table_ids(db, 'orders') == [open_order, recent]
+    assert table_ids(db, 'orders_archive') == [delivered, failed]
+    assert batches == [((delivered, 1),), ((failed, None),)]
+    assert archiver.stats() == {"runs": 1, "batches": 2, "archived": 2, "errors": 0}
+    status = archiver.status()
+    assert (status["live_orders"], status["archived_orders"], status["due"]) == (2, 2, 0)
+
+
+def test_reads_fall_back_to_the_archive(db, orders):
+    archived, live = orders(DELIVERED, OLD, 1), orders(ASSIGNED, OLD, 1)
+    OrderArchiver(db, after_days=30, interval=0).archive_all()
+    with db.cursor() as cursor:
+        assert order_row(cursor, ['order_id', 'status'], "order_id = %s", (archived,)) == (archived, DELIVERED)
+        assert order_row(cursor, ['order_id', 'status'], "order_id = %s", (live,)) == (live, ASSIGNED)
+        assert order_row(cursor, ['order_id'], "order_id = %s", (999,)) is None
+
+
+def test_history_pages_span_both_tables(db, orders):
+    ids = [orders(DELIVERED, OLD + timedelta(hours=i), 1) for i in range(3)]
+    OrderArchiver(db, after_days=30, interval=0, batch_size=2).archive_batch()
+    ids.append(orders(DELIVERED, RECENT, 1))
+    with db.cursor() as cursor:
+        page = history_page(cursor, ['order_id', 'closed_at'], 1, DELIVERED, limit=2)
+        assert [row[0] for row in page] == [ids[3], ids[2], ids[1]]  # limit + 1 rows: more follow
+        last = page[1]
+        page = history_page(cursor, ['order_id', 'closed_at'], 1, DELIVERED, before=(last[1], last[0]), limit=2)
+        assert [row[0] for row in page] == [ids[1], ids[0]]
+        page = history_page(cursor, ['order_id', 'closed_at'], 1, DELIVERED, start=OLD + timedelta(hours=1),
+                            end=RECENT)
+        assert [row[0] for row in page] == [ids[2], ids[1]]
+
+
+def test_later_writes_do_not_move_a_closed_order(db, orders):
+    # A location flush after delivery touches updated_at; age and history order follow closed_at
+    moved = orders(DELIVERED, OLD, 1, updated_at=RECENT)
+    first = orders(DELIVERED, RECENT - timedelta(hours=2), 1, updated_at=RECENT)
+    second = orders(DELIVERED, RECENT - timedelta(hours=1), 1)
+    assert OrderArchiver(db, after_days=30, interval=0).archive_all() == 1
+    assert table_ids(db, 'orders_archive') == [moved]
+    with db.cursor() as cursor:
+        page = history_page(cursor, ['order_id', 'closed_at'], 1, DELIVERED)
+    assert [row[0] for row in page] == [second, first, moved]
@@ -0,0 +1,169 @@
+import asyncio
+import gzip
+import io
+import itertools
+import json
+import os
+from concurrent.futures import Executor, ThreadPoolExecutor
+
+import pytest
+
+pytest.importorskip('MySQLdb')  # asgi.py imports app.py and the async driver
+pytest.importorskip('aiomysql')
+import asgi
+from benchmarks import sqlite_backend
+from flask_jwt_extended import create_access_token
+from migrate import migrate
+from asgi import HTTPError, Request, RequestBody, Response, Subscription, bearer_token, finish_response, match_route
+
+
+def scope(method='GET', path='/', query_string=b'', headers=()):
+    return {'type': 'http', 'method': method, 'path': path, 'query_string': query_string,
+            'headers': [(k.encode('latin-1'), v.encode('latin-1')) for k, v in headers]}
+
+
+def receiver(*chunks):
+    messages = [{'type': 'http.request', 'body': chunk, 'more_body': i < len(chunks) - 1}
+                for i, chunk in enumerate(chunks)]
+
+    async def receive():
+        if messages:
+            return messages.pop(0)
+        await asyncio.sleep(3600)
+    return receive
+
+
+def test_match_route():
+    rule, handler, roles, params = match_route('GET', '/customer/track-order/42')
+    assert (rule, handler, roles, params) == ('/customer/track-order/<int:order_id>', asgi.track_order, ('customer',),
+                                             {'order_id': 42})
+    assert match_route('POST', '/customer/track-order/42') is None
+    assert match_route('GET', '/customer/track-order/abc') is None
+
+
+def test_bearer_token():
+    assert bearer_token(Request(scope(headers=[('Authorization', 'Bearer abc')]), b'')) == 'abc'
+    assert bearer_token(Request(scope(query_string=b'jwt=abc'), b''), query_string=True) == 'abc'
+    with pytest.raises(HTTPError) as e:
+        bearer_token(Request(scope(query_string=b'jwt=abc'), b''))
+    assert e.value.status == 401
+    with pytest.raises(HTTPError) as e:
+        bearer_token(Request(scope(headers=[('Authorization', 'Token abc')]), b''))
+    assert e.value.status == 422
+
+
+@pytest.mark.parametrize('body, error', [(b'{bad', "Invalid JSON body"), (b'[1]', "JSON object body required"),
+                                         (b'', "JSON object body required")])
+def test_request_json_errors(body, error):
+    with pytest.raises(HTTPError) as e:
+        Request(scope('POST'), body).json
+    assert (e.value.status, e.value.payload) == (400, {"error": error})
+
+
+def test_subscription_drops_the_oldest_event():
+    async def run():
+        subscription = Subscription(asyncio.get_running_loop(), maxsize=2)
+        for event in ('a', 'b', 'c'):
+            subscription.put_nowait(event)
+        await asyncio.sleep(0)
+        return [subscription.queue.get_nowait() for _ in range(subscription.queue.qsize())]
+    assert asyncio.run(run()) == ['b', 'c']
+
+
+def test_request_body_is_received_as_it_is_read():
+    async def run():
+        loop = asyncio.get_running_loop()
+        stream = io.BufferedReader(RequestBody(receiver(b'{"a":', b' 1}'), loop))
+        return await loop.run_in_executor(None, stream.read)
+    assert asyncio.run(run()) == b'{"a": 1}'
+
+
+def test_listings_get_an_etag_and_304():
+    body = asgi.jsonify({"orders": []}).body
+    request = Request(scope(), b'')
+    response = finish_response(request, '/admin/orders', Response(body))
+    tag = response.headers['ETag']
+    request = Request(scope(headers=[('If-None-Match', tag)]), b'')
+    assert finish_response(request, '/admin/orders', Response(body)).status == 304
+
+
+def test_large_responses_are_compressed():
+    body = json.dumps({"rows": ["x" * 10] * 500}).encode()
+    request = Request(scope(headers=[('Accept-Encoding', 'gzip')]), b'')
+    response = finish_response(request, '/customer/track-order/<int:order_id>', Response(body))
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.body) == body
+    assert 'ETag' not in response.headers
+
+
+def call(method, path, *chunks, headers=(), query_string=b''):
+    chunks = chunks or (b'',)
+    sent = []
+
+    async def send(message):
+        sent.append(message)
+
+    asyncio.run(asgi.application(scope(method, path, query_string, headers), receiver(*chunks), send))
+    body = b''.join(message.get('body', b'') for message in sent[1:])
+    return sent[0]['status'], dict(sent[0]['headers']), body
+
+
+def test_other_routes_are_served_by_flask():
+    status, headers, body = call('GET', '/health')
+    assert (status, json.loads(body)) == (200, {"status": "ok"})
+    assert headers[b'content-type'] == b'application/json'
+
+
+def test_native_route_rejects_missing_token():
+    status, headers, body = call('GET', '/delivery/assigned-orders')
+    assert (status, json.loads(body)) == (401, {"msg": "Missing Authorization Header"})
+    assert headers[b'access-control-allow-origin'] == b'*'
+
+
+class RoundRobinExecutor(Executor):
+    # Every call on the next of several threads, as a busy pool may hand them out
+    def __init__(self, threads):
+        self.pools = [ThreadPoolExecutor(max_workers=1) for _ in range(threads)]
+        self.turn = itertools.cycle(self.pools)
+
+    def submit(self, fn, *args, **kwargs):
+        return next(self.turn).submit(fn, *args, **kwargs)
+
+    def shutdown(self, wait=True, **kwargs):
+        for pool in self.pools:
+            pool.shutdown(wait)
+
+
+@pytest.fixture
+def sqlite_service(tmp_path, monkeypatch):
+    # The service's pool on the SQLite stand-in, already started, with one delivery person
+    path = str(tmp_path / 'courier.sqlite3')
+    sqlite_backend.create_schema(path)
+    db = asgi.service.db
+    db.pool.close_all()
+    monkeypatch.setattr(db.pool, 'connect', sqlite_backend.connect_factory(path))
+    monkeypatch.setattr(asgi.service.startup, 'pid', os.getpid())
+    with db.connection() as conn:
+        migrate(conn, log=lambda message: None)
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO delivery_persons (name, email, password) VALUES (%s, %s, %s)",
+                       ('d', 'd@example.com', 'x'))
+    yield db
+    db.pool.close_all()
+
+
+def test_streamed_fallback_keeps_its_connection_on_its_own_context(sqlite_service, monkeypatch):
+    threads = RoundRobinExecutor(2)
+    monkeypatch.setattr(asgi, 'wsgi_threads', threads)
+    with asgi.app1.app_context():
+        token = create_access_token(identity='1', additional_claims={'role': 'admin'})
+    try:
+        status, headers, body = call('GET', '/admin/export/delivery_persons', query_string=b'format=ndjson',
+                                     headers=[('Authorization', f"Bearer {token}")])
+        assert status == 200
+        assert [json.loads(line)["email"] for line in body.decode().splitlines()] == ["d@example.com"]
+        assert sqlite_service.pool.stats()["in_use"] == 0
+        # Neither thread is left holding the stream's connection
+        assert [pool.submit(sqlite_service.current.get).result() for pool in threads.pools] == [None, None]
+    finally:
+        threads.shutdown()
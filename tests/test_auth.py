@@ -0,0 +1,127 @@
+import time
+from contextlib import contextmanager
+from datetime import timedelta
+
+import pytest
+from flask import Flask, jsonify
+from flask_jwt_extended import JWTManager, create_access_token
+
+from auth import RevocationList, TokenRevocations, role_required, to_datetime, to_timestamp
+
+
+def test_timestamps_round_trip_as_naive_utc():
+    assert to_datetime(0).isoformat() == '1970-01-01T00:00:00'
+    assert to_timestamp(to_datetime(1700000000.5)) == 1700000000.5
+    assert to_timestamp('1970-01-01 00:01:00') == 60
+
+
+def test_revoked_token_id():
+    revoked = RevocationList()
+    revoked.add('abc', 'customer', None, 100, 200)
+    assert revoked.is_revoked({'jti': 'abc', 'role': 'customer', 'sub': '1', 'iat': 150})
+    assert not revoked.is_revoked({'jti': 'other', 'role': 'customer', 'sub': '1', 'iat': 50})
+
+
+def test_revoked_user_covers_tokens_issued_until_then():
+    revoked = RevocationList()
+    revoked.add(None, 'customer', 7, 100, 200)
+    assert revoked.is_revoked({'jti': 'a', 'role': 'customer', 'sub': '7', 'iat': 100})
+    assert not revoked.is_revoked({'jti': 'b', 'role': 'customer', 'sub': '7', 'iat': 101})
+    # User ids are per role
+    assert not revoked.is_revoked({'jti': 'c', 'role': 'delivery_person', 'sub': '7', 'iat': 50})
+
+
+def test_later_revocation_wins_and_expired_entries_are_pruned():
+    revoked = RevocationList()
+    revoked.add(None, 'customer', 7, 100, 200)
+    revoked.add(None, 'customer', 7, 90, 300)
+    revoked.add('abc', None, None, 100, 150)
+    assert revoked.users[('customer', '7')] == (100, 300)
+    revoked.prune(160)
+    assert revoked.sizes() == (0, 1)
+
+
+class FakeCursor:
+    def __init__(self, db):
+        self.db = db
+
+    def execute(self, sql, params):
+        self.db.executed.append((sql, params))
+
+    def fetchall(self):
+        return self.db.rows
+
+
+class FakeDB:
+    def __init__(self, rows=()):
+        self.rows = list(rows)
+        self.executed = []
+
+    @contextmanager
+    def cursor(self):
+        yield FakeCursor(self)
+
+    transaction = cursor
+
+
+def test_sync_loads_rows_and_moves_the_window():
+    now = time.time()
+    db = FakeDB([('abc', 'customer', None, to_datetime(now - 10), to_datetime(now + 60)),
+                 (None, 'customer', 7, to_datetime(now - 5), to_datetime(now + 60))])
+    revocations = TokenRevocations(db, overlap=2)
+    assert revocations.is_revoked({'jti': 'abc', 'sub': '1', 'role': 'customer', 'iat': now - 100})
+    assert revocations.is_revoked({'jti': 'x', 'sub': '7', 'role': 'customer', 'iat': now - 100})
+    assert revocations.loaded and revocations.since == pytest.approx(now - 5, abs=1e-3)
+    revocations.sync()
+    # Rows committed late are read again for `overlap` seconds
+    assert to_timestamp(db.executed[-1][1][0]) == pytest.approx(now - 7, abs=1e-3)
+    assert revocations.stats()["syncs"] == 2 and revocations.stats()["rejected"] == 2
+
+
+def test_revoke_user_writes_to_the_callers_transaction():
+    db = FakeDB()
+    revocations = TokenRevocations(db, retention=3600)
+    cursor = FakeCursor(db)
+    revocations.revoke_user('delivery_person', 3, cursor=cursor)
+    [(sql, params)] = db.executed
+    assert sql.startswith("INSERT INTO token_revocations")
+    assert params[:3] == (None, 'delivery_person', 3)
+    assert revocations.revoked.is_revoked({'role': 'delivery_person', 'sub': '3', 'iat': time.time() - 1})
+
+
+@pytest.fixture
+def client():
+    app = Flask(__name__)
+    app.config['JWT_SECRET_KEY'] = 'test-secret-key-that-is-long-enough'
+    app.config['JWT_ACCESS_TOKEN_EXPIRES'] = timedelta(minutes=5)
+    JWTManager(app)
+
+    @app.route('/admin')
+    @role_required('admin')
+    def admin():
+        return jsonify({"ok": True})
+
+    @app.route('/staff')
+    @role_required('admin', 'delivery_person', message="Staff only")
+    def staff():
+        return jsonify({"ok": True})
+
+    with app.app_context():
+        tokens = {role: create_access_token(identity='1', additional_claims={'role': role})
+                  for role in ('admin', 'customer', 'delivery_person')}
+    client = app.test_client()
+    client.tokens = tokens
+    return client
+
+
+def get(client, path, role):
+    return client.get(path, headers={'Authorization': f"Bearer {client.tokens[role]}"})
+
+
+def test_role_required(client):
+    assert get(client, '/admin', 'admin').status_code == 200
+    response = get(client, '/admin', 'customer')
+    assert (response.status_code, response.get_json()) == (403, {"error": "Admin access required"})
+    assert get(client, '/staff', 'delivery_person').status_code == 200
+    assert get(client, '/staff', 'customer').get_json() == {"error": "Staff only"}
+    assert client.get('/admin').status_code == 401
@@ -0,0 +1,94 @@
+import pytest
+
+from benchmarks import sqlite_backend
+from benchmarks.run import compare, percentile, summarize
+from benchmarks.sqlite_backend import translate_schema, translate_sql
+from migrate import migrate
+
+DUMP = """CREATE TABLE `orders` (
+  `order_id` int NOT NULL AUTO_INCREMENT,
+  `status` enum('Pending','Delivered') DEFAULT 'Pending' COMMENT 'where it is',
+  `customer_id` int DEFAULT NULL,
+  `updated_at` timestamp NULL DEFAULT CURRENT_TIMESTAMP ON UPDATE CURRENT_TIMESTAMP,
+  PRIMARY KEY (`order_id`),
+  UNIQUE KEY `tracking` (`order_id`,`status`),
+  KEY `customer` (`customer_id`(10))
+) ENGINE=InnoDB DEFAULT CHARSET=utf8mb4;
+"""
+
+
+def test_translate_schema():
+    table, unique, index = translate_schema(DUMP)
+    assert "`order_id` INTEGER PRIMARY KEY AUTOINCREMENT" in table
+    assert "`status` TEXT DEFAULT 'Pending'" in table
+    assert "ON UPDATE" not in table and "COMMENT" not in table
+    assert unique == "CREATE UNIQUE INDEX IF NOT EXISTS `orders_tracking` ON `orders` (`order_id`,`status`)"
+    assert index == "CREATE INDEX IF NOT EXISTS `orders_customer` ON `orders` (`customer_id`)"
+
+
+@pytest.mark.parametrize('mysql, sqlite', [
+    ("SELECT * FROM orders WHERE order_id = %s FOR UPDATE", "SELECT * FROM orders WHERE order_id = ? "),
+    ("SELECT issue_id FROM issues LIMIT %s FOR UPDATE SKIP LOCKED", "SELECT issue_id FROM issues LIMIT ? "),
+    ("UPDATE orders SET updated_at = NOW()", "UPDATE orders SET updated_at = CURRENT_TIMESTAMP"),
+    ("INSERT INTO c (k, n) VALUES (%s, %s) ON DUPLICATE KEY UPDATE n = n + VALUES(n)",
+     "INSERT INTO c (k, n) VALUES (?, ?) ON CONFLICT DO UPDATE SET n = n + excluded.n"),
+    ("START TRANSACTION", "BEGIN IMMEDIATE"),
+    ("CREATE INDEX triage ON issues (status)", "CREATE INDEX IF NOT EXISTS `issues_triage` ON `issues` (status)"),
+    ("DROP INDEX status ON issues", "DROP INDEX IF EXISTS `issues_status`"),
+    ("CREATE FULLTEXT INDEX ft ON issues (message)", "SELECT 1"),
+    ("SELECT MATCH (message) AGAINST (%s IN BOOLEAN MODE) FROM issues", "SELECT FULLTEXT_SCORE(?, message) FROM issues"),
+])
+def test_translate_sql(mysql, sqlite):
+    assert translate_sql(mysql) == sqlite
+
+
+def test_percentile():
+    values = [0.1, 0.2, 0.3, 0.4, 0.5]
+    assert percentile([], 0.5) == 0.0
+    assert (percentile(values, 0.0), percentile(values, 0.5), percentile(values, 1.0)) == (0.1, 0.3, 0.5)
+
+
+def test_summarize_counts_errors_per_route():
+    samples = [("GET /a", 0.010, 200), ("GET /a", 0.030, 500), ("GET /b", 0.020, 0), ("GET /b", 0.040, 404)]
+    routes, total = summarize(samples, elapsed=2.0)
+    assert routes["GET /a"]["requests"] == 2 and routes["GET /a"]["errors"] == 1
+    assert routes["GET /b"]["errors"] == 1  # a connection failure counts, a 404 does not
+    assert routes["GET /a"]["max_ms"] == 30.0
+    assert total == {"requests": 4, "errors": 2, "throughput_rps": 2.0,
+                     "p50_ms": 30.0, "p95_ms": 40.0, "p99_ms": 40.0}
+
+
+def run_results(p95, rps, import_seconds=1.0):
+    return {"routes": {"GET /a": {"p95_ms": p95, "throughput_rps": rps}},
+            "startup": {"import_seconds": import_seconds, "warm_up_seconds": 0.5}}
+
+
+def test_compare_within_tolerance():
+    assert compare(run_results(10.5, 95), run_results(10, 100), tolerance=0.1) == []
+
+
+def test_compare_reports_regressions():
+    regressions = compare(run_results(20, 50, import_seconds=2.0), run_results(10, 100), tolerance=0.1)
+    assert regressions == ["GET /a: p95 10ms -> 20ms", "GET /a: throughput 100 -> 50 req/s",
+                           "startup: import_seconds 1.000s -> 2.000s"]
+
+
+def test_compare_ignores_small_startup_differences():
+    assert compare(run_results(10, 100, import_seconds=0.04), run_results(10, 100, import_seconds=0.02), 0.1) == []
+
+
+def test_schema_and_migrations_on_sqlite(tmp_path):
+    path = str(tmp_path / 'bench.sqlite3')
+    sqlite_backend.create_schema(path)
+    conn = sqlite_backend.Connection(path)
+    try:
+        assert migrate(conn, log=lambda message: None)
+        assert migrate(conn, log=lambda message: None) == []
+        cursor = conn.cursor()
+        cursor.execute("START TRANSACTION")
+        cursor.execute("INSERT INTO admins (username, password) VALUES (%s, %s)", ('bench', 'x'))
+        conn.commit()
+        cursor.execute("SELECT username FROM admins WHERE id = %s FOR UPDATE", (cursor.lastrowid,))
+        assert cursor.fetchone() == ('bench',)
+    finally:
+        conn.close()
@@ -0,0 +1,145 @@
+import io
+import json
+
+import pytest
+
+pytest.importorskip('MySQLdb')  # bulk.py needs the MySQL driver installed, not a server
+from bulk import (UnreadableInput, detect_format, email_field, export_rows, import_records, int_field, password_fields,
+                  read_records, text_field, validate_order)
+from hashing import PasswordHasher
+from order_status import ASSIGNED, PENDING
+
+
+def records(data, fmt):
+    return list(read_records(io.BytesIO(data.encode('utf-8')), fmt))
+
+
+def test_read_csv_records():
+    data = "\ufeffname , email\r\n Ann ,ann@example.com\r\n\"Bob\nJr\",\r\n"
+    assert records(data, 'csv') == [(2, {"name": "Ann", "email": "ann@example.com"}),
+                                    (4, {"name": "Bob\nJr", "email": ""})]
+
+
+def test_short_csv_rows_get_empty_values_and_extra_cells_are_dropped():
+    assert records("a,b\n1\n1,2,3\n", 'csv') == [(2, {"a": "1", "b": ""}), (3, {"a": "1", "b": "2"})]
+
+
+def test_read_ndjson_records():
+    parsed = records('{"a": 1}\n\n{bad\n[1]\n', 'ndjson')
+    assert parsed[0] == (1, {"a": 1})
+    assert [(line, str(error)) for line, error in parsed[1:]] == [(3, "Invalid JSON"), (4, "Expected a JSON object")]
+
+
+@pytest.mark.parametrize('fmt, content_type, filename, expected', [
+    (None, 'application/x-ndjson', '', 'ndjson'), (None, 'application/json', '', 'ndjson'),
+    (None, '', 'orders.jsonl', 'ndjson'), (None, 'text/csv', 'orders.csv', 'csv'), (None, '', '', 'csv'),
+    ('csv', 'application/json', '', 'csv'),
+])
+def test_detect_format(fmt, content_type, filename, expected):
+    assert detect_format(fmt, content_type, filename) == expected
+
+
+def test_unknown_format():
+    with pytest.raises(ValueError, match="format must be one of: csv, ndjson"):
+        detect_format('xml')
+
+
+def test_text_field():
+    assert text_field({"name": "  Ann "}, 'name', 10) == "Ann"
+    assert text_field({"name": 42}, 'name', 10) == "42"
+    assert text_field({"name": " "}, 'name', 10, required=False) is None
+    with pytest.raises(ValueError, match="name is required"):
+        text_field({}, 'name', 10)
+    with pytest.raises(ValueError, match="name is longer than 3 characters"):
+        text_field({"name": "Anna"}, 'name', 3)
+
+
+def test_int_field():
+    assert int_field({"id": "7"}, 'id') == 7
+    assert int_field({"id": ""}, 'id', required=False) is None
+    with pytest.raises(ValueError, match="id is required"):
+        int_field({"id": None}, 'id')
+    with pytest.raises(ValueError, match="id must be an integer"):
+        int_field({"id": "7.5"}, 'id')
+
+
+def test_email_and_password_fields():
+    assert email_field({"email": "a@b"}) == "a@b"
+    with pytest.raises(ValueError, match="email is not a valid address"):
+        email_field({"email": "ab"})
+    assert password_fields({"password": "pw"}) == ("pw", None)
+    assert password_fields({"password_hash": "$2b$04$abc"}) == (None, "$2b$04$abc")
+    with pytest.raises(ValueError, match="password_hash must be a bcrypt hash"):
+        password_fields({"password_hash": "md5:abc"})
+
+
+def test_validate_order():
+    assert validate_order({"customer_id": "3"})["status"] == PENDING
+    assert validate_order({"customer_id": 3, "assigned_to": 2, "status": ASSIGNED})["assigned_to"] == 2
+    with pytest.raises(ValueError, match="status Assigned requires assigned_to"):
+        validate_order({"customer_id": 3, "status": ASSIGNED})
+    with pytest.raises(ValueError, match="status must be one of"):
+        validate_order({"customer_id": 3, "status": "Lost"})
+
+
+@pytest.fixture
+def hasher():
+    return PasswordHasher(rounds=4, executor='inline')
+
+
+def test_import_skips_bad_rows(db, hasher):
+    data = ("name,phone,email,address,password\n"
+            "Ann,1,ann@example.com,Street 1,pw1\n"
+            "Bob,2,bob-at-example.com,Street 2,pw2\n"
+            "Ann Again,3,ANN@example.com,Street 3,pw3\n"
+            "Cid,4,cid@example.com,Street 4,pw4\n")
+    chunks = []
+    report = import_records(db, hasher, 'customers', records(data, 'csv'), chunk_size=2, on_chunk=chunks.append)
+    result = report.as_dict()
+    assert (result["rows"], result["inserted"], result["failed"]) == (4, 2, 2)
+    assert [(e["line"], e["error"]) for e in result["errors"]] == [(3, "email is not a valid address"),
+                                                                   (4, "email already registered")]
+    assert [[row["email"] for _, row in chunk] for chunk in chunks] == [["ann@example.com"], ["cid@example.com"]]
+    with db.cursor() as cursor:
+        cursor.execute("SELECT email, password FROM customers ORDER BY customer_id")
+        stored = cursor.fetchall()
+    assert [email for email, _ in stored] == ["ann@example.com", "cid@example.com"]
+    assert hasher.verify(stored[0][1], "pw1")
+
+
+def test_undecodable_bytes_stop_the_records():
+    [(line, error)] = list(read_records(io.BytesIO(b'{"a": 1}\n\xff\n'), 'ndjson'))
+    assert line == 1 and isinstance(error, UnreadableInput)
+    assert "can't decode" in str(error)
+
+
+def test_oversized_csv_field_stops_the_import_after_the_rows_before_it(db, hasher):
+    rows = [f"C{i},{i},c{i}@example.com,Street,$2b$04$abc" for i in range(3)] + ["x" * 200000]
+    data = "name,phone,email,address,password_hash\n" + "\n".join(rows) + "\nD,9,d@example.com,Street,$2b$04$abc\n"
+    result = import_records(db, hasher, 'customers', records(data, 'csv'), chunk_size=2).as_dict()
+    assert (result["rows"], result["inserted"], result["failed"], result["stopped"]) == (3, 3, 1, True)
+    [error] = result["errors"]
+    assert error["line"] == 5 and "field larger than field limit" in error["error"]
+
+
+def test_imported_orders_are_counted(db, hasher):
+    import_records(db, hasher, 'customers', [(1, {"name": "A", "phone": "1", "email": "a@example.com",
+                                                  "address": "x", "password_hash": "$2b$04$abc"})])
+    report = import_records(db, hasher, 'orders', records('{"customer_id": 1}\n{"customer_id": 99}\n', 'ndjson'),
+                            actor=('admin', 5))
+    assert report.as_dict()["errors"] == [{"line": 2, "error": "customer not found"}]
+    with db.cursor() as cursor:
+        cursor.execute("SELECT order_count FROM order_status_counts WHERE status = %s", (PENDING,))
+        assert cursor.fetchone() == (1,)
+        cursor.execute("SELECT actor_type, actor_id FROM order_events")
+        assert cursor.fetchall() == (('admin', 5),)
+
+
+def test_export(db, hasher):
+    import_records(db, hasher, 'delivery_persons', [(1, {"name": "D1", "email": "d1@example.com", "password": "pw"}),
+                                                    (2, {"name": "D2", "email": "d2@example.com", "password": "pw"})])
+    csv_text = ''.join(export_rows(db, 'delivery_persons', 'csv', batch_size=1))
+    assert csv_text.splitlines()[0] == "delivery_person_id,name,email,created_at"
+    assert len(csv_text.splitlines()) == 3
+    ndjson = [json.loads(line) for line in ''.join(export_rows(db, 'delivery_persons', 'ndjson', after=1)).splitlines()]
+    assert [(row["delivery_person_id"], row["email"]) for row in ndjson] == [(2, "d2@example.com")]
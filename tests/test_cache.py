@@ -0,0 +1,81 @@
+import pytest
+
+from cache import LocalCache, SQLiteCache, assigned_key, create_cache, order_key
+
+
+@pytest.fixture(params=['local', 'sqlite'])
+def make_cache(request, tmp_path):
+    def make(ttl=30, max_entries=100):
+        if request.param == 'local':
+            return LocalCache(ttl, max_entries)
+        # Evicts on every set, so the limits apply at once
+        return SQLiteCache(str(tmp_path / 'cache.db'), ttl, max_entries, evict_every=1)
+    return make
+
+
+def test_read_through(make_cache):
+    cache = make_cache()
+    assert cache.get('order:1') is None
+    cache.set('order:1', {"order_id": 1, "status": "Pending"})
+    assert cache.get('order:1') == {"order_id": 1, "status": "Pending"}
+    stats = cache.stats.snapshot()
+    assert (stats["hits"], stats["misses"], stats["sets"], stats["hit_ratio"]) == (1, 1, 1, 0.5)
+
+
+def test_entries_expire(make_cache):
+    cache = make_cache(ttl=0)
+    cache.set('order:1', 1)
+    assert cache.get('order:1') is None
+
+
+def test_least_recently_used_entries_are_evicted(make_cache):
+    cache = make_cache(max_entries=2)
+    cache.set('a', 1)
+    cache.set('b', 2)
+    cache.get('a')
+    cache.set('c', 3)
+    assert (cache.get('a'), cache.get('b'), cache.get('c')) == (1, None, 3)
+    assert cache.size() == 2
+
+
+def test_delete_invalidates(make_cache):
+    cache = make_cache()
+    cache.set('a', 1)
+    cache.delete('a', 'missing')
+    assert cache.get('a') is None
+    assert cache.stats.snapshot()["invalidations"] == 2
+
+
+def test_load_that_raced_an_invalidation_is_not_stored(make_cache):
+    cache = make_cache()
+    generation = cache.generation('order:1')
+    cache.delete('order:1')  # a write commits while the row is being read
+    cache.set('order:1', {"status": "Pending"}, generation)
+    assert cache.get('order:1') is None
+    assert cache.stats.snapshot()["stale_sets"] == 1
+
+    cache.set('order:1', {"status": "Assigned"}, cache.generation('order:1'))
+    assert cache.get('order:1') == {"status": "Assigned"}
+
+
+def test_keys_without_a_kept_generation_report_the_floor(make_cache):
+    cache = make_cache(max_entries=2)
+    generation = cache.generation('z')
+    cache.delete('a', 'b', 'c')
+    cache.set('x', 0)
+    # z's generation is no longer known exactly: a load that began before the drop is not stored
+    cache.set('z', 1, generation)
+    assert cache.get('z') is None
+    cache.set('z', 2, cache.generation('z'))
+    assert cache.get('z') == 2
+
+
+def test_create_cache():
+    assert isinstance(create_cache('local'), LocalCache)
+    with pytest.raises(ValueError):
+        create_cache('redis://localhost')
+
+
+def test_keys():
+    assert order_key('12') == 'order:12'
+    assert assigned_key(3) == 'assigned:3'
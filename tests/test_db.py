@@ -0,0 +1,165 @@
+import threading
+
+import pytest
+from flask import Flask
+
+MySQLdb = pytest.importorskip('MySQLdb')  # db.py needs the MySQL driver installed, not a server
+import MySQLdb.cursors
+from db import ConnectionPool, Database, PoolExhausted
+
+
+class FakeConnection:
+    def __init__(self):
+        self.statements = []
+        self.commits = self.rollbacks = self.pings = 0
+        self.closed = False
+        self.alive = True
+
+    def cursor(self, cursorclass=None):
+        return FakeCursor(self)
+
+    def commit(self):
+        self.commits += 1
+
+    def rollback(self):
+        self.rollbacks += 1
+
+    def ping(self):
+        self.pings += 1
+        if not self.alive:
+            raise OSError("gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class FakeCursor:
+    rowcount = 0
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append(sql)
+
+    def close(self):
+        pass
+
+
+def test_connections_are_reused():
+    opened = []
+    pool = ConnectionPool(lambda: opened.append(FakeConnection()) or opened[-1], size=2)
+    conn = pool.acquire()
+    pool.release(conn)
+    assert pool.acquire() is conn
+    assert len(opened) == 1
+
+
+def test_exhausted_pool_times_out():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=0.05)
+    pool.acquire()
+    with pytest.raises(PoolExhausted):
+        pool.acquire()
+    assert pool.stats()["timeouts"] == 1
+
+
+def test_waiter_gets_the_released_connection():
+    pool = ConnectionPool(FakeConnection, size=1, timeout=5)
+    conn = pool.acquire()
+    got = []
+    waiter = threading.Thread(target=lambda: got.append(pool.acquire()))
+    waiter.start()
+    pool.release(conn)
+    waiter.join(5)
+    assert got == [conn]
+
+
+def test_old_connections_are_recycled():
+    pool = ConnectionPool(FakeConnection, recycle=0)
+    conn = pool.acquire()
+    pool.release(conn)
+    fresh = pool.acquire()
+    assert fresh is not conn and conn.raw.closed
+    assert pool.stats()["recycled"] == 1
+
+
+def test_idle_connections_that_fail_a_ping_are_replaced():
+    pool = ConnectionPool(FakeConnection, ping_after=0)
+    conn = pool.acquire()
+    conn.raw.alive = False
+    pool.release(conn)
+    assert pool.acquire() is not conn
+    assert pool.stats()["failed_health_checks"] == 1
+
+
+def test_discarded_connections_are_closed():
+    pool = ConnectionPool(FakeConnection)
+    conn = pool.acquire()
+    pool.release(conn, discard=True)
+    assert conn.raw.closed
+    assert pool.stats()["idle"] == 0
+
+
+def test_prefill_stops_at_the_pool_size():
+    pool = ConnectionPool(FakeConnection, size=3)
+    assert pool.prefill(10) == 3
+    assert pool.stats()["idle"] == 3
+
+
+@pytest.fixture
+def db():
+    app = Flask(__name__)
+    app.config.update(MYSQL_HOST='', MYSQL_USER='', MYSQL_PASSWORD='', MYSQL_DB='', DB_CONNECT=FakeConnection)
+    return Database(app)
+
+
+def test_transaction_commits(db):
+    with db.transaction() as cursor:
+        cursor.execute("UPDATE orders SET status = %s", ('Delivered',))
+    raw = db.pool.idle[0].raw
+    assert raw.statements == ["START TRANSACTION", "UPDATE orders SET status = %s"]
+    assert (raw.commits, raw.rollbacks) == (1, 0)
+
+
+def test_failed_transaction_rolls_back_and_keeps_the_connection(db):
+    with pytest.raises(RuntimeError):
+        with db.transaction() as cursor:
+            raw = cursor.conn
+            raise RuntimeError("rejected transition")
+    assert (raw.commits, raw.rollbacks) == (0, 1)
+    assert not raw.closed and db.pool.stats()["idle"] == 1
+
+
+@pytest.mark.parametrize('error', [MySQLdb.Error("Lost connection to MySQL server during query"), KeyboardInterrupt()])
+def test_driver_errors_and_interrupts_drop_the_connection(db, error):
+    with pytest.raises(type(error)):
+        with db.transaction() as cursor:
+            raw = cursor.conn
+            raise error
+    assert raw.rollbacks == 1
+    assert raw.closed and db.pool.stats()["idle"] == 0
+
+
+def test_errors_with_a_streamed_result_unread_drop_the_connection(db):
+    with pytest.raises(ValueError):
+        with db.cursor(MySQLdb.cursors.SSCursor) as cursor:
+            raw = cursor.conn
+            raise ValueError("bad row")
+    assert raw.closed and db.pool.stats()["idle"] == 0
+    with pytest.raises(ValueError):
+        with db.cursor() as cursor:
+            raw = cursor.conn
+            raise ValueError("bad input")
+    assert not raw.closed and db.pool.stats()["idle"] == 1
+
+
+def test_nested_blocks_share_the_outer_connection(db):
+    with db.transaction() as outer:
+        with db.cursor() as inner:
+            assert inner.conn is outer.conn
+        with db.transaction() as nested:
+            nested.execute("SELECT 1")
+    raw = db.pool.idle[0].raw
+    assert raw.statements == ["START TRANSACTION", "SELECT 1"]
+    assert raw.commits == 1
+    assert db.pool.stats()["acquired"] == 1
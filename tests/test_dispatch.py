@@ -0,0 +1,51 @@
+from collections import Counter
+
+import dispatch
+from dispatch import apply_assignments, balance_assignments
+from order_status import ASSIGNED, PENDING
+
+
+class RecordingCursor:
+    def __init__(self):
+        self.calls = []
+
+    def execute(self, sql, params):
+        self.calls.append((sql, params))
+        return len(params)
+
+
+def test_least_loaded_courier_goes_first():
+    assert balance_assignments([10, 11, 12], {1: 2, 2: 0, 3: 1}) == {10: 2, 11: 2, 12: 3}
+
+
+def test_orders_spread_evenly():
+    counts = Counter(balance_assignments(range(9), {1: 0, 2: 0, 3: 0}).values())
+    assert counts == {1: 3, 2: 3, 3: 3}
+
+
+def test_full_couriers_get_no_more_orders():
+    assignments = balance_assignments(range(10), {1: 0, 2: 1, 3: 5}, max_per_courier=2)
+    assert Counter(assignments.values()) == {1: 2, 2: 1}
+    assert list(assignments) == [0, 1, 2]
+
+
+def test_no_couriers_assigns_nothing():
+    assert balance_assignments([1, 2], {}) == {}
+
+
+def test_apply_assignments_writes_one_case_update():
+    cursor = RecordingCursor()
+    apply_assignments(cursor, {5: 1, 6: 2})
+    [(sql, params)] = cursor.calls
+    assert sql == ("UPDATE orders SET assigned_to = CASE order_id WHEN %s THEN %s WHEN %s THEN %s END, "
+                   "status = CASE WHEN status = %s THEN %s ELSE status END WHERE order_id IN (%s, %s)")
+    assert params == [5, 1, 6, 2, PENDING, ASSIGNED, 5, 6]
+
+
+def test_apply_assignments_chunks_and_can_skip_assigned_orders(monkeypatch):
+    monkeypatch.setattr(dispatch, 'UPDATE_CHUNK_SIZE', 2)
+    cursor = RecordingCursor()
+    apply_assignments(cursor, {1: 1, 2: 1, 3: 1}, only_unassigned=True)
+    assert len(cursor.calls) == 2
+    assert all(sql.endswith(" AND assigned_to IS NULL") for sql, _ in cursor.calls)
+    assert cursor.calls[1][1] == [3, 1, PENDING, ASSIGNED, 3]
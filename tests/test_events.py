@@ -0,0 +1,117 @@
+import queue
+import threading
+import time
+
+from events import EventHub, SQLiteBroker, sse_format
+
+
+def drain(q):
+    items = []
+    while True:
+        try:
+            items.append(q.get_nowait())
+        except queue.Empty:
+            return items
+
+
+def test_publish_reaches_only_the_channel_subscribers():
+    hub = EventHub()
+    hub.start()
+    tracked, other = hub.subscribe(1), hub.subscribe(2)
+    hub.publish(1, {"status": "Picked Up"})
+    assert drain(tracked) == [{"status": "Picked Up"}]
+    assert drain(other) == []
+
+
+def test_full_queue_drops_its_oldest_event():
+    hub = EventHub(queue_size=3)
+    q = hub.subscribe('7')
+    for n in range(5):
+        hub.dispatch('7', n)
+    assert drain(q) == [2, 3, 4]
+
+
+def test_unsubscribed_queue_gets_nothing():
+    hub = EventHub()
+    q = hub.subscribe(1)
+    hub.unsubscribe(1, q)
+    hub.dispatch('1', 'late')
+    assert drain(q) == []
+    assert hub.subscribers == {}
+
+
+def test_racing_publishers_on_a_full_queue_never_raise():
+    hub = EventHub(queue_size=1)
+    q = hub.subscribe(1)
+    errors = []
+
+    def publish():
+        try:
+            for n in range(5000):
+                hub.dispatch('1', n)
+        except Exception as e:
+            errors.append(e)
+
+    def consume():
+        for _ in range(5000):
+            drain(q)
+
+    threads = [threading.Thread(target=publish) for _ in range(4)] + [threading.Thread(target=consume)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert errors == []
+    assert q.qsize() <= 1
+
+
+def test_subscribe_accepts_a_custom_queue():
+    class Recorder:
+        def __init__(self):
+            self.items = []
+
+        def put_nowait(self, payload):
+            self.items.append(payload)
+
+    hub = EventHub()
+    recorder = hub.subscribe(3, Recorder())
+    hub.dispatch('3', {"type": "location"})
+    assert recorder.items == [{"type": "location"}]
+
+
+def test_sse_format():
+    assert sse_format({"a": 1}) == 'data: {"a": 1}\n\n'
+    assert sse_format({"a": 1}, event="status") == 'event: status\ndata: {"a": 1}\n\n'
+
+
+def wait_for(condition, timeout=5):
+    deadline = time.monotonic() + timeout
+    while not condition() and time.monotonic() < deadline:
+        time.sleep(0.01)
+    return condition()
+
+
+def test_sqlite_broker_delivers_across_instances(tmp_path):
+    path = str(tmp_path / 'events.db')
+    received = []
+    subscriber, publisher = SQLiteBroker(path, poll_interval=0.01), SQLiteBroker(path)
+    subscriber.start(lambda channel, payload: received.append((channel, payload)))
+    publisher.publish(5, {"status": "Delivered"})
+    assert wait_for(lambda: received == [('5', {"status": "Delivered"})])
+
+
+def test_sqlite_broker_keeps_polling_after_an_error(tmp_path):
+    received, failures = [], []
+
+    def dispatch(channel, payload):
+        if not failures:
+            failures.append(payload)
+            raise RuntimeError("database is locked")
+        received.append(payload)
+
+    broker = SQLiteBroker(str(tmp_path / 'events.db'), poll_interval=0.01)
+    broker.start(dispatch)
+    broker.publish(1, {"n": 1})
+    assert wait_for(lambda: failures)
+    broker.publish(1, {"n": 2})
+    assert wait_for(lambda: received == [{"n": 2}])
@@ -0,0 +1,82 @@
+import pytest
+
+from hashing import HashingBusy, PasswordHasher, VerifiedCache, hash_cost
+
+
+@pytest.fixture
+def hasher():
+    # Cheapest bcrypt cost, run on the calling thread
+    return PasswordHasher(rounds=4, workers=2, executor='inline')
+
+
+def test_hash_and_verify(hasher):
+    stored = hasher.hash('s3cret-pass')
+    assert hash_cost(stored) == 4
+    assert hasher.verify(stored, 's3cret-pass')
+    assert not hasher.verify(stored, 'wrong')
+
+
+def test_malformed_stored_hash_never_verifies(hasher):
+    assert not hasher.verify('plain-text-password', 'plain-text-password')
+
+
+def test_only_the_first_72_bytes_count(hasher):
+    stored = hasher.hash('x' * 72 + 'tail')
+    assert hasher.verify(stored, 'x' * 72 + 'other')
+
+
+def test_verified_passwords_are_remembered(hasher):
+    stored = hasher.hash('s3cret-pass')
+    hasher.verify(stored, 's3cret-pass')
+    hasher.verify(stored, 's3cret-pass')
+    assert hasher.stats()["verify_cache_hits"] == 1
+    assert hasher.stats()["latency"]["verify"]["calls"] == 1
+
+
+def test_verified_cache_is_keyed_by_hash_and_password():
+    cache = VerifiedCache(ttl=60)
+    cache.add('$2b$04$hash', 'right')
+    assert cache.hit('$2b$04$hash', 'right')
+    assert not cache.hit('$2b$04$hash', 'wrong')
+    assert not cache.hit('$2b$04$other', 'right')
+
+
+def test_verified_cache_can_be_disabled():
+    cache = VerifiedCache(ttl=0)
+    cache.add('$2b$04$hash', 'right')
+    assert not cache.hit('$2b$04$hash', 'right')
+
+
+def test_needs_rehash_after_a_cost_change(hasher):
+    assert not hasher.needs_rehash(hasher.hash('pw', rounds=4))
+    assert hasher.needs_rehash(hasher.hash('pw', rounds=5))
+    assert hasher.needs_rehash('not a bcrypt hash')
+
+
+@pytest.mark.parametrize('stored, cost', [('$2b$12$abc', 12), ('$2a$04$abc', 4), ('nonsense', None), (None, None)])
+def test_hash_cost(stored, cost):
+    assert hash_cost(stored) == cost
+
+
+def test_hash_many(hasher):
+    hashes = hasher.hash_many(['a1', 'b2', 'c3'])
+    assert [hasher.verify(stored, pw) for stored, pw in zip(hashes, ['a1', 'b2', 'c3'])] == [True] * 3
+    assert hasher.stats()["bulk_hashed"] == 3
+
+
+def test_full_queue_rejects_callers():
+    hasher = PasswordHasher(rounds=4, max_pending=1, queue_timeout=0.01, executor='inline')
+    with hasher.slot():
+        with pytest.raises(HashingBusy):
+            hasher.hash('pw')
+    assert hasher.stats()["rejected_busy"] == 1
+    assert hasher.stats()["pending"] == 0
+
+
+def test_thread_executor():
+    threaded = PasswordHasher(rounds=4, workers=2, executor='thread')
+    try:
+        assert threaded.warm() == 2
+        assert threaded.verify(threaded.hash('pw'), 'pw')
+    finally:
+        threaded.shutdown()
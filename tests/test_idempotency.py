@@ -0,0 +1,60 @@
+import sqlite3
+
+import pytest
+
+from idempotency import IdempotencyConflict, IdempotencyKeys, request_hash
+
+
+def test_request_hash():
+    first = request_hash('POST', '/customer/place-order', b'{"a": 1}')
+    assert first == request_hash('POST', '/customer/place-order', b'{"a": 1}')
+    assert first != request_hash('POST', '/customer/place-order', b'{"a": 2}')
+    assert first != request_hash('PUT', '/customer/place-order', b'{"a": 1}')
+    assert request_hash('POST', '/x', None) == request_hash('POST', '/x', b'')
+
+
+@pytest.fixture
+def customer_id(db):
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO customers (name, phone, email, address, password) VALUES (%s, %s, %s, %s, %s)",
+                       ('c', '1', 'c@example.com', 'a', 'x'))
+        return cursor.lastrowid
+
+
+def test_stored_response_is_replayed(db, customer_id):
+    keys = IdempotencyKeys(db)
+    fingerprint = request_hash('POST', '/customer/place-order', b'{}')
+    with db.transaction() as cursor:
+        assert keys.lookup(cursor, customer_id, 'key-1', fingerprint) is None
+        keys.store(cursor, customer_id, 'key-1', fingerprint, 201, '{"order_id": 1}')
+    with db.transaction() as cursor:
+        assert keys.lookup(cursor, customer_id, 'key-1', fingerprint) == (201, '{"order_id": 1}')
+        with pytest.raises(IdempotencyConflict):
+            keys.lookup(cursor, customer_id, 'key-1', request_hash('POST', '/customer/place-order', b'{"x": 1}'))
+
+
+def test_concurrent_store_with_one_key_fails(db, customer_id):
+    keys = IdempotencyKeys(db)
+    with db.transaction() as cursor:
+        keys.store(cursor, customer_id, 'key-1', 'a' * 64, 201, '{}')
+    with pytest.raises(sqlite3.IntegrityError):
+        with db.transaction() as cursor:
+            keys.store(cursor, customer_id, 'key-1', 'a' * 64, 201, '{}')
+
+
+def test_expired_keys_can_be_reused_and_are_purged(db, customer_id):
+    keys = IdempotencyKeys(db, ttl=-1, purge_every=2)
+    with db.transaction() as cursor:
+        keys.store(cursor, customer_id, 'key-1', 'a' * 64, 201, '{}')
+    with db.transaction() as cursor:
+        assert keys.lookup(cursor, customer_id, 'key-1', 'b' * 64) is None
+        keys.store(cursor, customer_id, 'key-1', 'b' * 64, 201, '{}')
+        keys.store(cursor, customer_id, 'key-2', 'b' * 64, 201, '{}')
+    keys.stored_one()
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM idempotency_keys")
+        assert cursor.fetchone() == (2,)
+    keys.stored_one()
+    with db.cursor() as cursor:
+        cursor.execute("SELECT COUNT(*) FROM idempotency_keys")
+        assert cursor.fetchone() == (0,)
@@ -0,0 +1,44 @@
+import pytest
+from werkzeug.datastructures import MultiDict
+
+pytest.importorskip('MySQLdb')  # app.py needs the MySQL driver installed, not a server
+import app as service
+
+FIELDS = ["order_id", "status"]
+
+
+def build(**args):
+    return service.build_listing_query(FIELDS, "orders", "order_id", service.ORDER_FILTERS, args=MultiDict(args))
+
+
+def test_no_filters_reads_in_key_order():
+    assert build() == ("SELECT order_id, status FROM orders ORDER BY order_id", [])
+
+
+def test_cursor_and_filters_become_bound_parameters():
+    sql, params = build(after='5', status='Pending', assigned_to='3', created_from='2025-05-01T00:00:00')
+    assert sql == ("SELECT order_id, status FROM orders "
+                   "WHERE order_id > %s AND status = %s AND assigned_to = %s AND created_at >= %s ORDER BY order_id")
+    assert params[:3] == [5, 'Pending', 3]
+    assert params[3].isoformat() == '2025-05-01T00:00:00'
+
+
+def test_blank_filters_are_ignored():
+    assert build(status='', after='') == build()
+
+
+@pytest.mark.parametrize('args', [{'after': 'x'}, {'assigned_to': 'abc'}, {'created_to': 'yesterday'}])
+def test_bad_values_raise_value_error(args):
+    with pytest.raises(ValueError):
+        build(**args)
+
+
+@pytest.mark.parametrize('limit, expected', [
+    (None, service.DEFAULT_PAGE_SIZE),
+    ('0', 1),
+    ('25', 25),
+    ('1000000', service.MAX_PAGE_SIZE),
+    ('many', service.DEFAULT_PAGE_SIZE),
+])
+def test_page_limit_is_clamped(limit, expected):
+    assert service.page_limit(MultiDict({} if limit is None else {'limit': limit})) == expected
@@ -0,0 +1,174 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from locations import LocationBuffer, downsample_interval, latest_per_order, parse_fix
+
+
+class Rejected(Exception):
+    pass
+
+
+def test_coordinates_make_a_location():
+    fix = parse_fix({"order_id": "7", "lat": "12.9716", "lon": 77.5946})
+    assert fix["order_id"] == 7
+    assert (fix["lat"], fix["lon"]) == (12.9716, 77.5946)
+    assert fix["location"] == "12.971600,77.594600"
+
+
+def test_lat_lon_text_gives_coordinates():
+    fix = parse_fix({"order_id": 1, "location": " 12.5, -77.25 "})
+    assert (fix["lat"], fix["lon"]) == (12.5, -77.25)
+    assert fix["location"] == " 12.5, -77.25 "
+
+
+def test_free_text_location_has_no_coordinates():
+    fix = parse_fix({"order_id": 1, "location": "Near the gate"})
+    assert (fix["lat"], fix["lon"]) == (None, None)
+
+
+def test_out_of_range_text_is_kept_without_coordinates():
+    fix = parse_fix({"order_id": 1, "location": "123,456"})
+    assert (fix["lat"], fix["lon"]) == (None, None)
+
+
+@pytest.mark.parametrize('raw, error', [
+    ({"lat": 1, "lon": 2}, KeyError),
+    ({"order_id": "x", "location": "a"}, ValueError),
+    ({"order_id": 1}, ValueError),
+    ({"order_id": 1, "lat": 91, "lon": 0}, ValueError),
+    ({"order_id": 1, "lat": 1}, TypeError),
+    ({"order_id": 1, "location": "a", "recorded_at": "not a time"}, ValueError),
+])
+def test_bad_fixes_raise(raw, error):
+    with pytest.raises(error):
+        parse_fix(raw)
+
+
+@pytest.mark.parametrize('raw, message', [
+    ({"order_id": 1, "location": "a", "recorded_at": 1e20}, "recorded_at out of range"),
+    ({"order_id": 1, "location": "a", "recorded_at": -1e20}, "recorded_at out of range"),
+    ({"order_id": 1, "location": "a", "recorded_at": float("inf")}, "recorded_at out of range"),
+    ({"order_id": 1, "location": "a", "recorded_at": "0001-01-01T00:00:00+05:30"}, "recorded_at out of range"),
+    ({"order_id": 1, "location": "a", "recorded_at": True}, "recorded_at must be a timestamp"),
+    ({"order_id": float("inf"), "location": "a"}, "order_id out of range"),
+])
+def test_out_of_range_values_are_value_errors(raw, message):
+    with pytest.raises(ValueError, match=message):
+        parse_fix(raw)
+
+
+@pytest.mark.parametrize('recorded_at', [
+    "2025-05-27T09:18:35Z",
+    "2025-05-27T14:48:35+05:30",
+    "2025-05-27T09:18:35",
+    1748337515,
+])
+def test_recorded_at_is_stored_as_naive_utc(recorded_at):
+    fix = parse_fix({"order_id": 1, "location": "a", "recorded_at": recorded_at})
+    assert fix["recorded_at"] == datetime(2025, 5, 27, 9, 18, 35)
+
+
+def test_fixes_from_the_future_are_rejected():
+    now = datetime.now(timezone.utc)
+    parse_fix({"order_id": 1, "location": "a", "recorded_at": (now + timedelta(seconds=30)).isoformat()})
+    with pytest.raises(ValueError, match="recorded_at is in the future"):
+        parse_fix({"order_id": 1, "location": "a", "recorded_at": (now + timedelta(seconds=90)).timestamp()})
+    with pytest.raises(ValueError, match="recorded_at is in the future"):
+        parse_fix({"order_id": 1, "location": "a", "recorded_at": (now + timedelta(seconds=30)).isoformat()},
+                  max_skew=0)
+
+
+def test_latest_per_order_keeps_the_newest_fix():
+    old = {"order_id": 1, "recorded_at": datetime(2025, 1, 1, 10)}
+    new = {"order_id": 1, "recorded_at": datetime(2025, 1, 1, 11)}
+    other = {"order_id": 2, "recorded_at": datetime(2025, 1, 1, 9)}
+    assert latest_per_order([new, other, old]) == {1: new, 2: other}
+
+
+@pytest.mark.parametrize('value, expected', [(None, 60), ('0', 1), ('300', 300), ('999999', 86400)])
+def test_downsample_interval(value, expected):
+    assert downsample_interval(value) == expected
+
+
+def test_downsample_interval_rejects_text():
+    with pytest.raises(ValueError):
+        downsample_interval('soon')
+
+
+def fixes(*ids):
+    return [{"order_id": n} for n in ids]
+
+
+def test_flush_hands_over_everything_pending():
+    batches = []
+    buffer = LocationBuffer(batches.append)
+    buffer.add(fixes(1, 2))
+    buffer.add(fixes(3))
+    assert buffer.flush() == 3
+    assert batches == [fixes(1, 2, 3)]
+    assert buffer.flush() == 0
+    assert buffer.stats() == {"pending": 0, "flushed": 3, "dropped": 0, "rejected": 0}
+
+
+def test_reaching_max_size_wakes_the_flusher():
+    buffer = LocationBuffer(lambda batch: None, max_size=2)
+    buffer.add(fixes(1))
+    assert not buffer.wakeup.is_set()
+    buffer.add(fixes(2))
+    assert buffer.wakeup.is_set()
+
+
+def test_overflow_drops_the_oldest_fixes():
+    buffer = LocationBuffer(lambda batch: None, max_pending=3)
+    buffer.add(fixes(1, 2, 3, 4, 5))
+    assert buffer.pending == fixes(3, 4, 5)
+    assert buffer.stats()["dropped"] == 2
+
+
+def test_failed_flush_is_retried_then_given_up():
+    calls = []
+
+    def down(batch):
+        calls.append([fix["order_id"] for fix in batch])
+        raise RuntimeError("MySQL is down")
+
+    buffer = LocationBuffer(down, max_attempts=3)
+    buffer.add(fixes(1, 2))
+    for _ in range(5):
+        buffer.flush()
+    assert calls == [[1, 2]] * 3
+    assert buffer.stats() == {"pending": 0, "flushed": 0, "dropped": 2, "rejected": 0}
+
+
+def test_retried_fixes_go_ahead_of_newer_ones():
+    outcomes = [RuntimeError("MySQL is down"), None]
+    batches = []
+
+    def flaky(batch):
+        batches.append([fix["order_id"] for fix in batch])
+        outcome = outcomes.pop(0)
+        if outcome:
+            raise outcome
+
+    buffer = LocationBuffer(flaky)
+    buffer.add(fixes(1, 2))
+    buffer.flush()
+    buffer.add(fixes(3))
+    assert buffer.flush() == 3
+    assert batches == [[1, 2], [1, 2, 3]]
+
+
+def test_rejected_fixes_are_isolated_and_dropped():
+    written = []
+
+    def write(batch):
+        if any(fix["order_id"] < 0 for fix in batch):
+            raise Rejected("foreign key")
+        written.extend(fix["order_id"] for fix in batch)
+
+    buffer = LocationBuffer(write, reject_errors=(Rejected,))
+    buffer.add(fixes(1, -2, 3, 4, -5, 6))
+    assert buffer.flush() == 4
+    assert sorted(written) == [1, 3, 4, 6]
+    assert buffer.stats() == {"pending": 0, "flushed": 4, "dropped": 0, "rejected": 2}
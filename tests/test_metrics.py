@@ -0,0 +1,99 @@
+import logging
+
+import pytest
+from flask import Flask, jsonify
+
+from metrics import Histogram, InstrumentedCursor, LabeledCounter, Metrics, query_shape
+
+
+@pytest.mark.parametrize('sql, shape', [
+    ("SELECT *  FROM orders\n WHERE order_id = 42", "SELECT * FROM orders WHERE order_id = ?"),
+    ("SELECT * FROM users WHERE name = 'it''s' OR name = 'a\\'b'", "SELECT * FROM users WHERE name = ?? OR name = ?"),
+    ("SELECT * FROM orders WHERE order_id IN (%s, %s, %s)", "SELECT * FROM orders WHERE order_id IN (...)"),
+    ("INSERT INTO t (a, b) VALUES (%s, %s), (%s, %s), (%s, %s)", "INSERT INTO t (a, b) VALUES (...), ..."),
+    ("UPDATE t SET s = CASE id WHEN %s THEN %s WHEN %s THEN %s END", "UPDATE t SET s = CASE id WHEN ... END"),
+    (b"SELECT 1", "SELECT ?"),
+])
+def test_query_shape(sql, shape):
+    assert query_shape(sql) == shape
+
+
+def test_query_shape_is_truncated():
+    assert len(query_shape("SELECT " + "x, " * 200 + "y FROM t")) == 200
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram('latency', 'Latency', ('route',), buckets=(0.1, 1))
+    histogram.observe(('/a',), 0.05)
+    histogram.observe(('/a',), 0.5)
+    histogram.observe(('/a',), 5)
+    assert histogram.render() == [
+        "# HELP latency Latency", "# TYPE latency histogram",
+        'latency_bucket{route="/a",le="0.1"} 1', 'latency_bucket{route="/a",le="1"} 2',
+        'latency_bucket{route="/a",le="+Inf"} 3', 'latency_sum{route="/a"} 5.55', 'latency_count{route="/a"} 3',
+    ]
+
+
+def test_counter_escapes_labels():
+    counter = LabeledCounter('events', 'Events', ('name',))
+    counter.inc(('say "hi"\n',), 2)
+    assert counter.render()[-1] == 'events{name="say \\"hi\\"\\n"} 2'
+
+
+class FakeCursor:
+    rowcount = 3
+
+    def __init__(self):
+        self.executed = []
+
+    def execute(self, sql, params=None):
+        self.executed.append((sql, params))
+
+    def fetchall(self):
+        return ((1,),)
+
+
+def test_instrumented_cursor_reports_every_statement():
+    seen = []
+    cursor = InstrumentedCursor(FakeCursor(), lambda sql, seconds, rows: seen.append((sql, rows)))
+    cursor.execute("SELECT 1", ())
+    assert seen == [("SELECT 1", 3)]
+    assert cursor.fetchall() == ((1,),)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    metrics = Metrics(app)
+
+    @app.route('/orders/<int:order_id>')
+    def track(order_id):
+        metrics.observe_query("SELECT * FROM orders WHERE order_id = 7", 0.002, 1)
+        return jsonify({"order_id": order_id})
+
+    return app
+
+
+def test_requests_are_recorded_by_route(app):
+    assert app.test_client().get('/orders/7').status_code == 200
+    text = app.extensions['metrics'].render()
+    assert ('courier_http_request_duration_seconds_count{method="GET",route="/orders/<int:order_id>",status="200"} 1'
+            in text)
+    assert 'courier_http_request_phase_seconds_count{route="/orders/<int:order_id>",phase="sql"} 1' in text
+    assert 'courier_http_request_phase_seconds_count{route="/orders/<int:order_id>",phase="serialization"} 1' in text
+    assert 'courier_sql_rows_count{query="SELECT * FROM orders WHERE order_id = ?"} 1' in text
+
+
+def test_slow_queries_are_logged(app, caplog):
+    app.config['SLOW_QUERY_MS'] = 1
+    with caplog.at_level(logging.WARNING, logger='slow_query'):
+        app.test_client().get('/orders/7')
+    assert "route=/orders/<int:order_id>: SELECT * FROM orders WHERE order_id = ?" in caplog.text
+
+
+def test_gauges_are_sampled_at_render(app):
+    metrics = app.extensions['metrics']
+    depth = [1]
+    metrics.add_gauges(lambda: [('courier_queue_depth', 'Queue depth', depth[0])])
+    depth[0] = 5
+    assert "courier_queue_depth 5\n" in metrics.render()
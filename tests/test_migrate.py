@@ -0,0 +1,113 @@
+import pytest
+
+import migrate as migrate_module
+from benchmarks import sqlite_backend
+from migrate import (MigrationError, collect_search_statements, collect_statements, load_migrations, migrate,
+                     pending_migrations, plan_problems, sample_params, split_statements, sql_sources)
+
+
+def test_split_statements():
+    sql = "-- comment; not a statement\nCREATE TABLE t (a int);\n\n  -- another\nINSERT INTO t VALUES (1);\n"
+    assert split_statements(sql) == ["CREATE TABLE t (a int)", "INSERT INTO t VALUES (1)"]
+
+
+def test_migrations_are_numbered_in_order():
+    migrations = load_migrations()
+    versions = [version for version, _, _, _ in migrations]
+    assert versions == list(range(len(versions)))
+    assert all(statements for _, _, statements, _ in migrations)
+
+
+def test_checksums_ignore_line_endings(tmp_path):
+    (tmp_path / '0000_a.sql').write_bytes(b"SELECT 1;\r\n")
+    (tmp_path / 'notes.txt').write_text("not a migration")
+    [(version, name, statements, crlf)] = load_migrations(str(tmp_path))
+    (tmp_path / '0000_a.sql').write_bytes(b"SELECT 1;\n")
+    assert (version, name, statements) == (0, 'a', ["SELECT 1"])
+    assert load_migrations(str(tmp_path))[0][3] == crlf
+
+
+def test_duplicate_versions_are_refused(tmp_path):
+    (tmp_path / '0001_a.sql').write_text("SELECT 1;")
+    (tmp_path / '0001_b.sql').write_text("SELECT 2;")
+    with pytest.raises(MigrationError, match="share a version"):
+        load_migrations(str(tmp_path))
+
+
+@pytest.fixture
+def conn(tmp_path):
+    path = str(tmp_path / 'schema.sqlite3')
+    sqlite_backend.create_schema(path)
+    conn = sqlite_backend.Connection(path)
+    yield conn
+    conn.close()
+
+
+def test_migrate_up_to_a_target_then_the_rest(conn):
+    assert migrate(conn, target=2, log=lambda message: None) == [0, 1, 2]
+    pending = [version for version, _, _, _ in pending_migrations(conn)]
+    assert pending[0] == 3
+    assert migrate(conn, log=lambda message: None) == pending
+    assert pending_migrations(conn) == []
+
+
+def test_edited_migrations_are_refused(conn):
+    migrations = load_migrations()[:1]
+    migrate(conn, log=lambda message: None, target=0)
+    edited = [(version, name, statements, 'x' * 64) for version, name, statements, _ in migrations]
+    with pytest.raises(MigrationError, match="was edited after it was applied"):
+        pending_migrations(conn, edited)
+
+
+def test_a_failed_migration_is_not_recorded(conn, tmp_path, monkeypatch):
+    (tmp_path / '0000_broken.sql').write_text("INSERT INTO missing VALUES (1);\n")
+    broken = load_migrations(str(tmp_path))
+    monkeypatch.setattr(migrate_module, 'pending_migrations', lambda conn: broken)
+    with pytest.raises(MigrationError, match="Migration 0000_broken failed"):
+        migrate(conn, log=lambda message: None)
+    assert migrate_module.applied_migrations(conn) == {}
+
+
+def test_statements_are_rendered_from_the_source(tmp_path):
+    source = tmp_path / 'module.py'
+    source.write_text(
+        "def read(cursor, ids, status):\n"
+        "    columns = ['order_id', 'status']\n"
+        "    sql = f\"SELECT {', '.join(columns)} FROM orders\"\n"
+        "    sql = sql + f\" WHERE order_id IN ({', '.join(['%s'] * len(ids))})\"\n"
+        "    cursor.execute(sql, ids)\n"
+        "    cursor.execute(\"DELETE FROM orders\")  # advisor: full-scan-ok (test)\n"
+        "    cursor.execute(\"INSERT INTO orders (status) VALUES (%s)\", (status,))\n"
+        "    cursor.execute(build(status))\n"
+    )
+    statements, skipped = collect_statements(str(source))
+    assert statements == [("module.py:5", "SELECT order_id, status FROM orders WHERE order_id IN (%s)", False),
+                          ("module.py:6", "DELETE FROM orders", True)]
+    assert skipped == ["module.py:8"]
+
+
+def test_every_sql_module_is_scanned():
+    sources = sql_sources()
+    assert {'app.py', 'archive.py', 'bulk.py', 'rollups.py', 'triage.py'} <= set(sources)
+    assert not {'cache.py', 'migrate.py', 'db.py'} & set(sources)
+
+
+def test_search_statements_cover_every_filter():
+    labels = [location for location, _, _ in collect_search_statements()]
+    assert "search.py:issues (no filters)" in labels and "search.py:feedback (customer_id)" in labels
+
+
+def test_sample_params():
+    samples = {'status': 'Pending', 'created_at': '2025-01-01 00:00:00'}
+    sql = "SELECT * FROM orders WHERE status = %s AND created_at >= %s AND assigned_to IN (%s, %s) LIMIT %s"
+    assert sample_params(sql, samples) == ['Pending', '2025-01-01 00:00:00', 1, 1, 10]
+
+
+def test_plan_problems():
+    assert plan_problems("SELECT 1", [{'table': 'orders', 'type': 'ref', 'key': 'status'}]) == []
+    assert plan_problems("SELECT 1", [{'table': 'orders', 'type': 'ALL', 'possible_keys': None, 'rows': 10}]) == [
+        ('error', "full scan of orders, no usable index (~10 rows)")]
+    assert plan_problems("SELECT 1", [{'table': 'admins', 'type': 'ALL', 'possible_keys': 'PRIMARY'}])[0][0] == 'warning'
+    assert plan_problems("SELECT 1", [{'table': 'orders', 'type': 'index', 'key': 'PRIMARY'}])[0][0] == 'warning'
+    assert plan_problems("SELECT 1 LIMIT 5", [{'table': 'orders', 'type': 'index', 'key': 'PRIMARY'}]) == []
+    assert plan_problems("SELECT 1", [{'table': '<derived2>', 'type': 'ALL'}]) == []
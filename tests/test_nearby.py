@@ -0,0 +1,139 @@
+import random
+import time
+from datetime import datetime, timedelta
+
+import pytest
+
+from nearby import CourierPositions, GridIndex, box_distance_km, haversine_km, latest_positions, to_timestamp
+
+
+def test_haversine():
+    assert haversine_km(0, 0, 0, 0) == 0
+    assert haversine_km(0, 0, 0, 1) == pytest.approx(111.195, abs=0.01)
+    assert haversine_km(0, 179.5, 0, -179.5) == pytest.approx(111.195, abs=0.01)
+    assert haversine_km(90, 0, -90, 0) == pytest.approx(20015.1, abs=0.1)
+
+
+def edge_distance(lat, lon, lat0, lat1, lon0, lon1, steps=400):
+    # Brute force: the nearest of many points along the box's edges
+    points = []
+    for i in range(steps + 1):
+        t = i / steps
+        points += [(lat0 + (lat1 - lat0) * t, lon0), (lat0 + (lat1 - lat0) * t, lon1),
+                   (lat0, lon0 + (lon1 - lon0) * t), (lat1, lon0 + (lon1 - lon0) * t)]
+    return min(haversine_km(lat, lon, plat, plon) for plat, plon in points)
+
+
+def test_box_distance_inside_and_straight_above():
+    assert box_distance_km(10.5, 20.5, 10, 11, 20, 21) == 0
+    assert box_distance_km(12, 20.5, 10, 11, 20, 21) == pytest.approx(haversine_km(12, 20.5, 11, 20.5))
+    # The box's longitudes wrap: a point at -179.5 is beside a box ending at 180
+    assert box_distance_km(0, -179.5, 0, 1, 179, 180) == pytest.approx(haversine_km(0, -179.5, 0, 180))
+
+
+@pytest.mark.parametrize('lat, lon, box', [
+    (60, 0, (50, 51, 10, 20)),      # the nearest point of a meridian lies poleward of the point
+    (-45, 100, (-10, 10, 0, 10)),
+    (0, 0, (89, 90, 90, 180)),
+    (80, -170, (70, 75, 170, 180)),  # across the antimeridian
+    (22.3, 4.4, (-79, -71, 165, 174.5)),  # past the antipode of the meridian's nearest point
+])
+def test_box_distance_matches_brute_force(lat, lon, box):
+    distance = box_distance_km(lat, lon, *box)
+    assert distance <= edge_distance(lat, lon, *box) + 1e-6
+    assert distance == pytest.approx(edge_distance(lat, lon, *box), abs=1.0)
+
+
+def test_box_distance_is_a_lower_bound():
+    rng = random.Random(7)
+    for _ in range(300):
+        lat, lon = rng.uniform(-90, 90), rng.uniform(-180, 180)
+        lat0, lon0 = rng.uniform(-90, 80), rng.uniform(-180, 170)
+        box = (lat0, lat0 + rng.uniform(0, 10), lon0, lon0 + rng.uniform(0, 10))
+        assert box_distance_km(lat, lon, *box) <= edge_distance(lat, lon, *box, steps=50) + 1e-6
+
+
+def brute_force(points, lat, lon, k=None, max_km=None, since=0):
+    found = sorted((haversine_km(lat, lon, plat, plon), key) for key, (plat, plon, stamp) in points.items()
+                   if stamp >= since)
+    found = [entry for entry in found if max_km is None or entry[0] <= max_km]
+    return found[:k] if k is not None else found
+
+
+@pytest.fixture
+def scattered():
+    rng = random.Random(42)
+    index = GridIndex(cell_degrees=0.5, leaf_size=4)
+    points = {}
+    for key in range(400):
+        if key % 2:  # a dense cluster and couriers spread over the globe, poles and antimeridian included
+            point = (12.97 + rng.uniform(-0.2, 0.2), 77.59 + rng.uniform(-0.2, 0.2), key)
+        else:
+            point = (rng.uniform(-90, 90), rng.uniform(-180, 180), key)
+        points[key] = point
+        index.update(key, *point)
+    return index, points
+
+
+@pytest.mark.parametrize('lat, lon', [(12.97, 77.59), (0, 0), (89.9, 10), (-30, 179.9), (-30, -179.9)])
+def test_search_matches_brute_force(scattered, lat, lon):
+    index, points = scattered
+    for kwargs in ({'k': 1}, {'k': 10}, {'max_km': 500}, {'k': 5, 'max_km': 30}, {'k': 10, 'since': 200}):
+        found = [(round(km, 9), key) for km, key, _, _, _ in index.search(lat, lon, **kwargs)]
+        assert found == [(round(km, 9), key) for km, key in brute_force(points, lat, lon, **kwargs)]
+
+
+def test_nearest_and_within():
+    index = GridIndex(cell_degrees=0.01)
+    index.update('a', 12.97, 77.59, 100)
+    index.update('b', 12.98, 77.59, 100)
+    assert [key for _, key, _, _, _ in index.nearest(12.972, 77.58, 1)] == ['a']
+    assert [key for _, key, _, _, _ in index.within(12.97, 77.59, 0.5)] == ['a']
+    assert index.within(12.97, 77.59, 5, limit=1)[0][1] == 'a'
+    assert index.nearest(12.97, 77.59, 5, since=101) == []
+
+
+def test_updates_move_couriers_and_ignore_older_fixes():
+    index = GridIndex(cell_degrees=0.01)
+    assert index.update('a', 10, 10, 100)
+    assert not index.update('a', 50, 50, 99)
+    assert index.update('a', -10, -10, 101)
+    assert index.nearest(-10, -10, 1)[0][:2] == (0, 'a')
+    assert index.sizes() == (1, 1)
+    index.update('b', 0, 180, 50)  # longitude 180 is -180
+    assert index.nearest(0, -179.99, 1)[0][1] == 'b'
+    assert index.prune(before=100) == 1
+    index.remove('a')
+    index.remove('missing')
+    assert index.sizes() == (0, 0) and all(not level for level in index.levels)
+
+
+def test_latest_positions():
+    t = datetime(2025, 5, 27, 10)
+    fixes = [{"delivery_person_id": 1, "lat": 1, "lon": 1, "recorded_at": t},
+             {"delivery_person_id": 1, "lat": 2, "lon": 2, "recorded_at": t - timedelta(seconds=1)},
+             {"delivery_person_id": 2, "lat": None, "lon": None, "recorded_at": t},
+             {"delivery_person_id": None, "lat": 3, "lon": 3, "recorded_at": t},
+             {"delivery_person_id": 3, "lat": 4, "lon": 4, "recorded_at": t},
+             {"delivery_person_id": 3, "lat": 5, "lon": 5, "recorded_at": t}]
+    assert latest_positions(fixes) == {1: (1, 1, t), 3: (5, 5, t)}
+
+
+def test_positions_are_shared_through_the_table(db):
+    now = datetime.utcnow()
+    writer, reader = CourierPositions(db, sync_interval=0), CourierPositions(db, sync_interval=0)
+    with db.transaction() as cursor:
+        assert writer.record(cursor, [{"delivery_person_id": 1, "lat": 12.97, "lon": 77.59, "recorded_at": now}]) == 1
+    with db.transaction() as cursor:
+        # An older fix that arrives late leaves the newer position in place
+        writer.record(cursor, [{"delivery_person_id": 1, "lat": 0.0, "lon": 0.0, "recorded_at": now - timedelta(minutes=1)},
+                               {"delivery_person_id": 2, "lat": 12.99, "lon": 77.59, "recorded_at": now}])
+    assert [key for _, key, _, _, _ in writer.nearest(12.97, 77.59, 5)] == [1, 2]
+    reader.sync()
+    assert [(key, lat) for _, key, lat, _, _ in reader.nearest(12.97, 77.59, 5)] == [(1, 12.97), (2, 12.99)]
+    assert reader.since == pytest.approx(time.time(), abs=5)
+    assert reader.stats()["couriers"] == 2 and reader.stats()["syncs"] == 1
+
+
+def test_to_timestamp_reads_naive_utc_text():
+    assert to_timestamp('1970-01-01 00:01:00.500') == 60.5
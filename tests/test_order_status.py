@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from order_status import (ASSIGNED, COURIER_STATUSES, DELIVERED, FAILED, IN_TRANSIT, PENDING, PICKED_UP, STATUSES,
+                          TRANSITIONS, UNASSIGNED, InvalidTransition, assigned_status, change_statements,
+                          check_transition, closed_at, summarize)
+
+ALLOWED = [(PENDING, ASSIGNED), (ASSIGNED, PICKED_UP), (ASSIGNED, FAILED), (PICKED_UP, IN_TRANSIT),
+           (PICKED_UP, FAILED), (IN_TRANSIT, DELIVERED), (IN_TRANSIT, FAILED)]
+
+
+@pytest.mark.parametrize('current, new', [(c, n) for c in STATUSES for n in STATUSES])
+def test_only_the_listed_transitions_are_allowed(current, new):
+    if (current, new) in ALLOWED:
+        check_transition(current, new)
+    else:
+        with pytest.raises(InvalidTransition, match=f"Cannot change status from '{current}' to '{new}'"):
+            check_transition(current, new)
+
+
+def test_closed_statuses_are_final():
+    assert TRANSITIONS[DELIVERED] == TRANSITIONS[FAILED] == ()
+
+
+def test_unknown_target_status():
+    with pytest.raises(InvalidTransition, match="Invalid status 'Lost'"):
+        check_transition(PENDING, 'Lost')
+    # Couriers cannot assign or reset orders
+    with pytest.raises(InvalidTransition, match="expected one of: Picked Up, In Transit, Delivered, Failed"):
+        check_transition(PENDING, ASSIGNED, COURIER_STATUSES)
+
+
+def test_legacy_free_text_status_may_move_anywhere():
+    check_transition('on the way', DELIVERED)
+    assert issubclass(InvalidTransition, ValueError)
+
+
+@pytest.mark.parametrize('current, expected', [(PENDING, ASSIGNED), (ASSIGNED, ASSIGNED), (IN_TRANSIT, IN_TRANSIT),
+                                               ('legacy', 'legacy')])
+def test_assigned_status(current, expected):
+    assert assigned_status(current) == expected
+
+
+@pytest.mark.parametrize('current', [DELIVERED, FAILED])
+def test_closed_orders_cannot_be_assigned(current):
+    with pytest.raises(InvalidTransition, match=f"Cannot assign an order that is {current}"):
+        assigned_status(current)
+
+
+def test_change_statements_move_counters_then_log_events():
+    counts, events = change_statements([(1, PENDING, ASSIGNED, None, 7), (2, None, PENDING, None, None)],
+                                       actor_type='admin', actor_id=3)
+    assert events[0].startswith("INSERT INTO order_events")
+    assert events[1] == [1, PENDING, ASSIGNED, 7, 'admin', 3, 2, None, PENDING, None, 'admin', 3]
+    # Sorted by (status, courier); the pending order replaces the one assigned, so Pending/unassigned nets to 0
+    assert counts[0].endswith("ON DUPLICATE KEY UPDATE order_count = order_count + VALUES(order_count)")
+    assert counts[1] == [ASSIGNED, 7, 1]
+
+
+def test_closing_statuses_stamp_closed_at():
+    assert abs(closed_at(DELIVERED) - datetime.utcnow()) < timedelta(seconds=5)
+    assert closed_at(FAILED) is not None
+    assert closed_at(IN_TRANSIT) is None
+
+
+def test_deleted_orders_are_counted_but_not_logged():
+    [(sql, params)] = change_statements([(1, DELIVERED, None, 7, None)])
+    assert sql.startswith("INSERT INTO order_status_counts")
+    assert params == [DELIVERED, 7, -1]
+
+
+def test_unchanged_orders_write_nothing():
+    assert change_statements([(1, ASSIGNED, ASSIGNED, 7, 7)]) == []
+
+
+def test_reassignment_moves_the_count_between_couriers():
+    (sql, params), _ = change_statements([(1, ASSIGNED, ASSIGNED, 7, 8)])
+    assert params == [ASSIGNED, 7, -1, ASSIGNED, 8, 1]
+
+
+def test_summarize():
+    rows = [(PENDING, UNASSIGNED, 4), (ASSIGNED, 7, 2), (DELIVERED, 7, 5), (DELIVERED, 8, 1), (FAILED, 8, 0)]
+    assert summarize(rows) == {
+        "total": 12,
+        "by_status": {PENDING: 4, ASSIGNED: 2, DELIVERED: 6},
+        "unassigned": {PENDING: 4},
+        "by_delivery_person": {"7": {ASSIGNED: 2, DELIVERED: 5}, "8": {DELIVERED: 1}},
+    }
@@ -0,0 +1,94 @@
+import gzip
+import uuid
+from datetime import date, datetime
+from decimal import Decimal
+
+import pytest
+from flask import Flask, Response, jsonify
+from flask.json.provider import DefaultJSONProvider
+
+import responses
+from responses import (Compression, FastJSONProvider, body_etag, choose_encoding, compress, compressible, etag,
+                       rows_payload, wants_columns)
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = FastJSONProvider(app)
+    app.config['COMPRESS_MIN_SIZE'] = 100
+    Compression(app)
+
+    @app.route('/big')
+    def big():
+        response = jsonify([{"order_id": i, "status": "Pending"} for i in range(50)])
+        response.set_etag(etag('/big', 1))
+        return response
+
+    @app.route('/small')
+    def small():
+        return jsonify({"ok": True})
+
+    @app.route('/stream')
+    def stream():
+        return Response((line for line in ['{"a": 1}\n'] * 100), mimetype='application/x-ndjson')
+
+    return app
+
+
+def test_same_output_as_the_default_provider(app):
+    payload = {"b": [1, 2.5, None], "a": "é", "when": datetime(2025, 5, 27, 10, 15), "day": date(2025, 5, 27),
+               "amount": Decimal('12.30'), "id": uuid.UUID(int=1)}
+    default = DefaultJSONProvider(app)
+    for kwargs in ({}, {"sort_keys": True}):
+        assert app.json.loads(app.json.dumps(payload, **kwargs)) == default.loads(default.dumps(payload, **kwargs))
+    assert app.json.dumps({"n": 2 ** 70}) == default.dumps({"n": 2 ** 70})
+
+
+def test_stdlib_fallback(app, monkeypatch):
+    monkeypatch.setattr(responses, 'orjson', None)
+    assert app.json.dumps({"b": 1, "a": 2}) == '{"a": 2, "b": 1}'
+
+
+def test_rows_payload():
+    rows = [(1, 'Pending'), (2, 'Assigned')]
+    assert rows_payload(["id", "status"], rows) == [{"id": 1, "status": "Pending"}, {"id": 2, "status": "Assigned"}]
+    assert rows_payload(["id", "status"], rows, columnar=True) == {"fields": ["id", "status"], "rows": rows}
+    assert wants_columns({"shape": "columns"}) and not wants_columns({})
+
+
+def test_etags():
+    assert etag('/orders', 7, None) == etag('/orders', 7, None)
+    assert etag('/orders', 7) != etag('/orders', 8)
+    assert etag('a\x1fb') == etag('a', 'b')  # parts are joined with the unit separator
+    assert body_etag(b'{}').startswith('b') and body_etag(b'{}') != body_etag(b'[]')
+
+
+@pytest.mark.parametrize('accept, expected', [('gzip, deflate', 'gzip'), ('deflate', None), ('', None), (None, None),
+                                              ('gzip;q=0', None)])
+def test_choose_encoding(accept, expected, monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    assert choose_encoding(accept) == expected
+
+
+def test_compressible():
+    assert compressible('application/json') and compressible('text/csv')
+    assert not compressible('image/png') and not compressible(None)
+    assert gzip.decompress(compress(b'x' * 100, 'gzip', 1)) == b'x' * 100
+
+
+def test_large_responses_are_compressed_with_a_weak_etag(app, monkeypatch):
+    monkeypatch.setattr(responses, 'brotli', None)
+    client = app.test_client()
+    plain = client.get('/big')
+    compressed = client.get('/big', headers={'Accept-Encoding': 'gzip'})
+    assert compressed.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(compressed.data) == plain.data
+    assert compressed.headers['ETag'] == 'W/' + plain.headers['ETag']
+    assert compressed.headers['Vary'] == 'Accept-Encoding'
+
+
+def test_small_and_streamed_responses_are_sent_as_is(app):
+    client = app.test_client()
+    assert 'Content-Encoding' not in client.get('/small', headers={'Accept-Encoding': 'gzip'}).headers
+    assert 'Content-Encoding' not in client.get('/stream', headers={'Accept-Encoding': 'gzip'}).headers
@@ -0,0 +1,108 @@
+from datetime import date, datetime, timedelta
+
+from order_status import ASSIGNED, DELIVERED, PENDING, UNASSIGNED
+from rollups import OrderRollups, day_of, fold_rows, hour_of
+
+T = datetime(2025, 5, 27, 10, 15, 30)
+
+
+def test_buckets():
+    assert hour_of(T) == datetime(2025, 5, 27, 10)
+    assert hour_of('2025-05-27 10:59:59.5') == datetime(2025, 5, 27, 10)
+    assert day_of('2025-05-27 23:59:59') == date(2025, 5, 27)
+
+
+def test_fold_rows_sums_per_bucket_courier_and_status():
+    rows = [
+        (PENDING, None, T, None),
+        (PENDING, None, T + timedelta(minutes=50), None),
+        (DELIVERED, 7, T, 600),
+        (DELIVERED, 7, T + timedelta(hours=1), None),
+        (DELIVERED, 7, T + timedelta(hours=1), 120.9),
+    ]
+    buckets = fold_rows(rows)
+    hour, next_hour = datetime(2025, 5, 27, 10), datetime(2025, 5, 27, 11)
+    assert dict(buckets['hour']) == {
+        (hour, UNASSIGNED, PENDING): [1, 0, 0],
+        (next_hour, UNASSIGNED, PENDING): [1, 0, 0],
+        (hour, 7, DELIVERED): [1, 1, 600],
+        (next_hour, 7, DELIVERED): [2, 1, 120],
+    }
+    assert dict(buckets['day']) == {
+        (date(2025, 5, 27), UNASSIGNED, PENDING): [2, 0, 0],
+        (date(2025, 5, 27), 7, DELIVERED): [3, 2, 720],
+    }
+
+
+def test_fold_rows_empty():
+    assert {granularity: dict(rows) for granularity, rows in fold_rows([]).items()} == {'hour': {}, 'day': {}}
+
+
+def add_events(db, *events):
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO order_events (order_id, to_status, delivery_person_id, created_at) VALUES (%s, %s, %s, %s)",
+            events
+        )
+
+
+def add_event(db, event_id, order_id, status, created_at):
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO order_events (event_id, order_id, to_status, created_at) VALUES (%s, %s, %s, %s)",
+                       (event_id, order_id, status, created_at))
+
+
+def daily(db):
+    with db.cursor() as cursor:
+        cursor.execute("SELECT delivery_person_id, status, transitions, timed_deliveries, delivery_seconds "
+                       "FROM order_rollups_daily ORDER BY status")
+        return cursor.fetchall()
+
+
+def test_fold_counts_every_event_once(db):
+    add_events(db, (1, PENDING, None, T), (1, ASSIGNED, 7, T + timedelta(minutes=5)),
+               (1, DELIVERED, 7, T + timedelta(minutes=45)))
+    rollups = OrderRollups(db, interval=0, batch_size=2, settle=0)
+    assert rollups.fold_all() == 3
+    assert rollups.fold_all() == 0
+    assert daily(db) == ((7, ASSIGNED, 1, 0, 0), (7, DELIVERED, 1, 1, 2400), (UNASSIGNED, PENDING, 1, 0, 0))
+    assert rollups.status()["events_behind"] == 0
+    assert rollups.stats()["events"] == 3
+
+
+def test_recent_events_wait_for_the_next_fold(db):
+    add_events(db, (1, PENDING, None, datetime.utcnow()))
+    assert OrderRollups(db, interval=0, settle=60).fold() == 0
+
+
+def test_slow_commit_below_the_mark_is_folded_later(db):
+    now = datetime.utcnow()
+    add_event(db, 1, 1, PENDING, now - timedelta(seconds=60))
+    # event_id 2 is taken by a transaction still open when event 3 commits
+    add_event(db, 3, 3, PENDING, now - timedelta(seconds=30))
+    rollups = OrderRollups(db, interval=0, settle=5, gap_seconds=300)
+    assert rollups.fold_all() == 1
+    assert rollups.status()["high_water"] == 1
+    add_event(db, 2, 2, PENDING, now - timedelta(seconds=40))
+    assert rollups.fold_all() == 2
+    assert sum(row[2] for row in daily(db)) == 3  # one or two days, near midnight
+    assert rollups.stats()["gap_waits"] == 1
+
+
+def test_old_gaps_are_rollbacks(db):
+    add_event(db, 1, 1, PENDING, T)
+    add_event(db, 3, 3, PENDING, T)
+    rollups = OrderRollups(db, interval=0, settle=5, gap_seconds=300)
+    assert rollups.fold_all() == 2
+    assert rollups.stats()["gap_waits"] == 0
+
+
+def test_backfill_includes_orders_without_events(db):
+    with db.transaction() as cursor:
+        cursor.execute("INSERT INTO customers (name, phone, email, address, password) VALUES (%s, %s, %s, %s, %s)",
+                       ('c', '1', 'c@example.com', 'a', 'x'))
+        cursor.execute("INSERT INTO orders (customer_id, status, created_at, updated_at) VALUES (%s, %s, %s, %s)",
+                       (cursor.lastrowid, DELIVERED, T, T + timedelta(hours=2)))
+    add_events(db, (99, PENDING, None, T))
+    assert OrderRollups(db, interval=0, settle=0).backfill(log=lambda message: None) == (1, 1)
+    assert daily(db) == ((UNASSIGNED, DELIVERED, 1, 0, 0), (UNASSIGNED, PENDING, 2, 0, 0))
@@ -0,0 +1,66 @@
+import pytest
+
+from search import SearchQuery, build_search_query
+
+
+@pytest.mark.parametrize('text, boolean', [
+    ('late delivery', '+late +delivery'),
+    ('"wrong address" -refund deliv*', '+"wrong address" -refund +deliv*'),
+    ('-"never arrived" package', '-"never arrived" +package'),
+    ('Late, DAMAGED!', '+late +damaged'),
+    ('e-mail', '+mail'),
+    ('"open quote', '+"open quote"'),
+    ('+late', '+late'),
+])
+def test_parse(text, boolean):
+    assert SearchQuery.parse(text).boolean() == boolean
+
+
+def test_short_words_are_dropped():
+    query = SearchQuery.parse('is it ok "to go"')
+    assert query.clauses == [] and not query
+    assert SearchQuery.parse('ab*').boolean() == ''
+    assert SearchQuery.parse('ab', min_length=2).boolean() == '+ab'
+
+
+def test_only_exclusions_is_no_query():
+    assert not SearchQuery.parse('-refund')
+    assert SearchQuery.parse('-refund late')
+
+
+def test_score():
+    query = SearchQuery.parse('late "wrong address" deliv* -refund')
+    assert query.score("Late again, wrong address.", "Delivered late by the courier") == 4.0
+    assert query.score("late to the wrong address") == 0.0  # no deliv* word
+    assert query.score("late delivery, wrong address", "refund issued") == 0.0
+    assert query.score(None, "late delivery wrong address") == 3.0
+
+
+def test_build_search_query():
+    query = SearchQuery.parse('late')
+    sql, params = build_search_query('issues', query, {'status': 'open', 'user_id': '7', 'user_type': ''},
+                                     created_from='2025-01-01')
+    assert sql == ("SELECT issue_id, user_type, user_id, message, status, response, created_at, "
+                   "MATCH (message, response) AGAINST (%s IN BOOLEAN MODE) AS score FROM issues "
+                   "WHERE MATCH (message, response) AGAINST (%s IN BOOLEAN MODE) AND status = %s AND user_id = %s "
+                   "AND created_at >= %s ORDER BY score DESC, issue_id DESC")
+    assert params == ['+late', '+late', 'open', 7, '2025-01-01']
+
+
+def test_bad_filter_value():
+    with pytest.raises(ValueError):
+        build_search_query('feedback', SearchQuery.parse('late'), {'order_id': 'abc'})
+
+
+def test_search_on_the_sqlite_stand_in(db):
+    with db.transaction() as cursor:
+        cursor.executemany(
+            "INSERT INTO issues (user_type, user_id, message, status) VALUES (%s, %s, %s, %s)",
+            [('customer', 1, "Parcel late, late again", 'open'), ('customer', 2, "Late and damaged", 'open'),
+             ('customer', 3, "Damaged box", 'open'), ('sender', 1, "Late pickup", 'resolved')]
+        )
+    sql, params = build_search_query('issues', SearchQuery.parse('late -damaged'), {'status': 'open'})
+    with db.cursor() as cursor:
+        cursor.execute(sql, params)
+        rows = cursor.fetchall()
+    assert [(row[0], row[-1]) for row in rows] == [(1, 2.0)]
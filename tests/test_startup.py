@@ -0,0 +1,91 @@
+import os
+
+import pytest
+
+import startup as startup_module
+from startup import Startup
+
+
+class Component:
+    def __init__(self):
+        self.starts = 0
+
+    def start(self):
+        self.starts += 1
+
+
+@pytest.fixture
+def startup():
+    return Startup()
+
+
+def test_nothing_runs_until_start(startup):
+    component = startup.service(Component())
+    calls = []
+    startup.step('cache')(lambda: calls.append('cache'))
+    assert (component.starts, calls, startup.status()["ready"]) == (0, [], False)
+    assert not startup.started()
+
+
+def test_start_runs_services_then_steps_once(startup):
+    component = startup.service(Component())
+    calls = []
+
+    @startup.step('db_connections')
+    def connections():
+        assert component.starts == 1
+        calls.append('db_connections')
+
+    startup.step('cache')(lambda: calls.append('cache'))
+    startup.imported(0.5)
+    startup.start()
+    startup.start()
+    assert (component.starts, calls) == (1, ['db_connections', 'cache'])
+    status = startup.status()
+    assert (status["ready"], status["pid"], status["import_seconds"]) == (True, os.getpid(), 0.5)
+    assert list(status["steps"]) == ['db_connections', 'cache'] and status["errors"] == {}
+
+
+def test_steps_can_be_skipped_or_left_out(startup):
+    calls = []
+    startup.step('db_connections')(lambda: calls.append('db_connections'))
+    startup.step('cache')(lambda: calls.append('cache'))
+    startup.start(skip=('db_connections',))
+    assert calls == ['cache']
+    cold = Startup()
+    cold.step('cache')(lambda: calls.append('cold'))
+    cold.start(warm=False)
+    assert calls == ['cache'] and cold.status()["ready"] and cold.status()["steps"] == {}
+
+
+def test_a_failed_step_is_reported_and_the_worker_still_starts(startup):
+    def broken():
+        raise RuntimeError("database unavailable")
+
+    calls = []
+    startup.step('db_connections')(broken)
+    startup.step('cache')(lambda: calls.append('cache'))
+    startup.start()
+    status = startup.status()
+    assert calls == ['cache'] and status["ready"]
+    assert status["errors"] == {'db_connections': "database unavailable"}
+    assert 'db_connections' in status["steps"]
+
+
+def test_a_forked_worker_starts_again(startup, monkeypatch):
+    component = startup.service(Component())
+    startup.start()
+    monkeypatch.setattr(startup_module.os, 'getpid', lambda: -1)
+    assert not startup.started()
+    startup.start()
+    assert component.starts == 2 and startup.status()["pid"] == -1
+
+
+def test_measure_reads_each_run(monkeypatch):
+    class Result:
+        stdout = ('log line\n{"import_seconds": 0.4, "warm_up_seconds": 0.2, "total_seconds": 0.7, '
+                  '"steps": {"cache": 0.1}}\n')
+
+    monkeypatch.setattr(startup_module.subprocess, 'run', lambda *args, **kwargs: Result())
+    samples = startup_module.measure(runs=2, log=lambda message: None)
+    assert samples == {'import': [0.4, 0.4], 'warm_up': [0.2, 0.2], 'total': [0.7, 0.7], 'cache': [0.1, 0.1]}
@@ -0,0 +1,87 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+from triage import IssueQueue, NotClaimed, parse_head_starts
+
+T = datetime(2025, 5, 27, 10, 0)
+
+
+def test_parse_head_starts():
+    assert parse_head_starts(" delivery_person=3600, customer=900.5 ") == {
+        'customer': 900.5, 'delivery_person': 3600.0, 'sender': 0.0}
+    assert parse_head_starts('') == parse_head_starts(None) == {'customer': 0.0, 'delivery_person': 0.0, 'sender': 0.0}
+
+
+@pytest.mark.parametrize('spec', ['admin=60', 'customer=soon'])
+def test_invalid_head_starts(spec):
+    with pytest.raises(ValueError):
+        parse_head_starts(spec)
+
+
+def test_rank_moves_issues_back_by_their_head_start():
+    queue = IssueQueue(None, head_starts=parse_head_starts('delivery_person=3600'))
+    courier = (1, 'delivery_person', 5, 'm', 'open', None, T)
+    sender = (2, 'sender', 5, 'm', 'open', None, T - timedelta(minutes=59))
+    older_sender = (3, 'sender', 5, 'm', 'open', None, T - timedelta(minutes=61))
+    same_age = (0, 'delivery_person', 5, 'm', 'open', None, T)
+    undated = (4, 'customer', 5, 'm', 'open', None, None)
+    assert sorted([sender, courier, older_sender, same_age, undated], key=queue.rank) == [
+        undated, older_sender, same_age, courier, sender]
+    assert queue.rank((9, 'sender', 5, 'm', 'open', None, '2025-05-27 10:00:00'))[0] == T
+
+
+@pytest.fixture
+def issues(db):
+    def add(user_type, created_at, status='open'):
+        with db.transaction() as cursor:
+            cursor.execute("INSERT INTO issues (user_type, user_id, message, status, created_at) "
+                           "VALUES (%s, %s, %s, %s, %s)", (user_type, 1, 'help', status, created_at))
+            return cursor.lastrowid
+    return add
+
+
+def test_claims_take_the_oldest_open_issues_first(db, issues):
+    customer = issues('customer', T - timedelta(hours=2))
+    courier = issues('delivery_person', T - timedelta(hours=1))
+    sender = issues('sender', T)
+    issues('customer', T - timedelta(hours=5), status='resolved')
+    queue = IssueQueue(db, head_starts=parse_head_starts('delivery_person=7200'))
+    claimed = queue.claim(admin_id=1, count=2)
+    assert [row[0] for row in claimed] == [courier, customer]
+    assert claimed[0][-1] > datetime.utcnow()  # the lease
+    # Leased issues are passed over by the next admin
+    assert [row[0] for row in queue.claim(admin_id=2, count=5)] == [sender]
+    assert queue.claim(admin_id=3, count=5) == []
+    assert queue.status() == {'customer': {'open': 1, 'claimed': 1}, 'delivery_person': {'open': 1, 'claimed': 1},
+                              'sender': {'open': 1, 'claimed': 1}}
+
+
+def test_expired_leases_go_back_to_the_queue(db, issues):
+    issue = issues('customer', T)
+    queue = IssueQueue(db, lease_seconds=-1)
+    assert [row[0] for row in queue.claim(1, 1)] == [issue]
+    assert [row[0] for row in queue.claim(2, 1)] == [issue]
+
+
+def test_respond_only_to_held_issues(db, issues):
+    first, second = issues('customer', T), issues('customer', T + timedelta(minutes=1))
+    queue = IssueQueue(db)
+    queue.claim(1, 1)
+    queue.claim(2, 1)
+    with pytest.raises(NotClaimed) as e:
+        queue.respond(1, [(first, 'done', 'resolved'), (second, 'done', 'resolved')])
+    assert e.value.issue_ids == [second]
+    rows = queue.respond(1, [(first, 'done', 'resolved')])
+    assert [(row[0], row[4], row[5]) for row in rows] == [(first, 'resolved', 'done')]
+    assert queue.release(1, [second]) == 0
+    assert queue.release(2, [second]) == 1
+    assert queue.stats() == {"claims": 2, "claimed": 2, "responded": 1, "released": 1, "conflicts": 1}
+
+
+def test_claim_count_is_capped(db, issues):
+    for i in range(5):
+        issues('sender', T + timedelta(minutes=i))
+    queue = IssueQueue(db, max_claim=3)
+    assert len(queue.claim(1, 10)) == 3
+    assert len(queue.claim(1, 0)) == 1
@@ -0,0 +1,134 @@
+import threading
+from datetime import datetime, timedelta
+
+from rollups import to_datetime
+
+# Issue triage queue.
+# Admins claim the next open issues instead of each reading the whole table. A claim reads the
+# oldest candidates with SELECT ... FOR UPDATE SKIP LOCKED, so admins claiming at the same time
+# pass over each other's rows instead of waiting on them or taking the same ones, and stamps the
+# chosen issues with a lease (claimed_by, claim_expires_at) that outlives the transaction.
+# An issue whose lease ran out is back in the queue. Issues are served oldest first, with a head
+# start per user_type: a delivery person's issue 1 hour old ranks with a sender's 2 hours old
+# when delivery_person has 3600 seconds more.
+# Responses are written for a batch of issues in one transaction, and only if the admin still
+# holds every one of them; a lease that ran out stays good until another admin claims the issue.
+
+OPEN = 'open'
+RESOLVED = 'resolved'
+USER_TYPES = ('customer', 'delivery_person', 'sender')
+CLAIM_FIELDS = ["issue_id", "user_type", "user_id", "message", "status", "response", "created_at", "claim_expires_at"]
+
+
+class NotClaimed(Exception):
+    def __init__(self, issue_ids):
+        super().__init__(f"Issues not claimed by this admin: {issue_ids}")
+        self.issue_ids = issue_ids
+
+
+def parse_head_starts(spec):
+    # "user_type=seconds,..." -> {user_type: seconds}, e.g. "delivery_person=3600,customer=900"
+    head_starts = dict.fromkeys(USER_TYPES, 0.0)
+    for entry in filter(None, (part.strip() for part in (spec or '').split(','))):
+        user_type, _, seconds = entry.partition('=')
+        if user_type.strip() not in head_starts:
+            raise ValueError(f"Unknown user_type in issue priority: {entry}")
+        head_starts[user_type.strip()] = float(seconds)
+    return head_starts
+
+
+class IssueQueue:
+    def __init__(self, db, lease_seconds=900, head_starts=None, max_claim=50):
+        self.db = db
+        self.lease_seconds = lease_seconds
+        self.head_starts = head_starts or dict.fromkeys(USER_TYPES, 0.0)
+        self.max_claim = max_claim
+        self.lock = threading.Lock()
+        self.counters = {"claims": 0, "claimed": 0, "responded": 0, "released": 0, "conflicts": 0}
+
+    def incr(self, name, amount=1):
+        with self.lock:
+            self.counters[name] += amount
+
+    def rank(self, row):
+        # Effective age: created_at moved back by the user_type's head start
+        created_at = to_datetime(row[6]) if row[6] is not None else datetime.min + timedelta(days=1)
+        return created_at - timedelta(seconds=self.head_starts.get(row[1], 0)), row[0]
+
+    def claim(self, admin_id, count):
+        # Leases up to `count` open issues to admin_id -> their rows (CLAIM_FIELDS), in priority order
+        count = max(1, min(count, self.max_claim))
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.lease_seconds)
+        with self.db.transaction() as cursor:
+            # The oldest `count` of each user_type hold the best `count` overall; the ones not
+            # chosen are unlocked again when this short transaction commits
+            candidates = []
+            for user_type in USER_TYPES:
+                cursor.execute(
+                    f"SELECT {', '.join(CLAIM_FIELDS)} FROM issues "
+                    "WHERE status = %s AND user_type = %s AND (claim_expires_at IS NULL OR claim_expires_at <= %s) "
+                    "ORDER BY created_at, issue_id LIMIT %s FOR UPDATE SKIP LOCKED",
+                    (OPEN, user_type, now, count)
+                )
+                candidates.extend(cursor.fetchall())
+            chosen = sorted(candidates, key=self.rank)[:count]
+            if chosen:
+                ids = [row[0] for row in chosen]
+                cursor.execute(
+                    f"UPDATE issues SET claimed_by = %s, claim_expires_at = %s WHERE issue_id IN ({', '.join(['%s'] * len(ids))})",
+                    [admin_id, expires_at] + ids
+                )
+        self.incr("claims")
+        self.incr("claimed", len(chosen))
+        return [row[:-1] + (expires_at,) for row in chosen]
+
+    def respond(self, admin_id, responses):
+        # responses: [(issue_id, response, status)], all written or none; raises NotClaimed
+        # when admin_id does not hold one of the issues (any more)
+        ids = [issue_id for issue_id, _, _ in responses]
+        placeholders = ', '.join(['%s'] * len(ids))
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                f"SELECT issue_id FROM issues WHERE issue_id IN ({placeholders}) AND claimed_by = %s FOR UPDATE",
+                ids + [admin_id]
+            )
+            missing = sorted(set(ids) - {row[0] for row in cursor.fetchall()})
+            if missing:
+                self.incr("conflicts")
+                raise NotClaimed(missing)
+            cursor.executemany(
+                "UPDATE issues SET response = %s, status = %s, claimed_by = NULL, claim_expires_at = NULL WHERE issue_id = %s",
+                [(response, status, issue_id) for issue_id, response, status in responses]
+            )
+            cursor.execute(f"SELECT {', '.join(CLAIM_FIELDS[:-2])} FROM issues WHERE issue_id IN ({placeholders})", ids)
+            rows = cursor.fetchall()
+        self.incr("responded", len(rows))
+        return rows
+
+    def release(self, admin_id, issue_ids):
+        # Hands issues back to the queue -> how many admin_id held
+        with self.db.transaction() as cursor:
+            cursor.execute(
+                "UPDATE issues SET claimed_by = NULL, claim_expires_at = NULL "
+                f"WHERE issue_id IN ({', '.join(['%s'] * len(issue_ids))}) AND claimed_by = %s",
+                list(issue_ids) + [admin_id]
+            )
+            released = cursor.rowcount
+        self.incr("released", released)
+        return released
+
+    def status(self):
+        # Open issues per user_type, and how many of them are under a live lease
+        with self.db.cursor() as cursor:
+            cursor.execute(
+                "SELECT user_type, COUNT(*), SUM(CASE WHEN claim_expires_at > %s THEN 1 ELSE 0 END) FROM issues "
+                "WHERE status = %s GROUP BY user_type",
+                (datetime.utcnow(), OPEN)
+            )
+            rows = cursor.fetchall()
+        return {user_type: {"open": int(total), "claimed": int(claimed or 0)} for user_type, total, claimed in rows}
+
+    def stats(self):
+        with self.lock:
+            return dict(self.counters)